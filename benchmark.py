@@ -0,0 +1,117 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This script benchmarks the wall time and peak memory of the module
+# generators and testbench data functions over a grid of sizes and test
+# lengths, see python/benchmarks.py. The results can be written as JSON and
+# compared with a stored baseline, exiting with an error on a regression.
+# See the README for a detailed description of runtime arguments and flags.
+
+import argparse
+import benchmarks
+from common import atomic_write
+import json
+import os
+
+# Command line interface specification
+# See README for spec description
+def cli():
+   parser = argparse.ArgumentParser(
+      description='Benchmarks the wall time and peak memory of the generators'
+   )
+   parser.add_argument(
+      '-bench', dest='names', action='store', type=str_list, required=False,
+      default=list( benchmarks.NAMES ), help='Benchmarks, comma separated, default all'
+   )
+   parser.add_argument(
+      '-size', dest='sizes', action='store', type=int_list, required=False,
+      default=benchmarks.SIZES, help='Sizes (M = N = O for matrix multiply), comma separated'
+   )
+   parser.add_argument(
+      '-len', dest='lengths', action='store', type=int_list, required=False,
+      default=benchmarks.LENGTHS, help='Test lengths, comma separated'
+   )
+   parser.add_argument(
+      '-alaghi', dest='alaghi', action='store_true', required=False,
+      help='Uses alaghi adders in the matrix multiply and dot product benchmarks'
+   )
+   parser.add_argument(
+      '-repeat', dest='repeat', action='store', type=int, required=False,
+      default=3, help='Number of runs of every case, the fastest is kept'
+   )
+   parser.add_argument(
+      '-seed', dest='seed', action='store', type=int, required=False,
+      default=0, help='Seed of the random data of every run'
+   )
+   parser.add_argument(
+      '-out', dest='out', action='store', type=str, required=False,
+      default=None, help='JSON file to write the results to'
+   )
+   parser.add_argument(
+      '-baseline', dest='baseline', action='store', type=str, required=False,
+      default=None, help='JSON results to compare with, exits with an error on a regression'
+   )
+   parser.add_argument(
+      '-time', dest='time_threshold', action='store', type=float, required=False,
+      default=benchmarks.TIME_THRESHOLD, help='Allowed growth of the wall time, e.g. 0.2 for 20%%'
+   )
+   parser.add_argument(
+      '-memory', dest='memory_threshold', action='store', type=float, required=False,
+      default=benchmarks.MEMORY_THRESHOLD, help='Allowed growth of the peak memory'
+   )
+   args = parser.parse_args()
+
+   # Argument validation
+   if ( args.repeat < 1 ):
+      print( "Usage: -repeat N, N > 0" )
+      exit()
+   if ( args.time_threshold < 0 or args.memory_threshold < 0 ):
+      print( "Usage: -time T -memory T, T >= 0" )
+      exit()
+   if ( args.baseline is not None and not os.path.isfile( args.baseline ) ):
+      print( "ERROR: baseline={} is not a file".format( args.baseline ) )
+      exit()
+
+   return args
+
+# Helper function to parse a comma separated list of ints
+def int_list( v ):
+   try:
+      return [int( x ) for x in v.split( ',' )]
+   except ValueError:
+      raise argparse.ArgumentTypeError( 'Comma separated integers expected.' )
+
+# Helper function to parse a comma separated list of lower case strings
+def str_list( v ):
+   return [x.strip().lower() for x in v.split( ',' )]
+
+# Script entry point function
+if __name__ == '__main__':
+   args = cli()
+   try:
+      cases = benchmarks.cases( args.names, args.sizes, args.lengths, args.alaghi )
+   except ValueError as e:
+      print( "ERROR: {}".format( e ) )
+      exit()
+
+   baseline = None
+   if args.baseline is not None:
+      with open( args.baseline, 'r' ) as f:
+         baseline = json.load( f )
+
+   print( "Running {} benchmarks, {} runs each...".format( len( cases ), args.repeat ) )
+   results = benchmarks.run( cases, repeat=args.repeat, seed=args.seed )
+   print( benchmarks.format_table( results, baseline ) )
+   if args.out is not None:
+      atomic_write( args.out, json.dumps( results, sort_keys=True, indent=1 ) + "\n" )
+
+   if baseline is not None:
+      regressions = benchmarks.compare( results, baseline, args.time_threshold,
+                                        args.memory_threshold )
+      if regressions:
+         print( "" )
+         print( "Regressions against {}:".format( args.baseline ) )
+         for (key, metric, old, new, ratio) in regressions:
+            print( "   {} {}: {} -> {} ({:+.1f}%)".format( key, metric, old, new,
+                                                          100 * (ratio - 1) ) )
+         exit( 1 )
+      print( "" )
+      print( "No regressions against {}.".format( args.baseline ) )
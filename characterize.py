@@ -0,0 +1,119 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This script characterizes the accuracy of stochastic dot products against
+# the stream length, the number of inputs, the noise source and the adder
+# type, with Monte Carlo runs of the golden models, see
+# python/characterization.py. It prints the error statistics of every
+# configuration and, given an accuracy target, the shortest stream length
+# meeting it.
+# See the README for a detailed description of runtime arguments and flags.
+
+import argparse
+import characterization
+from common import atomic_write
+import json
+
+# Command line interface specification
+# See README for spec description
+def cli():
+   parser = argparse.ArgumentParser(
+      description='Characterizes the accuracy of stochastic dot products against stream length'
+   )
+   parser.add_argument(
+      '-len', dest='length', action='store', type=int_list, required=False,
+      default=[64, 128, 256, 512, 1024], help='Stream lengths, comma separated'
+   )
+   parser.add_argument(
+      '-is', dest='inputs', action='store', type=int_list, required=False,
+      default=[16], help='Numbers of inputs of the dot product, comma separated'
+   )
+   parser.add_argument(
+      '-rng', dest='rng', action='store', type=str_list, required=False,
+      default=["lfsr"], help='Noise sources, comma separated, options are lfsr or random'
+   )
+   parser.add_argument(
+      '-adder', dest='adder', action='store', type=str_list, required=False,
+      default=["mux", "alaghi"], help='Adder types, comma separated, options are mux or alaghi'
+   )
+   parser.add_argument(
+      '-rep', dest='rep', action='store', type=str_list, required=False,
+      default=["uni"], help='Stochastic representations, comma separated, options are uni or bi'
+   )
+   parser.add_argument(
+      '-trials', dest='trials', action='store', type=int, required=False,
+      default=1000, help='Number of random dot products per configuration'
+   )
+   parser.add_argument(
+      '-target', dest='target', action='store', type=float, required=False,
+      default=None, help='Accuracy target, reports the shortest stream length meeting it'
+   )
+   parser.add_argument(
+      '-metric', dest='metric', action='store', type=str, required=False,
+      default='rmse', help='Statistic compared with the target, e.g. rmse, p95 or max'
+   )
+   parser.add_argument(
+      '-out', dest='out', action='store', type=str, required=False,
+      default=None, help='JSON file to write the results to'
+   )
+   parser.add_argument(
+      '-j', dest='jobs', action='store', type=int, required=False,
+      default=1, help='Number of processes'
+   )
+   parser.add_argument(
+      '-seed', dest='seed', action='store', type=int, required=False,
+      default=None, help='Seed for reproducible results'
+   )
+   args = parser.parse_args()
+
+   # Argument validation
+   if ( args.jobs < 1 ):
+      print( "Usage: -j N, N > 0" )
+      exit()
+   if ( args.trials < 1 ):
+      print( "Usage: -trials N, N > 0" )
+      exit()
+   metrics = ["mse", "rmse", "bias", "std", "max"] \
+             + ["p" + str(p) for p in characterization.PERCENTILES]
+   if ( args.metric not in metrics ):
+      print( "Usage: -metric [" + "|".join( metrics ) + "]" )
+      exit()
+
+   return args
+
+# Helper function to parse a comma separated list of ints
+def int_list( v ):
+   try:
+      return [int( x ) for x in v.split( ',' )]
+   except ValueError:
+      raise argparse.ArgumentTypeError( 'Comma separated integers expected.' )
+
+# Helper function to parse a comma separated list of lower case strings
+def str_list( v ):
+   return [x.strip().lower() for x in v.split( ',' )]
+
+# Script entry point function
+if __name__ == '__main__':
+   args = cli()
+   spec = { "length" : args.length, "inputs" : args.inputs, "rng" : args.rng,
+            "adder" : args.adder, "rep" : args.rep }
+   try:
+      configs = characterization.expand( spec )
+   except ValueError as e:
+      print( "ERROR: {}".format( e ) )
+      exit()
+
+   print( "Characterizing {} configurations, {} trials each, on {} processes...".format(
+          len( configs ), args.trials, args.jobs ) )
+   results = characterization.run( configs, trials=args.trials, jobs=args.jobs, seed=args.seed )
+   print( characterization.format_table( results ) )
+
+   if args.target is not None:
+      print( "" )
+      print( "Shortest stream length with {} <= {}:".format( args.metric, args.target ) )
+      for (inputs, rng, adder, rep, length) in characterization.shortest_lengths(
+            results, args.target, args.metric ):
+         print( "   N={} {} {} {}: {}".format( inputs, adder, rng, rep,
+                                               "none" if length is None else length ) )
+   if args.out is not None:
+      atomic_write( args.out, json.dumps( { "seed" : args.seed, "trials" : args.trials,
+                                            "results" : results },
+                                          sort_keys=True, indent=1 ) + "\n" )
@@ -1,12 +1,27 @@
 # Copyright (c) Gyorgy Wyatt Muntean 2017
-# This python module serves as the only executable module in the repo.
+# This python module serves as the main executable module in the repo.
 # This is the top-level script which writes all verilog modules, testbenches,
-# noise sources, and wrappers. 
+# noise sources, and wrappers. sweep.py runs it over a grid of configurations.
 # See the README for a detailed description of runtime arguments and flags.
 
 import argparse
+from common import DOT_PROD, MATRIX, MATRIX_IP, STREAM_CHUNK, SYSTOLIC, atomic_write
+import cProfile
+import estimate
+import gen_cache
+import json
+import mif
+import numpy as np
 import os
+import performance
+import profiling
+import pstats
+import sc_dot_product_gen
+import sc_matrix_ip_gen
 import sc_matrix_mult_gen
+import sc_systolic_gen
+import scheduler
+import simulator
 import tb_gen
 import sim_gen
 
@@ -48,6 +63,30 @@ def cli():
       default=32, help='Length of the stochacstic numbers'
    )
    """
+   parser.add_argument(
+      '-engines', dest='engines', action='store', type=int, required=False,
+      default=None, help='Dot product engines of a folded matrix multiply, default M*O (unfolded)'
+   )
+   parser.add_argument(
+      '-systolic', dest='systolic', action='store', type=str2bool, nargs='?', required=False,
+      const=True, default=False, help='Generates a weight-stationary systolic array instead'
+   )
+   parser.add_argument(
+      '-ip', dest='ip', action='store', type=str2bool, nargs='?', required=False,
+      const=True, default=False, help='Generates the matrix multiply IP with binary inputs and outputs'
+   )
+   parser.add_argument(
+      '-lanes', dest='lanes', action='store', type=int, required=False,
+      default=None, help='Generates a dot product of -is inputs with k lanes instead'
+   )
+   parser.add_argument(
+      '-precision', dest='precision', action='store', type=int, required=False,
+      default=sc_matrix_ip_gen.IP_PRECISION, help='Bit width of the inputs and weights of the IP'
+   )
+   parser.add_argument(
+      '-window', dest='window', action='store', type=int, required=False,
+      default=None, help='Cycles per output matrix of the IP, default 2^precision'
+   )
    parser.add_argument(
       '-rep', dest='rep', action='store', type=str, required=False,
       default='uni', help='Type of stochastic representation, options are Uni or Bi'
@@ -56,10 +95,59 @@ def cli():
       '-alaghi', dest='alaghi', action='store', type=str2bool, nargs='?', required=False,
       default=False, help='Switches to alaghi adders instead of conventional sc adders'
    )
+   parser.add_argument(
+      '-datafmt', dest='datafmt', action='store', type=str, required=False,
+      default='bin', help='Format of the testbench data files, options are bin, hex or raw'
+   )
+   parser.add_argument(
+      '-testlen', dest='test_length', action='store', type=int, required=False,
+      default=100, help='Number of cycles of testbench data'
+   )
+   parser.add_argument(
+      '-chunk', dest='chunk_size', action='store', type=int, required=False,
+      default=STREAM_CHUNK, help='Number of cycles of testbench data generated at a time'
+   )
+   parser.add_argument(
+      '-seed', dest='seed', action='store', type=int, required=False,
+      default=None, help='Seed for deterministic output, the same seed always writes the same files'
+   )
+   parser.add_argument(
+      '-cache', dest='cache_dir', action='store', type=str, required=False,
+      default=None, help='Directory of the generation cache, requires -seed'
+   )
+   parser.add_argument(
+      '-cachesize', dest='cache_size', action='store', type=int, required=False,
+      default=gen_cache.DEFAULT_MAX_BYTES // (1024 * 1024), help='Size limit of the generation cache in MB'
+   )
+   parser.add_argument(
+      '-j', dest='jobs', action='store', type=int, required=False,
+      default=1, help='Number of processes generating modules and testbench data in parallel'
+   )
    parser.add_argument(
       '-test', dest='test', action='store', type=str2bool, nargs='?', required=False,
       default=True, help='Selects optional test bench generation'
    )
+   parser.add_argument(
+      '-estimate', dest='estimate', action='store', type=str2bool, nargs='?', required=False,
+      const=True, default=True, help='Writes the area and logic depth estimate of the design as JSON'
+   )
+   parser.add_argument(
+      '-clock', dest='clock', action='store', type=float, required=False,
+      default=performance.DEFAULT_CLOCK, help='Clock frequency in MHz of the performance manifest'
+   )
+   parser.add_argument(
+      '-simulate', dest='simulate', action='store', type=str2bool, nargs='?', required=False,
+      const=True, default=False, help='Runs the matrix multiply testbench on the python simulator'
+   )
+   parser.add_argument(
+      '-profile', '--profile', dest='profile', action='store', type=str, nargs='?',
+      required=False, const='profile', default=None,
+      help='Profiles the generation stages into a directory, default profile'
+   )
+   parser.add_argument(
+      '-cprofile', dest='cprofile', action='store', type=str2bool, nargs='?', required=False,
+      const=True, default=False, help='Adds cProfile statistics to -profile'
+   )
    parser.add_argument(
       '-sim', dest='sim', action='store', type=str2bool, nargs='?', required=False,
       default=True, help='Selects optional simulation bench generation' 
@@ -67,11 +155,63 @@ def cli():
    args = parser.parse_args()
    args.rep = str.lower( args.rep )
    rep_options = ["uni", "bi"]  # types of supported stochastic representations
+   args.datafmt = str.lower( args.datafmt )
 
    # Argument validation
    if ( args.rep not in rep_options ):
       print( "Usage: -p [uni|bi]" )
       exit()
+   if ( args.datafmt not in mif.FORMATS ):
+      print( "Usage: -datafmt [bin|hex|raw]" )
+      exit()
+   if ( args.test_length < 1 ):
+      print( "Usage: -testlen N, N > 0" )
+      exit()
+   if ( args.chunk_size < 1 ):
+      print( "Usage: -chunk N, N > 0" )
+      exit()
+   if ( args.cache_dir is not None and args.seed is None ):
+      print( "Usage: -cache DIR requires -seed N" )
+      exit()
+   if ( args.jobs < 1 ):
+      print( "Usage: -j N, N > 0" )
+      exit()
+   if ( args.engines is not None
+        and not 0 < args.engines <= args.batch_size * args.output_size ):
+      print( "Usage: -engines P, 0 < P <= M*O" )
+      exit()
+   if ( args.systolic and (args.alaghi or args.engines is not None) ):
+      print( "Usage: -systolic uses the mux adder, without -alaghi or -engines" )
+      exit()
+   if ( args.ip and (args.systolic or args.engines is not None) ):
+      print( "Usage: -ip is not supported with -systolic or -engines" )
+      exit()
+   if ( args.lanes is not None and args.lanes < 1 ):
+      print( "Usage: -lanes K, K > 0" )
+      exit()
+   if ( args.lanes is not None
+        and (args.systolic or args.ip or args.engines is not None or args.simulate) ):
+      print( "Usage: -lanes is not supported with -systolic, -ip, -engines or -simulate" )
+      exit()
+   if ( args.lanes is not None and args.test_length % args.lanes != 0 ):
+      print( "Usage: -lanes K requires -testlen N, N a multiple of K" )
+      exit()
+   if ( args.ip ):
+      try:
+         sc_matrix_ip_gen.ip_window( args.batch_size, args.input_size, args.output_size,
+                                     args.precision, args.window, args.alaghi )
+      except ValueError as e:
+         print( "ERROR: {}".format( e ) )
+         exit()
+   if ( args.clock <= 0 ):
+      print( "Usage: -clock MHz, MHz > 0" )
+      exit()
+   if ( args.cache_size < 0 ):
+      print( "Usage: -cachesize MB, MB >= 0" )
+      exit()
+   if ( args.cprofile and args.profile is None ):
+      print( "Usage: -cprofile requires -profile" )
+      exit()
    if ( args.rep is "bi" ):
       raise NotImplementedError, "[Error] Bipolar representation is not fully supported"
    if ( args.dest_dir is "gen" ):
@@ -92,18 +232,279 @@ def str2bool(v):
     else:
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
+# Writes the area and logic depth estimate of the matrix multiply, the
+# systolic array, the IP or the dot product of -lanes, next to it.
+def write_estimate( args ):
+   if args.lanes is not None:
+      design = sc_dot_product_gen.build_design( args.input_size, args.rep, args.alaghi,
+                                                args.lanes )
+   elif args.ip:
+      design = sc_matrix_ip_gen.build_design( args.batch_size, args.input_size, args.output_size,
+                                              args.precision, args.window, args.alaghi )
+   elif args.systolic:
+      design = sc_systolic_gen.build_design( args.input_size, args.output_size )
+   else:
+      design = sc_matrix_mult_gen.build_design( args.batch_size, args.input_size,
+                                                args.output_size, args.alaghi, args.engines,
+                                                args.test_length )
+   estimate.write_estimate( os.path.join( args.dest_dir, design.top + estimate.SUFFIX ), design )
+
+# Writes the performance manifest of the matrix multiply, the systolic array,
+# the IP or the dot product of -lanes, next to it.
+def write_performance( args ):
+   if args.lanes is not None:
+      manifest = performance.dot_product( args.input_size, args.alaghi, args.test_length,
+                                          args.clock, args.lanes )
+   elif args.ip:
+      manifest = performance.matrix_ip( args.batch_size, args.input_size, args.output_size,
+                                        args.precision, args.window, args.alaghi, args.clock )
+   elif args.systolic:
+      manifest = performance.systolic_array( args.batch_size, args.input_size, args.output_size,
+                                             args.test_length, args.clock )
+   else:
+      manifest = performance.matrix_mult( args.batch_size, args.input_size, args.output_size,
+                                          args.alaghi, args.test_length, args.clock,
+                                          args.engines )
+   if args.lanes is not None:
+      name = DOT_PROD
+   else:
+      name = MATRIX_IP if args.ip else SYSTOLIC if args.systolic else MATRIX
+   performance.write_performance( os.path.join( args.dest_dir, name + performance.SUFFIX ),
+                                  manifest )
+
+# Runs the matrix multiply testbench on the python simulator and exits with
+# an error when a result does not match the golden model. In deterministic
+# mode the test data is the data written for the verilog testbench.
+def simulate( args ):
+   print( "Simulating..." )
+   (errors, checked) = simulator.self_test()
+   if errors > 0:
+      print( "Simulator self test failure: {} error(s) in {} cycles.".format( errors, checked ) )
+      exit( 1 )
+   if args.ip:
+      gen_cache.seed_random( gen_cache.call_key( sc_matrix_ip_gen.generate,
+                                                 batch=args.batch_size,
+                                                 input_features=args.input_size,
+                                                 output_features=args.output_size,
+                                                 precision=args.precision,
+                                                 window=args.window,
+                                                 alaghi=args.alaghi,
+                                                 test=args.test,
+                                                 matrices=sc_matrix_ip_gen.IP_TEST_MATRICES,
+                                                 datafmt=args.datafmt,
+                                                 chunk=args.chunk_size ) )
+      (errors, checked) = sc_matrix_ip_gen.simulate_test( args.batch_size,
+                                                          args.input_size,
+                                                          args.output_size,
+                                                          args.precision,
+                                                          args.window,
+                                                          args.alaghi,
+                                                          chunk=args.chunk_size )
+      _report( errors, checked )
+      return
+   if args.systolic:
+      gen_cache.seed_random( gen_cache.call_key( sc_systolic_gen.generate,
+                                                 input_features=args.input_size,
+                                                 output_features=args.output_size,
+                                                 test=args.test,
+                                                 batch=args.batch_size,
+                                                 datafmt=args.datafmt,
+                                                 length=args.test_length,
+                                                 chunk=args.chunk_size ) )
+      (errors, checked) = sc_systolic_gen.simulate_test( args.batch_size,
+                                                         args.input_size,
+                                                         args.output_size,
+                                                         length=args.test_length,
+                                                         chunk=args.chunk_size )
+      _report( errors, checked )
+      return
+   gen_cache.seed_random( gen_cache.call_key( sc_matrix_mult_gen.generate,
+                                              batch=args.batch_size,
+                                              input_features=args.input_size,
+                                              output_features=args.output_size,
+                                              alaghi=args.alaghi,
+                                              test=args.test,
+                                              datafmt=args.datafmt,
+                                              length=args.test_length,
+                                              chunk=args.chunk_size,
+                                              engines=args.engines ) )
+   (errors, checked) = sc_matrix_mult_gen.simulate_test( args.batch_size,
+                                                         args.input_size,
+                                                         args.output_size,
+                                                         args.alaghi,
+                                                         length=args.test_length,
+                                                         chunk=args.chunk_size,
+                                                         engines=args.engines )
+   _report( errors, checked )
+
+# Helper function to report the results of simulate, exits with an error on
+# a mismatch.
+def _report( errors, checked ):
+   if errors > 0:
+      print( "Validation failure: {} error(s) in {} results.".format( errors, checked ) )
+      exit( 1 )
+   print( "Validation successful, {} results.".format( checked ) )
+
+# Generates the design and everything asked for by the arguments.
+def run( args ):
+   if args.jobs > 1:
+      # plan every module, testbench and the simulation as tasks and run them
+      # on a pool of processes
+      print( "Generating Modules on {} processes...".format( args.jobs ) )
+      sched = scheduler.Scheduler( args.jobs )
+      with profiling.span( "plan" ):
+         if args.lanes is not None:
+            sc_dot_product_gen.plan( sched,
+                                     args.input_size,
+                                     args.rep,
+                                     args.alaghi,
+                                     test=args.test,
+                                     datafmt=args.datafmt,
+                                     length=args.test_length,
+                                     chunk=args.chunk_size,
+                                     lanes=args.lanes )
+         elif args.ip:
+            sc_matrix_ip_gen.plan( sched,
+                                   args.batch_size,
+                                   args.input_size,
+                                   args.output_size,
+                                   args.precision,
+                                   args.window,
+                                   args.alaghi,
+                                   test=args.test,
+                                   datafmt=args.datafmt,
+                                   chunk=args.chunk_size )
+         elif args.systolic:
+            sc_systolic_gen.plan( sched,
+                                  args.input_size,
+                                  args.output_size,
+                                  test=args.test,
+                                  batch=args.batch_size,
+                                  datafmt=args.datafmt,
+                                  length=args.test_length,
+                                  chunk=args.chunk_size )
+         else:
+            sc_matrix_mult_gen.plan( sched,
+                                    args.batch_size,
+                                    args.input_size,
+                                    args.output_size,
+                                    args.alaghi,
+                                    test=args.test,
+                                    datafmt=args.datafmt,
+                                    length=args.test_length,
+                                    chunk=args.chunk_size,
+                                    engines=args.engines )
+         if args.sim and not args.ip and args.lanes is None:
+            sched.add( "sim", sim_gen.generate )
+      with profiling.span( "schedule" ):
+         sched.run( args.dest_dir )
+      print( "done!" )
+      if gen_cache.get_cache() is not None:
+         print( "cache: {} hits, {} misses".format( sched.hits, sched.misses ) )
+   else:
+      print( "Generating Modules..." )
+      if args.lanes is not None:
+         sc_dot_product_gen.generate( args.dest_dir,
+                                      args.input_size,
+                                      args.rep,
+                                      args.alaghi,
+                                      test=args.test,
+                                      datafmt=args.datafmt,
+                                      length=args.test_length,
+                                      chunk=args.chunk_size,
+                                      lanes=args.lanes )
+      elif args.ip:
+         sc_matrix_ip_gen.generate( args.dest_dir,
+                                    args.batch_size,
+                                    args.input_size,
+                                    args.output_size,
+                                    args.precision,
+                                    args.window,
+                                    args.alaghi,
+                                    test=args.test,
+                                    datafmt=args.datafmt,
+                                    chunk=args.chunk_size )
+      elif args.systolic:
+         sc_systolic_gen.generate( args.dest_dir,
+                                   args.input_size,
+                                   args.output_size,
+                                   test=args.test,
+                                   batch=args.batch_size,
+                                   datafmt=args.datafmt,
+                                   length=args.test_length,
+                                   chunk=args.chunk_size )
+      else:
+         sc_matrix_mult_gen.generate( args.dest_dir,
+                                     args.batch_size,
+                                     args.input_size,
+                                     args.output_size,
+                                     args.alaghi,
+                                     test=args.test,
+                                     datafmt=args.datafmt,
+                                     length=args.test_length,
+                                     chunk=args.chunk_size,
+                                     engines=args.engines )
+      print( "done!" )
+      if args.sim and not args.ip and args.lanes is None:
+         # the simulation bench writes its own lfsr, counter and sng, and a
+         # serial sc_dot_product which would replace the one of -lanes
+         print( "Generating Simulation..." )
+         with profiling.span( "sim" ):
+            sim_gen.generate( args.dest_dir )
+      cache = gen_cache.get_cache()
+      if cache is not None:
+         print( "cache: {} hits, {} misses".format( cache.hits, cache.misses ) )
+
+   with profiling.span( "performance" ):
+      write_performance( args )
+   if args.estimate:
+      with profiling.span( "estimate" ):
+         write_estimate( args )
+   if args.simulate:
+      with profiling.span( "simulate" ):
+         simulate( args )
+
+# Runs run with the stage profiler on, see python/profiling.py, and writes
+# into the -profile directory:
+#  stages.json, the time, bytes written and peak memory of every stage
+#  trace.json, every span as a chrome trace (chrome://tracing or perfetto)
+#  generate.prof, cprofile.txt, the cProfile statistics of this process with
+#     -cprofile, the raw statistics and the functions of the most time
+def profile( args ):
+   if not os.path.isdir( args.profile ):
+      os.makedirs( args.profile )
+   profiler = profiling.Profiler()
+   profiling.set_profiler( profiler )
+   stats = cProfile.Profile() if args.cprofile else None
+   if stats is not None:
+      stats.enable()
+   try:
+      with profiling.span( "generate" ):
+         run( args )
+   finally:
+      if stats is not None:
+         stats.disable()
+         stats.dump_stats( os.path.join( args.profile, "generate.prof" ) )
+         with open( os.path.join( args.profile, "cprofile.txt" ), 'w' ) as f:
+            pstats.Stats( stats, stream=f ).sort_stats( "cumulative" ).print_stats( 50 )
+      profiling.set_profiler( None )
+      summary = profiling.summarize( profiler.events )
+      atomic_write( os.path.join( args.profile, "stages.json" ),
+                    json.dumps( summary, sort_keys=True, indent=1 ) + "\n" )
+      atomic_write( os.path.join( args.profile, "trace.json" ),
+                    json.dumps( profiling.chrome_trace( profiler.events ) ) + "\n" )
+      print( profiling.format_table( summary ) )
+      print( "Profile written to {}".format( args.profile ) )
+
 # Script entry point function
 if __name__ == '__main__':
    args = cli()
-   print( "Generating Modules..." )
-   sc_matrix_mult_gen.generate( args.dest_dir, 
-                                args.batch_size, 
-                                args.input_size, 
-                                args.output_size, 
-                                args.alaghi,
-                                test=args.test )
-   print( "done!" )
-   if args.sim:
-      print( "Generating Simulation..." )
-      sim_gen.generate( args.dest_dir )
-   
+   if args.seed is not None:
+      np.random.seed( args.seed )
+      gen_cache.set_seed( args.seed )
+   if args.cache_dir is not None:
+      gen_cache.set_cache( gen_cache.GenCache( args.cache_dir, args.cache_size * 1024 * 1024 ) )
+   if args.profile is None:
+      run( args )
+   else:
+      profile( args )
@@ -3,10 +3,14 @@
 # representing a alaghi adder tree. 
 
 from common import *
+import bitstream
+import gen_cache
+import golden_model
+import lfsr_model
+import mif
+import netlist
 import numpy as np
 import os
-from pysc.core.arithmetic import *
-from pysc.rngs.lfsr import *
 
 # alaghi adder testbench constants
 _ALAGHI_INPUT_FN = "adder_inputs.mif"
@@ -17,43 +21,82 @@ _ALAGHI_TEST_SIZE = 100
 # Opens and writes a alaghi adder tree module to a file.
 #  dest, a string, the directory to write the file
 #  n, an int, the number of inputs to the adder tree (hence nadder)
-def generate( dest, n, test = True ):
-   with open( os.path.join( dest, ALAGHI_NADDER + ".v" ), 'w' ) as f:
+#  datafmt, a string, the format of the testbench data files (bin, hex or raw)
+#  length, an int, the number of cycles of testbench data
+#  chunk, an int, the number of cycles of testbench data generated at once
+#  lanes, an int, the stream bits added per cycle, see build_alaghi_nadder_module,
+#     length is then the bits of every stream, a multiple of lanes
+@gen_cache.cached
+def generate( dest, n, test = True, datafmt = "bin", length = _ALAGHI_TEST_SIZE,
+              chunk = STREAM_CHUNK, lanes = 1 ):
+   check_lanes( length, lanes )
+   generate_module( dest, n, lanes )
+   if test:
+      generate_test( dest, n, datafmt, length, chunk, lanes )
+
+# Adds the tasks of generate to a scheduler.Scheduler and returns the name of
+# the task writing the module. See generate for the parameters.
+def plan( sched, n, test = True, datafmt = "bin", length = _ALAGHI_TEST_SIZE,
+          chunk = STREAM_CHUNK, lanes = 1 ):
+   check_lanes( length, lanes )
+   key = gen_cache.call_key( generate, n=n, test=test, datafmt=datafmt, length=length,
+                             chunk=chunk, lanes=lanes )
+   module = sched.add( ALAGHI_NADDER, generate_module, (n, lanes) )
+   if test:
+      sched.add( ALAGHI_NADDER + "_tb", generate_test, (n, datafmt, length, chunk, lanes),
+                 deps=[module], seed_key=key )
+   return module
+
+# Writes the alaghi adder tree module into dest, and with several lanes the
+# alaghi adder of several lanes it is built of.
+def generate_module( dest, n, lanes = 1 ):
+   if lanes > 1:
+      with open_verilog( os.path.join( dest, ALAGHI_LANES + ".v" ) ) as f:
+         write_header_alaghi_lanes( f )
+         netlist.write_module( f, build_alaghi_lanes_module( ALAGHI_LANES, lanes ) )
+   with open_verilog( os.path.join( dest, ALAGHI_NADDER + ".v" ) ) as f:
       write_header_alaghi_nadder( f )
-      write_alaghi_nadder_module( f, ALAGHI_NADDER, n )
+      write_alaghi_nadder_module( f, ALAGHI_NADDER, n, lanes )
 
-   if test:
-      (tb, data) = makeTestDir( dest )
-      tb_name = ALAGHI_NADDER + "_tb"
+# Writes the alaghi adder tree testbench and its data into dest.
+def generate_test( dest, n, datafmt = "bin", length = _ALAGHI_TEST_SIZE, chunk = STREAM_CHUNK,
+                   lanes = 1 ):
+   (tb, data) = makeTestDir( dest )
+   tb_name = ALAGHI_NADDER + "_tb"
 
-      # write the alaghi adder testbench module
-      gen_alaghi_data( data, n, _ALAGHI_TEST_SIZE )
-      with open( os.path.join( tb, tb_name + ".v" ), 'w' ) as f:
-         # write the header comment
-         write_alaghi_nadder_tb_header( f )
-         write_alaghi_nadder_tb( f, tb_name, n )
+   # write the alaghi adder testbench module
+   gen_alaghi_data( data, n, length, datafmt=datafmt, chunk=chunk, lanes=lanes )
+   with open_verilog( os.path.join( tb, tb_name + ".v" ) ) as f:
+      # write the header comment
+      write_alaghi_nadder_tb_header( f )
+      write_alaghi_nadder_tb( f, tb_name, n, datafmt=datafmt, length=length, lanes=lanes )
 
 # Writes an alaghi n-input adder module.
 # Parameters:
 #  f, the file to write to
 #  module_name, a string for the module name
 #  n, an integer, specifies the number of inputs
-def write_alaghi_nadder_module( f, module_name, n ):
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "clk,", 1 )
-   write_line( f, "rst,", 1 )
-   write_line( f, "inpts,", 1 )
-   write_line( f, "out", 1 )
-   write_line( f, ");" )
-   write_line( f, "" )
-   write_line( f, "input clk;", 1 )
-   write_line( f, "input rst;", 1 )
-   write_line( f, "input [" + str(n-1) + ":0] inpts;", 1 )
-   write_line( f, "output out;", 1 )
-   write_line( f, "" )
+#  lanes, an int, k, the stream bits added per cycle
+def write_alaghi_nadder_module( f, module_name, n, lanes = 1 ):
+   netlist.write_module( f, build_alaghi_nadder_module( module_name, n, lanes ) )
+
+# Builds the netlist of an alaghi n-input adder module.
+# With k lanes every input carries k consecutive bits of its stream, lane j of
+# input i in inpts[j*n + i], and the tree is built of alaghi_adder_lanes, so
+# every wire and register of the tree is k bits wide and out[j] is lane j.
+# Parameters:
+#  module_name, a string for the module name
+#  n, an integer, specifies the number of inputs
+#  lanes, an int, k, the stream bits added per cycle
+def build_alaghi_nadder_module( module_name, n, lanes = 1 ):
+   m = netlist.Module( module_name )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   m.add_input( "inpts", lanes * n )
+   out = m.add_output( "out", lanes_width( lanes ) )
 
    # Arrays are for storing the wires, registers, and alaghi adder module
-   # information needed. The contents of the arrays are used to write the verilog
+   # information needed. The contents of the arrays are used to build the
    # module after determining the structure of the adder tree.
    wire_strs = []
    sum_reg_strs = []
@@ -62,7 +105,11 @@ def write_alaghi_nadder_module( f, module_name, n ):
    # initialize the first layer of input names
    input_names = []
    for i in range(n):
-      input_names.append( "inpts[" + str(i) + "]" )
+      if lanes == 1:
+         input_names.append( netlist.Ref( "inpts", i ) )
+      else:
+         input_names.append( netlist.Op( "concat", *[netlist.Ref( "inpts", j*n + i )
+                                                     for j in reversed( range(lanes) )] ) )
 
    # call the helper routine and generate each layer of alaghi adders
    layer_num = 1
@@ -78,55 +125,81 @@ def write_alaghi_nadder_module( f, module_name, n ):
       alaghi_modules.extend( alaghi_tuples )
 
       # update next layer inputs
-      input_names = sum_regs
+      input_names = [netlist.Ref( r ) for r in sum_regs]
       n = len(sum_regs)
       layer_num += 1
 
-   # Write all the wires, registers and adders to the file
-   write_line( f, "// Wires for this tree. The first number specifies the level of the tree.", 1 )
-   write_line( f, "// The second number is the 'name' (or index) of the wire within the level it resides.", 1 )
-
-   # write all wire declarations
    for i in range(len(wire_strs)):
-      write_line( f, "wire " + wire_strs[i] + ";", 1 )
-
-   write_line( f, "" )
-   write_line( f, "// Registers for each level of output.", 1 )
+      comment = None
+      if i == 0:
+         comment = "Wires for this tree. The first number specifies the level of the tree.\n" \
+                   "The second number is the 'name' (or index) of the wire within the level " \
+                   "it resides."
+      m.add_wire( wire_strs[i], lanes_width( lanes ), comment )
 
-   # write all register declarations
    for i in range(len(sum_reg_strs)):
-      write_line( f, "reg " + sum_reg_strs[i] + ";", 1 )
+      comment = "Registers for each level of output." if i == 0 else None
+      m.add_register( sum_reg_strs[i], lanes_width( lanes ),
+                      [(None, netlist.Ref( wire_strs[i] ))], comment=comment )
 
-   write_line( f, "" )
-   write_line( f, "// Write register assignments", 1 )
-   write_line( f, "always @(posedge clk) begin", 1 )
-
-   # write wire->register assignments
-   for i in range(len(wire_strs)):
-      write_line( f, sum_reg_strs[i] + " <= " + wire_strs[i] + ";", 2 )
-
-   write_line( f, "end", 1 )
-   write_line( f, "" )
-
-   # write adder modules
+   adder = "alaghi_adder" if lanes == 1 else ALAGHI_LANES
    for i in range(len(alaghi_modules)):
-      (in1, in2, out) = alaghi_modules[i]
-      write_line( f, "alaghi_adder ADDER" + str(i) + "(.clk(clk), .rst(rst), " \
-                     + ".x(" + in1 + "), .y(" + in2 + "), " \
-                     + ".out(" + out + "));", 1 )
+      (in1, in2, wire) = alaghi_modules[i]
+      m.add_instance( adder, "ADDER" + str(i),
+                      [("clk", netlist.Ref( "clk" )), ("rst", netlist.Ref( "rst" )),
+                       ("x", in1), ("y", in2), ("out", netlist.Ref( wire ))],
+                      comment="adder modules" if i == 0 else None )
 
    last_out = len(sum_reg_strs) - 1
-   write_line( f, "" )
-   write_line( f, "assign out = " + sum_reg_strs[last_out] + ";", 1 )
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+   m.assign( out, netlist.Ref( sum_reg_strs[last_out] ) )
+   return m
+
+# Returns the netlist.Design of an alaghi n-input adder, for simulation.
+def build_design( n, lanes = 1 ):
+   modules = []
+   if lanes > 1:
+      modules.append( build_alaghi_lanes_module( ALAGHI_LANES, lanes ) )
+   return netlist.Design( build_alaghi_nadder_module( ALAGHI_NADDER, n, lanes ), modules )
+
+# Builds the netlist of an alaghi adder of k lanes, the alaghi_adder of srcs
+# taking k consecutive bits of x and y every cycle. The serial adder toggles
+# its flip-flop on every bit where x and y differ, so the flip-flop entering
+# lane j is the one of the cycle xor the differing lanes before j, and the
+# flip-flop of the next cycle is the one leaving lane k-1.
+# Parameters:
+#  module_name, a string for the module name
+#  lanes, an int, k
+def build_alaghi_lanes_module( module_name, lanes ):
+   m = netlist.Module( module_name )
+   m.add_param( "reset_seed", 0 )
+   lanes = m.add_param( "LANES", lanes )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   x = m.add_input( "x", lanes )
+   y = m.add_input( "y", lanes )
+   m.add_output( "out", lanes )
+
+   xor_input = m.add_wire( "xor_input", lanes )
+   m.assign( xor_input, netlist.Op( "xor", x, y ) )
+   tff = netlist.Ref( "tff" )
+   m.add_wire( "state", lanes, comment="the flip-flop entering every lane" )
+   for j in range(lanes):
+      toggles = [netlist.Ref( "xor_input", i ) for i in range(j)]
+      m.assign( netlist.Ref( "state", j ), netlist.xor_all( [tff] + toggles ) )
+      m.assign( netlist.Ref( "out", j ), netlist.Op( "mux", netlist.Ref( "xor_input", j ),
+                                                     netlist.Ref( "state", j ),
+                                                     netlist.Ref( "y", j ) ) )
+   seed = netlist.Ref( "reset_seed" )
+   last = netlist.Op( "xor", netlist.Ref( "state", lanes-1 ), netlist.Ref( "xor_input", lanes-1 ) )
+   m.add_register( "tff", None, [(netlist.is_high( "rst" ), seed), (None, last)], init=seed )
+   return m
 
 # Helper function to compute the wire, registers, and adders for a layer of
 # the adder tree.
 #
 # n, an int for the number of inputs to this layer
 # layer_num, an int specifying the layer number (used for naming)
-# input_names, the verilog names of the inputs to this layer
+# input_names, the netlist expressions of the inputs to this layer
 #
 # Returns a list of wires, registers, and adder modules through
 # the return parameters: wires, sum_regs, and alaghi_tuples.
@@ -163,41 +236,59 @@ def compute_layer( n, layer_num, input_names, wires, sum_regs, alaghi_tuples):
       wires.append(wire_str)
       reg_str = "sumreg_" + str(layer_num) + "_0const"
       sum_regs.append(reg_str)
-      alaghi_tup = (input_names[last_index], str(0), wire_str)
+      alaghi_tup = (input_names[last_index], netlist.Const( 0 ), wire_str)
       alaghi_tuples.append( alaghi_tup )
 
 # Writes the test bench for the alaghi n-adder module.
 # 	f, the file to write to
 #  module_name, the name of the testbench
 #	n, the number of inputs to the nadder dut
-def write_alaghi_nadder_tb( f, module_name, n ):
+#  datafmt, a string, the format of the data files to load (bin, hex or raw)
+#  length, an int, the number of cycles of test data
+#  lanes, an int, the lanes of the adder, length is then the bits of every
+#     stream and the test takes length/lanes cycles
+def write_alaghi_nadder_tb( f, module_name, n, datafmt="bin", length=_ALAGHI_TEST_SIZE,
+                            lanes=1 ):
    delay = int(clogb2( n )) - 1 
+   length = length // lanes
+   test_width = max( clogb2( length ), 1 )
+   delay_width = max( clogb2( n ), 1 )
+   streams = "INPUT_STREAMS" if lanes == 1 else "LANES*INPUT_STREAMS"
 
    write_line( f, "`timescale 1ns / 10ps" )
    write_line( f, "" )
    write_line( f, "module " + module_name + "();" )
    write_line( f, "parameter INPUT_STREAMS = " + str(n) + ";", 1 ) 
    write_line( f, "parameter DELAY =         " + str(delay) + ";", 1 ) 
-   write_line( f, "parameter INPUTS =        \"" + _ALAGHI_INPUT_FN + "\";", 1 ) 
-   write_line( f, "parameter ADDER_RESULT =  \"" + _ALAGHI_RES_FN + "\";", 1 ) 
-   write_line( f, "parameter TEST_LENGTH =   " + str(_ALAGHI_TEST_SIZE) + ";", 1 ) 
+   write_line( f, "parameter INPUTS =        \"" + mif.file_name( _ALAGHI_INPUT_FN, datafmt ) + "\";", 1 ) 
+   write_line( f, "parameter ADDER_RESULT =  \"" + mif.file_name( _ALAGHI_RES_FN, datafmt ) + "\";", 1 ) 
+   write_line( f, "parameter TEST_LENGTH =   " + str(length) + ";", 1 ) 
+   if lanes > 1:
+      write_line( f, "parameter LANES =         " + str(lanes) + ";", 1 )
    write_line( f, "" )
    write_line( f, "// modules inputs and outputs", 1 ) 
    write_line( f, "reg                      clk;", 1 ) 
    write_line( f, "reg                      rst;", 1 ) 
-   write_line( f, "wire [INPUT_STREAMS-1:0] inpts;", 1 ) 
-   write_line( f, "wire                     out;", 1 ) 
+   write_line( f, "wire [" + streams + "-1:0] inpts;", 1 ) 
+   if lanes > 1:
+      write_line( f, "wire [LANES-1:0]         out;", 1 )
+   else:
+      write_line( f, "wire                     out;", 1 ) 
    write_line( f, "" )
    write_line( f, "// read input data and expected results data", 1 ) 
-   write_line( f, "reg [INPUT_STREAMS-1:0] test_inputs [TEST_LENGTH-1:0];", 1 ) 
-   write_line( f, "reg expected_results [TEST_LENGTH-1:0];", 1 ) 
+   write_line( f, "reg [" + streams + "-1:0] test_inputs [TEST_LENGTH-1:0];", 1 ) 
+   if lanes > 1:
+      write_line( f, "reg [LANES-1:0] expected_results [TEST_LENGTH-1:0];", 1 )
+   else:
+      write_line( f, "reg expected_results [TEST_LENGTH-1:0];", 1 ) 
+   mif.write_mem_load_decls( f, datafmt )
    write_line( f, "initial begin", 1 ) 
-   write_line( f, "$readmemb(INPUTS, test_inputs, 0, TEST_LENGTH-1);", 2 ) 
-   write_line( f, "$readmemb(ADDER_RESULT, expected_results, 0, TEST_LENGTH-1);", 2 ) 
+   mif.write_mem_load( f, datafmt, "INPUTS", "test_inputs", "TEST_LENGTH" )
+   mif.write_mem_load( f, datafmt, "ADDER_RESULT", "expected_results", "TEST_LENGTH" )
    write_line( f, "end", 1 ) 
    write_line( f, "" )
    write_line( f, "// Test input data assignment logic", 1 ) 
-   write_line( f, "reg [TEST_LENGTH-1:0] test_index;", 1 ) 
+   write_line( f, "reg [" + str(test_width-1) + ":0] test_index;", 1 ) 
    write_line( f, "initial test_index = 0;", 1 ) 
    write_line( f, "always @(posedge clk) begin", 1 ) 
    write_line( f, "if( rst == 1'b1 ) begin", 2 ) 
@@ -206,12 +297,14 @@ def write_alaghi_nadder_tb( f, module_name, n ):
    write_line( f, "test_index <= test_index + 1;", 3 ) 
    write_line( f, "end", 2 ) 
    write_line( f, "end", 1 ) 
-   write_line( f, "assign inpts = test_inputs[test_index];", 1 ) 
+   # hold the inputs at 0 during reset, the tree's pipeline registers have no
+   # reset and are flushed with 0s instead, which never toggle an adder
+   write_line( f, "assign inpts = (rst == 1'b1) ? 0 : test_inputs[test_index];", 1 )
    write_line( f, "" )
    write_line( f, "" )
    write_line( f, "// Output checking and error handling", 1 ) 
    write_line( f, "reg valid;", 1 ) 
-   write_line( f, "reg [TEST_LENGTH-1:0] valid_delay;", 1 ) 
+   write_line( f, "reg [" + str(delay_width-1) + ":0] valid_delay;", 1 ) 
    write_line( f, "initial valid_delay = 0;", 1 ) 
    write_line( f, "always @(posedge clk) begin", 1 ) 
    write_line( f, "if( rst ) begin", 2 ) 
@@ -257,7 +350,7 @@ def write_alaghi_nadder_tb( f, module_name, n ):
    write_line( f, "initial begin", 1 )
    write_line( f, "// initialize inputs", 2 )
    write_line( f, "rst = 1;", 2 )
-   write_line( f, "#(1*CLOCK_PERIOD);", 2 )
+   write_line( f, "#((DELAY+2)*CLOCK_PERIOD);", 2 )
    write_line( f, "" )
    write_line( f, "// start sim", 2 )
    write_line( f, "rst = 0;", 2 )
@@ -276,56 +369,36 @@ def write_alaghi_nadder_tb( f, module_name, n ):
    write_line( f, "endmodule // " + module_name )
 
 # Function to generate random input data for the alaghi adder.
+# The data and expected results are written one chunk of cycles at a time.
 # Parameters:
 #  data_dir, the directory to write the files into
 #  n, an int, the number of inputs to the adder
 #  length, an int, the length of the stochastic streams
-def gen_alaghi_data( data_dir, n, length ):
-   # generate a random vector of size n
-   inpt = np.random.randint( length, size = n )
-   rng = lfsr_sequence( length, normalize = False )
-   inputs = np.empty( (n, length), dtype = bool )
-   for d in range(n):
-      inputs[d, :] = rng < inpt[d]
-
-   # Write the input data to a file
-   with open( os.path.join( data_dir, _ALAGHI_INPUT_FN ), 'w' ) as f:
-      for stream in range(length):
-         s_str = stream_to_str( inputs[:,stream] )
-         f.write( s_str + "\n" )
-
-   # compute the result and write them to a file
-   result = alaghi_adder( inputs )
-
-   with open( os.path.join( data_dir, _ALAGHI_RES_FN ), 'w' ) as f:
-      for res in result:
-         if res:
-            res_str = "1"
-         else:
-            res_str = "0"
-         f.write( res_str + "\n" )
-
-# This function could be facoted out to the arithmetic directory in pysc.
-# Also pysc's sc_dot_product could call this function?
-def alaghi_adder( inputs ):
-   (dimensions, length) = inputs.shape
-   dims = int(2 ** clogb2(dimensions))
-   zero = np.zeros( length, dtype=bool )
-   while dims > 1:
-      x = 0
-      while x in range(dims):
-         op_a = zero if x >= dimensions else inputs[x, :]
-         op_b = zero if x+1 >= dimensions else inputs[x+1, :]
-         add_res = sc_add( op_a, op_b, select_mode = "ALAGHI" )
-         if x == 0:
-            inputs[0, :] = add_res
-         else:
-            inputs[x/2, :] = add_res
-         x = x + 2
-
-      dims = dims / 2
-
-   return inputs[0, :]
+#  datafmt, a string, the format of the data files (bin, hex or raw)
+#  chunk, an int, the number of cycles generated at once
+#  lanes, an int, the lanes of the adder, every line of the files holds
+#     lanes consecutive bits, see mif.lane_bits
+def gen_alaghi_data( data_dir, n, length, datafmt="bin", chunk=STREAM_CHUNK, lanes=1 ):
+   # generate a random vector of size n and the seed of the noise source
+   rng = lfsr_model.LfsrModel( lfsr_model.rng_width( length ) )
+   inpt = np.random.randint( 1 << rng.width, size = n )
+   seed = np.random.randint( 1 << rng.width )
+
+   input_path = os.path.join( data_dir, mif.file_name( _ALAGHI_INPUT_FN, datafmt ) )
+   res_path = os.path.join( data_dir, mif.file_name( _ALAGHI_RES_FN, datafmt ) )
+
+   model = golden_model.AlaghiTreeModel()
+   for (start, stop) in chunk_ranges( length, lane_chunk( chunk, lanes ) ):
+      append = start > 0
+
+      # Write the input data to a file
+      rngs = rng.sequence( seed, stop - start, start )
+      inputs = bitstream.from_thresholds( rngs[np.newaxis, :], inpt )
+      mif.write_streams( input_path, inputs, datafmt, append, lanes )
+
+      # compute the result and write them to a file
+      result = model.run( inputs )
+      mif.write_streams( res_path, result, datafmt, append, lanes )
 
 # Writes the header comment for the alaghi_nadder module.
 # The file written to is the parameter, f.
@@ -337,6 +410,16 @@ def write_header_alaghi_nadder( f ):
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
    write_line( f, "" )
 
+# Writes the header comment for the alaghi_adder_lanes module.
+def write_header_alaghi_lanes( f ):
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "// Create Date: " + get_time() )
+   write_line( f, "//" )
+   write_line( f, "// Description: An alaghi adder taking LANES consecutive bits of its streams every" )
+   write_line( f, "// cycle. The flip-flop of the adder passes through the lanes in order." )
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "" )
+
 # Writes the header comment for alaghi_nadder testbench to file, f.
 def write_alaghi_nadder_tb_header( f ):
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
@@ -344,22 +427,3 @@ def write_alaghi_nadder_tb_header( f ):
    write_line( f, "//" )
    write_line( f, "// Description: This module serves as a testbench for the alaghi_nadder module." )
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
-
-# Helper function
-# Takes in an array of 1's and 0's and outputs a string of
-# those 1's and 0's concatenated.
-# Characters of the stream are concatenated to the front,
-# this is because we write the stream to the data file
-# in a way that makes it easy for verilog's readmemb()
-# to read the data.
-def stream_to_str( stream, reverse = False ):
-   s_str = ""
-   for bit in stream:
-      #s_str = "1" + s_str if bit else "0" + s_str
-      if bit:
-         s_str = "1" + s_str
-      else:
-         s_str = "0" + s_str
-
-   return s_str
-
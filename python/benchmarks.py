@@ -0,0 +1,182 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains the generation benchmarks used by benchmark.py. Every
+# case times a generator, or a golden model data function, on one point of a
+# grid of sizes and test lengths and records the peak memory it took, so a
+# change can be checked against a stored baseline.
+#
+# Every case runs in a process of its own, forked from the harness, so its
+# peak resident set size (RSS) is its own and not that of the cases before
+# it. The case is repeated and the fastest wall time kept, the most stable
+# measure of a run on a busy machine. Files are written to a temporary
+# directory, removed afterwards, and the numpy random state is seeded the
+# same way for every run.
+#
+# The benchmarks are:
+#  sc_matrix_mult, sc_matrix_mult_gen.generate, M = N = O = size
+#  sc_dot_product, sc_dot_product_gen.generate, N = size
+#  alaghi_nadder, alaghi_nadder_gen.generate, n = size
+#  gen_mm_data, gen_dp_data, gen_alaghi_data, the testbench data and golden
+#     model results alone, of the same sizes
+
+import alaghi_nadder_gen
+import multiprocessing
+import numpy as np
+import platform
+import profiling
+import sc_dot_product_gen
+import sc_matrix_mult_gen
+import shutil
+import tempfile
+import timeit
+
+NAMES = ("sc_matrix_mult", "sc_dot_product", "alaghi_nadder", "gen_mm_data", "gen_dp_data",
+         "gen_alaghi_data")
+
+# default grid
+SIZES = [4, 16]
+LENGTHS = [100, 1000]
+
+# default regression thresholds, the fraction a case may grow by
+TIME_THRESHOLD = 0.2
+MEMORY_THRESHOLD = 0.1
+
+# changes of the wall time smaller than this, in seconds, are noise
+TIME_FLOOR = 0.01
+
+# Returns the list of cases of a grid, every case a dictionary of the
+# benchmark 'name', the 'size' and the test 'length', in grid order.
+# Parameters:
+#  names, a list of benchmark names, see NAMES
+#  sizes, lengths, lists of ints
+#  alaghi, a boolean, selects alaghi adders for the matrix multiply and dot
+#     product benchmarks
+def cases( names=NAMES, sizes=SIZES, lengths=LENGTHS, alaghi=False ):
+   result = []
+   for name in names:
+      if name not in NAMES:
+         raise ValueError( "Unknown benchmark: " + str(name) )
+      for size in sizes:
+         for length in lengths:
+            if size < 1 or length < 1:
+               raise ValueError( "Benchmark sizes and lengths must be positive" )
+            result.append( { "name" : name, "size" : size, "length" : length,
+                             "alaghi" : alaghi } )
+   return result
+
+# Runs the cases one after the other, every one in a process of its own.
+# Parameters:
+#  cases, a list of cases, see cases
+#  repeat, an int, the number of runs of every case
+#  seed, an int, the seed of the numpy random state of every run
+# Returns a dictionary of the machine and a list of 'results', every case
+# with its fastest wall time 'wall', the time of every run 'walls', in
+# seconds, and its peak RSS 'peak_rss_kb'.
+def run( cases, repeat=3, seed=0 ):
+   results = []
+   for case in cases:
+      queue = multiprocessing.Queue()
+      proc = multiprocessing.Process( target=_run_case, args=(case, repeat, seed, queue) )
+      proc.start()
+      (error, walls, peak) = queue.get()
+      proc.join()
+      if error is not None:
+         raise RuntimeError( "Benchmark " + case_key( case ) + " failed: " + error )
+      result = dict( case )
+      result.update( { "wall" : min( walls ), "walls" : walls, "peak_rss_kb" : peak } )
+      results.append( result )
+   return { "python" : platform.python_version(),
+            "numpy" : np.__version__,
+            "machine" : platform.machine(),
+            "repeat" : repeat,
+            "seed" : seed,
+            "results" : results }
+
+# Compares results with a baseline, both as returned by run.
+# A case regresses when its wall time grew by more than time_threshold, and
+# by more than TIME_FLOOR seconds, or its peak RSS by more than
+# memory_threshold. Cases missing from either side are skipped.
+# Returns a list of (key, metric, baseline, current, ratio) tuples, the
+# regressions, where metric is 'wall' or 'peak_rss_kb'.
+def compare( current, baseline, time_threshold=TIME_THRESHOLD,
+             memory_threshold=MEMORY_THRESHOLD ):
+   base = dict( (case_key( r ), r) for r in baseline["results"] )
+   regressions = []
+   for r in current["results"]:
+      key = case_key( r )
+      if key not in base:
+         continue
+      old = base[key]
+      if r["wall"] > old["wall"] * (1 + time_threshold) and r["wall"] - old["wall"] > TIME_FLOOR:
+         regressions.append( (key, "wall", old["wall"], r["wall"],
+                              _ratio( r["wall"], old["wall"] )) )
+      if r["peak_rss_kb"] > old["peak_rss_kb"] * (1 + memory_threshold):
+         regressions.append( (key, "peak_rss_kb", old["peak_rss_kb"], r["peak_rss_kb"],
+                              _ratio( r["peak_rss_kb"], old["peak_rss_kb"] )) )
+   return regressions
+
+# Returns the name of a case, e.g. 'sc_matrix_mult/16/1000' or
+# 'sc_dot_product/16/1000/alaghi'.
+def case_key( case ):
+   key = case["name"] + "/" + str(case["size"]) + "/" + str(case["length"])
+   if case["alaghi"] and case["name"] not in ("alaghi_nadder", "gen_alaghi_data"):
+      key += "/alaghi"
+   return key
+
+# Returns a text table of results, one line per case, with the change
+# against a baseline when one is given.
+def format_table( current, baseline=None ):
+   base = {}
+   if baseline is not None:
+      base = dict( (case_key( r ), r) for r in baseline["results"] )
+   lines = ["%-32s %10s %12s %10s %10s" % ("case", "wall (s)", "peak (KB)", "wall", "peak")]
+   for r in current["results"]:
+      key = case_key( r )
+      (dwall, dpeak) = ("", "")
+      if key in base:
+         dwall = "%+.1f%%" % (100 * (_ratio( r["wall"], base[key]["wall"] ) - 1))
+         dpeak = "%+.1f%%" % (100 * (_ratio( r["peak_rss_kb"], base[key]["peak_rss_kb"] ) - 1))
+      lines.append( "%-32s %10.4f %12d %10s %10s" % (key, r["wall"], r["peak_rss_kb"], dwall,
+                                                    dpeak) )
+   return "\n".join( lines )
+
+# Helper function
+# Runs the runs of a case in the process forked for it and puts
+# (error, walls, peak RSS in KB) on the queue.
+def _run_case( case, repeat, seed, queue ):
+   try:
+      walls = []
+      for i in range(repeat):
+         dest = tempfile.mkdtemp( prefix="sc_bench_" )
+         try:
+            np.random.seed( seed )
+            start = timeit.default_timer()
+            _call( case, dest )
+            walls.append( timeit.default_timer() - start )
+         finally:
+            shutil.rmtree( dest, ignore_errors=True )
+      queue.put( (None, walls, profiling.peak_rss_kb()) )
+   except Exception as e:
+      queue.put( (repr( e ), [], 0) )
+
+# Helper function
+# Calls the function of a case, writing into dest.
+def _call( case, dest ):
+   (name, size, length, alaghi) = (case["name"], case["size"], case["length"], case["alaghi"])
+   if name == "sc_matrix_mult":
+      sc_matrix_mult_gen.generate( dest, size, size, size, alaghi, length=length )
+   elif name == "sc_dot_product":
+      sc_dot_product_gen.generate( dest, size, alaghi=alaghi, length=length )
+   elif name == "alaghi_nadder":
+      alaghi_nadder_gen.generate( dest, size, length=length )
+   elif name == "gen_mm_data":
+      sc_matrix_mult_gen.gen_mm_data( dest, size, size, size, length, alaghi=alaghi )
+   elif name == "gen_dp_data":
+      sc_dot_product_gen.gen_dp_data( dest, size, length, alaghi=alaghi )
+   else:
+      alaghi_nadder_gen.gen_alaghi_data( dest, size, length )
+
+# Helper function
+def _ratio( a, b ):
+   if b == 0:
+      return float( "inf" ) if a > 0 else 1.0
+   return float( a ) / b
@@ -0,0 +1,192 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains a bit-packed container for arrays of stochastic streams.
+# Streams are stored 64 cycles to a uint64 word rather than one byte per cycle,
+# so they take an eighth of the memory of a bool array and every bitwise
+# operation works on 64 cycles at a time.
+#
+# Cycle t of a stream is bit (t % 64) of word (t // 64). Bits past the end of
+# the stream in the last word are always 0.
+
+import numpy as np
+import profiling
+
+WORD_BITS = 64
+
+ONES = np.uint64( 0xFFFFFFFFFFFFFFFF )
+
+# number of set bits in every byte value, used to count the ones of a stream
+_POPCOUNT = np.array( [bin(i).count('1') for i in range(256)], dtype=np.int64 )
+
+# Returns the number of words needed to hold a stream of the given length.
+def num_words( length ):
+   return (length + WORD_BITS - 1) // WORD_BITS
+
+# An array of stochastic streams of the same length.
+# The words are held in a uint64 array of shape (..., W), where (...) is the
+# shape of the array of streams and W is num_words( length ).
+class PackedStreams( object ):
+
+   # words, a uint64 array of shape (..., W)
+   # length, an int, the number of cycles in every stream
+   def __init__( self, words, length ):
+      self.words = words
+      self.length = length
+
+   @property
+   def shape( self ):
+      return self.words.shape[:-1]
+
+   # Index the array of streams, never the cycles of the streams.
+   # See time_slice for slicing along time.
+   def __getitem__( self, index ):
+      if not isinstance( index, tuple ):
+         index = (index,)
+      if any( i is Ellipsis for i in index ):
+         index = index + (slice(None),)
+      else:
+         index = index + (Ellipsis, slice(None))
+      return PackedStreams( self.words[index], self.length )
+
+   def __and__( self, other ):
+      return PackedStreams( self.words & other.words, self._check( other ) )
+
+   def __or__( self, other ):
+      return PackedStreams( self.words | other.words, self._check( other ) )
+
+   def __xor__( self, other ):
+      return PackedStreams( self.words ^ other.words, self._check( other ) )
+
+   def __invert__( self ):
+      return PackedStreams( ~self.words & tail_mask( self.length ), self.length )
+
+   # Returns the number of ones in every stream, an int array of shape (...).
+   def count( self ):
+      octets = np.ascontiguousarray( self.words.astype( '<u8' ) ).view( np.uint8 )
+      return _POPCOUNT[octets].sum( axis = -1 )
+
+   # Decodes the value of every stream.
+   # Parameters:
+   #  rep, a string, 'uni' or 'bi', the stochastic representation
+   # Returns a float array of shape (...).
+   def value( self, rep="uni" ):
+      p = self.count() / float( self.length )
+      if rep == "uni":
+         return p
+      elif rep == "bi":
+         return 2 * p - 1
+      else:
+         raise ValueError( "Unknown stochastic representation: " + str(rep) )
+
+   # Returns cycles [start, stop) of every stream as new streams.
+   def time_slice( self, start, stop ):
+      stop = min( stop, self.length )
+      start = min( start, stop )
+      length = stop - start
+      first = start // WORD_BITS
+      shift = start % WORD_BITS
+      words = num_words( length )
+      if shift == 0:
+         out = self.words[..., first:first + words].copy()
+      else:
+         # each output word is made from the top of one word and the bottom
+         # of the next, past the last word the next word is 0
+         src = self.words[..., first:first + words + 1]
+         if src.shape[-1] < words + 1:
+            pad = [(0, 0)] * src.ndim
+            pad[-1] = (0, words + 1 - src.shape[-1])
+            src = np.pad( src, pad, mode='constant' )
+         out = (src[..., :-1] >> np.uint64( shift )) | \
+               (src[..., 1:] << np.uint64( WORD_BITS - shift ))
+      out &= tail_mask( length )
+      return PackedStreams( out, length )
+
+   # Unpacks the streams into a bool array of shape (..., L).
+   def to_bools( self ):
+      octets = np.ascontiguousarray( self.words.astype( '<u8' ) ).view( np.uint8 )
+      bits = np.unpackbits( octets.reshape( self.shape + (-1, 1) ), axis = -1 )
+      # unpackbits puts the most significant bit of every byte first
+      bits = bits[..., ::-1].reshape( self.shape + (-1,) )
+      return bits[..., :self.length].astype( bool )
+
+   # Helper function
+   # Checks that other has the same length and returns the length.
+   def _check( self, other ):
+      if self.length != other.length:
+         raise ValueError( "Stream lengths differ: " + str(self.length) + " and " \
+                           + str(other.length) )
+      return self.length
+
+# Returns the mask of the valid bits of every word of a stream, a uint64
+# array of shape (W,).
+def tail_mask( length ):
+   mask = np.full( num_words( length ), ONES, dtype=np.uint64 )
+   if length % WORD_BITS:
+      mask[-1] = (np.uint64( 1 ) << np.uint64( length % WORD_BITS )) - np.uint64( 1 )
+   return mask
+
+# Packs a bool array of streams.
+# Parameters:
+#  bits, a bool array of shape (..., L)
+# Returns PackedStreams of shape (...).
+def from_bools( bits ):
+   bits = np.asarray( bits, dtype=bool )
+   length = bits.shape[-1]
+   words = num_words( length )
+   padded = np.zeros( bits.shape[:-1] + (words * WORD_BITS,), dtype=bool )
+   padded[..., :length] = bits
+   # packbits puts the first bit in the most significant position of a byte
+   octets = padded.reshape( bits.shape[:-1] + (words * 8, 8) )[..., ::-1]
+   octets = np.packbits( octets, axis = -1 ).reshape( bits.shape[:-1] + (words * 8,) )
+   packed = np.ascontiguousarray( octets ).view( '<u8' ).astype( np.uint64 )
+   return PackedStreams( packed, length )
+
+# Returns x as PackedStreams, packing it if it is a bool array.
+def pack( x ):
+   if isinstance( x, PackedStreams ):
+      return x
+   return from_bools( x )
+
+# Generates streams by comparing random numbers against binary values, the
+# way an sng does, without building a bool array of the whole streams.
+# Bit t of a stream is 1 when rng[..., t] < values.
+# Parameters:
+#  rng, an int array of shape (..., L), the random number sequences
+#  values, an int array broadcastable against rng.shape[:-1]
+# Returns PackedStreams of the broadcast shape.
+@profiling.timed( "streams" )
+def from_thresholds( rng, values ):
+   rng = np.asarray( rng, dtype=np.int64 )
+   values = np.asarray( values, dtype=np.int64 )[..., np.newaxis]
+   length = rng.shape[-1]
+   words = num_words( length )
+   if words * WORD_BITS != length:
+      # padded cycles are never below the value so they stay 0
+      pad = [(0, 0)] * rng.ndim
+      pad[-1] = (0, words * WORD_BITS - length)
+      rng = np.pad( rng, pad, mode='constant', constant_values=np.iinfo( np.int64 ).max )
+   rng = rng.reshape( rng.shape[:-1] + (words, WORD_BITS) )
+
+   shape = np.broadcast( rng[..., 0], values ).shape
+   packed = np.zeros( shape, dtype=np.uint64 )
+   for b in range(WORD_BITS):
+      packed |= (rng[..., b] < values).astype( np.uint64 ) << np.uint64( b )
+   return PackedStreams( packed, length )
+
+# Multiplexes two arrays of streams, x where sel is 0 and y where sel is 1.
+def mux( sel, x, y ):
+   return (x & ~sel) | (y & sel)
+
+# Multiplexes N streams into one using a sequence of select numbers, the
+# way an sc_nadder does.
+# Parameters:
+#  streams, PackedStreams of shape (..., N)
+#  sel_sequence, an int array of length L, the index of the stream passed on
+#     every cycle
+# Returns PackedStreams of shape (...).
+def mux_select( streams, sel_sequence ):
+   sel_sequence = np.asarray( sel_sequence )
+   n = streams.shape[-1]
+   # one select mask for every input stream
+   masks = from_bools( sel_sequence[np.newaxis, :] == np.arange( n )[:, np.newaxis] )
+   selected = streams.words & masks.words
+   return PackedStreams( np.bitwise_or.reduce( selected, axis = -2 ), streams.length )
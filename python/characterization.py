@@ -0,0 +1,217 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains the Monte Carlo accuracy characterization used by
+# characterize.py. For every configuration, a stream length, a number of
+# inputs N, a noise source, an adder and a representation, thousands of
+# random dot products are run through the golden models in vectorized
+# batches, on a pool of processes, and the error of their decoded outputs
+# against the exact scaled dot product is summarized.
+#
+# The noise sources are:
+#  lfsr, the hardware arrangement of the testbenches, one LFSR with a random
+#     seed for the data vector, one for the weight vector and one for the
+#     select stream of the mux adder
+#  random, an ideal source, an independent random number for every bit
+#
+# The adders scale the sum of the products, by 1/N for the mux adder and by
+# 1/2^clogb2(N) for the alaghi tree, which is padded to a power of 2.
+
+from common import *
+import bitstream
+import error_model
+import golden_model
+import hashlib
+import itertools
+import lfsr_model
+import multiprocessing
+import numpy as np
+import os
+
+# parameters of a configuration and their defaults
+DEFAULTS = [("length", 256), ("inputs", 16), ("rng", "lfsr"), ("adder", "mux"), ("rep", "uni")]
+
+RNGS = ("lfsr", "random")
+ADDERS = ("mux", "alaghi")
+REPS = ("uni", "bi")
+
+# percentiles of the absolute error reported for every configuration
+PERCENTILES = (50, 90, 95, 99)
+
+# number of stream bits generated at once by a batch of trials
+_BATCH_BITS = 1 << 22
+
+# Expands a spec, a dictionary whose values are lists (the grid) or single
+# values of the parameters in DEFAULTS, into a list of configurations in grid
+# order with duplicates removed.
+def expand( spec ):
+   for name in spec:
+      if name not in dict( DEFAULTS ):
+         raise ValueError( "Unknown characterization parameter: " + str(name) )
+   names = [name for (name, _) in DEFAULTS]
+   values = [_as_list( spec.get( name, default ) ) for (name, default) in DEFAULTS]
+   configs = []
+   for combo in itertools.product( *values ):
+      config = dict( zip( names, combo ) )
+      _check( config )
+      if config not in configs:
+         configs.append( config )
+   return configs
+
+# Runs the trials of every configuration and summarizes their errors.
+# Parameters:
+#  configs, a list of configurations, see expand
+#  trials, an int, the number of random dot products per configuration
+#  jobs, an int, the number of processes
+#  seed, an int or None, the same seed always gives the same results
+# Returns a list of dictionaries, every configuration with its statistics,
+# see error_stats, and the RMSE predicted by error_model, 'model_rmse'.
+def run( configs, trials=1000, jobs=1, seed=None ):
+   if seed is None:
+      seed = int(np.frombuffer( os.urandom( 4 ), dtype=np.uint32 )[0])
+   batches = []
+   for c in range(len( configs )):
+      size = batch_size( configs[c] )
+      for start in range(0, trials, size):
+         batches.append( (configs[c], c, start, min( size, trials - start ), seed) )
+
+   if jobs > 1:
+      pool = multiprocessing.Pool( jobs )
+      try:
+         errors = pool.map( _run_batch, batches, chunksize=1 )
+         pool.close()
+      except:
+         pool.terminate()
+         raise
+      finally:
+         pool.join()
+   else:
+      errors = [_run_batch( b ) for b in batches]
+
+   results = []
+   for c in range(len( configs )):
+      errs = np.concatenate( [e for (b, e) in zip( batches, errors ) if b[1] == c] )
+      result = dict( configs[c] )
+      result.update( error_stats( errs ) )
+      model = error_model.expected_error( result["inputs"], result["length"], result["adder"],
+                                          result["rep"] )
+      result["model_rmse"] = float( model["rmse"] )
+      results.append( result )
+   return results
+
+# Returns the number of trials of a configuration run at once.
+def batch_size( config ):
+   return max( 1, _BATCH_BITS // (config["inputs"] * config["length"]) )
+
+# Runs random dot products of one configuration.
+# Parameters:
+#  config, a configuration, see expand
+#  count, an int, the number of dot products
+#  rs, a numpy RandomState
+# Returns (measured, exact), float arrays of shape (count), the decoded
+# output of every dot product and the exact scaled dot product.
+def dot_products( config, count, rs ):
+   n = config["inputs"]
+   length = config["length"]
+   rep = config["rep"]
+   rng = lfsr_model.LfsrModel( lfsr_model.rng_width( length ) )
+   top = 1 << rng.width
+
+   # binary values of the inputs, and the numbers they stand for
+   data = rs.randint( top, size=(count, n) )
+   weight = rs.randint( top, size=(count, n) )
+   (x, w) = (data / float( top ), weight / float( top ))
+   if rep == "bi":
+      (x, w) = (2 * x - 1, 2 * w - 1)
+
+   if config["rng"] == "lfsr":
+      data_rngs = rng.sequence( rs.randint( top, size=count ), length )[:, np.newaxis, :]
+      weight_rngs = rng.sequence( rs.randint( top, size=count ), length )[:, np.newaxis, :]
+      sel = rng.sequence( rs.randint( top ), length ) % n
+   else:
+      data_rngs = rs.randint( top, size=(count, n, length) )
+      weight_rngs = rs.randint( top, size=(count, n, length) )
+      sel = rs.randint( n, size=length )
+   datas = bitstream.from_thresholds( data_rngs, data )
+   weights = bitstream.from_thresholds( weight_rngs, weight )
+   products = golden_model.sc_multiply( datas, weights, rep )
+
+   if config["adder"] == "alaghi":
+      out = golden_model.alaghi_tree( products )
+      scale = 2 ** clogb2( n ) if n > 1 else 1
+   else:
+      out = bitstream.mux_select( products, sel )
+      scale = n
+   return (out.value( rep ), (x * w).sum( axis=-1 ) / scale)
+
+# Summarizes an array of errors.
+# Returns a dictionary of the number of trials, the mean squared error, its
+# root, the bias (mean error), the standard deviation, the largest absolute
+# error and the PERCENTILES of the absolute error, as 'p50' etc.
+def error_stats( errors ):
+   errors = np.asarray( errors, dtype=float )
+   stats = { "trials" : len( errors ),
+             "mse" : float( np.mean( errors ** 2 ) ),
+             "rmse" : float( np.sqrt( np.mean( errors ** 2 ) ) ),
+             "bias" : float( np.mean( errors ) ),
+             "std" : float( np.std( errors ) ),
+             "max" : float( np.max( np.abs( errors ) ) ) }
+   for (p, v) in zip( PERCENTILES, np.percentile( np.abs( errors ), PERCENTILES ) ):
+      stats["p" + str(p)] = float( v )
+   return stats
+
+# Returns the shortest stream length of every (inputs, rng, adder, rep)
+# whose error metric is within target, None when no length is.
+# Parameters:
+#  results, a list of results, see run
+#  target, a float, the largest acceptable error
+#  metric, a string, the statistic compared with target, e.g. 'rmse' or 'p95'
+# Returns a list of (inputs, rng, adder, rep, length) tuples.
+def shortest_lengths( results, target, metric="rmse" ):
+   best = {}
+   for r in results:
+      key = (r["inputs"], r["rng"], r["adder"], r["rep"])
+      best.setdefault( key, None )
+      if r[metric] <= target and (best[key] is None or r["length"] < best[key]):
+         best[key] = r["length"]
+   return [k + (best[k],) for k in sorted( best )]
+
+# Returns a text table of results, one line per configuration.
+def format_table( results ):
+   cols = ["inputs", "adder", "rng", "rep", "length", "trials", "mse", "rmse", "bias"] \
+          + ["p" + str(p) for p in PERCENTILES] + ["model_rmse"]
+   lines = [" ".join( "%10s" % c for c in cols )]
+   for r in results:
+      cells = []
+      for c in cols:
+         if isinstance( r[c], float ):
+            cells.append( "%10.5f" % r[c] )
+         else:
+            cells.append( "%10s" % str(r[c]) )
+      lines.append( " ".join( cells ) )
+   return "\n".join( lines )
+
+# Helper function
+# Runs a batch of trials, seeded from the run's seed, the configuration and
+# the first trial, and returns the errors of the dot products.
+def _run_batch( batch ):
+   (config, _, start, count, seed) = batch
+   text = repr( (seed, sorted( config.items() ), start) ).encode( "utf-8" )
+   rs = np.random.RandomState( int(hashlib.sha1( text ).hexdigest()[:8], 16) )
+   (measured, exact) = dot_products( config, count, rs )
+   return measured - exact
+
+# Helper function
+def _as_list( value ):
+   if isinstance( value, list ):
+      return value
+   return [value]
+
+# Helper function
+# Checks the parameters of a configuration.
+def _check( config ):
+   for name in ("length", "inputs"):
+      if not isinstance( config[name], int ) or config[name] < 1:
+         raise ValueError( "Characterization parameter " + name + " must be a positive int: " \
+                           + str(config[name]) )
+   for (name, options) in (("rng", RNGS), ("adder", ADDERS), ("rep", REPS)):
+      if config[name] not in options:
+         raise ValueError( "Unknown " + name + ": " + str(config[name]) )
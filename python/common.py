@@ -1,8 +1,10 @@
 # Copyright (c) Gyorgy Wyatt Muntean 2017
 # This file contains common code shared throughout the generation scripts in this repo.
 
+from contextlib import contextmanager
 import math
 import os
+import profiling
 from time import gmtime, strftime
 
 # shared file names
@@ -10,14 +12,28 @@ MATRIX = "sc_matrix_mult"
 DOT_PROD = "sc_dot_product"
 NADDER = "sc_nadder"
 ALAGHI_NADDER = "alaghi_nadder"
+ALAGHI_LANES = "alaghi_adder_lanes"
 COUNTER = "counter"
 LFSR = "lfsr"
+LFSR_LEAP = "lfsr_leap"
 SD_CONVERTER = "sd_converter"
 DS_CONVERTER = "ds_converter"
 SNG = "sng"
 SHIFT = "shift_"
 REG = "_register"
 DOT_PROD_SIM = "sc_dot_product_sim"
+SYSTOLIC = "sc_systolic_array"
+SYSTOLIC_PE = "sc_systolic_pe"
+MATRIX_IP = "sc_matrix_multiply_ip"
+
+# indentation of one level of the generated verilog
+TAB = "   "
+
+# default number of stream cycles generated at once for testbench data
+STREAM_CHUNK = 4096
+
+# number of cycles the generated testbenches hold reset for
+TB_RESET_CYCLES = 8
 
 # n is the number of registers in the shift register
 def shiftreg_name( n ):
@@ -26,14 +42,122 @@ def shiftreg_name( n ):
 # Writes string to file f with numTabs number of tabs before
 # the string and a newline character after the string.
 def write_line( f, string, numTabs=0 ):
-   tab = ""
-   for i in range(0,numTabs):
-      tab += "   "
-   f.write( tab + string + "\n" )
+   f.write( TAB * numTabs + string + "\n" )
+
+# Opens a verilog file for writing, for use in a with statement:
+#    with open_verilog( path ) as f:
+# The text is collected by an Emitter and written with a single write when the
+# with block finishes. It is written to a temporary file which is renamed over
+# path, so an interrupted run never leaves a half written file behind.
+@contextmanager
+def open_verilog( path ):
+   with profiling.span( "verilog", os.path.basename( path ) ):
+      f = Emitter()
+      yield f
+      f.save( path )
+
+# Collects the text of a verilog file in memory.
+# It can be passed to write_line like a file, or written to with line(), which
+# indents by the indent stack. The block helpers write the opening line of a
+# block, indent everything written inside the with statement and write the
+# closing line:
+#    with f.always( "posedge clk" ):
+#       f.line( "counter <= counter + 1;" )
+class Emitter( object ):
+
+   def __init__( self ):
+      self.parts = []
+      self.level = 0
+
+   # Appends raw text, so the emitter can be used as a file.
+   def write( self, text ):
+      self.parts.append( text )
+
+   # Writes a line indented by the indent stack, or by numTabs when given.
+   def line( self, string="", numTabs=None ):
+      if numTabs is None:
+         numTabs = self.level
+      if string:
+         self.parts.append( TAB * numTabs + string + "\n" )
+      else:
+         self.parts.append( "\n" )
+
+   # Pushes and pops a level of the indent stack.
+   def indent( self ):
+      self.level += 1
+
+   def dedent( self ):
+      self.level -= 1
+
+   # Writes opening, then everything in the with statement indented one level
+   # deeper, then closing (when it is not None).
+   @contextmanager
+   def block( self, opening, closing ):
+      self.line( opening )
+      self.indent()
+      yield self
+      self.dedent()
+      if closing is not None:
+         self.line( closing )
+
+   # Writes a module with its port list, ended by "endmodule // name".
+   # Parameters:
+   #  name, a string, the name of the module
+   #  ports, a list of strings, the port list (names or full declarations)
+   @contextmanager
+   def module( self, name, ports ):
+      self.line( "module " + name + "(" )
+      self.indent()
+      for i in range(len(ports)):
+         self.line( ports[i] + ("," if i < len(ports) - 1 else "") )
+      self.dedent()
+      self.line( ");" )
+      self.indent()
+      yield self
+      self.dedent()
+      self.line( "endmodule // " + name )
+
+   # Writes an always block with the given sensitivity list.
+   def always( self, sensitivity ):
+      return self.block( "always @(" + sensitivity + ") begin", "end" )
+
+   # Writes a generate block.
+   def generate( self ):
+      return self.block( "generate", "endgenerate" )
+
+   # Returns all the text written so far.
+   def getvalue( self ):
+      return "".join( self.parts )
+
+   # Writes the text to the file at path, see atomic_write.
+   def save( self, path ):
+      atomic_write( path, self.getvalue() )
+
+# Writes data to the file at path with a single write. The data goes to a
+# temporary file in the same directory which is then renamed over path.
+def atomic_write( path, data, mode='w' ):
+   tmp = path + ".tmp"
+   with open( tmp, mode ) as f:
+      f.write( data )
+   os.rename( tmp, path )
+   profiling.add_bytes( len( data ) )
+
+# date written by get_time in deterministic mode, see set_fixed_time
+FIXED_TIME = "1970-01-01 00:00:00 GMT"
+
+_fixed_time = False
+
+# Makes get_time return FIXED_TIME, so generated headers do not change
+# between runs.
+def set_fixed_time( fixed ):
+   global _fixed_time
+   _fixed_time = fixed
 
 # Function to get the time and date in GMT
 # Value returned as a string
 def get_time():
+   if _fixed_time:
+      return FIXED_TIME
    return strftime("%Y-%m-%d %H:%M:%S", gmtime()) + " GMT"
 
 # Computes the ceiling log base 2 of input.
@@ -44,6 +168,29 @@ def clogb2( x ):
 def flogb2( x ):
    return int(math.floor( math.log( x, 2 ) ))
 
+# Splits a stream of 'length' cycles into consecutive chunks of at most
+# 'size' cycles. Returns a list of (start, stop) tuples.
+def chunk_ranges( length, size=STREAM_CHUNK ):
+   return [(start, min( start + size, length )) for start in range(0, length, size)]
+
+# Returns the width of a one bit signal of a datapath of the given number of
+# lanes, the stream bits it processes per cycle: None, a scalar, for 1.
+def lanes_width( lanes ):
+   return lanes if lanes > 1 else None
+
+# Checks that a stream of 'length' bits fills whole cycles of a datapath of
+# the given number of lanes, raises a ValueError otherwise.
+def check_lanes( length, lanes ):
+   if lanes < 1 or length % lanes != 0:
+      raise ValueError( "The stream length must be a multiple of the lanes: " + str(length) \
+                        + ", " + str(lanes) )
+
+# Returns the chunk size to use with a datapath of the given number of lanes,
+# the largest multiple of lanes at most size, so that every chunk is whole
+# cycles.
+def lane_chunk( size, lanes ):
+   return max( size - size % lanes, lanes )
+
 # 
 def makeTestDir( parentDir ):
    if parentDir is str:
@@ -2,56 +2,54 @@
 # Python script to generate a Verilog counter module.
 
 from common import *
+import gen_cache
+import netlist
 import os
 
 # Function to open and write a modular counter verilog module to a file.
 #	dest, the directory to write the file into
 #  threshold_value, max value this counter reaches (range is [0,threshold])
+@gen_cache.cached
 def generate( dest, threshold_value ):
-   with open( os.path.join( dest, COUNTER + ".v" ), 'w' ) as f:
+   with open_verilog( os.path.join( dest, COUNTER + ".v" ) ) as f:
       write_header_counter( f )
       write_modular_counter_module( f, COUNTER, threshold_value )
 
 # Writes a counter module.
 # Parameters:
-#  f, file to write to
+#  f, the Emitter to write to
 #  module_name, a string for module_name
 #  width, an int, the bit_width of the counter
 #  threshold, the number the counter reaches before it wraps back to 0 
 # 		(output in range [0,max_num])
 def write_modular_counter_module( f, module_name, threshold ):
-   # calculate bit_width of the counter
-   bit_width = clogb2( threshold )
+   netlist.write_module( f, build_modular_counter_module( module_name, threshold ) )
 
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "clk,", 1 )
-   write_line( f, "rst,", 1 )
-   write_line( f, "enable,", 1 )
-   write_line( f, "restart,", 1 )
-   write_line( f, "out", 1 )
-   write_line( f, ");" )
-   write_line( f, "parameter N = " + str(threshold) + ";", 1 )
-   write_line( f, "" )
-   write_line( f, "input clk;", 1 )
-   write_line( f, "input rst;", 1 )
-   write_line( f, "input enable;", 1 )
-   write_line( f, "input restart;", 1 )
-   write_line( f, "output [" + str(bit_width) + "-1:0] out;", 1 )
-   write_line( f, "" )
-   write_line( f, "reg [" + str(bit_width) + "-1:0] counter;", 1 )
-   write_line( f, "initial counter = 0;", 1 )
-   write_line( f, "always @(posedge clk or posedge rst) begin", 1 )
-   write_line( f, "if (rst) counter <= 0;", 2 )
-   write_line( f, "else if (restart) counter <= 0;", 2 )
-   write_line( f, "else if (enable) begin", 2 )
-   write_line( f, "if (counter == N) counter <= 0;", 3 )
-   write_line( f, "else counter <= counter + 1;", 3 )
-   write_line( f, "end", 2 )
-   write_line( f, "end", 1 )
-   write_line( f, "" )
-   write_line( f, "assign out = counter;", 1 )
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+# Builds the netlist of a counter module.
+# Parameters:
+#  module_name, a string for module_name
+#  threshold, the number the counter reaches before it wraps back to 0
+def build_modular_counter_module( module_name, threshold ):
+   # calculate bit_width of the counter, wide enough to hold threshold
+   bit_width = max( clogb2( threshold + 1 ), 1 )
+
+   m = netlist.Module( module_name )
+   m.add_param( "N", threshold )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   enable = m.add_input( "enable" )
+   restart = m.add_input( "restart" )
+   out = m.add_output( "out", bit_width )
+
+   counter = netlist.Ref( "counter" )
+   zero = netlist.Const( 0 )
+   wrapped = netlist.Op( "mux", netlist.Op( "eq", counter, netlist.Const( threshold ) ), zero,
+                         netlist.Op( "add", counter, netlist.Const( 1 ) ) )
+   m.add_register( "counter", bit_width,
+                   [(netlist.Ref( "rst" ), zero), (restart, zero), (enable, wrapped)],
+                   async_reset="rst", init=0 )
+   m.assign( out, counter )
+   return m
 
 # Writes comment for counter module.
 def write_header_counter( f ):
@@ -0,0 +1,175 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains the design-space sweep used by sweep.py. A sweep
+# generates a matrix multiply design for every configuration of a grid, each
+# into its own directory, with one scheduler and pool of processes for the
+# whole sweep. Sub-modules and testbenches shared by several configurations,
+# such as a dot product of the same width, are generated once and copied.
+# A manifest indexing every generated design is written next to them.
+#
+# A spec is a dictionary, read from a JSON file or built from the command
+# line, whose values are lists (the grid) or single values:
+#    { "batch" : [2, 4], "input" : [4, 8], "output" : 4, "alaghi" : [false, true] }
+# A spec may also list its configurations explicitly, every entry filled in
+# from the rest of the spec:
+#    { "length" : 1000, "configs" : [{ "batch" : 2, "input" : 4, "output" : 4 }] }
+# An "engines" value folds the matrix multiply onto that many dot products,
+# see sc_matrix_mult_gen.build_folded_module, null (the default) unfolds it.
+
+from common import *
+import estimate
+import gen_cache
+import hashlib
+import itertools
+import json
+import mif
+import os
+import performance
+import sc_matrix_mult_gen
+import scheduler
+
+MANIFEST_FN = "manifest.json"
+
+# parameters of a configuration and their defaults
+DEFAULTS = [("batch", 4), ("input", 4), ("output", 4), ("alaghi", False), ("rep", "uni"),
+            ("test", True), ("datafmt", "bin"), ("length", 100), ("chunk", STREAM_CHUNK),
+            ("engines", None)]
+
+# Expands a spec into a list of configurations, dictionaries of every
+# parameter in DEFAULTS, in grid order with duplicates removed.
+def expand( spec ):
+   spec = dict( spec )
+   for name in spec:
+      if name not in dict( DEFAULTS ) and name != "configs":
+         raise ValueError( "Unknown sweep parameter: " + str(name) )
+
+   if "configs" in spec:
+      base = dict( (k, v) for (k, v) in spec.items() if k != "configs" )
+      grids = []
+      for config in spec["configs"]:
+         entry = dict( base )
+         entry.update( config )
+         grids.append( entry )
+   else:
+      grids = [spec]
+
+   configs = []
+   for grid in grids:
+      names = [name for (name, _) in DEFAULTS]
+      values = [_as_list( grid.get( name, default ) ) for (name, default) in DEFAULTS]
+      for combo in itertools.product( *values ):
+         config = dict( zip( names, combo ) )
+         _check( config )
+         if config not in configs:
+            configs.append( config )
+   return configs
+
+# Returns the directory name of a configuration.
+def design_name( config ):
+   adder = "alaghi" if config["alaghi"] else "nadder"
+   name = "mm_" + str(config["batch"]) + "x" + str(config["input"]) + "x" \
+          + str(config["output"]) + "_" + adder + "_" + config["rep"]
+   if sc_matrix_mult_gen.is_folded( config["batch"], config["output"], config["engines"] ):
+      name += "_p" + str(config["engines"])
+   return name
+
+# Generates every configuration into its own directory of dest and writes
+# the manifest.
+# Parameters:
+#  dest, a string, the directory to write the designs into
+#  configs, a list of configurations, see expand
+#  jobs, an int, the number of processes
+#  clock, a float, the clock frequency in MHz of the performance manifests
+# Returns the manifest, a dictionary.
+def run( dest, configs, jobs=1, clock=performance.DEFAULT_CLOCK ):
+   sched = scheduler.Scheduler( jobs )
+   for config in configs:
+      sched.target( os.path.join( dest, design_name( config ) ) )
+      sc_matrix_mult_gen.plan( sched, config["batch"], config["input"], config["output"],
+                               config["alaghi"], test=config["test"],
+                               datafmt=config["datafmt"], length=config["length"],
+                               chunk=config["chunk"], engines=config["engines"] )
+   sched.run()
+   for config in configs:
+      target = os.path.join( dest, design_name( config ) )
+      estimate.write_estimate( os.path.join( target, MATRIX + estimate.SUFFIX ),
+                               _build_design( config ) )
+      performance.write_performance( os.path.join( target, MATRIX + performance.SUFFIX ),
+                                     _performance( config, clock ) )
+
+   manifest = make_manifest( dest, configs, sched, clock )
+   atomic_write( os.path.join( dest, MANIFEST_FN ),
+                 json.dumps( manifest, sort_keys=True, indent=1 ) + "\n" )
+   return manifest
+
+# Returns the manifest of a sweep: every design with its parameters, the
+# digest of its matrix multiply netlist, its cell counts and logic depth (see
+# estimate.py), its performance at clock MHz (see performance.py), its files
+# and its tasks, and the tasks shared between designs.
+def make_manifest( dest, configs, sched, clock=performance.DEFAULT_CLOCK ):
+   designs = []
+   users = {}
+   for (config, (target, ids)) in zip( configs, sched.outputs() ):
+      name = design_name( config )
+      design = _build_design( config )
+      estimated = estimate.estimate_design( design )
+      designs.append( { "name" : name,
+                        "dir" : os.path.relpath( target, dest ),
+                        "params" : config,
+                        "netlist" : design.module().digest(),
+                        "cells" : estimated["cells"],
+                        "critical_path" : estimated["critical_path"],
+                        "performance" : _performance( config, clock ),
+                        "files" : _file_digests( target ),
+                        "tasks" : ids } )
+      for task_id in ids:
+         users.setdefault( task_id, [] ).append( name )
+
+   shared = dict( (t, names) for (t, names) in users.items() if len( names ) > 1 )
+   return { "seed" : gen_cache.get_seed(),
+            "designs" : designs,
+            "tasks" : len( sched.tasks ),
+            "shared" : shared }
+
+# Helper function
+def _build_design( config ):
+   return sc_matrix_mult_gen.build_design( config["batch"], config["input"], config["output"],
+                                           config["alaghi"], config["engines"], config["length"] )
+
+# Helper function
+def _performance( config, clock ):
+   return performance.matrix_mult( config["batch"], config["input"], config["output"],
+                                   config["alaghi"], config["length"], clock, config["engines"] )
+
+# Helper function
+def _as_list( value ):
+   if isinstance( value, list ):
+      return value
+   return [value]
+
+# Helper function
+# Checks the parameters of a configuration.
+def _check( config ):
+   for name in ("batch", "input", "output", "length", "chunk"):
+      if not isinstance( config[name], int ) or config[name] < 1:
+         raise ValueError( "Sweep parameter " + name + " must be a positive int: " \
+                           + str(config[name]) )
+   if config["rep"] != "uni":
+      raise NotImplementedError( "Only the uni stochastic representation is supported: " \
+                                 + str(config["rep"]) )
+   if config["datafmt"] not in mif.FORMATS:
+      raise ValueError( "Unknown data format: " + str(config["datafmt"]) )
+   if config["engines"] is not None:
+      if not isinstance( config["engines"], int ):
+         raise ValueError( "Sweep parameter engines must be an int: " + str(config["engines"]) )
+      sc_matrix_mult_gen.is_folded( config["batch"], config["output"], config["engines"] )
+
+# Helper function
+# Returns the sha1 of every file below a directory, by relative path.
+def _file_digests( root ):
+   digests = {}
+   for (path, dirs, names) in os.walk( root ):
+      for fn in names:
+         full = os.path.join( path, fn )
+         with open( full, 'rb' ) as f:
+            digests[os.path.relpath( full, root )] = hashlib.sha1( f.read() ).hexdigest()
+   return digests
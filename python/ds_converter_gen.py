@@ -6,13 +6,16 @@
 # The precision of the binary input (and rng input) must be specified.
 
 from common import *
+import gen_cache
+import netlist
 import os
 
 # Function to open and write a ds_converter module
 #  dest, the directory to write the file into
 #  precision, the bitwidth of the binary input and rng input
+@gen_cache.cached
 def generate( dest, precision ):
-   with open( os.path.join( dest, DS_CONVERTER + ".v" ), 'w' ) as f:
+   with open_verilog( os.path.join( dest, DS_CONVERTER + ".v" ) ) as f:
       write_header_ds_converter( f ) 
       write_ds_converter_module( f, DS_CONVERTER, precision )
 
@@ -23,20 +26,18 @@ def generate( dest, precision ):
 #  precision, an integer, the precision of the input binary number and
 #     input random number
 def write_ds_converter_module( f, module_name, precision ):
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "in,", 1 )
-   write_line( f, "rng,", 1 )
-   write_line( f, "out", 1 )
-   write_line( f, ");" )
-   write_line( f, "parameter PRECISION = " + str(precision) + ";", 1 )
-   write_line( f, "" )
-   write_line( f, "input [PRECISION-1:0] in;", 1 )
-   write_line( f, "input [PRECISION-1:0] rng;", 1 )
-   write_line( f, "output out;", 1 )
-   write_line( f, "" )
-   write_line( f, "assign out = (rng < in) ? 1 : 0;", 1 )
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+   netlist.write_module( f, build_ds_converter_module( module_name, precision ) )
+
+# Builds the netlist of a ds_converter module, see write_ds_converter_module.
+def build_ds_converter_module( module_name, precision ):
+   m = netlist.Module( module_name )
+   precision = m.add_param( "PRECISION", precision )
+   inpt = m.add_input( "in", precision )
+   rng = m.add_input( "rng", precision )
+   out = m.add_output( "out" )
+   m.assign( out, netlist.Op( "mux", netlist.Op( "lt", rng, inpt ), netlist.Const( 1 ),
+                              netlist.Const( 0 ) ) )
+   return m
 
 def write_header_ds_converter( f ):
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
@@ -0,0 +1,206 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains a closed-form model of the error and latency of the
+# generated stochastic dot product and matrix multiply, so configurations
+# can be compared without generating any streams.
+#
+# The model assumes every bit of the input streams is an independent random
+# bit. This is the 'random' noise source of characterization.py. It is not a
+# bound for the LFSR sources of the generated designs, whose streams are
+# correlated and can be less accurate than the model, e.g. nearly twice its
+# RMSE for a 16 input bipolar alaghi dot product of 256 bits. Size the
+# streams of an LFSR design with characterize.py -rng lfsr instead.
+#
+# Both adders scale the sum of the N products, the mux adder (sc_nadder) by
+# 1/N and the alaghi tree by 1/S, S = 2^D for a tree of depth D = clogb2(N).
+#  mux, every output bit is the product bit picked by a uniform select, so
+#     the output is a Bernoulli stream of the mean product and its variance
+#     is p(1-p)/L.
+#  alaghi, an adder outputs half of the ones of its inputs, rounded down by
+#     its toggle flip-flop starting at 0, so the tree adds no sampling noise
+#     of its own. Its variance is that of the product streams scaled by 1/S^2.
+#     The rounding biases the output by -1/4 of a one per adder, -D/4 ones in
+#     total. In bipolar, the constant 0 streams that pad the tree to S inputs
+#     stand for -1 and add (N - S)/S.
+# Bipolar values are 2p - 1 of the probability p of a one, so their variance
+# is 4 times that of p.
+
+import math
+import numpy as np
+import sc_dot_product_gen
+
+ADDERS = ("mux", "alaghi")
+REPS = ("uni", "bi")
+
+# The estimate of a stochastic dot product, every field an array of the
+# shape of the estimated outputs.
+#  mean, the expected value of the decoded output
+#  exact, the exact scaled dot product, sum( x * w ) / scale
+#  bias, mean - exact
+#  variance, std, the variance and standard deviation of the output
+#  mse, the mean squared error against exact, variance + bias^2
+#  low, high, the confidence interval of the output, clipped to the range of
+#     the representation
+#  latency, an int, the cycles from the inputs to the first output bit
+#  cycles, an int, the cycles from the first input bit to the last output bit
+class Estimate( object ):
+
+   def __init__( self, mean, exact, variance, low, high, latency, cycles ):
+      self.mean = mean
+      self.exact = exact
+      self.bias = mean - exact
+      self.variance = variance
+      self.std = np.sqrt( variance )
+      self.mse = variance + self.bias ** 2
+      self.low = low
+      self.high = high
+      self.latency = latency
+      self.cycles = cycles
+
+# Estimates the outputs of stochastic dot products of given values.
+# Parameters:
+#  x, w, float arrays of shape (..., N), the values of the data and weights,
+#     in [0, 1] for 'uni' and [-1, 1] for 'bi'
+#  length, an int, the stream length L
+#  adder, a string, 'mux' or 'alaghi'
+#  rep, a string, 'uni' or 'bi'
+#  precision, an int or None, the bits of the binary values; when given the
+#     error of rounding x and w to it is included, when None the values are
+#     assumed to be exact in that precision
+#  confidence, a float, the probability of the confidence interval
+# Returns an Estimate of shape (...).
+def dot_product( x, w, length, adder="mux", rep="uni", precision=None, confidence=0.95 ):
+   _check( adder, rep )
+   x = np.asarray( x, dtype=float )
+   w = np.asarray( w, dtype=float )
+   v = x * w
+   n = v.shape[-1]
+   (depth, scale) = _tree( n, adder )
+   exact = v.sum( axis=-1 ) / scale
+
+   # p, the probability of a one in every product stream
+   p = v if rep == "uni" else (1 + v) / 2
+   if adder == "mux":
+      mu = p.mean( axis=-1 )
+      variance = mu * (1 - mu) / length
+      mean = mu
+   else:
+      variance = (p * (1 - p)).sum( axis=-1 ) / (length * scale ** 2) \
+                 + _rounding_variance( depth ) / length ** 2
+      mean = p.sum( axis=-1 ) / scale - depth / (4.0 * length)
+   if rep == "bi":
+      (mean, variance) = (2 * mean - 1, 4 * variance)
+
+   if precision is not None:
+      step = 2.0 ** -precision if rep == "uni" else 2.0 ** (1 - precision)
+      variance = variance + (x ** 2 + w ** 2).sum( axis=-1 ) * step ** 2 / (12 * scale ** 2)
+
+   z = normal_quantile( 0.5 + confidence / 2.0 )
+   (lo, hi) = (0.0, 1.0) if rep == "uni" else (-1.0, 1.0)
+   std = np.sqrt( variance )
+   low = np.clip( mean - z * std, lo, hi )
+   high = np.clip( mean + z * std, lo, hi )
+   delay = latency( n, adder == "alaghi" )
+   return Estimate( mean, exact, variance, low, high, delay, delay + length )
+
+# Estimates the outputs of a stochastic matrix multiply, every output a dot
+# product, see dot_product.
+# Parameters:
+#  datas, a float array of shape (M, N), the input matrix
+#  weights, a float array of shape (O, N), the transposed weight matrix, as
+#     the generated sc_matrix_mult takes it
+#  length, adder, rep, precision, confidence, see dot_product
+# Returns an Estimate of shape (M, O).
+def matrix_mult( datas, weights, length, adder="mux", rep="uni", precision=None,
+                 confidence=0.95 ):
+   datas = np.asarray( datas, dtype=float )
+   weights = np.asarray( weights, dtype=float )
+   return dot_product( datas[:, np.newaxis, :], weights[np.newaxis, :, :], length, adder, rep,
+                       precision, confidence )
+
+# Returns the expected error of dot products of uniformly random values, the
+# average over inputs of the estimates of dot_product, as a dictionary of
+# 'mse', 'rmse', 'bias', 'std', 'latency' and 'cycles'.
+# inputs (N) and length (L) may be arrays, which are broadcast against each
+# other, so many configurations are estimated at once.
+# Parameters:
+#  inputs, an int or int array, the number of inputs N
+#  length, an int or int array, the stream length L
+#  adder, rep, see dot_product
+def expected_error( inputs, length, adder="mux", rep="uni" ):
+   _check( adder, rep )
+   n = np.asarray( inputs, dtype=float )
+   length = np.asarray( length, dtype=float )
+   (depth, scale) = _tree( n, adder )
+
+   # moments of the probability of a one in a product stream, with x and w
+   # uniform over [0, 1] (uni) or [-1, 1] (bi)
+   if rep == "uni":
+      (m1, m2) = (1 / 4.0, 1 / 9.0)
+   else:
+      (m1, m2) = (1 / 2.0, 5 / 18.0)
+
+   if adder == "mux":
+      # E[mu (1 - mu)] of the mean mu of N products
+      second = m1 ** 2 + (m2 - m1 ** 2) / n
+      variance = (m1 - second) / length
+      bias = np.zeros( np.broadcast( n, length ).shape )
+   else:
+      variance = n * (m1 - m2) / (length * scale ** 2) + _rounding_variance( depth ) / length ** 2
+      bias = -depth / (4.0 * length)
+   if rep == "bi":
+      variance = 4 * variance
+      bias = 2 * bias
+      if adder == "alaghi":
+         bias = bias + (n - scale) / scale
+
+   mse = variance + bias ** 2
+   delay = latency( inputs, adder == "alaghi" )
+   return { "mse" : mse, "rmse" : np.sqrt( mse ), "bias" : bias, "std" : np.sqrt( variance ),
+            "latency" : delay, "cycles" : delay + np.asarray( length, dtype=int ) }
+
+# Returns the pipeline latency of the dot product, and so of the matrix
+# multiply, the delay of sc_dot_product_gen.dp_delay. inputs may be an array.
+def latency( inputs, alaghi=False ):
+   if np.ndim( inputs ) == 0:
+      return sc_dot_product_gen.dp_delay( int(inputs), alaghi )
+   return np.vectorize( lambda n: sc_dot_product_gen.dp_delay( int(n), alaghi ) )( inputs )
+
+# Returns the quantile of the standard normal distribution at probability q.
+def normal_quantile( q ):
+   if not 0 < q < 1:
+      raise ValueError( "Probability must be in (0, 1): " + str(q) )
+   # bisection on the normal distribution function
+   (lo, hi) = (-40.0, 40.0)
+   for i in range(100):
+      mid = (lo + hi) / 2
+      if 0.5 * (1 + math.erf( mid / math.sqrt( 2 ) )) < q:
+         lo = mid
+      else:
+         hi = mid
+   return (lo + hi) / 2
+
+# Helper function
+# Returns the depth D and the scale of the adder of n inputs, n may be an array.
+def _tree( n, adder ):
+   n = np.asarray( n, dtype=float )
+   depth = np.ceil( np.log2( n ) )
+   if adder == "mux":
+      return (depth, n)
+   return (depth, 2 ** depth)
+
+# Helper function
+# Returns the variance, in ones squared, of the rounding of a tree of depth D.
+# An adder rounds down by half a one on half of the cycles, variance 1/16,
+# and the adders of level l (S / 2^l of them) are scaled by 2^-(D-l) on the
+# way to the output.
+def _rounding_variance( depth ):
+   depth = np.asarray( depth, dtype=float )
+   # sum over l = 1..D of 2^(D-l) * 4^-(D-l) / 16 = sum of 2^-k / 16 for k < D
+   return (1 - 2.0 ** -depth) / 8
+
+# Helper function
+def _check( adder, rep ):
+   if adder not in ADDERS:
+      raise ValueError( "Unknown adder: " + str(adder) )
+   if rep not in REPS:
+      raise ValueError( "Unknown stochastic representation: " + str(rep) )
@@ -0,0 +1,318 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains a structural estimate of the area and critical path of
+# a generated design, computed from its netlist (see netlist.py) in place of
+# synthesis.
+#
+# Area is counted in technology independent cells, over the whole hierarchy:
+#  flip_flops, register bits, of which lfsr_bits are the bits of LFSRs
+#  and, or, xor, not, 2-input gates and inverters, a bitwise operator of
+#     width w over k operands is (k-1)*w gates
+#  mux2, bits of 2-input muxes, of '?:' and of the enable and reset rules of
+#     registers
+#  muxes, mux_inputs, N-input muxes (x[sel]) and their total inputs
+#  comparators, comparator_bits, '==' and '<' and their widths, other than
+#     a bit compared with a constant
+#  adders, adder_bits, '+' and their widths
+#
+# Logic depth is counted in levels of 2-input cells. A bitwise chain of k
+# operands is a balanced tree of clogb2(k) levels, an N-input mux clogb2(N)
+# levels, a w-bit compare, add or reduction clogb2(w) + 1 levels, a '?:' or a
+# register rule one level and an inverter none. Paths start at the inputs of
+# the top module or at a register and end at a register or an output, and
+# the worst path of every kind is reported with the cells along it.
+
+from common import *
+import json
+import netlist
+
+# suffix of the file an estimate is written to, after the module name
+SUFFIX = "_estimate.json"
+
+# The kinds of paths: input to output, input to register, register to
+# output and register to register.
+PATHS = ("in_to_out", "in_to_reg", "reg_to_out", "reg_to_reg")
+
+_CELLS = ("flip_flops", "lfsr_bits", "and", "or", "xor", "not", "mux2", "muxes", "mux_inputs",
+          "comparators", "comparator_bits", "adders", "adder_bits")
+
+# Estimates the area and logic depth of a netlist.Design.
+# Returns a dictionary of the top module, its 'cells' (see above), the
+# 'instances' of every module below it, the 'depth' of the worst path of
+# every kind in PATHS, the 'critical_path', the deepest of them, and the
+# cells along it, 'critical_path_cells'.
+def estimate_design( design ):
+   memo = {}
+   summary = _summarize( design, design.top, memo )
+   instances = {}
+   _count_instances( design, design.top, 1, instances )
+   worst = None
+   for kind in PATHS:
+      if summary[kind] is not None and (worst is None or summary[kind][0] > worst[0]):
+         worst = summary[kind]
+   return { "top" : design.top,
+            "design" : design.digest(),
+            "cells" : summary["cells"],
+            "instances" : instances,
+            "depth" : dict( (k, None if summary[k] is None else summary[k][0]) for k in PATHS ),
+            "critical_path" : 0 if worst is None else worst[0],
+            "critical_path_cells" : [] if worst is None else worst[1] }
+
+# Writes the estimate of a design as JSON to the file at path.
+def write_estimate( path, design ):
+   atomic_write( path, json.dumps( estimate_design( design ), sort_keys=True, indent=1 ) + "\n" )
+
+# Helper function
+# Counts the instances of every module below a module, times count.
+def _count_instances( design, name, count, instances ):
+   for inst in design.module( name ).instances:
+      instances[inst.module] = instances.get( inst.module, 0 ) + count
+      _count_instances( design, inst.module, count, instances )
+
+# Helper function
+# Returns the summary of a module, its cells and the worst path of every
+# kind, a (depth, cells along it) pair or None when there is no such path.
+def _summarize( design, name, memo ):
+   if name in memo:
+      return memo[name]
+   module = design.module( name )
+   cells = dict( (c, 0) for c in _CELLS )
+   children = {}
+   for inst in module.instances:
+      if inst.module not in children:
+         children[inst.module] = _summarize( design, inst.module, memo )
+      _add_cells( cells, children[inst.module]["cells"] )
+
+   walker = _Walker( module, children, cells )
+   summary = { "cells" : cells,
+               "output_ports" : set( p.name for p in module.ports if p.direction == "output" ) }
+   for kind in PATHS:
+      summary[kind] = None
+
+   # paths ending at registers of this module and inside its instances
+   for reg in module.registers:
+      width = module.width( reg.name )
+      cells["flip_flops"] += width
+      if name.startswith( LFSR ):
+         cells["lfsr_bits"] += width
+      rules = len( [c for (c, _) in reg.rules if c is not None] )
+      cells["mux2"] += rules * width
+      for (cond, value) in reg.rules:
+         for expr in ([cond] if cond is not None else []) + [value]:
+            arrival = walker.expr( expr )
+            _worst( summary, "in_to_reg", _delay( arrival[0], rules, "rule " + reg.name ) )
+            _worst( summary, "reg_to_reg", _delay( arrival[1], rules, "rule " + reg.name ) )
+   for inst in module.instances:
+      child = children[inst.module]
+      arrival = walker.inputs( inst )
+      label = inst.name + " (" + inst.module + ")"
+      _worst( summary, "in_to_reg", _join( arrival[0], child["in_to_reg"], label ) )
+      _worst( summary, "reg_to_reg", _join( arrival[1], child["in_to_reg"], label ) )
+      _worst( summary, "reg_to_reg", _join( (0, []), child["reg_to_reg"], label ) )
+
+   # paths ending at the outputs
+   for port in module.ports:
+      if port.direction == "output":
+         arrival = walker.net( port.name )
+         _worst( summary, "in_to_out", arrival[0] )
+         _worst( summary, "reg_to_out", arrival[1] )
+
+   # the gates of nets nobody reads are still counted
+   for a in module.assigns:
+      walker.net( a.lhs.name )
+   memo[name] = summary
+   return summary
+
+# Helper class
+# Finds the arrival of nets and expressions of a module, a pair of the
+# deepest path from an input and from a register, each a (depth, cells)
+# pair or None, and counts the cells of the expressions it visits.
+class _Walker( object ):
+
+   def __init__( self, module, children, cells ):
+      self.module = module
+      self.children = children
+      self.cells = cells
+      self.inputs_ = set( p.name for p in module.ports if p.direction == "input" )
+      self.regs = set( r.name for r in module.registers )
+      self.params = set( p for (p, _, _) in module.params )
+      self.drivers = {}
+      for a in module.assigns:
+         self.drivers.setdefault( a.lhs.name, [] ).append( a )
+      for inst in module.instances:
+         for (port, expr) in inst.connections:
+            if isinstance( expr, netlist.Ref ) and _is_output( children[inst.module], port ):
+               self.drivers.setdefault( expr.name, [] ).append( (inst, port) )
+      self.arrivals = {}
+      self.visiting = set()
+      self.counted = set()
+
+   # Returns the arrival of a net.
+   def net( self, name ):
+      if name in self.arrivals:
+         return self.arrivals[name]
+      if name in self.inputs_:
+         return ((0, []), None)
+      if name in self.regs:
+         return (None, (0, []))
+      if name in self.visiting:
+         raise ValueError( "Combinational loop through " + name + " in module " \
+                           + self.module.name )
+      self.visiting.add( name )
+      arrival = (None, None)
+      for driver in self.drivers.get( name, [] ):
+         if isinstance( driver, netlist.Assign ):
+            arrival = _max_arrival( arrival, self.expr( driver.rhs ) )
+         else:
+            (inst, port) = driver
+            child = self.children[inst.module]
+            label = inst.name + " (" + inst.module + ")"
+            through = self.inputs( inst )
+            arrival = _max_arrival( arrival, (_join( through[0], child["in_to_out"], label ),
+                                              _join( through[1], child["in_to_out"], label )) )
+            arrival = _max_arrival( arrival, (None, _join( (0, []), child["reg_to_out"], label )) )
+      self.visiting.discard( name )
+      self.arrivals[name] = arrival
+      return arrival
+
+   # Returns the latest arrival of the inputs of an instance.
+   def inputs( self, inst ):
+      arrival = (None, None)
+      for (port, expr) in inst.connections:
+         if not _is_output( self.children[inst.module], port ):
+            arrival = _max_arrival( arrival, self.expr( expr ) )
+      return arrival
+
+   # Returns the arrival of an expression, counting its cells once.
+   def expr( self, e ):
+      count = id(e) not in self.counted
+      self.counted.add( id(e) )
+      if isinstance( e, netlist.Ref ):
+         if e.name in self.params:
+            return (None, None)
+         return self.net( e.name )
+      if isinstance( e, netlist.Const ):
+         return (None, None)
+
+      op = e.op
+      args = _chain( e ) if op in ("and", "or", "xor", "add") else list( e.args )
+      arrival = (None, None)
+      for a in args:
+         arrival = _max_arrival( arrival, self.expr( a ) )
+      width = max( [self._width( a ) for a in args] )
+      if op in ("and", "or", "xor"):
+         levels = clogb2( len( args ) )
+         if count:
+            self.cells[op] += (len( args ) - 1) * width
+      elif op == "not":
+         levels = 0
+         if count:
+            self.cells["not"] += width
+      elif op in ("eq", "lt") and width == 1 \
+           and any( isinstance( a, netlist.Const ) for a in args ):
+         # a bit compared with a constant is the bit or its inverse
+         levels = 0
+      elif op in ("eq", "lt"):
+         levels = clogb2( max( width, 2 ) ) + 1
+         if count:
+            self.cells["comparators"] += 1
+            self.cells["comparator_bits"] += width
+      elif op == "add":
+         levels = clogb2( max( width, 2 ) ) + 1
+         if count:
+            self.cells["adders"] += len( args ) - 1
+            self.cells["adder_bits"] += (len( args ) - 1) * width
+      elif op == "reduce_or":
+         levels = clogb2( max( width, 2 ) )
+         if count:
+            self.cells["or"] += width - 1
+      elif op == "mux":
+         levels = 1
+         width = max( self._width( e.args[1] ), self._width( e.args[2] ) )
+         if count:
+            self.cells["mux2"] += width
+      elif op == "index":
+         inputs = self._width( e.args[0] )
+         levels = clogb2( max( inputs, 2 ) )
+         if count:
+            self.cells["muxes"] += 1
+            self.cells["mux_inputs"] += inputs
+      else:
+         # concat is wiring
+         levels = 0
+      label = op + "[" + str(width) + "]" if op != "index" \
+         else "mux[" + str(self._width( e.args[0] )) + ":1]"
+      return (_delay( arrival[0], levels, label ), _delay( arrival[1], levels, label ))
+
+   # Helper function
+   # Returns the width of an expression. Parameters and unsized constants
+   # take the width of what they are used with, so count as 1 bit.
+   def _width( self, e ):
+      if isinstance( e, netlist.Ref ):
+         if e.name in self.params:
+            return 1
+         if e.msb is None:
+            return self.module.width( e.name )
+         if e.lsb is None:
+            return 1
+         return e.msb - e.lsb + 1
+      if isinstance( e, netlist.Const ):
+         return 1 if e.width is None else e.width
+      if e.op in ("eq", "lt", "reduce_or", "index"):
+         return 1
+      if e.op == "concat":
+         return sum( self._width( a ) for a in e.args )
+      if e.op == "mux":
+         return max( self._width( e.args[1] ), self._width( e.args[2] ) )
+      return max( self._width( a ) for a in e.args )
+
+# Helper function
+# Returns the operands of a chain of the same associative operator.
+def _chain( e ):
+   args = []
+   for a in e.args:
+      if isinstance( a, netlist.Op ) and a.op == e.op:
+         args.extend( _chain( a ) )
+      else:
+         args.append( a )
+   return args
+
+# Helper function
+def _is_output( summary, port ):
+   return port in summary["output_ports"]
+
+# Helper function
+# Adds levels to a path, None stays None.
+def _delay( path, levels, label ):
+   if path is None:
+      return None
+   if levels == 0:
+      return path
+   return (path[0] + levels, path[1] + [label])
+
+# Helper function
+# Continues a path into an instance, None when either part is missing.
+def _join( path, inner, label ):
+   if path is None or inner is None:
+      return None
+   return (path[0] + inner[0], path[1] + [label + ": " + c for c in inner[1]])
+
+# Helper function
+def _max_path( a, b ):
+   if a is None:
+      return b
+   if b is None or a[0] >= b[0]:
+      return a
+   return b
+
+# Helper function
+def _max_arrival( a, b ):
+   return (_max_path( a[0], b[0] ), _max_path( a[1], b[1] ))
+
+# Helper function
+def _worst( summary, kind, path ):
+   summary[kind] = _max_path( summary[kind], path )
+
+# Helper function
+def _add_cells( cells, other ):
+   for c in _CELLS:
+      cells[c] += other[c]
@@ -0,0 +1,248 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains the deterministic output mode and the on-disk cache of
+# generated files.
+#
+# In deterministic mode every generator draws its testbench data from its own
+# random seed, derived from the run's seed, the generator and its parameters,
+# and headers carry a fixed date, so the same command always writes the same
+# files whichever generators run first or come from the cache.
+#
+# The cache stores the files written by every call of a generate function
+# decorated with @cached, keyed by a hash of the generator, its parameters,
+# the seed and the version of the generator code. Generators called with a
+# key seen before copy their files out of the cache instead of building them.
+# The least recently used entries are dropped when the cache grows past its
+# size limit.
+
+import common
+import functools
+import hashlib
+import inspect
+import json
+import numpy as np
+import os
+import profiling
+import shutil
+import tempfile
+
+# Bump to invalidate every cache entry when the output format changes in a
+# way the source digest below does not catch.
+VERSION = 1
+
+# default size limit of the cache in bytes
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_MANIFEST = "manifest.json"
+
+# seed of the run, None unless deterministic mode is on
+_seed = None
+
+# the active GenCache, None when caching is off
+_cache = None
+
+_version = None
+
+# Turns deterministic mode on with the given seed, or off with None.
+def set_seed( seed ):
+   global _seed
+   _seed = seed
+   common.set_fixed_time( seed is not None )
+
+# Returns the seed of the run, None unless deterministic mode is on.
+def get_seed():
+   return _seed
+
+# Sets the cache used by @cached generators, None turns caching off.
+def set_cache( cache ):
+   global _cache
+   _cache = cache
+
+# Returns the active cache, or None.
+def get_cache():
+   return _cache
+
+# Returns the version of the generator code, VERSION and a digest of the
+# python sources and tables the generators are built from.
+def code_version():
+   global _version
+   if _version is None:
+      here = os.path.dirname( os.path.abspath( __file__ ) )
+      h = hashlib.sha1( str(VERSION).encode( "utf-8" ) )
+      for fn in sorted( os.listdir( here ) ):
+         if fn.endswith( ".py" ) or fn.endswith( ".json" ):
+            with open( os.path.join( here, fn ), 'rb' ) as f:
+               h.update( fn.encode( "utf-8" ) )
+               h.update( f.read() )
+      _version = h.hexdigest()
+   return _version
+
+# Returns the cache key of a generator call.
+# Parameters:
+#  name, a string, the generator
+#  params, a dictionary of the generator's parameters
+#  seed, an int or None, the seed of the run
+def make_key( name, params, seed ):
+   text = json.dumps( [name, params, seed, code_version()], sort_keys=True, default=str )
+   return hashlib.sha1( text.encode( "utf-8" ) ).hexdigest()
+
+# Decorator for generate functions which write their files into the
+# directory given by the argument 'dest'. The function is keyed by its module
+# and name and all its other arguments.
+#
+# In deterministic mode the numpy random state is seeded from the key while
+# the function runs and restored afterwards, so a generator's data does not
+# depend on what ran before it, and skipping it on a cache hit does not
+# change what runs after it.
+def cached( func ):
+   name = func.__module__ + "." + func.__name__
+
+   @functools.wraps( func )
+   def wrapper( *args, **kwargs ):
+      params = inspect.getcallargs( func, *args, **kwargs )
+      dest = params.pop( "dest" )
+      if _seed is None and _cache is None:
+         return func( *args, **kwargs )
+
+      key = make_key( name, params, _seed )
+      build = lambda d: _seeded( key, func, d, params )
+      if _cache is None:
+         return build( dest )
+      return _cache.build( key, name, params, dest, build )
+
+   # every call is a stage of the profile, see profiling.py
+   wrapper = profiling.timed( name )( wrapper )
+   wrapper.generator = func
+   return wrapper
+
+# Returns the key of a call of a generate function decorated with @cached,
+# without calling it. dest may be left out.
+def call_key( generator, *args, **kwargs ):
+   func = generator.generator
+   kwargs.setdefault( "dest", None )
+   params = inspect.getcallargs( func, *args, **kwargs )
+   params.pop( "dest" )
+   return make_key( func.__module__ + "." + func.__name__, params, _seed )
+
+# Seeds the numpy random state from a key in deterministic mode, the way a
+# @cached generator with that key is seeded.
+def seed_random( key ):
+   if _seed is not None:
+      np.random.seed( int(key[:8], 16) )
+
+# Helper function
+# Calls a generator with dest, the numpy random state seeded from the key.
+def _seeded( key, func, dest, params ):
+   kwargs = dict( params )
+   kwargs["dest"] = dest
+   state = np.random.get_state()
+   seed_random( key )
+   try:
+      return func( **kwargs )
+   finally:
+      np.random.set_state( state )
+
+# A directory of cached generator outputs.
+# Every entry is a directory named by its key, holding the files written by
+# the generator (relative to dest) and a manifest. An entry's modification
+# time is its last use, for the least recently used eviction.
+class GenCache( object ):
+
+   # root, a string, the directory of the cache, created if missing
+   # max_bytes, an int, the size limit of the cache
+   def __init__( self, root, max_bytes=DEFAULT_MAX_BYTES ):
+      self.root = root
+      self.max_bytes = max_bytes
+      self.hits = 0
+      self.misses = 0
+      if not os.path.isdir( root ):
+         os.makedirs( root )
+
+   # Writes the files of a generator call into dest, from the cache on a hit
+   # or by calling build( directory ) on a miss.
+   # Parameters:
+   #  key, a string, see make_key
+   #  name, a string, the generator, recorded in the manifest
+   #  params, a dictionary, the parameters, recorded in the manifest
+   #  dest, a string, the directory to write the files into
+   #  build, a function writing the files into the directory it is passed
+   def build( self, key, name, params, dest, build ):
+      entry = os.path.join( self.root, key )
+      if os.path.isfile( os.path.join( entry, _MANIFEST ) ):
+         self.hits += 1
+         os.utime( entry, None )
+         _copy_tree( entry, dest, skip=_MANIFEST )
+         return None
+
+      self.misses += 1
+      tmp = tempfile.mkdtemp( prefix=key + ".", dir=self.root )
+      try:
+         result = build( tmp )
+         files = _list_files( tmp )
+         size = sum( os.path.getsize( os.path.join( tmp, fn ) ) for fn in files )
+         manifest = { "name" : name, "params" : params, "seed" : get_seed(),
+                      "version" : code_version(), "files" : files, "size" : size }
+         with open( os.path.join( tmp, _MANIFEST ), 'w' ) as f:
+            json.dump( manifest, f, sort_keys=True, indent=1, default=str )
+         _copy_tree( tmp, dest, skip=_MANIFEST )
+         try:
+            os.rename( tmp, entry )
+         except OSError:
+            # another process stored the same entry first
+            shutil.rmtree( tmp, ignore_errors=True )
+      except:
+         shutil.rmtree( tmp, ignore_errors=True )
+         raise
+      self.evict()
+      return result
+
+   # Returns a list of (last use, size, key) of the entries, oldest first.
+   def entries( self ):
+      entries = []
+      for key in os.listdir( self.root ):
+         manifest = os.path.join( self.root, key, _MANIFEST )
+         if not os.path.isfile( manifest ):
+            continue
+         with open( manifest, 'r' ) as f:
+            size = json.load( f )["size"]
+         entries.append( (os.path.getmtime( os.path.join( self.root, key ) ), size, key) )
+      return sorted( entries )
+
+   # Returns the total size of the cached files in bytes.
+   def size( self ):
+      return sum( size for (_, size, _) in self.entries() )
+
+   # Drops the least recently used entries until the cache is within its limit.
+   def evict( self ):
+      entries = self.entries()
+      total = sum( size for (_, size, _) in entries )
+      for (_, size, key) in entries:
+         if total <= self.max_bytes:
+            break
+         shutil.rmtree( os.path.join( self.root, key ), ignore_errors=True )
+         total -= size
+
+   # Removes every entry of the cache.
+   def clear( self ):
+      for (_, _, key) in self.entries():
+         shutil.rmtree( os.path.join( self.root, key ), ignore_errors=True )
+
+# Helper function
+# Returns the paths of all files below a directory, relative to it.
+def _list_files( root ):
+   files = []
+   for (path, dirs, names) in os.walk( root ):
+      for fn in names:
+         files.append( os.path.relpath( os.path.join( path, fn ), root ) )
+   return sorted( files )
+
+# Helper function
+# Copies every file below src into dst, keeping the directory structure.
+def _copy_tree( src, dst, skip=None ):
+   for fn in _list_files( src ):
+      if fn == skip:
+         continue
+      target = os.path.join( dst, fn )
+      folder = os.path.dirname( target )
+      if not os.path.isdir( folder ):
+         os.makedirs( folder )
+      shutil.copyfile( os.path.join( src, fn ), target )
@@ -0,0 +1,194 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains batched golden models of the generated stochastic circuits.
+# The models compute the expected output streams used by the testbenches for
+# every (batch, output) pair in a single pass, rather than calling pysc's
+# sc_dot_product once per pair. Streams are held as bitstream.PackedStreams.
+
+import bitstream
+import numpy as np
+import profiling
+from common import *
+
+# Computes the element-wise stochastic products of two arrays of streams.
+# Uni-polar multiplication is an AND gate, bi-polar multiplication is an XNOR gate.
+# Parameters:
+#  x, y, PackedStreams (broadcastable against each other)
+#  rep, a string, 'uni' or 'bi', the stochastic representation
+def sc_multiply( x, y, rep="uni" ):
+   if rep == "uni":
+      return x & y
+   elif rep == "bi":
+      return ~(x ^ y)
+   else:
+      raise ValueError( "Unknown stochastic representation: " + str(rep) )
+
+# Computes the output of a stochastic matrix multiply, the expected value of
+# the outputStreams of the generated sc_matrix_mult module.
+# Parameters:
+#  datas, streams of shape (M, N), the input matrix streams
+#  weights, streams of shape (O, N), the (transposed) weight matrix streams
+#  rep, a string, 'uni' or 'bi', the stochastic representation
+#  sel_sequence, an int array of length L, the raw select numbers shared by every
+#     sc_nadder (only used when alaghi is False)
+#  alaghi, a boolean, specifies that alaghi adder trees are used
+# Streams are either PackedStreams or bool arrays with time as the last axis.
+# Returns PackedStreams of shape (M, O).
+def sc_matrix_mult( datas, weights, rep="uni", sel_sequence=None, alaghi=False ):
+   model = MatrixMultModel( rep=rep, alaghi=alaghi )
+   return model.run( datas, weights, sel_sequence )
+
+# Computes the output of a stochastic dot product of two vectors of streams.
+# Parameters:
+#  datas, weights, streams of shape (N)
+#  rep, sel_sequence, alaghi, see sc_matrix_mult
+# Returns PackedStreams of shape ().
+def sc_dot_product( datas, weights, rep="uni", sel_sequence=None, alaghi=False ):
+   datas = bitstream.pack( datas )
+   weights = bitstream.pack( weights )
+   result = sc_matrix_mult( datas[np.newaxis], weights[np.newaxis],
+                            rep=rep, sel_sequence=sel_sequence, alaghi=alaghi )
+   return result[0, 0]
+
+# Golden model of the generated sc_matrix_mult module which runs over a stream
+# one chunk of cycles at a time. The toggle flip-flops of the alaghi adders
+# carry their state from one chunk into the next, so running consecutive
+# chunks gives the same streams as running the whole stream at once.
+class MatrixMultModel( object ):
+
+   # rep, a string, 'uni' or 'bi', the stochastic representation
+   # alaghi, a boolean, specifies that alaghi adder trees are used
+   def __init__( self, rep="uni", alaghi=False ):
+      self.rep = rep
+      self.alaghi = alaghi
+      self.tree = AlaghiTreeModel()
+
+   # Computes the next chunk of output streams.
+   # See sc_matrix_mult for the parameters, L is the length of the chunk.
+   @profiling.timed( "golden" )
+   def run( self, datas, weights, sel_sequence=None ):
+      datas = bitstream.pack( datas )
+      weights = bitstream.pack( weights )
+      if self.alaghi:
+         # every product stream is needed by the adder tree
+         products = sc_multiply( datas[:, np.newaxis, :], weights[np.newaxis, :, :], self.rep )
+         return self.tree.run( products )
+
+      # The mux adder only passes the product selected on each cycle, so select
+      # the data and weight bits first and multiply those.
+      sel = np.asarray( sel_sequence, dtype=np.int64 ) % datas.shape[-1]
+      data_sel = bitstream.mux_select( datas, sel )        # (M)
+      weight_sel = bitstream.mux_select( weights, sel )    # (O)
+      return sc_multiply( data_sel[:, np.newaxis], weight_sel[np.newaxis, :], self.rep )
+
+# Golden model of a bank of sc_dot_product modules, every one fed its own pair
+# of vectors, such as the engines of a folded sc_matrix_mult. Like
+# MatrixMultModel it can be run one chunk of cycles at a time, and the adders
+# of every engine carry their state from one chunk into the next.
+class DotProductsModel( object ):
+
+   # rep, a string, 'uni' or 'bi', the stochastic representation
+   # alaghi, a boolean, specifies that alaghi adder trees are used
+   def __init__( self, rep="uni", alaghi=False ):
+      self.rep = rep
+      self.alaghi = alaghi
+      self.tree = AlaghiTreeModel()
+
+   # Computes the next chunk of output streams.
+   #  datas, weights, streams of shape (P, N), the vectors of every engine
+   #  sel_sequence, see sc_matrix_mult
+   # Returns PackedStreams of shape (P).
+   @profiling.timed( "golden" )
+   def run( self, datas, weights, sel_sequence=None ):
+      datas = bitstream.pack( datas )
+      weights = bitstream.pack( weights )
+      if self.alaghi:
+         return self.tree.run( sc_multiply( datas, weights, self.rep ) )
+
+      sel = np.asarray( sel_sequence, dtype=np.int64 ) % datas.shape[-1]
+      return sc_multiply( bitstream.mux_select( datas, sel ),
+                          bitstream.mux_select( weights, sel ), self.rep )
+
+# Golden model of a tree of alaghi adders, the one built by alaghi_nadder_gen,
+# for a batch of input vectors. The inputs are padded with constant 0 streams
+# up to a power of 2 and neighbouring streams are added pairwise, one level at
+# a time. Like MatrixMultModel it can be run one chunk of cycles at a time.
+class AlaghiTreeModel( object ):
+
+   # seed, an int, the reset_seed parameter of the alaghi adders
+   def __init__( self, seed=0 ):
+      self.seed = seed
+      # toggle flip-flop state of every level of the tree, created on first use
+      self.tffs = None
+
+   # Computes the next chunk of the tree's output.
+   #  inputs, streams of shape (..., N)
+   # Returns PackedStreams of shape (...).
+   @profiling.timed( "alaghi_tree" )
+   def run( self, inputs ):
+      inputs = bitstream.pack( inputs )
+      n = inputs.shape[-1]
+      width = int(2 ** clogb2( n )) if n > 1 else 1
+      if width != n:
+         pad = [(0, 0)] * inputs.words.ndim
+         pad[-2] = (0, width - n)
+         inputs = bitstream.PackedStreams( np.pad( inputs.words, pad, mode='constant' ),
+                                           inputs.length )
+
+      if self.tffs is None:
+         self.tffs = []
+         pairs = width
+         while pairs > 1:
+            pairs = pairs // 2
+            self.tffs.append( np.full( inputs.shape[:-1] + (pairs,), bool(self.seed),
+                                       dtype=bool ) )
+
+      level = inputs
+      for i in range(len(self.tffs)):
+         (level, self.tffs[i]) = alaghi_add( level[..., 0::2], level[..., 1::2], self.tffs[i] )
+
+      return level[..., 0]
+
+# Computes the output of a tree of alaghi adders over whole streams.
+# Parameters:
+#  inputs, streams of shape (..., N)
+# Returns PackedStreams of shape (...).
+def alaghi_tree( inputs ):
+   return AlaghiTreeModel().run( inputs )
+
+# Computes the output of alaghi adders for arrays of stream pairs.
+# Each adder holds a toggle flip-flop which starts at the reset seed. When the
+# inputs differ the adder outputs the flip-flop and toggles it, otherwise it
+# passes y. The flip-flop before cycle t is therefore the seed xor the parity
+# of the differing cycles before t, an exclusive prefix xor of x ^ y, so every
+# adder is computed at once with a scan over the packed words.
+# Parameters:
+#  x, y, PackedStreams of the same shape (...)
+#  tff, a bool array of shape (...), the flip-flop states before the first
+#     cycle, defaults to the seed
+#  seed, an int, the reset_seed parameter of alaghi_adder.v
+# Returns the output streams, PackedStreams of shape (...), and the
+# flip-flop states after the last cycle.
+def alaghi_add( x, y, tff=None, seed=0 ):
+   diff = x ^ y
+   if tff is None:
+      tff = np.full( x.shape, bool(seed), dtype=bool )
+
+   # inclusive prefix xor within every word
+   scan = diff.words.copy()
+   shift = 1
+   while shift < bitstream.WORD_BITS:
+      scan ^= scan << np.uint64( shift )
+      shift *= 2
+
+   # the top bit of a word's scan is the parity of the whole word, the state
+   # entering each word is the initial state xor the parity of earlier words
+   parity = (scan >> np.uint64( bitstream.WORD_BITS - 1 )).astype( bool )
+   carry = np.logical_xor.accumulate( parity, axis = -1 )
+   entering = np.logical_xor( tff[..., np.newaxis], carry ^ parity )
+
+   # shift by one to make the scan exclusive and fill in the entering state
+   states = (scan << np.uint64( 1 )) ^ np.where( entering, bitstream.ONES, np.uint64( 0 ) )
+   states = bitstream.PackedStreams( states & bitstream.tail_mask( x.length ), x.length )
+
+   tff_out = np.logical_xor( tff, carry[..., -1] ) if x.length else tff
+   return (bitstream.mux( diff, y, states ), tff_out)
@@ -2,13 +2,51 @@
 # Python script to generate a Verilog LFSR module.
 
 from common import *
+import gen_cache
+import lfsr_model
+import lfsr_taps
+import netlist
 import os
 
+# hard code the xor taps into a dictionary (bit_width->tapLocations)
+TAPS = {}
+TAPS[3] = [3, 2]
+TAPS[4] = [4, 3]
+TAPS[5] = [5, 3]
+TAPS[6] = [6, 5]
+TAPS[7] = [7, 6]
+TAPS[8] = [8, 7, 6, 1]
+TAPS[9] = [9, 5]
+TAPS[10] = [10, 7]
+TAPS[11] = [11, 9]
+TAPS[12] = [12, 11, 10, 4]
+TAPS[13] = [13, 12, 11, 8]
+TAPS[14] = [14, 13, 12, 2]
+TAPS[15] = [15, 14]
+TAPS[16] = [16, 15, 13, 4]
+TAPS[17] = [17, 14]
+TAPS[18] = [18, 11]
+TAPS[19] = [19, 18, 17, 14]
+TAPS[20] = [20, 17]
+TAPS[24] = [24, 23, 22, 17]
+TAPS[32] = [32, 31, 30, 10]
+
+# Returns a copy of the xor tap locations of an LFSR of the given bit width.
+# Tap t is bit t-1 of the shift register. Widths missing from TAPS are looked
+# up in (or searched for and added to) the table of lfsr_taps, so every width
+# from 2 to 64 gets the full period.
+def get_taps( data_len ):
+   taps = TAPS.get( data_len )
+   if( taps == None ):
+      taps = lfsr_taps.get_taps( data_len )
+   return list( taps )
+
 # Function to open and write a lfsr verilog module to a file.
 #  dest, the directory to write the file into
 #  length, the bit width of the LFSR's output
+@gen_cache.cached
 def generate( dest, length ):
-   with open( os.path.join( dest, LFSR + ".v" ), 'w' ) as f:
+   with open_verilog( os.path.join( dest, LFSR + ".v" ) ) as f:
       write_header_lfsr( f ) 
       write_lfsr_module( f, LFSR, length, zero_detect=True )
 
@@ -20,82 +58,134 @@ def generate( dest, length ):
 #  zero_detect, a boolean, artificially adds a 0 value to the LFSR
 #      zero_detect defaults to True
 def write_lfsr_module( f, module_name, data_len, zero_detect=True ):
-   # hard code the xor taps into a dictionary (bit_width->tapLocations)
-   taps_dict = {}
-   taps_dict[3] = [3, 2]
-   taps_dict[4] = [4, 3]
-   taps_dict[5] = [5, 3]
-   taps_dict[6] = [6, 5]
-   taps_dict[7] = [7, 6]
-   taps_dict[8] = [8, 7, 6, 1]
-   taps_dict[9] = [9, 5]
-   taps_dict[10] = [10, 7]
-   taps_dict[11] = [11, 9]
-   taps_dict[12] = [12, 11, 10, 4]
-   taps_dict[13] = [13, 12, 11, 8]
-   taps_dict[14] = [14, 13, 12, 2]
-   taps_dict[15] = [15, 14] 
-   taps_dict[16] = [16, 15, 13, 4]
-   taps_dict[17] = [17, 14] 
-   taps_dict[18] = [18, 11] 
-   taps_dict[19] = [19, 18, 17, 14] 
-   taps_dict[20] = [20, 17] 
-   taps_dict[24] = [24, 23, 22, 17] 
-   taps_dict[32] = [32, 31, 30, 10] 
-
-   # begin writing the module
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "clk,", 1 )
-   write_line( f, "rst,", 1 )
-   write_line( f, "seed,", 1 )
-   write_line( f, "enable,", 1 )
-   write_line( f, "restart,", 1 )
-   write_line( f, "out", 1 )
-   write_line( f, ");" )
-   write_line( f, "parameter N = " + str(data_len) + ";", 1 ) 
-   write_line( f, "" )
-   write_line( f, "input clk;", 1 ) 
-   write_line( f, "input rst;", 1 ) 
-   write_line( f, "input [N-1:0] seed;", 1 ) 
-   write_line( f, "input enable;", 1 ) 
-   write_line( f, "input restart;", 1 ) 
-   write_line( f, "output [N-1:0] out;", 1 ) 
-   write_line( f, "" )
-   write_line( f, "reg [N-1:0] shift_reg;", 1 ) 
-   write_line( f, "wire shift_in;", 1 ) 
-   write_line( f, "" )
-   write_line( f, "always @(posedge clk or posedge rst) begin", 1 ) 
-   write_line( f, "if (rst) shift_reg <= seed;", 2 ) 
-   write_line( f, "else if (restart) shift_reg <= seed;", 2 ) 
-   write_line( f, "else if (enable) shift_reg <= {shift_reg[N-2:0], shift_in};", 2 ) 
-   write_line( f, "end", 1 ) 
-   write_line( f, "" )
+   netlist.write_module( f, build_lfsr_module( module_name, data_len, zero_detect ) )
+
+# Builds the netlist of a lfsr module, see write_lfsr_module.
+def build_lfsr_module( module_name, data_len, zero_detect=True ):
+   m = netlist.Module( module_name )
+   data_len = m.add_param( "N", data_len )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   seed = m.add_input( "seed", data_len )
+   enable = m.add_input( "enable" )
+   restart = m.add_input( "restart" )
+   out = m.add_output( "out", data_len )
+
+   shift_in = m.add_wire( "shift_in" )
+   shifted = netlist.Op( "concat", netlist.Ref( "shift_reg", data_len-2, 0 ), shift_in )
+   shift_reg = m.add_register( "shift_reg", data_len,
+                               [(netlist.Ref( "rst" ), seed), (restart, seed), (enable, shifted)],
+                               async_reset="rst" )
 
    # determine and place the xor taps
-   taps = taps_dict.get( data_len )
-   if( taps == None ):
-      taps = [3, 2]
+   taps = get_taps( data_len )
+   xor_out = m.add_wire( "xor_out" )
+   m.assign( xor_out, netlist.xor_all( [netlist.Ref( "shift_reg", tap-1 ) for tap in taps] ) )
+
+   if zero_detect:
+      zero_detector = m.add_wire( "zero_detector" )
+      m.assign( zero_detector, netlist.Op( "not", netlist.Op( "reduce_or",
+                netlist.Ref( "shift_reg", data_len-2, 0 ) ) ) )
+      m.assign( shift_in, netlist.Op( "xor", xor_out, zero_detector ) )
+   else:
+      m.assign( shift_in, xor_out )
+
+   m.assign( out, shift_reg )
+   return m
 
-   # add the first tap, then delete it from list
-   taps_str = "shift_reg[" + str(taps[0]-1) + "]" 
-   del taps[0]
-   for tap in taps:
-      taps_str += " ^ shift_reg[" + str(tap-1) + "]"
-   taps_str += ";"
+# Returns the netlist.Design of a lfsr module, for simulation.
+def build_design( data_len, zero_detect=True ):
+   return netlist.Design( build_lfsr_module( LFSR, data_len, zero_detect ) )
 
-   write_line( f, "wire xor_out;", 1 )
-   write_line( f, "assign xor_out = " + taps_str, 1 )
+# Function to open and write a leap-forward lfsr verilog module to a file.
+#  dest, the directory to write the file into
+#  length, the bit width of the LFSR's states
+#  lanes, the number of states the LFSR outputs per clock
+@gen_cache.cached
+def generate_leap( dest, length, lanes ):
+   with open_verilog( os.path.join( dest, LFSR_LEAP + ".v" ) ) as f:
+      write_header_lfsr_leap( f )
+      write_lfsr_leap_module( f, LFSR_LEAP, length, lanes, zero_detect=True )
+
+# Writes a leap-forward LFSR module, which steps k states of the LFSR of
+# write_lfsr_module per clock. out[j*N +: N] is the state of the j-th of the
+# k clocks of the serial module, the layout of the rng input of a k-lane sng.
+# Parameters:
+#  f, the file to write to
+#  module_name, a string
+#  data_len, the bit width of the LFSR's states
+#  lanes, an int, k, the states per clock, 1 to 2^data_len - 1
+#  zero_detect, a boolean, artificially adds a 0 value to the LFSR
+#      zero_detect defaults to True
+def write_lfsr_leap_module( f, module_name, data_len, lanes, zero_detect=True ):
+   netlist.write_module( f, build_lfsr_leap_module( module_name, data_len, lanes, zero_detect ) )
+
+# Builds the netlist of a leap-forward lfsr module, see write_lfsr_leap_module.
+# Lane j of the linear register is an xor network of the state, the GF(2)
+# matrix of j steps (lfsr_model.LfsrModel.leap_matrices). With zero detect
+# the lanes are then corrected for the inserted 0 as in LfsrModel.leap.
+def build_lfsr_leap_module( module_name, data_len, lanes, zero_detect=True ):
+   model = lfsr_model.LfsrModel( data_len, get_taps( data_len ), zero_detect )
+   model.check_leap( lanes )
+   matrices = model.leap_matrices( lanes )
+
+   m = netlist.Module( module_name )
+   data_len = m.add_param( "N", data_len )
+   lanes = m.add_param( "LANES", lanes )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   seed = m.add_input( "seed", data_len )
+   enable = m.add_input( "enable" )
+   restart = m.add_input( "restart" )
+   out = m.add_output( "out", lanes * data_len )
+
+   # the register takes the state after the last lane
+   state = "state" if zero_detect else "linear"
+   shift_reg = m.add_register( "shift_reg", data_len,
+                               [(netlist.Ref( "rst" ), seed), (restart, seed),
+                                (enable, _lane( state, data_len, lanes ))],
+                               async_reset="rst" )
+
+   m.add_wire( "linear", (lanes+1) * data_len, comment="states of the linear register" )
+   m.assign( _lane( "linear", data_len, 0 ), shift_reg )
+   for j in range(1, lanes+1):
+      for bit in range(data_len):
+         row = [i for i in range(data_len) if (int(matrices[j][i]) >> bit) & 1]
+         m.assign( netlist.Ref( "linear", j*data_len + bit ),
+                   netlist.xor_all( [netlist.Ref( "shift_reg", i ) for i in row] ) )
 
    if zero_detect:
-      write_line( f, "" )
-      write_line( f, "wire zero_detector;", 1 )
-      write_line( f, "assign zero_detector = ~(|(shift_reg[N-2:0]));", 1 )
-      write_line( f, "assign shift_in = xor_out ^ zero_detector;", 1 )
-      write_line( f, "" )
+      # the lanes holding the state with the top bit alone, after which 0 is inserted
+      m.add_wire( "top", lanes )
+      for j in range(lanes):
+         m.assign( netlist.Ref( "top", j ), netlist.Op( "eq", _lane( "linear", data_len, j ),
+                   netlist.Const( 1 << (data_len-1), data_len ) ) )
+      zero_detector = m.add_wire( "zero_detector" )
+      m.assign( zero_detector, netlist.Op( "not", netlist.Op( "reduce_or", shift_reg ) ) )
 
-   write_line( f, "assign out = shift_reg;", 1 )
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+      m.add_wire( "state", (lanes+1) * data_len, comment="states of the register, 0 inserted" )
+      m.assign( _lane( "state", data_len, 0 ), shift_reg )
+      for j in range(1, lanes+1):
+         lane = _lane( "linear", data_len, j )
+         if j > 1:
+            lane = netlist.Op( "mux", netlist.Op( "reduce_or", netlist.Ref( "top", j-2, 0 ) ),
+                               _lane( "linear", data_len, j-1 ), lane )
+         lane = netlist.Op( "mux", netlist.Ref( "top", j-1 ), netlist.Const( 0, data_len ), lane )
+         lane = netlist.Op( "mux", zero_detector, netlist.Const( int(matrices[j-1][0]), data_len ),
+                            lane )
+         m.assign( _lane( "state", data_len, j ), lane )
+
+   m.assign( out, netlist.Ref( state, lanes*data_len - 1, 0 ) )
+   return m
+
+# Returns the netlist.Design of a leap-forward lfsr module, for simulation.
+def build_leap_design( data_len, lanes, zero_detect=True ):
+   return netlist.Design( build_lfsr_leap_module( LFSR_LEAP, data_len, lanes, zero_detect ) )
+
+# Helper function
+# Returns the slice of lane j of a bus of lanes of the given width.
+def _lane( name, width, j ):
+   return netlist.Ref( name, (j+1)*width - 1, j*width )
 
 # writes header comment for lfsr module
 def write_header_lfsr( f ):
@@ -108,3 +198,13 @@ def write_header_lfsr( f ):
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
    write_line( f, "" )
 
+# writes header comment for the leap-forward lfsr module
+def write_header_lfsr_leap( f ):
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "// Create Date: " + get_time() )
+   write_line( f, "//" )
+   write_line( f, "// Description: A leap-forward linear feedback shift register, which steps LANES" )
+   write_line( f, "// states of the lfsr module per clock and outputs them all, out[j*N +: N] the" )
+   write_line( f, "// j-th. Every lane is an xor network of the register, a matrix power over GF(2)." )
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "" )
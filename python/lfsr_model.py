@@ -0,0 +1,304 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains a Python model of the LFSR written by lfsr_gen. It uses
+# the same xor taps and zero detect logic, so the numbers it produces match
+# the generated hardware cycle for cycle, and it is used to produce the random
+# number sequences of the testbench data.
+#
+# Whole sequences are produced with vectorized jump-ahead: the linear part of
+# the LFSR is a matrix over GF(2), so the states a stride apart are found with
+# matrix powers and many lanes of the register are stepped at once. The same
+# matrices give the xor networks of the leap-forward register, which steps
+# several states per clock.
+
+from collections import OrderedDict
+from common import *
+import lfsr_gen
+import numpy as np
+import profiling
+
+# Widths up to this have their whole period computed once and cached, a seed
+# then only picks the starting point within the period.
+PERIOD_CACHE_WIDTH = 20
+
+# The number of cached periods and sequences kept before the oldest is dropped.
+CACHE_SIZE = 32
+
+# Number of lanes of the register stepped at once by the jump-ahead.
+_LANES = 1024
+
+_cache = OrderedDict()
+
+# A model of the LFSR module written by lfsr_gen.write_lfsr_module.
+# The state of the register is an unsigned integer, bit i is shift_reg[i].
+class LfsrModel( object ):
+
+   # width, an int, the bit width of the LFSR (N)
+   # taps, a list of the xor tap locations, defaults to lfsr_gen's taps
+   # zero_detect, a boolean, the zero_detect option of the hardware
+   def __init__( self, width, taps=None, zero_detect=True ):
+      if taps is None:
+         taps = lfsr_gen.get_taps( width )
+      self.width = width
+      self.taps = tuple( taps )
+      self.zero_detect = zero_detect
+      self.mask = np.uint64( (1 << width) - 1 )
+      self.dtype = np.uint32 if width <= 32 else np.uint64
+      # the state with only the most significant bit set
+      self.top = 1 << (width - 1)
+
+   # Returns the key the model's cached sequences are stored under.
+   def key( self ):
+      return (self.width, self.taps, self.zero_detect)
+
+   # Returns the number of states the register cycles through from state 1,
+   # the full period of 2^N (or 2^N - 1 without zero detect) for maximal taps.
+   def period( self ):
+      return len( self._cached_period()[0] )
+
+   # Steps every state in an array of states forward by one clock.
+   # Parameters:
+   #  states, an array of unsigned integer states
+   def step( self, states ):
+      states = np.asarray( states, dtype=np.uint64 )
+      shift_in = self._feedback( states )
+      if self.zero_detect:
+         low = np.uint64( self.top - 1 )
+         shift_in ^= ((states & low) == 0).astype( np.uint64 )
+      return ((states << np.uint64( 1 )) & self.mask) | shift_in
+
+   # Returns the states of the register, out, starting from the seed.
+   # Parameters:
+   #  seed, an int or an array of ints, the seed input of the hardware
+   #  count, an int, the number of cycles
+   #  start, an int, the number of cycles after the seed to start at
+   # Returns an array of shape (count) for one seed or (seeds, count).
+   @profiling.timed( "lfsr" )
+   def sequence( self, seed, count, start=0 ):
+      seeds = np.asarray( seed ).astype( np.uint64 ) & self.mask
+      if self.width <= PERIOD_CACHE_WIDTH:
+         (states, positions) = self._cached_period()
+         pos = positions[seeds]
+         if np.all( pos >= 0 ):
+            # every seed lies on the cached period, so its sequence is a rotation
+            cycles = start + np.arange( count, dtype=np.int64 )
+            return states[(pos[..., np.newaxis] + cycles) % len( states )]
+
+      seq = np.empty( seeds.shape + (count,), dtype=self.dtype )
+      for index in np.ndindex( seeds.shape ):
+         seq[index] = self._cached_run( int(seeds[index]), start + count )[start:]
+      return seq
+
+   # Returns the GF(2) matrix of one linear step (the register without zero
+   # detect), the image of every basis state, a uint64 array of shape (N).
+   def step_matrix( self ):
+      basis = np.uint64( 1 ) << np.arange( self.width, dtype=np.uint64 )
+      return self._linear_step( basis )
+
+   # Returns the GF(2) matrix of count linear steps, see step_matrix.
+   def jump_matrix( self, count ):
+      result = np.uint64( 1 ) << np.arange( self.width, dtype=np.uint64 )
+      power = self.step_matrix()
+      while count > 0:
+         if count & 1:
+            result = apply_matrix( power, result )
+         power = apply_matrix( power, power )
+         count >>= 1
+      return result
+
+   # Returns the GF(2) matrices of 0 to lanes linear steps, see jump_matrix,
+   # the xor networks of the lanes of a leap-forward register.
+   def leap_matrices( self, lanes ):
+      matrices = [self.jump_matrix( 0 )]
+      step = self.step_matrix()
+      for j in range(lanes):
+         matrices.append( apply_matrix( step, matrices[-1] ) )
+      return matrices
+
+   # Steps every state in an array of states forward by lanes clocks at once,
+   # the way the leap-forward module of lfsr_gen.write_lfsr_leap_module does.
+   # Lane j is found from the state by the matrix of j linear steps. The zero
+   # detect inserts 0 after the state with the top bit alone, so the lane after
+   # that state is 0 and the later lanes are the linear lanes one step back,
+   # and the lanes after the state 0 are the steps from 00..01.
+   # Parameters:
+   #  states, an array of unsigned integer states
+   #  lanes, an int, k, the clocks per step
+   # Returns an array of shape states.shape + (k+1), the state and the k states
+   # after it, the last is the next state of the leap-forward register.
+   def leap( self, states, lanes ):
+      self.check_leap( lanes )
+      states = np.asarray( states, dtype=np.uint64 )
+      matrices = self.leap_matrices( lanes )
+      linear = np.stack( [apply_matrix( m, states ) for m in matrices], axis=-1 )
+      if not self.zero_detect:
+         return linear.astype( self.dtype )
+
+      top = linear[..., :lanes] == np.uint64( self.top )
+      seen = np.logical_or.accumulate( top, axis=-1 )
+      before = np.concatenate( (np.zeros( seen.shape[:-1] + (1,), dtype=bool ),
+                                seen[..., :-1]), axis=-1 )
+      after = np.where( before, linear[..., :-1], linear[..., 1:] )
+      after = np.where( top, np.uint64( 0 ), after )
+      from_zero = np.array( [m[0] for m in matrices[:lanes]], dtype=np.uint64 )
+      after = np.where( (states == 0)[..., np.newaxis], from_zero, after )
+      return np.concatenate( (states[..., np.newaxis], after), axis=-1 ).astype( self.dtype )
+
+   # Returns the out values of the leap-forward register over cycles clocks
+   # from the seed, lane j of cycle c being state c*k+j of sequence.
+   # Parameters:
+   #  seed, an int or an array of ints, the seed input of the hardware
+   #  cycles, an int, the number of clocks
+   #  lanes, an int, k, the states per clock
+   # Returns an array of shape (cycles, k) for one seed or (seeds, cycles, k).
+   def leap_sequence( self, seed, cycles, lanes ):
+      self.check_leap( lanes )
+      seq = self.sequence( seed, cycles * lanes )
+      return seq.reshape( seq.shape[:-1] + (cycles, lanes) )
+
+   # Checks that the lanes of a leap-forward register are fewer than the
+   # states of a period, and that the zero detect inserts the state 0, and
+   # raises a ValueError otherwise.
+   def check_leap( self, lanes ):
+      if lanes < 1 or lanes >= (1 << self.width):
+         raise ValueError( "Lanes must be between 1 and 2^" + str(self.width) + "-1: " \
+                           + str(lanes) )
+      if self.zero_detect and self.width not in self.taps:
+         raise ValueError( "A leap-forward LFSR with zero detect needs the top tap: " \
+                           + str(self.taps) )
+
+   # Helper function
+   # Returns the xor of the tap bits of every state.
+   def _feedback( self, states ):
+      shift_in = np.zeros( states.shape, dtype=np.uint64 )
+      for tap in self.taps:
+         shift_in ^= (states >> np.uint64( tap - 1 )) & np.uint64( 1 )
+      return shift_in
+
+   # Helper function
+   # Steps states forward by one clock without the zero detect logic.
+   def _linear_step( self, states ):
+      return ((states << np.uint64( 1 )) & self.mask) | self._feedback( states )
+
+   # Helper function
+   # Runs the register without zero detect for count cycles from a state.
+   # The run is cut into lanes a stride apart, the start of every lane is
+   # found with jump_matrix and then all the lanes are stepped together.
+   def _linear_run( self, state, count ):
+      lanes = max( min( count, _LANES ), 1 )
+      stride = (count + lanes - 1) // lanes
+
+      # double the number of lane starts until there are enough
+      starts = np.array( [state], dtype=np.uint64 )
+      jump = self.jump_matrix( stride )
+      while len( starts ) < lanes:
+         starts = np.concatenate( (starts, apply_matrix( jump, starts )) )
+         jump = apply_matrix( jump, jump )
+      states = starts[:lanes]
+
+      run = np.empty( (stride, lanes), dtype=np.uint64 )
+      for i in range(stride):
+         run[i] = states
+         states = self._linear_step( states )
+      return run.T.reshape( -1 )[:count].astype( self.dtype )
+
+   # Helper function
+   # Returns the first count states of the register starting from a seed.
+   def _run( self, seed, count ):
+      if not self.zero_detect:
+         return self._linear_run( seed, count )
+
+      if self.width not in self.taps:
+         # Without the top tap the zero detect breaks the link with the linear
+         # register, so the register is stepped one clock at a time.
+         seq = np.empty( count, dtype=self.dtype )
+         state = np.uint64( seed )
+         for i in range(count):
+            seq[i] = state
+            state = self.step( state )
+         return seq
+
+      # The zero detect only changes the linear register at the state with the
+      # top bit alone, where 0 is inserted before the next state, 00..01.
+      if seed == 0:
+         if count == 0:
+            return np.empty( 0, dtype=self.dtype )
+         return np.concatenate( (np.zeros( 1, dtype=self.dtype ), self._run( 1, count - 1 )) )
+      seq = self._linear_run( seed, count )
+      tops = np.flatnonzero( seq == self.top )
+      if len( tops ):
+         seq = np.insert( seq, tops + 1, 0 )[:count]
+      return seq
+
+   # Helper function
+   # Returns the first count states from a seed, from the cache when a long
+   # enough run from the same seed has been computed before.
+   def _cached_run( self, seed, count ):
+      key = self.key() + (seed,)
+      seq = _cache_get( key )
+      if seq is None or len( seq ) < count:
+         seq = self._run( seed, count )
+         _cache_put( key, seq )
+      return seq[:count]
+
+   # Helper function
+   # Returns the states of the whole period from state 1 and the position of
+   # every state within it (-1 for states off the period).
+   def _cached_period( self ):
+      key = self.key() + ("period",)
+      period = _cache_get( key )
+      if period is None:
+         count = 1 << self.width
+         if not self.zero_detect or self.width not in self.taps:
+            count = count - 1
+         states = self._run( 1, count )
+         # cut the run at the first repeated state for taps which are not maximal
+         again = np.flatnonzero( states[1:] == states[0] )
+         if len( again ):
+            states = states[:again[0] + 1]
+         positions = np.full( 1 << self.width, -1, dtype=np.int64 )
+         positions[states] = np.arange( len( states ) )
+         period = (states, positions)
+         _cache_put( key, period )
+      return period
+
+# Applies a GF(2) matrix to an array of states.
+# Parameters:
+#  matrix, a uint64 array of shape (N), the image of every basis state
+#  states, a uint64 array of states
+def apply_matrix( matrix, states ):
+   states = np.asarray( states, dtype=np.uint64 )
+   result = np.zeros( states.shape, dtype=np.uint64 )
+   for j in range(len( matrix )):
+      bit = (states >> np.uint64( j )) & np.uint64( 1 )
+      result ^= bit * matrix[j]
+   return result
+
+# Returns the bit width of the LFSR used to generate streams of the given
+# length, wide enough that its period covers the whole stream.
+def rng_width( length ):
+   return max( clogb2( max( length, 1 ) ), 3 )
+
+# Returns the random numbers of an LFSR of the given width, see LfsrModel.sequence.
+# Parameters:
+#  width, an int, the bit width of the LFSR
+#  count, an int, the number of cycles
+#  seed, an int or an array of ints, the seed of the LFSR
+#  start, an int, the number of cycles after the seed to start at
+#  zero_detect, a boolean, the zero_detect option of the hardware
+def lfsr_sequence( width, count, seed, start=0, zero_detect=True ):
+   return LfsrModel( width, zero_detect=zero_detect ).sequence( seed, count, start )
+
+# Helper function
+# Looks up a key in the cache, marking it as the most recently used.
+def _cache_get( key ):
+   value = _cache.pop( key, None )
+   if value is not None:
+      _cache[key] = value
+   return value
+
+# Helper function
+# Adds a value to the cache, dropping the least recently used values.
+def _cache_put( key, value ):
+   _cache[key] = value
+   while len( _cache ) > CACHE_SIZE:
+      _cache.popitem( last=False )
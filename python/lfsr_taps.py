@@ -0,0 +1,198 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file finds and checks the xor taps of maximal length LFSRs.
+#
+# The LFSR written by lfsr_gen shifts left and feeds back the xor of the tap
+# bits, tap t being shift_reg[t-1]. Its bit sequence follows the recurrence of
+# the feedback polynomial x^N + sum( x^(N-t) for every tap t ), and the LFSR
+# has the full period of 2^N - 1 exactly when that polynomial is primitive
+# over GF(2). Primitivity is checked with polynomial arithmetic: the order of
+# x modulo the polynomial must be 2^N - 1, which needs x^(2^N - 1) = 1 and
+# x^((2^N - 1) / q) != 1 for every prime factor q of 2^N - 1. No LFSR is ever
+# stepped, so widths up to 64 are checked in milliseconds.
+#
+# Taps found by the search are kept in a table, lfsr_taps.json, next to this
+# file so every width is only searched once.
+
+import itertools
+import json
+import os
+
+MAX_WIDTH = 64
+
+TABLE_FN = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "lfsr_taps.json" )
+
+# table of taps loaded from TABLE_FN, loaded on first use
+_table = None
+
+# Returns the taps of a maximal length LFSR of the given width.
+# Taps are looked up in the table and searched for when the width is missing.
+# Parameters:
+#  width, an int, the bit width of the LFSR, 2 to MAX_WIDTH
+# Returns a list of taps, highest first, as in lfsr_gen.TAPS.
+def get_taps( width ):
+   table = load_table()
+   taps = table.get( width )
+   if taps is None:
+      taps = find_taps( width )
+      table[width] = taps
+      save_table( table )
+   return list( taps )
+
+# Searches for the taps of a maximal length LFSR of the given width.
+# Two taps are tried first, then four, so the xor gate is as small as possible.
+# Among taps of the same count the highest taps are preferred.
+def find_taps( width ):
+   if width < 2 or width > MAX_WIDTH:
+      raise ValueError( "LFSR width must be between 2 and " + str(MAX_WIDTH) + ": " + str(width) )
+
+   factors = prime_factors( (1 << width) - 1 )
+   for count in (1, 3):
+      for others in itertools.combinations( range(width - 1, 0, -1), count ):
+         taps = [width] + list( others )
+         if is_primitive( taps_to_poly( width, taps ), width, factors ):
+            return taps
+
+   raise ValueError( "No maximal length taps found for width " + str(width) )
+
+# Checks that the taps give an LFSR of the given width the full period.
+# Parameters:
+#  width, an int, the bit width of the LFSR
+#  taps, a list of taps
+def is_maximal( width, taps ):
+   if width not in taps:
+      return False
+   return is_primitive( taps_to_poly( width, taps ), width )
+
+# Returns the feedback polynomial of an LFSR as an int, bit i is the
+# coefficient of x^i.
+def taps_to_poly( width, taps ):
+   poly = 1 << width
+   for tap in taps:
+      poly ^= 1 << (width - tap)
+   return poly
+
+# Checks that a polynomial of the given degree is primitive over GF(2).
+# Parameters:
+#  poly, an int, the polynomial, see taps_to_poly
+#  degree, an int, the degree of poly
+#  factors, the prime factors of 2^degree - 1, computed when not given
+def is_primitive( poly, degree, factors=None ):
+   if not poly & 1:
+      return False
+   order = (1 << degree) - 1
+   if factors is None:
+      factors = prime_factors( order )
+   if poly_powmod( 2, order, poly, degree ) != 1:
+      return False
+   for q in factors:
+      if poly_powmod( 2, order // q, poly, degree ) == 1:
+         return False
+   return True
+
+# Multiplies two polynomials modulo poly, a polynomial of the given degree.
+def poly_mulmod( a, b, poly, degree ):
+   result = 0
+   top = 1 << degree
+   while b:
+      if b & 1:
+         result ^= a
+      b >>= 1
+      a <<= 1
+      if a & top:
+         a ^= poly
+   return result
+
+# Raises a polynomial to a power modulo poly, a polynomial of the given degree.
+def poly_powmod( a, exp, poly, degree ):
+   result = 1
+   while exp:
+      if exp & 1:
+         result = poly_mulmod( result, a, poly, degree )
+      a = poly_mulmod( a, a, poly, degree )
+      exp >>= 1
+   return result
+
+# Returns the distinct prime factors of n, smallest first.
+def prime_factors( n ):
+   factors = set()
+   stack = [n]
+   while stack:
+      m = stack.pop()
+      if m == 1:
+         continue
+      if is_prime( m ):
+         factors.add( m )
+         continue
+      d = _pollard_rho( m )
+      stack.extend( [d, m // d] )
+   return sorted( factors )
+
+# Deterministic Miller-Rabin primality test for n < 2^64.
+def is_prime( n ):
+   if n < 2:
+      return False
+   bases = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37]
+   for p in bases:
+      if n % p == 0:
+         return n == p
+   d = n - 1
+   s = 0
+   while d % 2 == 0:
+      d //= 2
+      s += 1
+   for a in bases:
+      x = pow( a, d, n )
+      if x == 1 or x == n - 1:
+         continue
+      for i in range(s - 1):
+         x = pow( x, 2, n )
+         if x == n - 1:
+            break
+      else:
+         return False
+   return True
+
+# Loads the table of taps, a dictionary of width->taps.
+def load_table():
+   global _table
+   if _table is None:
+      _table = {}
+      if os.path.exists( TABLE_FN ):
+         with open( TABLE_FN, 'r' ) as f:
+            for (width, taps) in json.load( f ).items():
+               _table[int(width)] = taps
+   return _table
+
+# Writes the table of taps to TABLE_FN. The table is written to a temporary
+# file first and renamed over the old one, so it is never left half written.
+def save_table( table ):
+   tmp = TABLE_FN + ".tmp"
+   lines = [" \"" + str(w) + "\": " + json.dumps( table[w] ) for w in sorted( table )]
+   with open( tmp, 'w' ) as f:
+      f.write( "{\n" + ",\n".join( lines ) + "\n}\n" )
+   os.rename( tmp, TABLE_FN )
+
+# Helper function
+# Returns a non-trivial factor of a composite n with Pollard's rho.
+def _pollard_rho( n ):
+   if n % 2 == 0:
+      return 2
+   c = 1
+   while True:
+      x = 2
+      y = 2
+      d = 1
+      while d == 1:
+         x = (x * x + c) % n
+         y = (y * y + c) % n
+         y = (y * y + c) % n
+         d = _gcd( abs( x - y ), n )
+      if d != n:
+         return d
+      c += 1
+
+# Helper function
+def _gcd( a, b ):
+   while b:
+      (a, b) = (b, a % b)
+   return a
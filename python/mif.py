@@ -0,0 +1,182 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains the encoder for the 'mif' data files read by the
+# generated testbenches. Whole arrays of bits are converted to text with
+# array operations and each file is written with a single write call.
+#
+# Three data formats are supported:
+#  bin, ascii binary read by $readmemb (one character per bit)
+#  hex, ascii hexadecimal read by $readmemh (one character per 4 bits)
+#  raw, packed big-endian bytes read by $fread (no text at all)
+
+import bitstream
+from common import *
+import numpy as np
+import os
+import profiling
+
+FORMATS = ["bin", "hex", "raw"]
+
+# file extension used for each data format
+_EXTENSIONS = { "bin" : ".mif", "hex" : ".hex", "raw" : ".bin" }
+
+# lookup tables from a bit and a nibble to its ascii character
+_BIT_CHARS = np.array( [ord('0'), ord('1')], dtype=np.uint8 )
+_HEX_CHARS = np.array( [ord(c) for c in "0123456789abcdef"], dtype=np.uint8 )
+_NEWLINE = ord('\n')
+
+# Encodes a matrix of bits as lines of text interpretable by verilog's readmemb().
+# Parameters:
+#  bits, an array of shape (L, W), one row per line of the file. Column 0 is
+#     the least significant bit, so it is the last character of the line.
+# Returns the encoded text as a byte string.
+def bits_to_text( bits ):
+   bits = np.asarray( bits, dtype=bool )
+   (lines, width) = bits.shape
+   chars = np.empty( (lines, width + 1), dtype=np.uint8 )
+   chars[:, :width] = _BIT_CHARS[bits[:, ::-1].astype(np.uint8)]
+   chars[:, width] = _NEWLINE
+   return chars.tobytes()
+
+# Encodes a matrix of bits as lines of text interpretable by verilog's readmemh().
+# Lines are padded with leading zeros to a whole number of hex digits.
+# Parameters:
+#  bits, an array of shape (L, W), see bits_to_text
+def bits_to_hex_text( bits ):
+   nibbles = _pack_words( bits, 4 )
+   (lines, digits) = nibbles.shape
+   chars = np.empty( (lines, digits + 1), dtype=np.uint8 )
+   chars[:, :digits] = _HEX_CHARS[nibbles]
+   chars[:, digits] = _NEWLINE
+   return chars.tobytes()
+
+# Encodes a matrix of bits as packed bytes interpretable by verilog's $fread().
+# Every line becomes a big-endian word of whole bytes, padded with leading zeros.
+# Parameters:
+#  bits, an array of shape (L, W), see bits_to_text
+def bits_to_raw( bits ):
+   return _pack_words( bits, 8 ).tobytes()
+
+# Encodes a matrix of bits in the given data format.
+# Parameters:
+#  bits, an array of shape (L, W), see bits_to_text
+#  datafmt, a string, one of FORMATS
+def encode_bits( bits, datafmt="bin" ):
+   if datafmt == "bin":
+      return bits_to_text( bits )
+   elif datafmt == "hex":
+      return bits_to_hex_text( bits )
+   elif datafmt == "raw":
+      return bits_to_raw( bits )
+   else:
+      raise ValueError( "Unknown data format: " + str(datafmt) )
+
+# Helper function
+# Groups each row of bits into digits of 'size' bits, most significant digit first.
+# Rows are padded with zeros on the most significant side.
+def _pack_words( bits, size ):
+   bits = np.asarray( bits, dtype=bool )
+   (lines, width) = bits.shape
+   digits = max( (width + size - 1) // size, 1 )
+   padded = np.zeros( (lines, digits * size), dtype=np.uint8 )
+   padded[:, :width] = bits
+   # reverse so the most significant bit of every digit comes first
+   msb_first = padded[:, ::-1].reshape( (lines, digits, size) )
+   weights = 1 << np.arange( size - 1, -1, -1 )
+   return msb_first.dot( weights ).astype( np.uint8 )
+
+# Encodes a flattened matrix of stochastic streams for readmemb().
+# Line t of the text holds bit t of every stream. Streams are flattened in
+# row-major order, with the first stream in the least significant position.
+# Parameters:
+#  streams, PackedStreams or a bool array of shape (..., L)
+#  datafmt, a string, one of FORMATS
+#  lanes, an int, the stream bits per cycle of a k-lane datapath, see lane_bits
+@profiling.timed( "mif" )
+def streams_to_text( streams, datafmt="bin", lanes=1 ):
+   if isinstance( streams, bitstream.PackedStreams ):
+      streams = streams.to_bools()
+   streams = np.asarray( streams, dtype=bool )
+   length = streams.shape[-1]
+   flat = streams.reshape( (-1, length) )
+   return encode_bits( lane_bits( flat.T, lanes ), datafmt )
+
+# Encodes a sequence of unsigned integers as binary numbers of a fixed width,
+# one number per line.
+# Parameters:
+#  values, an array of unsigned integers
+#  width, an int, the number of binary digits written for every value
+#  datafmt, a string, one of FORMATS
+#  lanes, an int, the values per line, see lane_bits
+@profiling.timed( "mif" )
+def ints_to_text( values, width, datafmt="bin", lanes=1 ):
+   width = max( width, 1 )
+   values = np.asarray( values ).astype( np.int64 )
+   shifts = np.arange( width, dtype=np.int64 )
+   bits = (values[:, np.newaxis] >> shifts[np.newaxis, :]) & 1
+   return encode_bits( lane_bits( bits, lanes ), datafmt )
+
+# Returns the lines of a k-lane datapath, which takes k consecutive lines of
+# a serial one every cycle. Line t holds lines t*k to t*k + k - 1, line
+# t*k + j in bits [j*W, (j+1)*W), so lane j is the j-th of the k cycles.
+# Parameters:
+#  bits, an array of shape (L, W), see bits_to_text, L a multiple of lanes
+#  lanes, an int, k
+# Returns an array of shape (L/k, k*W).
+def lane_bits( bits, lanes=1 ):
+   (lines, width) = bits.shape
+   if lines % lanes != 0:
+      raise ValueError( "Lines must be a multiple of the lanes: " + str(lines) + ", " \
+                        + str(lanes) )
+   return bits.reshape( (lines // lanes, lanes * width) )
+
+# Writes a flattened matrix of stochastic streams to the file at path.
+# See streams_to_text for the layout of the file.
+# When append is True the lines are added to the end of an existing file,
+# so long streams can be written one chunk of cycles at a time.
+def write_streams( path, streams, datafmt="bin", append=False, lanes=1 ):
+   write_text( path, streams_to_text( streams, datafmt, lanes ), append )
+
+# Writes a sequence of fixed width unsigned integers to the file at path.
+# See ints_to_text for the layout of the file.
+def write_ints( path, values, width, datafmt="bin", append=False, lanes=1 ):
+   write_text( path, ints_to_text( values, width, datafmt, lanes ), append )
+
+# Writes already encoded text to the file at path with a single write.
+def write_text( path, text, append=False ):
+   with profiling.span( "write", os.path.basename( path ) ):
+      with open( path, 'ab' if append else 'wb' ) as f:
+         f.write( text )
+      profiling.add_bytes( len( text ) )
+
+# Returns the name of a data file for the given data format.
+# The extension of fn is replaced by the extension of the format.
+def file_name( fn, datafmt="bin" ):
+   return os.path.splitext( fn )[0] + _EXTENSIONS[datafmt]
+
+# Writes the declarations needed by write_mem_load to file f.
+# Only the raw format needs any, a file descriptor and a return code for $fread.
+def write_mem_load_decls( f, datafmt, numTabs=1 ):
+   if datafmt == "raw":
+      write_line( f, "integer data_fd;", numTabs )
+      write_line( f, "integer data_count;", numTabs )
+
+# Writes the verilog statements which load a data file into a memory to file f.
+# The statements belong inside an initial block.
+# Parameters:
+#  f, the file to write to
+#  datafmt, a string, one of FORMATS
+#  fn_param, a string, the verilog parameter holding the file name
+#  mem_name, a string, the verilog memory to load
+#  length, a string, the verilog expression for the number of words to load
+#  numTabs, an int, the indentation of the statements
+def write_mem_load( f, datafmt, fn_param, mem_name, length, numTabs=2 ):
+   if datafmt == "bin":
+      write_line( f, "$readmemb(" + fn_param + ", " + mem_name + ", 0, " + length + "-1);", numTabs )
+   elif datafmt == "hex":
+      write_line( f, "$readmemh(" + fn_param + ", " + mem_name + ", 0, " + length + "-1);", numTabs )
+   elif datafmt == "raw":
+      write_line( f, "data_fd = $fopen(" + fn_param + ", \"rb\");", numTabs )
+      write_line( f, "data_count = $fread(" + mem_name + ", data_fd, 0, " + length + ");", numTabs )
+      write_line( f, "$fclose(data_fd);", numTabs )
+   else:
+      raise ValueError( "Unknown data format: " + str(datafmt) )
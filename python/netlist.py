@@ -0,0 +1,592 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains a small in-memory netlist of the generated hardware.
+# The design generators build a Module (ports, parameters, nets, registers,
+# continuous assignments and instances of other modules) and write_module
+# serializes it to verilog. Designs can be inspected, transformed, simulated
+# and cached as data before, or instead of, being written out.
+#
+# Expressions are trees of Ref, Const and Op. Widths are always ints, so the
+# netlist never has to evaluate verilog parameters. A width of None declares a
+# scalar, any int declares a vector, even of width 1, so that its bits can
+# still be selected. A Width is an int which also carries the parameter
+# expression it was computed from, and is declared with it ([PRECISION-1:0]),
+# so a module instantiated with other parameters gets ports of their size.
+#
+# Regular arrays of instances are written as generate loops. Their
+# connections are templates, which select bits with Index, the value of the
+# loop variables, and every instance of the array is also added to the
+# module as an ordinary Instance of the template at its index.
+
+from common import *
+import hashlib
+import itertools
+
+# Operators of Op, the number of operands and the verilog operator.
+# 'index' selects the bit of its first operand given by its second (x[sel]).
+_BINARY = { "and" : "&", "or" : "|", "xor" : "^", "eq" : "==", "lt" : "<", "add" : "+" }
+_UNARY = { "not" : "~", "reduce_or" : "|" }
+_ASSOCIATIVE = ("and", "or", "xor", "add")
+OPS = sorted( list(_BINARY) + list(_UNARY) + ["mux", "concat", "index"] )
+
+# instances longer than this are written one connection per line
+_LINE_LENGTH = 100
+
+# An int width together with the verilog expression of the module's
+# parameters it is equal to, e.g. Width( 8, "PRECISION" ). Module.add_param
+# returns the Width of a parameter. The product of two Widths is the Width of
+# the product of their expressions, and multiplying by 1 keeps the expression,
+# any other arithmetic gives a plain int.
+class Width( int ):
+
+   def __new__( cls, value, expr ):
+      width = int.__new__( cls, value )
+      width.expr = expr
+      return width
+
+   def __getnewargs__( self ):
+      return (int(self), self.expr)
+
+   def __mul__( self, other ):
+      if isinstance( other, Index ):
+         return NotImplemented
+      if isinstance( other, Width ):
+         return Width( int(self) * int(other), self.expr + "*" + other.expr )
+      if other == 1 and isinstance( other, int ):
+         return self
+      return int(self) * other
+
+   __rmul__ = __mul__
+
+# The value of the loop variables of a generate loop in a bit select, a sum
+# of genvar*scale terms and an offset. Index( "i" ) is the genvar i, and
+# Indexes add and are scaled by ints and Widths, e.g. Index( "i" ) * inpt.
+class Index( object ):
+
+   def __init__( self, genvar, terms=None, offset=0 ):
+      self.terms = terms if terms is not None else [(genvar, 1)]
+      self.offset = offset
+
+   def __add__( self, other ):
+      if isinstance( other, Index ):
+         return Index( None, self.terms + other.terms, self.offset + other.offset )
+      return Index( None, self.terms, self.offset + int(other) )
+
+   __radd__ = __add__
+
+   def __mul__( self, scale ):
+      return Index( None, [(g, s * scale) for (g, s) in self.terms], self.offset * scale )
+
+   __rmul__ = __mul__
+
+   # Returns the int value of the index for a dict of genvar values.
+   def at( self, values ):
+      return sum( values[g] * int(s) for (g, s) in self.terms ) + int(self.offset)
+
+   def __str__( self ):
+      terms = [g if s == 1 else g + "*" + _value( s ) for (g, s) in self.terms]
+      if self.offset:
+         terms.append( _value( self.offset ) )
+      return "+".join( terms )
+
+# Base class of expressions.
+class Expr( object ):
+
+   def __str__( self ):
+      return self.to_verilog()
+
+   # Returns the expression with every Index in it replaced by its value for
+   # a dict of genvar values.
+   def bind( self, values ):
+      return self
+
+# A reference to a net, or to a bit (msb) or range (msb, lsb) of a net.
+class Ref( Expr ):
+
+   def __init__( self, name, msb=None, lsb=None ):
+      self.name = name
+      self.msb = msb
+      self.lsb = lsb
+
+   def to_verilog( self ):
+      if self.msb is None:
+         return self.name
+      if self.lsb is None:
+         return self.name + "[" + str(self.msb) + "]"
+      return self.name + "[" + str(self.msb) + ":" + str(self.lsb) + "]"
+
+   def bind( self, values ):
+      return Ref( self.name, _at( self.msb, values ), _at( self.lsb, values ) )
+
+# The width bits of a net from bit base up, name[base +: width]. Selects the
+# bits of an instance of an array, base is usually an Index.
+class Part( Expr ):
+
+   def __init__( self, name, base, width ):
+      self.name = name
+      self.base = base
+      self.width = width
+
+   def to_verilog( self ):
+      return self.name + "[" + str(self.base) + " +: " + _value( self.width ) + "]"
+
+   def bind( self, values ):
+      base = _at( self.base, values )
+      return Ref( self.name, base + int(self.width) - 1, base )
+
+# A constant, written as a sized literal when its width is given.
+class Const( Expr ):
+
+   def __init__( self, value, width=None ):
+      self.value = value
+      self.width = width
+
+   def to_verilog( self ):
+      if self.width is None:
+         return str(self.value)
+      if self.width == 1:
+         return "1'b" + str(self.value)
+      return str(self.width) + "'d" + str(self.value)
+
+# An operator applied to operands, see OPS.
+class Op( Expr ):
+
+   def __init__( self, op, *args ):
+      if op not in OPS:
+         raise ValueError( "Unknown operator: " + str(op) )
+      self.op = op
+      self.args = args
+
+   def to_verilog( self ):
+      args = [_operand( a, self.op ) for a in self.args]
+      if self.op in _BINARY:
+         return (" " + _BINARY[self.op] + " ").join( args )
+      if self.op in _UNARY:
+         return _UNARY[self.op] + "(" + str(self.args[0]) + ")" \
+            if isinstance( self.args[0], Op ) or self.op == "reduce_or" \
+            else _UNARY[self.op] + args[0]
+      if self.op == "mux":
+         return args[0] + " ? " + args[1] + " : " + args[2]
+      if self.op == "concat":
+         return "{" + ", ".join( str(a) for a in self.args ) + "}"
+      # index
+      return str(self.args[0]) + "[" + str(self.args[1]) + "]"
+
+   def bind( self, values ):
+      return Op( self.op, *[a.bind( values ) for a in self.args] )
+
+# Helper function
+# Returns the value of a bit number, which may be an Index, for a dict of
+# genvar values.
+def _at( bit, values ):
+   if isinstance( bit, Index ):
+      return bit.at( values )
+   return bit
+
+# Helper function
+# Writes an operand of an operator, in parentheses when it is an operator
+# itself, other than a chain of the same associative operator.
+def _operand( expr, parent ):
+   if isinstance( expr, Op ) and expr.op not in ("concat", "index") \
+      and not (expr.op == parent and parent in _ASSOCIATIVE):
+      return "(" + str(expr) + ")"
+   return str(expr)
+
+# Returns the verilog condition 'signal == 1'b1' used by reset and enable logic.
+def is_high( name ):
+   return Op( "eq", Ref( name ), Const( 1, 1 ) )
+
+# Returns the xor of a list of expressions.
+def xor_all( exprs ):
+   result = exprs[0]
+   for e in exprs[1:]:
+      result = Op( "xor", result, e )
+   return result
+
+# A port of a module, direction is 'input' or 'output'.
+class Port( object ):
+
+   def __init__( self, name, direction, width=None ):
+      self.name = name
+      self.direction = direction
+      self.width = width
+
+# A wire or reg of a module. init is the value of an initial statement.
+class Net( object ):
+
+   def __init__( self, name, width=None, kind="wire", init=None, comment=None ):
+      self.name = name
+      self.width = width
+      self.kind = kind
+      self.init = init
+      self.comment = comment
+
+# A continuous assignment of an expression to a net.
+class Assign( object ):
+
+   def __init__( self, lhs, rhs, comment=None ):
+      self.lhs = lhs
+      self.rhs = rhs
+      self.comment = comment
+
+# A register clocked by the rising edge of clock.
+# rules is a list of (condition, value) pairs in priority order, the register
+# takes the value of the first rule whose condition is 1 and holds otherwise.
+# A condition of None is always 1. async_reset names a signal which is also
+# in the sensitivity list of the register.
+class Register( object ):
+
+   def __init__( self, name, rules, clock="clk", async_reset=None, comment=None ):
+      self.name = name
+      self.rules = rules
+      self.clock = clock
+      self.async_reset = async_reset
+      self.comment = comment
+
+# An instance of another module.
+# connections is a list of (port, expression) pairs, params a list of
+# (parameter, value) pairs. array is the InstanceArray it belongs to.
+class Instance( object ):
+
+   def __init__( self, module, name, connections, params=None, comment=None, array=None ):
+      self.module = module
+      self.name = name
+      self.connections = connections
+      self.params = params or []
+      self.comment = comment
+      self.array = array
+
+# A generate loop of instances, see Module.add_instance_array.
+class InstanceArray( object ):
+
+   def __init__( self, module, name, label, loops, connections, params=None, comment=None ):
+      self.module = module
+      self.name = name
+      self.label = label
+      self.loops = loops
+      self.connections = connections
+      self.params = params or []
+      self.comment = comment
+
+   # Returns the label of the block of every loop, the inner loops are
+   # named after their genvar.
+   def labels( self ):
+      return [self.label] + [self.label + "_" + g for (g, _) in self.loops[1:]]
+
+   # Returns the Instances of the array, in loop order.
+   def instances( self ):
+      insts = []
+      for index in itertools.product( *[range(count) for (_, count) in self.loops] ):
+         values = dict( zip( [g for (g, _) in self.loops], index ) )
+         scope = "".join( l + "[" + str(i) + "]." for (l, i) in zip( self.labels(), index ) )
+         insts.append( Instance( self.module, scope + self.name,
+                                 [(p, e.bind( values )) for (p, e) in self.connections],
+                                 self.params, array=self ) )
+      return insts
+
+# A verilog module.
+class Module( object ):
+
+   def __init__( self, name ):
+      self.name = name
+      self.ports = []
+      self.params = []
+      self.nets = []
+      self.assigns = []
+      self.registers = []
+      self.instances = []
+
+   # Adds a port and returns a reference to it.
+   def add_port( self, name, direction, width=None ):
+      self.ports.append( Port( name, direction, width ) )
+      return Ref( name )
+
+   def add_input( self, name, width=None ):
+      return self.add_port( name, "input", width )
+
+   def add_output( self, name, width=None ):
+      return self.add_port( name, "output", width )
+
+   # Adds a parameter, a comment is written after its value. Returns the
+   # Width of an int parameter, to declare the ports and nets it sizes.
+   def add_param( self, name, value, comment=None ):
+      self.params.append( (name, value, comment) )
+      if isinstance( value, int ):
+         return Width( value, name )
+
+   # Adds a wire and returns a reference to it.
+   def add_wire( self, name, width=None, comment=None ):
+      self.nets.append( Net( name, width, "wire", comment=comment ) )
+      return Ref( name )
+
+   # Adds a reg and returns a reference to it.
+   def add_reg( self, name, width=None, init=None, comment=None ):
+      self.nets.append( Net( name, width, "reg", init, comment ) )
+      return Ref( name )
+
+   def assign( self, lhs, rhs, comment=None ):
+      self.assigns.append( Assign( lhs, rhs, comment ) )
+
+   # Adds a reg together with the register which drives it.
+   def add_register( self, name, width, rules, clock="clk", async_reset=None, init=None,
+                     comment=None ):
+      ref = self.add_reg( name, width, init )
+      self.registers.append( Register( name, rules, clock, async_reset, comment ) )
+      return ref
+
+   def add_instance( self, module, name, connections, params=None, comment=None ):
+      self.instances.append( Instance( module, name, connections, params, comment ) )
+
+   # Adds a generate loop of instances of module, one for every value of the
+   # loop variables. It is written as a loop, and its instances are added as
+   # ordinary Instances.
+   # Parameters:
+   #  module, name, the module and the name of the instance in the loop
+   #  label, the name of the block of the loop
+   #  loops, a list of (genvar, count) pairs, outermost loop first, count an
+   #     int or a Width
+   #  connections, a list of (port, expression) pairs, the expressions may
+   #     select bits by Index( genvar ) with Ref and Part
+   #  params, comment, see add_instance
+   def add_instance_array( self, module, name, label, loops, connections, params=None,
+                           comment=None ):
+      array = InstanceArray( module, name, label, loops, connections, params, comment )
+      self.instances += array.instances()
+
+   # Returns the width of a port or net, 1 for scalars.
+   def width( self, name ):
+      for item in self.ports + self.nets:
+         if item.name == name:
+            return 1 if item.width is None else item.width
+      raise KeyError( name )
+
+   # Returns the names of the modules instantiated by this module.
+   def submodules( self ):
+      names = []
+      for inst in self.instances:
+         if inst.module not in names:
+            names.append( inst.module )
+      return names
+
+   # Returns the verilog of the module.
+   def to_verilog( self ):
+      f = Emitter()
+      write_module( f, self )
+      return f.getvalue()
+
+   # Returns a hash of the module's verilog, which identifies the design.
+   def digest( self ):
+      return hashlib.sha1( self.to_verilog().encode( "utf-8" ) ).hexdigest()
+
+# A design, a top module and every module it instantiates, by name.
+# The library modules of srcs are included.
+class Design( object ):
+
+   # top, the top Module
+   # modules, a list of the other Modules of the design
+   def __init__( self, top, modules=() ):
+      self.top = top.name
+      self.modules = library_modules()
+      for m in [top] + list( modules ):
+         self.add( m )
+
+   def add( self, module ):
+      self.modules[module.name] = module
+
+   def module( self, name=None ):
+      return self.modules[name or self.top]
+
+   # Returns a hash of the verilog of the top module and every module below it.
+   def digest( self ):
+      h = hashlib.sha1()
+      for name in sorted( self._used( self.top, set() ) ):
+         h.update( self.modules[name].digest().encode( "utf-8" ) )
+      return h.hexdigest()
+
+   # Helper function
+   # Returns the names of a module and every module below it.
+   def _used( self, name, names ):
+      names.add( name )
+      for sub in self.modules[name].submodules():
+         if sub not in names:
+            self._used( sub, names )
+      return names
+
+# Writes a module to an Emitter (or file) f.
+def write_module( f, module ):
+   if not isinstance( f, Emitter ):
+      e = Emitter()
+      write_module( e, module )
+      f.write( e.getvalue() )
+      return
+
+   with f.module( module.name, [p.name for p in module.ports] ):
+      for (name, value, comment) in module.params:
+         f.line( "parameter " + name + " = " + str(value) + ";" \
+                 + (" // " + comment if comment else "") )
+      f.line( "" )
+
+      for port in module.ports:
+         f.line( port.direction + _range( port.width ) + " " + port.name + ";" )
+      f.line( "" )
+
+      if module.nets:
+         for net in module.nets:
+            _comment( f, net.comment, net is not module.nets[0] )
+            f.line( net.kind + _range( net.width ) + " " + net.name + ";" )
+            if net.init is not None:
+               f.line( "initial " + net.name + " = " + str(net.init) + ";" )
+         f.line( "" )
+
+      if module.instances:
+         arrays = []
+         genvars = set()
+         for inst in module.instances:
+            if inst.array is None:
+               _comment( f, inst.comment, inst is not module.instances[0] )
+               _instance( f, inst )
+            elif inst.array not in arrays:
+               arrays.append( inst.array )
+               _comment( f, inst.array.comment, inst is not module.instances[0] )
+               _instance_array( f, inst.array, genvars )
+         f.line( "" )
+
+      for group in _register_groups( module.registers ):
+         _comment( f, group[0].comment )
+         sensitivity = "posedge " + group[0].clock
+         if group[0].async_reset:
+            sensitivity += " or posedge " + group[0].async_reset
+         with f.always( sensitivity ):
+            for reg in group:
+               for i in range(len(reg.rules)):
+                  (cond, value) = reg.rules[i]
+                  stmt = reg.name + " <= " + str(value) + ";"
+                  if cond is None:
+                     f.line( ("else " if i > 0 else "") + stmt )
+                  else:
+                     f.line( ("else if (" if i > 0 else "if (") + str(cond) + ") " + stmt )
+         f.line( "" )
+
+      if module.assigns:
+         for a in module.assigns:
+            _comment( f, a.comment, a is not module.assigns[0] )
+            f.line( "assign " + str(a.lhs) + " = " + str(a.rhs) + ";" )
+         f.line( "" )
+
+# Helper function
+# Writes an instance, on one line when it is at most _LINE_LENGTH long.
+def _instance( f, inst ):
+   params = ""
+   if inst.params:
+      params = " #(" + ", ".join( "." + p + "(" + _value( v ) + ")" for (p, v) in inst.params ) + ")"
+   conns = ["." + p + "(" + str(e) + ")" for (p, e) in inst.connections]
+   opening = inst.module + params + " " + inst.name + "("
+   if len( opening ) + len( ", ".join( conns ) ) <= _LINE_LENGTH:
+      f.line( opening + ", ".join( conns ) + ");" )
+      return
+   # one connection per line
+   with f.block( opening, None ):
+      for c in conns[:-1]:
+         f.line( c + "," )
+      f.line( conns[-1] + ");" )
+
+# Helper function
+# Writes an InstanceArray as nested generate loops. genvars is the set of
+# genvars already declared in the module.
+def _instance_array( f, array, genvars ):
+   for (g, _) in array.loops:
+      if g not in genvars:
+         f.line( "genvar " + g + ";" )
+         genvars.add( g )
+   with f.generate():
+      _array_loops( f, array, list( zip( array.labels(), array.loops ) ) )
+
+# Helper function
+def _array_loops( f, array, loops ):
+   if not loops:
+      _instance( f, Instance( array.module, array.name, array.connections, array.params ) )
+      return
+   (label, (g, count)) = loops[0]
+   with f.block( "for (" + g + " = 0; " + g + " < " + _value( count ) + "; " + g + " = " + g \
+                 + " + 1) begin : " + label, "end" ):
+      _array_loops( f, array, loops[1:] )
+
+# Helper function
+# Returns the verilog of an instance parameter value, a Width passes on the
+# parameters it was computed from.
+def _value( value ):
+   if isinstance( value, Width ):
+      return value.expr
+   return str(value)
+
+# Helper function
+# Returns the range of a declaration of the given width.
+def _range( width ):
+   if width is None:
+      return ""
+   if isinstance( width, Width ):
+      return " [" + width.expr + "-1:0]"
+   return " [" + str(width-1) + ":0]"
+
+# Helper function
+# Splits registers into the groups written in one always block. Consecutive
+# registers which simply load a value every clock share a block.
+def _register_groups( registers ):
+   groups = []
+   for reg in registers:
+      if _plain( reg ) and groups and groups[-1][-1].clock == reg.clock and _plain( groups[-1][-1] ) \
+         and not reg.comment:
+         groups[-1].append( reg )
+      else:
+         groups.append( [reg] )
+   return groups
+
+# Helper function
+def _plain( reg ):
+   return len( reg.rules ) == 1 and reg.rules[0][0] is None and not reg.async_reset
+
+# Helper function
+# Writes a comment, a line for every line of its text, after a blank line
+# when separate, so that a commented item other than the first of its section
+# stands apart.
+def _comment( f, comment, separate=False ):
+   if comment:
+      if separate:
+         f.line( "" )
+      for line in comment.split( "\n" ):
+         f.line( "// " + line )
+
+# Returns netlists of the hand written library modules in srcs, so that
+# designs using them can be analysed without parsing verilog.
+def library_modules():
+   modules = {}
+
+   m = Module( "sc_multiplier" )
+   x = m.add_input( "x" )
+   y = m.add_input( "y" )
+   m.add_output( "res" )
+   m.assign( Ref( "res" ), Op( "and", x, y ) )
+   modules[m.name] = m
+
+   m = Module( "sc_multiplier_bi" )
+   x = m.add_input( "x" )
+   y = m.add_input( "y" )
+   m.add_output( "z" )
+   m.assign( Ref( "z" ), Op( "not", Op( "xor", x, y ) ) )
+   modules[m.name] = m
+
+   m = Module( "alaghi_adder" )
+   m.add_param( "reset_seed", 0 )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   x = m.add_input( "x" )
+   y = m.add_input( "y" )
+   m.add_output( "out" )
+   xor_input = m.add_wire( "xor_input" )
+   m.assign( xor_input, Op( "xor", x, y ) )
+   seed = Ref( "reset_seed" )
+   tff = m.add_register( "tff", None, [(is_high( "rst" ), seed),
+                                    (xor_input, Op( "not", Ref( "tff" ) ))], init=seed )
+   m.assign( Ref( "out" ), Op( "mux", xor_input, tff, y ) )
+   modules[m.name] = m
+
+   return modules
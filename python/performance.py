@@ -0,0 +1,121 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains the performance manifest of the generated designs, the
+# exact cycle counts and throughput a scheduler or testbench needs, computed
+# from the same parameters the generators use.
+#
+# A stochastic dot product turns every cycle's input bits into one output
+# bit, LATENCY cycles later (see sc_dot_product_gen.dp_delay). A result is a
+# stream of L bits, so the pipeline takes a new set of inputs every L cycles
+# and all M*O dot products of the matrix multiply run side by side. A folded
+# matrix multiply computes them P at a time, one tile of results per window
+# of L cycles, so a matrix takes TILES = ceil(M*O / P) windows.
+
+from common import *
+import json
+import sc_dot_product_gen
+import sc_matrix_ip_gen
+import sc_systolic_gen
+
+# suffix of the file a manifest is written to, after the module name
+SUFFIX = "_performance.json"
+
+# clock frequency, in MHz, of the throughput when none is given
+DEFAULT_CLOCK = 100.0
+
+# Returns the performance manifest of a matrix multiply as a dictionary of
+#  latency, the cycles from an input bit to its output bit
+#  stream_length, L, the cycles of stream, and of output, per result
+#  results, the results of a matrix, M*O
+#  engines, the dot products computing them, P
+#  tiles, the windows of L cycles a matrix takes, ceil(M*O / P)
+#  cycles_per_result, the cycles between the matrices of results of a
+#     pipeline kept full, TILES*L
+#  first_result_cycles, the cycles from the first input bit to the last bit
+#     of the first matrix of results out of reset, latency + TILES*L
+#  input_bits_per_cycle, output_bits_per_cycle, the stream bits entering and
+#     leaving the module every cycle, select streams included
+#  clock_mhz, the clock the throughput is given at
+#  results_per_second, the results of a full pipeline per second at clock_mhz
+#  test_cycles, the cycles the generated testbench runs for, its reset,
+#     TILES*L cycles of test data and the latency
+# Parameters:
+#  batch, inpt, outpt, alaghi, the matrix multiply (M, N, O and adder type)
+#  length, an int, the stream length L
+#  clock, a float, the clock frequency in MHz
+#  engines, an int, the engines P of a folded matrix multiply, None for M*O
+def matrix_mult( batch, inpt, outpt, alaghi = False, length = 100, clock = DEFAULT_CLOCK,
+                 engines = None ):
+   select_bits = 0 if alaghi else clogb2( inpt )
+   engines = batch * outpt if engines is None else engines
+   return _manifest( sc_dot_product_gen.dp_delay( inpt, alaghi ), length, batch * outpt,
+                     (batch + outpt) * inpt + select_bits, engines, clock, engines )
+
+# Returns the performance manifest of a dot product of N inputs, see
+# matrix_mult. A dot product of k lanes takes k bits of every stream per
+# cycle, so its L bits of result take L/k cycles.
+def dot_product( dimensions, alaghi = False, length = 100, clock = DEFAULT_CLOCK, lanes = 1 ):
+   check_lanes( length, lanes )
+   select_bits = 0 if alaghi else clogb2( dimensions )
+   manifest = _manifest( sc_dot_product_gen.dp_delay( dimensions, alaghi ), length // lanes, 1,
+                         lanes * (2 * dimensions + select_bits), lanes, clock, 1 )
+   if lanes > 1:
+      manifest["stream_length"] = length
+      manifest["lanes"] = lanes
+   return manifest
+
+# Returns the performance manifest of a systolic array of N x O processing
+# elements streaming the M rows of an input matrix, see matrix_mult. A row of
+# O results is computed at once, so a matrix takes M windows.
+def systolic_array( batch, inpt, outpt, length = 100, clock = DEFAULT_CLOCK ):
+   return _manifest( sc_systolic_gen.systolic_delay( inpt, outpt ), length, batch * outpt,
+                     (1 + outpt) * inpt + sc_systolic_gen.select_width( inpt ), outpt, clock,
+                     outpt )
+
+# Returns the performance manifest of a matrix multiply IP, see matrix_mult.
+# The stream length is the window, the latency is counted from the end of a
+# window to its results, and the input and output bits are the binary rows
+# written and the results read out. A matrix is loaded during one window and
+# streamed during the next, so its first results come two windows and the
+# latency after the first row, and the testbench runs a window of the reset
+# banks besides its matrices.
+# Parameters:
+#  batch, inpt, outpt, precision, window, alaghi, matrices, see
+#     sc_matrix_ip_gen.generate
+#  clock, a float, the clock frequency in MHz
+def matrix_ip( batch, inpt, outpt, precision = sc_matrix_ip_gen.IP_PRECISION, window = None,
+               alaghi = False, clock = DEFAULT_CLOCK,
+               matrices = sc_matrix_ip_gen.IP_TEST_MATRICES ):
+   window = sc_matrix_ip_gen.ip_window( batch, inpt, outpt, precision, window, alaghi )
+   latency = sc_matrix_ip_gen.ip_delay( inpt, alaghi )
+   manifest = _manifest( latency, window, batch * outpt, 2 * inpt * precision,
+                         batch * outpt * sc_matrix_ip_gen.result_width( window ), clock,
+                         batch * outpt )
+   manifest["first_result_cycles"] = 2 * window + latency
+   manifest["test_cycles"] = TB_RESET_CYCLES + (matrices + 1) * window + latency + 1
+   return manifest
+
+# Writes a performance manifest as JSON to the file at path.
+def write_performance( path, manifest ):
+   atomic_write( path, json.dumps( manifest, sort_keys=True, indent=1 ) + "\n" )
+
+# Helper function
+def _manifest( latency, length, results, input_bits, output_bits, clock, engines ):
+   if length < 1:
+      raise ValueError( "Stream length must be positive: " + str(length) )
+   if clock <= 0:
+      raise ValueError( "Clock frequency must be positive: " + str(clock) )
+   if engines < 1 or engines > results:
+      raise ValueError( "Engines must be between 1 and " + str(results) + ": " + str(engines) )
+   cycles = (results + engines - 1) // engines * length
+   return { "latency" : latency,
+            "stream_length" : length,
+            "results" : results,
+            "engines" : engines,
+            "tiles" : cycles // length,
+            "cycles_per_result" : cycles,
+            "first_result_cycles" : latency + cycles,
+            "input_bits_per_cycle" : input_bits,
+            "output_bits_per_cycle" : output_bits,
+            "clock_mhz" : clock,
+            "results_per_second" : results * clock * 1e6 / cycles,
+            "test_cycles" : TB_RESET_CYCLES + cycles + latency + 1 }
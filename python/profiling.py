@@ -0,0 +1,259 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains the stage profiler of generate.py -profile. While a
+# Profiler is set, the stages of generation record spans, nested intervals of
+# wall time, with the bytes written to files inside them and the peak memory
+# of the process while they ran:
+#  the generate functions of the generators (@gen_cache.cached), named by
+#     their module, e.g. sc_dot_product_gen.generate
+#  task, a scheduler task, see scheduler.run_task
+#  verilog, emitting and writing a verilog file, see common.open_verilog
+#  lfsr, LFSR sequences, see lfsr_model.LfsrModel.sequence
+#  streams, converting binary numbers to streams, see bitstream.from_thresholds
+#  golden, alaghi_tree, the golden models, see golden_model
+#  mif, encoding testbench data as text, see mif
+#  write, writing testbench data files, see mif.write_text
+# When no Profiler is set a span costs a single check of a global.
+#
+# The peak memory of a span is its own: the peak resident set size of the
+# process is reset to its current size whenever a span starts, and read from
+# /proc, so a stage after a larger one does not report the larger one's peak.
+# Where the peak cannot be reset (other than linux) spans record no memory.
+#
+# The spans of the processes of a scheduler's pool are recorded there and
+# sent back with the results of their tasks, see Profiler.merge. Every
+# process is its own row of the chrome trace.
+
+from contextlib import contextmanager
+import functools
+import os
+import platform
+import resource
+import time
+
+_profiler = None
+
+# Sets the profiler spans are recorded in, None turns profiling off.
+def set_profiler( profiler ):
+   global _profiler
+   _profiler = profiler
+
+# Returns the profiler spans are recorded in, None when profiling is off.
+def get_profiler():
+   return _profiler
+
+# Returns a context manager recording a span of the given name, see
+# Profiler.span, which does nothing when profiling is off.
+def span( name, detail=None ):
+   if _profiler is None:
+      return _NULL_SPAN
+   return _profiler.span( name, detail )
+
+# Decorator recording a span of the given name around every call of a
+# function.
+def timed( name ):
+   def decorate( func ):
+      @functools.wraps( func )
+      def wrapper( *args, **kwargs ):
+         if _profiler is None:
+            return func( *args, **kwargs )
+         with _profiler.span( name ):
+            return func( *args, **kwargs )
+      return wrapper
+   return decorate
+
+# Adds n bytes written to a file to the spans open in this process.
+def add_bytes( n ):
+   if _profiler is not None:
+      _profiler.add_bytes( n )
+
+# Records the spans of one process.
+# Every span ends up in events as a dictionary of its 'name', its 'path', the
+# names of the spans it is nested in and its own joined by '/', its 'detail'
+# (e.g. the file or task) or None, its 'start' (seconds since the epoch),
+# 'duration' and 'self' time (the duration less that of the spans inside it),
+# the 'bytes' written inside it, the 'peak_rss_kb' of the process while it
+# ran, how far that peak rose above the resident set size when it started,
+# 'rss_growth_kb', the most memory the stage itself took, and the 'pid'. Both
+# memory fields are None where the peak cannot be reset, see above.
+class Profiler( object ):
+
+   def __init__( self ):
+      self.pid = os.getpid()
+      self.events = []
+      self.stack = []
+      self.memory = _peak_resettable()
+
+   # Context manager recording a span, see above.
+   @contextmanager
+   def span( self, name, detail=None ):
+      path = name if not self.stack else self.stack[-1]["path"] + "/" + name
+      rss = None
+      if self.memory:
+         # the peak so far belongs to the open spans, this one starts afresh
+         (rss, peak) = rss_kb()
+         self._add_peak( peak )
+         reset_peak_rss()
+      frame = { "path" : path, "bytes" : 0, "inner" : 0.0, "rss" : rss, "peak" : rss,
+                "start" : time.time() }
+      self.stack.append( frame )
+      try:
+         yield
+      finally:
+         duration = time.time() - frame["start"]
+         if self.memory:
+            self._add_peak( rss_kb()[1] )
+         self.stack.pop()
+         if self.stack:
+            self.stack[-1]["inner"] += duration
+         growth = None if rss is None else frame["peak"] - rss
+         self.events.append( { "name" : name, "path" : path, "detail" : detail,
+                               "start" : frame["start"], "duration" : duration,
+                               "self" : duration - frame["inner"], "bytes" : frame["bytes"],
+                               "peak_rss_kb" : frame["peak"], "rss_growth_kb" : growth,
+                               "pid" : self.pid } )
+
+   # Helper function
+   # Raises the peak of the open spans to peak, a peak of the process since
+   # the last reset.
+   def _add_peak( self, peak ):
+      for frame in self.stack:
+         frame["peak"] = max( frame["peak"], peak )
+
+   # Adds n bytes written to the open spans.
+   def add_bytes( self, n ):
+      for frame in self.stack:
+         frame["bytes"] += n
+
+   # Returns the events recorded since the last call and forgets them, used
+   # to send the spans of a task back from a process of a pool.
+   def take( self ):
+      events = self.events
+      self.events = []
+      return events
+
+   # Adds the events of another process, as if its spans were nested in the
+   # spans open here.
+   def merge( self, events ):
+      for e in events:
+         if "/" not in e["path"]:
+            self.add_bytes( e["bytes"] )
+         if self.stack:
+            e = dict( e, path=self.stack[-1]["path"] + "/" + e["path"] )
+         self.events.append( e )
+
+# Returns a summary of events, one dictionary per path in the order the
+# paths were first entered, with its 'count' of spans, their total 'seconds'
+# and 'self_seconds', 'bytes', and the largest 'peak_rss_kb' and
+# 'rss_growth_kb' of its spans, None when they recorded no memory.
+def summarize( events ):
+   stages = {}
+   for e in sorted( events, key=lambda e: e["start"] ):
+      if e["path"] not in stages:
+         stages[e["path"]] = { "path" : e["path"], "first" : e["start"], "count" : 0,
+                               "seconds" : 0.0, "self_seconds" : 0.0, "bytes" : 0,
+                               "peak_rss_kb" : None, "rss_growth_kb" : None }
+      s = stages[e["path"]]
+      s["count"] += 1
+      s["seconds"] += e["duration"]
+      s["self_seconds"] += e["self"]
+      s["bytes"] += e["bytes"]
+      for field in ("peak_rss_kb", "rss_growth_kb"):
+         if e[field] is not None:
+            s[field] = e[field] if s[field] is None else max( s[field], e[field] )
+   result = sorted( stages.values(), key=lambda s: _first( stages, s["path"] ) )
+   for s in result:
+      del s["first"]
+   return result
+
+# Returns a text table of a summary, the stages indented by their nesting.
+def format_table( summary ):
+   lines = ["%-48s %6s %10s %10s %12s %11s %11s" % ("stage", "count", "total (s)", "self (s)",
+                                                     "bytes", "peak (KB)", "growth (KB)")]
+   for s in summary:
+      parts = s["path"].split( "/" )
+      name = "  " * (len( parts ) - 1) + parts[-1]
+      memory = ["-" if s[f] is None else str(s[f]) for f in ("peak_rss_kb", "rss_growth_kb")]
+      lines.append( "%-48s %6d %10.4f %10.4f %12d %11s %11s" % (name, s["count"], s["seconds"],
+                                                                s["self_seconds"], s["bytes"],
+                                                                memory[0], memory[1]) )
+   return "\n".join( lines )
+
+# Returns events as a chrome trace, a dictionary to be written as JSON and
+# opened in chrome://tracing or https://ui.perfetto.dev. Every span is a
+# complete event, every process a row.
+def chrome_trace( events ):
+   t0 = min( [e["start"] for e in events] or [0] )
+   trace = []
+   for e in sorted( events, key=lambda e: (e["start"], -e["duration"]) ):
+      args = { "bytes" : e["bytes"], "peak_rss_kb" : e["peak_rss_kb"],
+               "rss_growth_kb" : e["rss_growth_kb"] }
+      if e["detail"] is not None:
+         args["detail"] = e["detail"]
+      trace.append( { "name" : e["name"], "cat" : e["path"].split( "/" )[0], "ph" : "X",
+                      "ts" : int(round( (e["start"] - t0) * 1e6 )),
+                      "dur" : int(round( e["duration"] * 1e6 )),
+                      "pid" : e["pid"], "tid" : e["pid"], "args" : args } )
+   return { "traceEvents" : trace, "displayTimeUnit" : "ms" }
+
+# Returns the resident set size of this process and its peak since the last
+# reset_peak_rss, in KB, read from /proc/self/status (linux).
+def rss_kb():
+   values = {}
+   with open( "/proc/self/status" ) as f:
+      for line in f:
+         if line.startswith( ("VmRSS:", "VmHWM:") ):
+            values[line[:5]] = int( line.split()[1] )
+   return (values["VmRSS"], values["VmHWM"])
+
+# Resets the peak resident set size of this process to its current size
+# (linux 4.0 and later). This also resets the ru_maxrss of peak_rss_kb.
+def reset_peak_rss():
+   with open( "/proc/self/clear_refs", 'w' ) as f:
+      f.write( "5" )
+
+# Returns the peak resident set size of this process in KB, ru_maxrss is in
+# bytes on OS X.
+def peak_rss_kb():
+   peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+   if platform.system() == "Darwin":
+      return peak // 1024
+   return peak
+
+_resettable = None
+
+# Helper function
+# Returns whether the peak resident set size of the process can be read and
+# reset, see rss_kb.
+def _peak_resettable():
+   global _resettable
+   if _resettable is None:
+      try:
+         reset_peak_rss()
+         rss_kb()
+         _resettable = True
+      except (IOError, OSError, KeyError):
+         _resettable = False
+   return _resettable
+
+# Helper function
+# Returns when the first of a path and the paths it is nested in was entered,
+# so nested stages are listed under the stage they are nested in.
+def _first( stages, path ):
+   parts = path.split( "/" )
+   key = []
+   for i in range(1, len( parts ) + 1):
+      prefix = "/".join( parts[:i] )
+      key.append( stages[prefix]["first"] if prefix in stages else 0 )
+   return key
+
+# Helper class
+# The span recorded when profiling is off.
+class _NullSpan( object ):
+
+   def __enter__( self ):
+      return None
+
+   def __exit__( self, *exc ):
+      return False
+
+_NULL_SPAN = _NullSpan()
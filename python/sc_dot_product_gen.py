@@ -4,8 +4,14 @@
 
 import alaghi_nadder_gen
 from common import *
+import bitstream
+import gen_cache
+import golden_model
+import lfsr_model
+import mif
+import netlist
+import numpy as np
 import os
-from pysc.linear_algebra.sc_dot_product import *
 import sc_nadder_gen
 import shiftreg_gen
 
@@ -22,38 +28,82 @@ _DP_TEST_SIZE = 100
 #  dimensions, an int, the dimension of the vectors to dot-product 
 #  rep, the stochastic representation
 #  alaghi, a boolean, specifies if alaghi adder tree is used
-def generate( dest, dimensions, rep = "uni", alaghi = False, test = True ):
+#  datafmt, a string, the format of the testbench data files (bin, hex or raw)
+#  length, an int, the number of cycles of testbench data
+#  chunk, an int, the number of cycles of testbench data generated at once
+#  lanes, an int, k, the stream bits processed per cycle, see
+#     build_dot_prod_module, length is then the bits of every stream, a
+#     multiple of lanes
+@gen_cache.cached
+def generate( dest, dimensions, rep = "uni", alaghi = False, test = True, datafmt = "bin",
+              length = _DP_TEST_SIZE, chunk = STREAM_CHUNK, lanes = 1 ):
+   check_lanes( length, lanes )
+   if alaghi:
+      alaghi_nadder_gen.generate( dest, dimensions, test=test, datafmt=datafmt,
+                                  length=length, chunk=chunk, lanes=lanes )
+   else:
+      sc_nadder_gen.generate( dest, dimensions, test=test, lanes=lanes )
+
    # generate the shift_register
-   delay = None
+   shiftreg_gen.generate( dest, dp_delay( dimensions, alaghi ) )
+
+   generate_module( dest, dimensions, rep, alaghi, lanes )
+   if test:
+      generate_test( dest, dimensions, alaghi, datafmt, length, chunk, lanes )
+
+# Adds the tasks of generate to a scheduler.Scheduler and returns the name of
+# the task writing the module. See generate for the parameters.
+def plan( sched, dimensions, rep = "uni", alaghi = False, test = True, datafmt = "bin",
+          length = _DP_TEST_SIZE, chunk = STREAM_CHUNK, lanes = 1 ):
+   check_lanes( length, lanes )
+   key = gen_cache.call_key( generate, dimensions=dimensions, rep=rep, alaghi=alaghi, test=test,
+                             datafmt=datafmt, length=length, chunk=chunk, lanes=lanes )
+   if alaghi:
+      adder = alaghi_nadder_gen.plan( sched, dimensions, test=test, datafmt=datafmt,
+                                      length=length, chunk=chunk, lanes=lanes )
+   else:
+      adder = sc_nadder_gen.plan( sched, dimensions, test=test, lanes=lanes )
+   delay = dp_delay( dimensions, alaghi )
+   shift = sched.add( shiftreg_name( delay ), shiftreg_gen.generate, (delay,) )
+
+   module = sched.add( DOT_PROD, generate_module, (dimensions, rep, alaghi, lanes),
+                       deps=[adder, shift] )
+   if test:
+      sched.add( DOT_PROD + "_tb", generate_test, (dimensions, alaghi, datafmt, length, chunk,
+                 lanes), deps=[module], seed_key=key )
+   return module
+
+# Returns the number of cycles from the inputs of the dot product to its result.
+def dp_delay( dimensions, alaghi = False ):
    if alaghi:
       # delay for alaghi tree is one cycle for every level, plus one for
       # final output register of the alaghi adder and another for the final
       # register of the dot product.
-      delay = int(clogb2( dimensions )) + 2
-      alaghi_nadder_gen.generate( dest, dimensions ) 
-   else:
-      # two clock cycle delay for standard dot product
-      # 1 cycle for multiplication, 1 for addition (single mux)
-      delay = 2
-      sc_nadder_gen.generate( dest, dimensions )      
+      return int(clogb2( dimensions )) + 2
+   # two clock cycle delay for standard dot product
+   # 1 cycle for multiplication, 1 for addition (single mux)
+   return 2
 
-   shiftreg_gen.generate( dest, delay )
-
-   with open( os.path.join( dest, DOT_PROD + ".v" ), 'w' ) as f:
+# Writes the dot product module into dest.
+def generate_module( dest, dimensions, rep = "uni", alaghi = False, lanes = 1 ):
+   with open_verilog( os.path.join( dest, DOT_PROD + ".v" ) ) as f:
       write_header_dot_prod( f )
-      write_dot_prod_module( f, DOT_PROD, dimensions, rep, alaghi )
-
-   if test:
-      (tb, data) = makeTestDir( dest )
-      tb_name = DOT_PROD + "_tb"
+      write_dot_prod_module( f, DOT_PROD, dimensions, rep, alaghi, lanes )
 
-      # write the dot product testbench
-      gen_dp_data( data, dimensions, _DP_TEST_SIZE, rep="uni", alaghi=alaghi )
-      with open( os.path.join( tb, tb_name + ".v" ), 'w' ) as f:
-         # write the header comment
-         write_dp_tb_header( f )
-         write_dp_tb( f, tb_name, dimensions, rep="uni", alaghi=alaghi )
+# Writes the dot product testbench and its data into dest.
+def generate_test( dest, dimensions, alaghi = False, datafmt = "bin", length = _DP_TEST_SIZE,
+                   chunk = STREAM_CHUNK, lanes = 1 ):
+   (tb, data) = makeTestDir( dest )
+   tb_name = DOT_PROD + "_tb"
 
+   # write the dot product testbench
+   gen_dp_data( data, dimensions, length, rep="uni", alaghi=alaghi, datafmt=datafmt,
+                chunk=chunk, lanes=lanes )
+   with open_verilog( os.path.join( tb, tb_name + ".v" ) ) as f:
+      # write the header comment
+      write_dp_tb_header( f )
+      write_dp_tb( f, tb_name, dimensions, rep="uni", alaghi=alaghi, datafmt=datafmt,
+                   length=length, lanes=lanes )
 
 # Writes a stochastic dot_product module to the file, f.
 # Parameters:
@@ -61,106 +111,124 @@ def generate( dest, dimensions, rep = "uni", alaghi = False, test = True ):
 #  rep, a string for the stochastic represntation type (uni or bi)
 #  module_name, a string for the module name
 #  dimensions, an int which specifies the length of the input vectors to the module
-def write_dot_prod_module( f, module_name, dimensions, rep = "uni", alaghi = False ):
+#  lanes, an int, k, the stream bits processed per cycle
+def write_dot_prod_module( f, module_name, dimensions, rep = "uni", alaghi = False, lanes = 1 ):
+   netlist.write_module( f, build_dot_prod_module( module_name, dimensions, rep, alaghi,
+                                                   lanes ) )
+
+# Builds the netlist of a stochastic dot_product module.
+# With k lanes the module takes k consecutive bits of every stream each cycle,
+# lane j of element i in data[j*LENGTH + i] and weights[j*LENGTH + i], with
+# the select number of every lane in sel[j*SELECT_WIDTH +: SELECT_WIDTH], and
+# result[j] is lane j of the result stream: the streams of the serial module
+# k bits at a time, at the same latency in cycles.
+# Parameters:
+#  module_name, a string for the module name
+#  dimensions, an int which specifies the length of the input vectors to the module
+#  rep, a string for the stochastic represntation type (uni or bi)
+#  alaghi, a boolean, specifies if alaghi adder tree is used
+#  lanes, an int, k, the stream bits processed per cycle
+def build_dot_prod_module( module_name, dimensions, rep = "uni", alaghi = False, lanes = 1 ):
    # compute number of select streams
    select_width = clogb2( dimensions )
+   clk = netlist.Ref( "clk" )
+   rst = netlist.Ref( "rst" )
+   reset = netlist.is_high( "rst" )
 
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "clk,", 1 )
-   write_line( f, "rst,", 1 )
-   write_line( f, "data,", 1 )
-   write_line( f, "weights,", 1 )
-   if not alaghi:
-      write_line( f, "sel,", 1 )
-   write_line( f, "result,", 1 )
-   write_line( f, "valid", 1 )
-   write_line( f, ");" )
-   write_line( f, "" )
-   write_line( f, "parameter LENGTH = " + str(dimensions) + ";", 1 )
+   m = netlist.Module( module_name )
+   dimensions = m.add_param( "LENGTH", dimensions )
    if not alaghi:
-      write_line( f, "parameter SELECT_WIDTH = " + str(select_width) + ";", 1 )
-   write_line( f, "" )
-   write_line( f, "// inputs and outputs", 1 )
-   write_line( f, "input                    clk;", 1 )
-   write_line( f, "input                    rst;", 1 )
-   write_line( f, "input [LENGTH-1:0]       data;", 1 )
-   write_line( f, "input [LENGTH-1:0]       weights;", 1 )
+      select_width = m.add_param( "SELECT_WIDTH", select_width )
+   if lanes > 1:
+      lanes = m.add_param( "LANES", lanes )
+
+   # inputs and outputs
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   m.add_input( "data", lanes * dimensions )
+   m.add_input( "weights", lanes * dimensions )
    if not alaghi:
-      write_line( f, "input [SELECT_WIDTH-1:0] sel;", 1 )
-   write_line( f, "output                   result;", 1 )
-   write_line( f, "output                   valid;", 1 )
-   write_line( f, "" )
-   write_line( f, "// multipication modules, for element wise multiplication of data and weights", 1 )
-   write_line( f, "genvar i;", 1 )
-   write_line( f, "wire [LENGTH-1:0] mult_out;", 1 )
-   write_line( f, "generate", 1 )
-   write_line( f, "for( i = 0; i < LENGTH; i = i + 1) begin : mult", 2 )
+      m.add_input( "sel", lanes * select_width )
+   result = m.add_output( "result", lanes_width( lanes ) )
+   valid = m.add_output( "valid" )
+
+   i = netlist.Index( "i" )
+   mult_out = m.add_wire( "mult_out", lanes * dimensions )
+   conns = [("x", netlist.Ref( "data", i )), ("y", netlist.Ref( "weights", i ))]
    if rep == 'uni':
-      write_line( f, "sc_multiplier MULT(.x(data[i]), .y(weights[i]), .res(mult_out[i]));", 3 )
+      (multiplier, res) = ("sc_multiplier", "res")
    if rep == 'bi':
-      write_line( f, "sc_multiplier_bi MULT(.x(data[i]), .y(weights[i]), .z(mult_out[i]));", 3 )
-   write_line( f, "end", 2 )
-   write_line( f, "endgenerate", 1 )
-   write_line( f, "" )
-   write_line( f, "// direct multiplication output to an intermediate register", 1 )
-   write_line( f, "reg [LENGTH-1:0] product_streams;", 1 )
-   write_line( f, "always @(posedge clk) begin", 1 )
-   write_line( f, "if( rst == 1'b1 ) begin", 2 )
-   write_line( f, "product_streams <= 0;", 3 )
-   write_line( f, "end else begin", 2 )
-   write_line( f, "product_streams <= mult_out;", 3 )
-   write_line( f, "end", 2 )
-   write_line( f, "end", 1 )
-   write_line( f, "" )
+      (multiplier, res) = ("sc_multiplier_bi", "z")
+   m.add_instance_array( multiplier, "MULT", "mult", [("i", lanes * dimensions)],
+                         conns + [(res, netlist.Ref( "mult_out", i ))],
+                         comment="multipication modules, for element wise multiplication "
+                                 "of data and weights" )
+
+   product_streams = m.add_register( "product_streams", lanes * dimensions,
+                                     [(reset, netlist.Const( 0 )), (None, mult_out)],
+                                     comment="direct multiplication output to an "
+                                             "intermediate register" )
+
    if not alaghi:
-      write_line( f, "// shift the slect streams by 1 cycle, must wait for multiplication to complete", 1 )
-      write_line( f, "reg [SELECT_WIDTH-1:0] select;", 1 )
-      write_line( f, "always @(posedge clk) begin", 1 )
-      write_line( f, "if( rst == 1'b1 ) begin", 2 )
-      write_line( f, "select <= 0;", 3 )
-      write_line( f, "end else begin", 2 )
-      write_line( f, "select <= sel;", 3 )
-      write_line( f, "end", 2 )
-      write_line( f, "end", 1 )
-      write_line( f, "" )
-   write_line( f, "// add all element-wise products", 1 )
-   write_line( f, "wire adder_res;", 1 )
+      select = m.add_register( "select", lanes * select_width,
+                               [(reset, netlist.Const( 0 )), (None, netlist.Ref( "sel" ))],
+                               comment="shift the slect streams by 1 cycle, must wait for "
+                                       "multiplication to complete" )
+
+   adder_res = m.add_wire( "adder_res", lanes_width( lanes ) )
    if alaghi:
-      write_line( f, "alaghi_nadder NADDER(.clk(clk), .rst(rst), .inpts(product_streams), .out(adder_res));", 1 )
+      m.add_instance( ALAGHI_NADDER, "NADDER", [("clk", clk), ("rst", rst),
+                      ("inpts", product_streams), ("out", adder_res)],
+                      comment="add all element-wise products" )
    else:
-      write_line( f, "sc_nadder NADDER(.x(product_streams), .sel(select), .out(adder_res));", 1 )
-   write_line( f, "" )
-   write_line( f, "// direct adder output to register and then to final output", 1 )
-   write_line( f, "reg i_result;", 1 )
-   write_line( f, "always @(posedge clk) begin", 1 )
-   write_line( f, "if( rst == 1'b1 ) begin", 2 )
-   write_line( f, "i_result <= 0;", 3 )
-   write_line( f, "end else begin", 2 )
-   write_line( f, "i_result <= adder_res;", 3 )
-   write_line( f, "end", 2 )
-   write_line( f, "end", 1 )
-   write_line( f, "" )
-   write_line( f, "assign result = i_result;", 1 )
-   write_line( f, "" )
-   write_line( f, "// Use shift register to indicate when module output is valid", 1 )
+      params = [("INPUT_STREAMS", dimensions), ("SELECT_WIDTH", select_width)]
+      if lanes > 1:
+         params.append( ("LANES", lanes) )
+      m.add_instance( NADDER, "NADDER", [("x", product_streams), ("sel", select),
+                      ("out", adder_res)], params, comment="add all element-wise products" )
+
+   i_result = m.add_register( "i_result", lanes_width( lanes ),
+                              [(reset, netlist.Const( 0 )), (None, adder_res)],
+                              comment="direct adder output to register and then to final output" )
+   m.assign( result, i_result )
+
+   delay = dp_delay( dimensions, alaghi )
+   m.add_instance( shiftreg_name( delay ), "SHIFT" + str(delay),
+                   [("clk", clk), ("rst", rst), ("data_in", netlist.Const( 1, 1 )),
+                    ("data_out", valid)],
+                   comment="Use shift register to indicate when module output is valid" )
+   return m
+
+# Returns the netlist.Design of a dot product module and the adder and shift
+# register it instantiates, for simulation.
+def build_design( dimensions, rep = "uni", alaghi = False, lanes = 1 ):
    if alaghi:
-      delay = int(clogb2( dimensions )) + 2
+      adders = alaghi_nadder_gen.build_design( dimensions, lanes ).modules.values()
    else:
-      delay = 2
-   write_line( f, "shift_" + str(delay) + "_register SHIFT" + str(delay) \
-                  + "(.clk(clk), .rst(rst), .data_in(1'b1), .data_out(valid));", 1 )
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+      adders = [sc_nadder_gen.build_nadder_module( NADDER, dimensions, lanes )]
+   delay = dp_delay( dimensions, alaghi )
+   shift = shiftreg_gen.build_shiftreg_module( shiftreg_name( delay ), delay )
+   return netlist.Design( build_dot_prod_module( DOT_PROD, dimensions, rep, alaghi, lanes ),
+                          list( adders ) + [shift] )
 
 # Writes the testbench module for the generated sc_dot_product.
 # Parameters:
 #  f, the file to write to
 #  module_name, a string, the name of the module
 #  rep, a string specifying the stochastic representation (either uni or bi)
-#  length, an integer, the length of the input vectors
-def write_dp_tb( f, module_name, dimension, rep = "uni", alaghi = False ):
+#  dimension, an integer, the length of the input vectors
+#  datafmt, a string, the format of the data files to load (bin, hex or raw)
+#  length, an int, the number of cycles of test data
+#  lanes, an int, the lanes of the dot product, length is then the bits of
+#     every stream and the test takes length/lanes cycles
+def write_dp_tb( f, module_name, dimension, rep = "uni", alaghi = False, datafmt = "bin",
+                 length = _DP_TEST_SIZE, lanes = 1 ):
      # compute number of select streams needed 
    select_width = clogb2( dimension )
+   length = length // lanes
+   (vector, select) = ("DIMENSION", "SELECT_WIDTH")
+   if lanes > 1:
+      (vector, select) = ("LANES*DIMENSION", "LANES*SELECT_WIDTH")
 
    write_line( f, "`timescale 1ns / 10ps" )
    write_line( f, "" )
@@ -168,39 +236,49 @@ def write_dp_tb( f, module_name, dimension, rep = "uni", alaghi = False ):
    write_line( f, "parameter DIMENSION =     " + str(dimension) + ";", 1 )
    if not alaghi:
       write_line( f, "parameter SELECT_WIDTH =  " + str(select_width) + ";", 1 )
-   write_line( f, "parameter DATA_VECTOR =   \"" + _DP_DATA_FN + "\";", 1 )
-   write_line( f, "parameter WEIGHT_VECTOR = \"" + _DP_WEIGHT_FN + "\";", 1 )
-   write_line( f, "parameter SELECT_STREAM = \"" + _DP_SELECT_FN + "\";", 1 )
-   write_line( f, "parameter DP_RESULT =     \"" + _DP_RES_FN + "\";", 1 )
-   write_line( f, "parameter LENGTH =        " + str(_DP_TEST_SIZE) + ";", 1 )
+   write_line( f, "parameter DATA_VECTOR =   \"" + mif.file_name( _DP_DATA_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter WEIGHT_VECTOR = \"" + mif.file_name( _DP_WEIGHT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter SELECT_STREAM = \"" + mif.file_name( _DP_SELECT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter DP_RESULT =     \"" + mif.file_name( _DP_RES_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter LENGTH =        " + str(length) + ";", 1 )
+   write_line( f, "parameter LATENCY =       " + str(dp_delay( dimension, alaghi )) + ";", 1 )
+   if lanes > 1:
+      write_line( f, "parameter LANES =         " + str(lanes) + ";", 1 )
    write_line( f, "" )
    write_line( f, "// module inputs and outputs", 1 )
    write_line( f, "reg                     clk;", 1 )
    write_line( f, "reg                     rst;", 1 )
-   write_line( f, "wire [DIMENSION-1:0]    data;", 1 )
-   write_line( f, "wire [DIMENSION-1:0]    weights;", 1 )
+   write_line( f, "wire [" + vector + "-1:0]    data;", 1 )
+   write_line( f, "wire [" + vector + "-1:0]    weights;", 1 )
    if not alaghi:
-      write_line( f, "wire [SELECT_WIDTH-1:0] sel;", 1 )
-   write_line( f, "wire                    result;", 1 )
+      write_line( f, "wire [" + select + "-1:0] sel;", 1 )
+   if lanes > 1:
+      write_line( f, "wire [LANES-1:0]        result;", 1 )
+   else:
+      write_line( f, "wire                    result;", 1 )
    write_line( f, "wire                    valid;", 1 )
    write_line( f, "" )
    write_line( f, "// read input data and expected output data", 1 )
-   write_line( f, "reg [DIMENSION-1:0] test_data [LENGTH-1:0];", 1 )
-   write_line( f, "reg [DIMENSION-1:0] test_weights [LENGTH-1:0];", 1 )
+   write_line( f, "reg [" + vector + "-1:0] test_data [LENGTH-1:0];", 1 )
+   write_line( f, "reg [" + vector + "-1:0] test_weights [LENGTH-1:0];", 1 )
    if not alaghi:
-      write_line( f, "reg [SELECT_WIDTH-1:0] test_sel [LENGTH-1:0];", 1 )
-   write_line( f, "reg expected_result [LENGTH-1:0];", 1 )
+      write_line( f, "reg [" + select + "-1:0] test_sel [LENGTH-1:0];", 1 )
+   if lanes > 1:
+      write_line( f, "reg [LANES-1:0] expected_result [LENGTH-1:0];", 1 )
+   else:
+      write_line( f, "reg expected_result [LENGTH-1:0];", 1 )
+   mif.write_mem_load_decls( f, datafmt )
    write_line( f, "initial begin", 1 )
-   write_line( f, "$readmemb(DATA_VECTOR, test_data, 0, LENGTH-1);", 2 )
-   write_line( f, "$readmemb(WEIGHT_VECTOR, test_weights, 0, LENGTH-1);", 2 )
+   mif.write_mem_load( f, datafmt, "DATA_VECTOR", "test_data", "LENGTH" )
+   mif.write_mem_load( f, datafmt, "WEIGHT_VECTOR", "test_weights", "LENGTH" )
    if not alaghi:
-      write_line( f, "$readmemb(SELECT_STREAM, test_sel, 0, LENGTH-1);", 2 )
-   write_line( f, "$readmemb(DP_RESULT, expected_result, 0, LENGTH-1);", 2 )
+      mif.write_mem_load( f, datafmt, "SELECT_STREAM", "test_sel", "LENGTH" )
+   mif.write_mem_load( f, datafmt, "DP_RESULT", "expected_result", "LENGTH" )
    write_line( f, "end", 1 )
    write_line( f, "" )
    write_line( f, "// Test input assignment logic", 1 )
 
-   test_width = clogb2( _DP_TEST_SIZE )
+   test_width = max( clogb2( length ), 1 )
 
    write_line( f, "reg [" + str(test_width-1) + ":0] test_index;", 1 )
    write_line( f, "initial test_index = 0;", 1 )
@@ -224,7 +302,7 @@ def write_dp_tb( f, module_name, dimension, rep = "uni", alaghi = False ):
    write_line( f, "always @(posedge clk) begin", 1 )
    write_line( f, "if( rst ) begin", 2 )
    write_line( f, "result_index <= 0;", 3 )
-   write_line( f, "end else if( valid == 1'b1 ) begin", 2 )
+   write_line( f, "end else if( valid == 1'b1 && result_index < LENGTH ) begin", 2 )
    write_line( f, "if( result != expected_result[result_index] ) begin", 3 )
    write_line( f, "$display(\"Error. Expected result %d does not match actual %d. On result index: %d\", ", 4 )
    write_line( f, "expected_result[result_index], result, result_index);", 5 )
@@ -258,14 +336,18 @@ def write_dp_tb( f, module_name, dimension, rep = "uni", alaghi = False ):
    write_line( f, "initial begin", 1 )
    write_line( f, "// initialize inputs", 2 )
    write_line( f, "rst = 1;", 2 )
-   write_line( f, "#(8*CLOCK_PERIOD);", 2 )
+   write_line( f, "#(" + str(TB_RESET_CYCLES) + "*CLOCK_PERIOD);", 2 )
    write_line( f, "" )
    write_line( f, "// start sim", 2 )
    write_line( f, "rst = 0;", 2 )
-   write_line( f, "#(LENGTH*CLOCK_PERIOD + 100) // add 100 extra cycles for initial ouput delay", 2 )
+   write_line( f, "#((LENGTH + LATENCY + 1)*CLOCK_PERIOD); // until the last result is out of the pipeline", 2 )
    write_line( f, "" )
    write_line( f, "// error summary", 2 )
    write_line( f, "$display(\"Simulation complete.\");", 2 )
+   write_line( f, "if( result_index < LENGTH ) begin", 2 )
+   write_line( f, "$display(\"Error. Only %d of %d results were checked.\", result_index, LENGTH);", 3 )
+   write_line( f, "errors = errors + 1;", 3 )
+   write_line( f, "end", 2 )
    write_line( f, "if( errors > 0 ) begin", 2 )
    write_line( f, "$display(\"Validataion failure: %d error(s).\", errors);", 3 )
    write_line( f, "end else begin", 2 )
@@ -278,7 +360,7 @@ def write_dp_tb( f, module_name, dimension, rep = "uni", alaghi = False ):
 
 # This function generates a few files used by the dot product testbench.
 # Files for input data vector, weight vector, select streams and final
-# dot_product results are generated. 
+# dot_product results are generated, one chunk of cycles at a time.
 #
 # Parameters:
 #  data_dir, the directory to write the 'mif' data files
@@ -286,57 +368,49 @@ def write_dp_tb( f, module_name, dimension, rep = "uni", alaghi = False ):
 #  length, the length of the input streams (essentially the length of the test)
 #  rep, a string, 'uni' or 'bi' specifying the stochastic representation
 #  alaghi, a boolean, specifies whether alaghi adders are used in the dot_product
-def gen_dp_data( data_dir, dimension, length, rep='uni', alaghi=False ):
-   # randomly generate some data and weight vectors
-   data = np.random.randint( length, size = dimension )
-   weight = np.random.randint( length, size = dimension )
-
-   rng0 = lfsr_sequence( length, normalize = False )
-   rng1 = lfsr_sequence( length, normalize = False )
-
-   datas = np.empty( (dimension, length), dtype = bool )
-   weights = np.empty( (dimension, length), dtype = bool )
-
-   for d in range(dimension):
-      datas[d, :] = rng0 < data[d]
-      weights[d, : ] = rng1 < weight[d]
-
-   # Write the data and weight vectors out to 'mif' files
-   # Open and write data to files 
-   with open( os.path.join( data_dir, _DP_DATA_FN ), 'w' ) as f:
-      for stream in range(length):
-         s_str = stream_to_str( datas[:,stream] )
-         f.write( s_str + "\n" )
-   with open( os.path.join( data_dir, _DP_WEIGHT_FN ), 'w' ) as f:
-      for stream in range(length):
-         s_str = stream_to_str( weights[:,stream] )
-         f.write( s_str + "\n" )
+#  datafmt, a string, the format of the data files (bin, hex or raw)
+#  chunk, an int, the number of cycles generated at once
+#  lanes, an int, the lanes of the dot product, every line of the files holds
+#     lanes consecutive cycles of the serial dot product, see mif.lane_bits
+def gen_dp_data( data_dir, dimension, length, rep='uni', alaghi=False, datafmt="bin",
+                 chunk=STREAM_CHUNK, lanes=1 ):
+   rng = lfsr_model.LfsrModel( lfsr_model.rng_width( length ) )
+   top = 1 << rng.width
+
+   # randomly generate some data and weight vectors, and the seeds of the
+   # data, weight and select noise sources
+   data = np.random.randint( top, size = dimension )
+   weight = np.random.randint( top, size = dimension )
+   seeds = np.random.randint( top, size = 3 )
 
    if not alaghi:
-      # generate a select stream
-      sel_sequence = lfsr_sequence( length, normalize = False )
-
-      # Write the select sequence out to a data file 
-      with open( os.path.join( data_dir, _DP_SELECT_FN ), 'w' ) as f:
-         select_width = clogb2( dimension )
-         for num in sel_sequence:
-            sel = int(num % dimension)
-            s_str = int_to_n_length_binary( sel, select_width )
-            f.write( s_str + "\n" )
-
-      # compute the standard dot product
-      result = sc_dot_product( datas, weights, mode="LFSR", rep=rep, sel_sequence=sel_sequence )
-   else:
-      result = sc_dot_product( datas, weights, mode="ALAGHI", rep=rep )
+      select_width = clogb2( dimension )
+
+   data_path = os.path.join( data_dir, mif.file_name( _DP_DATA_FN, datafmt ) )
+   weight_path = os.path.join( data_dir, mif.file_name( _DP_WEIGHT_FN, datafmt ) )
+   sel_path = os.path.join( data_dir, mif.file_name( _DP_SELECT_FN, datafmt ) )
+   res_path = os.path.join( data_dir, mif.file_name( _DP_RES_FN, datafmt ) )
+
+   # the dot product is a 1x1 matrix multiply
+   model = golden_model.MatrixMultModel( rep=rep, alaghi=alaghi )
+   for (start, stop) in chunk_ranges( length, lane_chunk( chunk, lanes ) ):
+      append = start > 0
+
+      # Write the data and weight vectors out to 'mif' files
+      rngs = rng.sequence( seeds, stop - start, start )
+      datas = bitstream.from_thresholds( rngs[0, np.newaxis, :], data )
+      weights = bitstream.from_thresholds( rngs[1, np.newaxis, :], weight )
+      mif.write_streams( data_path, datas, datafmt, append, lanes )
+      mif.write_streams( weight_path, weights, datafmt, append, lanes )
 
-   # write out the dot_product result to a 'mif' file
-   with open( os.path.join( data_dir, _DP_RES_FN ), 'w' ) as f:
-      for res in result:
-         if res:
-            res_str = "1"
-         else:
-            res_str = "0"
-         f.write( res_str + "\n" )
+      sel = None
+      if not alaghi:
+         sel = rngs[2] % dimension
+         mif.write_ints( sel_path, sel, select_width, datafmt, append, lanes )
+
+      # write out the dot_product result to a 'mif' file
+      result = model.run( datas[np.newaxis], weights[np.newaxis], sel )
+      mif.write_streams( res_path, result, datafmt, append, lanes )
 
 # Writes the header comment for the sc_dot_product module.
 # The file written to is the parameter, f.
@@ -356,31 +430,3 @@ def write_dp_tb_header( f ):
    write_line( f, "//" )
    write_line( f, "// Description: The module serves as a testbench for the stochastic dot product module." )
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
-
-# Helper function
-# Takes in an array of 1's and 0's and outputs a string of
-# those 1's and 0's concatenated.
-# Characters of the stream are concatenated to the front,
-# this is because we write the stream to the data file
-# in a way that makes it easy for verilog's readmemb()
-# to read the data.
-def stream_to_str( stream, reverse = False ):
-   s_str = ""
-   for bit in stream:
-      #s_str = "1" + s_str if bit else "0" + s_str
-      if bit:
-         s_str = "1" + s_str
-      else:
-         s_str = "0" + s_str
-
-   return s_str
-
-# Helper function
-# Converts a number, num, to a binary string of precision n. 
-def int_to_n_length_binary( num, n ): 
-   b_str = bin(num)[2:] 
-   for i in range(0, n - len(b_str)): 
-      b_str = "0" + b_str 
- 
-   return b_str
-
@@ -4,6 +4,7 @@
 
 from common import *
 import counter_gen
+import gen_cache
 import lfsr_gen
 import numpy as np
 import os
@@ -14,12 +15,13 @@ import sng_gen
 # Generates simulation modules for the following stochastic
 # circuits: dot_product, matrix_multiply
 # args, the parser arguments from generate.py
+@gen_cache.cached
 def generate( dest, dimensions, precision ):
    # generate width 8 lfsr
    lfsr_gen.generate( dest, precision ) 
 
-   # generate modular counter which counts upto 4 for select streams
-   counter_gen.generate( dest, dimensions )
+   # generate modular counter which counts from 0 to dimensions-1 for select streams
+   counter_gen.generate( dest, dimensions - 1 )
 
    # generate an sd_convertor which converts to an 8 bit binary number
    sd_converter_gen.generate( dest, precision )
@@ -30,7 +32,7 @@ def generate( dest, dimensions, precision ):
    # generate the dot product module!
    sc_dot_product_gen.generate( dest, dimensions )
 
-   with open( os.path.join( dest, DOT_PROD_SIM + ".v" ), 'w' ) as f:
+   with open_verilog( os.path.join( dest, DOT_PROD_SIM + ".v" ) ) as f:
       write_header_dp_sim( f )
       write_dot_product_simulation( f, DOT_PROD_SIM, dimensions, precision )
 
@@ -0,0 +1,611 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains functions to generate sc_matrix_multiply_ip, a matrix
+# multiply with binary inputs and outputs built around sc_matrix_mult:
+#  a bank of sngs turns every element of the input and weight matrices into
+#     a stream, the inputs from one LFSR and the weights from another
+#  the counter is the select source of the mux adders
+#  an sd_converter counts the ones of every result stream over a window
+#
+# The matrices are written one row per cycle into ping-pong registers. While
+# the sngs stream one bank, the next matrices are written into the other,
+# and the banks swap at the end of every window of WINDOW cycles, so a full
+# output matrix is computed every window with no idle cycles in between.
+#
+# Counting cycles from the end of reset, window w is the cycles
+# [w*WINDOW, (w+1)*WINDOW), and windowStart is 1 on its first cycle. Rows
+# written during window w are streamed during window w+1, and its results
+# are on outputData, with outputWriteEn, for one cycle LATENCY cycles after
+# the last cycle of window w+1: the sng register, the matrix multiply and
+# the register capturing the converters. Window 0 streams the banks as they
+# are out of reset, so its results are not written out.
+#
+# Bit c of a stream is 1 when the LFSR state of cycle c is below the
+# element. An input is only ever multiplied by a weight, and the mux adder
+# only passes one product of a dot product at a time, so the inputs share
+# one LFSR and the weights another, seeded half a period apart. Result
+# (i, j) is the count of the WINDOW bits of its stream, about
+# WINDOW * sum_k( a_ik * b_kj ) / (N * 4^PRECISION).
+
+from common import *
+import bitstream
+import counter_gen
+import gen_cache
+import golden_model
+import lfsr_gen
+import lfsr_model
+import mif
+import netlist
+import numpy as np
+import os
+import sc_dot_product_gen
+import sc_matrix_mult_gen
+import sd_converter_gen
+import shiftreg_gen
+import simulator
+import sng_gen
+
+# matrix multiply IP testbench constants
+_IP_INPUT_FN = "ip_input_rows.mif"
+_IP_WEIGHT_FN = "ip_weight_rows.mif"
+_IP_RES_FN = "ip_results.mif"
+
+# default number of pairs of matrices the testbench loads
+IP_TEST_MATRICES = 4
+
+# default and largest precision of the binary inputs
+IP_PRECISION = 8
+MAX_PRECISION = 16
+
+
+# Generates a matrix multiply IP and every module below it.
+#  dest, a string, the directory to write the files to
+#  batch, an int, M in MxN * NxO
+#  input_features, an int, N
+#  output_features, an int, O
+#  precision, an int, the bit width of the elements of the input and weight
+#     matrices, and of the LFSRs
+#  window, an int, the cycles of stream of every output matrix, None for
+#     2^precision, the period of the LFSRs
+#  alaghi, boolean, specifies use of alaghi adders instead of conventional
+#     stochastic adders
+#  test, a boolean, selects testbench generation
+#  matrices, an int, the number of pairs of matrices the testbench loads
+#  datafmt, a string, the format of the testbench data files (bin, hex or raw)
+#  chunk, an int, the number of cycles of testbench data generated at once
+@gen_cache.cached
+def generate( dest, batch, input_features, output_features, precision = IP_PRECISION,
+              window = None, alaghi = False, test = True, matrices = IP_TEST_MATRICES,
+              datafmt = "bin", chunk = STREAM_CHUNK ):
+   window = ip_window( batch, input_features, output_features, precision, window, alaghi )
+   sc_matrix_mult_gen.generate( dest, batch, input_features, output_features, alaghi,
+                                test=False )
+   lfsr_gen.generate( dest, precision )
+   sng_gen.generate( dest, precision )
+   sd_converter_gen.generate( dest, result_width( window ) )
+   if not alaghi:
+      counter_gen.generate( dest, input_features - 1 )
+   shiftreg_gen.generate( dest, ip_delay( input_features, alaghi ) - 1 )
+
+   generate_module( dest, batch, input_features, output_features, precision, window, alaghi )
+   if test:
+      generate_test( dest, batch, input_features, output_features, precision, window, alaghi,
+                     matrices, datafmt, chunk )
+
+# Adds the tasks of generate to a scheduler.Scheduler and returns the name of
+# the task writing the module. See generate for the parameters.
+def plan( sched, batch, input_features, output_features, precision = IP_PRECISION,
+          window = None, alaghi = False, test = True, matrices = IP_TEST_MATRICES,
+          datafmt = "bin", chunk = STREAM_CHUNK ):
+   key = gen_cache.call_key( generate, batch=batch, input_features=input_features,
+                             output_features=output_features, precision=precision,
+                             window=window, alaghi=alaghi, test=test, matrices=matrices,
+                             datafmt=datafmt, chunk=chunk )
+   window = ip_window( batch, input_features, output_features, precision, window, alaghi )
+   deps = [sc_matrix_mult_gen.plan( sched, batch, input_features, output_features, alaghi,
+                                    test=False ),
+           sched.add( LFSR, lfsr_gen.generate, (precision,) ),
+           sched.add( SNG, sng_gen.generate, (precision,) ),
+           sched.add( SD_CONVERTER, sd_converter_gen.generate, (result_width( window ),) )]
+   if not alaghi:
+      deps.append( sched.add( COUNTER, counter_gen.generate, (input_features - 1,) ) )
+   delay = ip_delay( input_features, alaghi ) - 1
+   deps.append( sched.add( shiftreg_name( delay ), shiftreg_gen.generate, (delay,) ) )
+
+   module = sched.add( MATRIX_IP, generate_module, (batch, input_features, output_features,
+                       precision, window, alaghi), deps=deps )
+   if test:
+      sched.add( MATRIX_IP + "_tb", generate_test, (batch, input_features, output_features,
+                 precision, window, alaghi, matrices, datafmt, chunk), deps=[module],
+                 seed_key=key )
+   return module
+
+# Checks the parameters of an IP and returns its window, see generate.
+# Raises a ValueError for an IP which cannot be built.
+def ip_window( batch, inpt, outpt, precision, window = None, alaghi = False ):
+   if precision < 2 or precision > MAX_PRECISION:
+      raise ValueError( "Precision must be between 2 and " + str(MAX_PRECISION) + ": " \
+                        + str(precision) )
+   if inpt < 2:
+      raise ValueError( "The adders need at least 2 input features: " + str(inpt) )
+   if window is None:
+      window = 1 << precision
+   if window < max( batch, outpt ):
+      # a row of each matrix is written every cycle
+      raise ValueError( "The window must be at least max(M, O) = " \
+                        + str(max( batch, outpt )) + " cycles: " + str(window) )
+   return window
+
+# Returns the number of cycles from the last cycle of a window to its
+# results, the sng register, the matrix multiply and the result registers.
+def ip_delay( inpt, alaghi = False ):
+   return sc_dot_product_gen.dp_delay( inpt, alaghi ) + 2
+
+# Returns the bit width of the results of an IP, wide enough to count every
+# bit of a window.
+def result_width( window ):
+   return clogb2( window + 1 )
+
+# Returns the width of the address of a matrix of the given number of rows.
+def address_width( rows ):
+   return max( clogb2( rows ), 1 )
+
+# Returns the seeds of the input and weight LFSRs, (seed0, seed1). The
+# weight LFSR starts half a period after the input LFSR, the farthest apart
+# two phases of the same sequence can be.
+def ip_seeds( precision ):
+   rng = lfsr_model.LfsrModel( precision )
+   return (1, int(rng.sequence( 1, 1, rng.period() // 2 )[0]))
+
+# Writes the IP module into dest.
+def generate_module( dest, batch, input_features, output_features, precision = IP_PRECISION,
+                     window = None, alaghi = False ):
+   window = ip_window( batch, input_features, output_features, precision, window, alaghi )
+   with open_verilog( os.path.join( dest, MATRIX_IP + ".v" ) ) as f:
+      write_header_ip( f, alaghi )
+      write_ip_module( f, MATRIX_IP, batch, input_features, output_features, precision, window,
+                       alaghi )
+
+# Writes the IP testbench and its data into dest.
+def generate_test( dest, batch, input_features, output_features, precision = IP_PRECISION,
+                   window = None, alaghi = False, matrices = IP_TEST_MATRICES, datafmt = "bin",
+                   chunk = STREAM_CHUNK ):
+   window = ip_window( batch, input_features, output_features, precision, window, alaghi )
+   (tb, data) = makeTestDir( dest )
+   tb_name = MATRIX_IP + "_tb"
+
+   gen_ip_data( data, batch, input_features, output_features, precision, window, alaghi,
+                matrices, datafmt, chunk )
+   with open_verilog( os.path.join( tb, tb_name + ".v" ) ) as f:
+      write_ip_tb_header( f )
+      write_ip_tb( f, tb_name, batch, input_features, output_features, precision, window,
+                   alaghi, matrices, datafmt )
+
+# Writes a matrix multiply IP module to an output file, f.
+# Parameters:
+#  module_name, a string for the module
+#  batch, inpt, outpt, the matrix multiply, M, N and O
+#  precision, window, alaghi, see generate
+def write_ip_module( f, module_name, batch, inpt, outpt, precision, window, alaghi = False ):
+   netlist.write_module( f, build_ip_module( module_name, batch, inpt, outpt, precision, window,
+                                             alaghi ) )
+
+# Builds the netlist of a matrix multiply IP module, see the top of this file.
+#  inputRow, inputAddr, inputWrEn, writes row inputAddr of the input matrix,
+#     element k of the row in bits [k*PRECISION +: PRECISION]
+#  weightRow, weightAddr, weightWrEn, writes row weightAddr of the
+#     (transposed) weight matrix, the same way
+#  windowStart, 1 on the first cycle of every window
+#  outputData, outputWrEn, the results of a window, result (i, j) in bits
+#     [(i*O + j)*RESULT_WIDTH +: RESULT_WIDTH]
+def build_ip_module( module_name, batch, inpt, outpt, precision, window, alaghi = False ):
+   count_width = max( clogb2( window ), 1 )
+   res_width = result_width( window )
+   delay = ip_delay( inpt, alaghi )
+   (seed0, seed1) = ip_seeds( precision )
+   clk = netlist.Ref( "clk" )
+   rst = netlist.Ref( "rst" )
+   reset = netlist.is_high( "rst" )
+   zero = netlist.Const( 0 )
+
+   m = netlist.Module( module_name )
+   batch = m.add_param( "BATCH_SIZE", batch, "M" )
+   inpt = m.add_param( "INPUT_FEATURES", inpt, "N" )
+   outpt = m.add_param( "OUTPUT_FEATURES", outpt, "O" )
+   precision = m.add_param( "PRECISION", precision )
+   m.add_param( "WINDOW", window, "cycles per output matrix" )
+   res_width = m.add_param( "RESULT_WIDTH", res_width )
+   m.add_param( "LATENCY", delay, "cycles from the end of a window to its results" )
+   row_width = inpt * precision
+
+   # inputs and outputs
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   m.add_input( "inputRow", row_width )
+   m.add_input( "inputAddr", address_width( batch ) )
+   m.add_input( "inputWrEn" )
+   m.add_input( "weightRow", row_width )
+   m.add_input( "weightAddr", address_width( outpt ) )
+   m.add_input( "weightWrEn" )
+   window_start = m.add_output( "windowStart" )
+   m.add_output( "outputData", batch * outpt * res_width )
+   write_en = m.add_output( "outputWrEn" )
+
+   # the cycle of the window and the bank the sngs stream, the other bank is
+   # written
+   window_end = m.add_wire( "window_end" )
+   count = netlist.Ref( "window_count" )
+   m.add_register( "window_count", count_width,
+                   [(reset, zero), (window_end, zero),
+                    (None, netlist.Op( "add", count, netlist.Const( 1, count_width ) ))],
+                   comment="cycle of the window" )
+   m.assign( window_end, netlist.Op( "eq", count, netlist.Const( window - 1, count_width ) ) )
+   m.assign( window_start, netlist.Op( "eq", count, netlist.Const( 0, count_width ) ) )
+   bank = m.add_register( "bank", None, [(reset, zero),
+                          (window_end, netlist.Op( "not", netlist.Ref( "bank" ) ))],
+                          comment="the bank streamed" )
+
+   # noise sources and select stream
+   rngs = {}
+   for (name, seed) in (("input", seed0), ("weight", seed1)):
+      rngs[name] = m.add_wire( name + "_rng", precision )
+      m.add_instance( LFSR, name.upper() + "_LFSR",
+                      [("clk", clk), ("rst", rst), ("seed", netlist.Const( seed, precision )),
+                       ("enable", netlist.Const( 1, 1 )), ("restart", netlist.Const( 0, 1 )),
+                       ("out", rngs[name])] )
+   if not alaghi:
+      sel = m.add_wire( "sel", clogb2( inpt ) )
+      m.add_instance( COUNTER, "COUNTER", [("clk", clk), ("rst", rst),
+                      ("enable", netlist.Const( 1, 1 )), ("restart", netlist.Const( 0, 1 )),
+                      ("out", sel)] )
+
+   # the ping-pong registers of every row and the sngs of its elements
+   for (name, rows) in (("input", batch), ("weight", outpt)):
+      streams = m.add_wire( name + "Streams", rows * inpt )
+      addr_width = address_width( rows )
+      for r in range(rows):
+         write = netlist.Op( "and", netlist.is_high( name + "WrEn" ),
+                             netlist.Op( "eq", netlist.Ref( name + "Addr" ),
+                                         netlist.Const( r, addr_width ) ) )
+         banks = []
+         for b in range(2):
+            load = netlist.Op( "and", write, netlist.Op( "eq", bank, netlist.Const( 1 - b, 1 ) ) )
+            banks.append( m.add_register( name + "_" + str(b) + "_" + str(r), row_width,
+                                          [(reset, zero), (load, netlist.Ref( name + "Row" ))] ) )
+         row = m.add_wire( name + "_" + str(r), row_width )
+         m.assign( row, netlist.Op( "mux", bank, banks[1], banks[0] ) )
+         for k in range(inpt):
+            m.add_instance( SNG, name.upper() + "_SNG_" + str(r) + "_" + str(k),
+                            [("clk", clk), ("rst", rst),
+                             ("in", netlist.Ref( row.name, (k+1)*precision - 1, k*precision )),
+                             ("rng", rngs[name]),
+                             ("out", netlist.Ref( streams.name, r*inpt + k ))],
+                            [("PRECISION", precision)] )
+
+   conns = [("clk", clk), ("rst", rst), ("inputStreams", netlist.Ref( "inputStreams" )),
+            ("weightStreams", netlist.Ref( "weightStreams" ))]
+   if not alaghi:
+      conns.append( ("sel", sel) )
+   results = m.add_wire( "resultStreams", batch * outpt )
+   conns.append( ("outputStreams", results) )
+   conns.append( ("outputWriteEn", m.add_wire( "mult_write_en" )) )
+   m.add_instance( MATRIX, "MATRIX_MULT", conns )
+
+   # the last bit of a window leaves the matrix multiply delay-1 cycles after
+   # the end of the window
+   last = m.add_wire( "last" )
+   m.add_instance( shiftreg_name( delay - 1 ), "SHIFT" + str(delay - 1),
+                   [("clk", clk), ("rst", rst), ("data_in", window_end), ("data_out", last)] )
+
+   m.add_wire( "counts", batch * outpt * res_width )
+   e = netlist.Index( "i" ) * outpt + netlist.Index( "j" )
+   m.add_instance_array( SD_CONVERTER, "SD_CONVERTER", "sd_loop", [("i", batch), ("j", outpt)],
+                         [("clk", clk), ("rst", rst), ("in", netlist.Ref( results.name, e )),
+                          ("last", last), ("out", netlist.Part( "counts", e * res_width, res_width ))],
+                         [("PRECISION", res_width)],
+                         "count the bits of every result, the converter drops the bit of the cycle\n"
+                         "last is 1, so it is added in when the count is captured" )
+   captured = []
+   for i in range(batch):
+      for j in range(outpt):
+         e = i*outpt + j
+         stream = netlist.Ref( results.name, e )
+         counted = netlist.Ref( "counts", (e+1)*res_width - 1, e*res_width )
+         captured.append( m.add_register( "result_" + str(i) + "_" + str(j), res_width,
+                                          [(reset, zero),
+                                           (last, netlist.Op( "add", counted, stream ))] ) )
+   m.assign( netlist.Ref( "outputData" ), netlist.Op( "concat", *reversed( captured ) ) )
+
+   started = m.add_register( "started", None, [(reset, zero), (last, netlist.Const( 1 ))],
+                             comment="past the results of window 0" )
+   written = m.add_register( "write_en", None,
+                             [(reset, zero), (None, netlist.Op( "and", last, started ))] )
+   m.assign( write_en, written )
+   return m
+
+# Returns the netlist.Design of an IP module and every module below it, for
+# simulation.
+def build_design( batch, inpt, outpt, precision = IP_PRECISION, window = None, alaghi = False ):
+   window = ip_window( batch, inpt, outpt, precision, window, alaghi )
+   delay = ip_delay( inpt, alaghi ) - 1
+   modules = sc_matrix_mult_gen.build_design( batch, inpt, outpt, alaghi ).modules.values()
+   modules = list( modules ) + [
+      lfsr_gen.build_lfsr_module( LFSR, precision ),
+      sd_converter_gen.build_sd_converter_module( SD_CONVERTER, result_width( window ) ),
+      shiftreg_gen.build_shiftreg_module( shiftreg_name( delay ), delay )]
+   modules += sng_gen.build_design( precision ).modules.values()
+   if not alaghi:
+      modules.append( counter_gen.build_modular_counter_module( COUNTER, inpt - 1 ) )
+   return netlist.Design( build_ip_module( MATRIX_IP, batch, inpt, outpt, precision, window,
+                                           alaghi ), modules )
+
+# Writes the header comment for the sc_matrix_multiply_ip module.
+# alaghi, a boolean, the matrix multiply uses alaghi adders
+def write_header_ip( f, alaghi = False ):
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "// Create Date: " + get_time() )
+   write_line( f, "//" )
+   write_line( f, "// Description: This module is a matrix multiply with binary inputs and outputs." )
+   write_line( f, "// The rows of an MxN matrix A and of the transpose of an NxO matrix B are written" )
+   write_line( f, "// into ping-pong registers, one row of each per cycle, while the other bank is" )
+   write_line( f, "// streamed through sngs into sc_matrix_mult. The banks swap every WINDOW cycles" )
+   write_line( f, "// and the ones of every stream of C are counted by an sd_converter, so a matrix" )
+   write_line( f, "// of counts comes out every WINDOW cycles, LATENCY cycles after the window which" )
+   write_line( f, "// streamed it." )
+   if not alaghi:
+      write_line( f, "// The select stream of the mux adders is a counter from 0 to N-1." )
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "" )
+
+# Writes the testbench module for the generated sc_matrix_multiply_ip module.
+# A pair of matrices is written during every window and the results of each
+# checked when they come out, two windows later.
+# Parameters:
+# f, file to write to
+# module_name, a string, name of the testbench
+# batch, inpt, outpt, the matrix multiply, M, N and O
+# precision, window, alaghi, matrices, datafmt, see generate
+def write_ip_tb( f, module_name, batch, inpt, outpt, precision, window, alaghi = False,
+                 matrices = IP_TEST_MATRICES, datafmt = "bin" ):
+   res_width = result_width( window )
+   count_width = max( clogb2( window ), 1 )
+   matrix_width = clogb2( matrices + 2 )
+
+   write_line( f, "module " + module_name + "();" )
+   write_line( f, "parameter BATCH_SIZE =      " + str(batch) + "; // M", 1 )
+   write_line( f, "parameter INPUT_FEATURES =  " + str(inpt) + "; // N", 1 )
+   write_line( f, "parameter OUTPUT_FEATURES = " + str(outpt) + "; // O", 1 )
+   write_line( f, "parameter PRECISION =       " + str(precision) + ";", 1 )
+   write_line( f, "parameter RESULT_WIDTH =    " + str(res_width) + ";", 1 )
+   write_line( f, "parameter INPUT_ROWS =      \"" + mif.file_name( _IP_INPUT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter WEIGHT_ROWS =     \"" + mif.file_name( _IP_WEIGHT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter IP_RESULT =       \"" + mif.file_name( _IP_RES_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter WINDOW =       " + str(window) + ";", 1 )
+   write_line( f, "parameter LATENCY =      " + str(ip_delay( inpt, alaghi )) + ";", 1 )
+   write_line( f, "parameter MATRICES =     " + str(matrices) + ";", 1 )
+   write_line( f, "" )
+   write_line( f, "// module inputs and outputs", 1 )
+   write_line( f, "reg clk;", 1 )
+   write_line( f, "reg rst;", 1 )
+   write_line( f, "wire [INPUT_FEATURES*PRECISION-1:0] inputRow;", 1 )
+   write_line( f, "wire [" + str(address_width( batch ) - 1) + ":0] inputAddr;", 1 )
+   write_line( f, "wire inputWrEn;", 1 )
+   write_line( f, "wire [INPUT_FEATURES*PRECISION-1:0] weightRow;", 1 )
+   write_line( f, "wire [" + str(address_width( outpt ) - 1) + ":0] weightAddr;", 1 )
+   write_line( f, "wire weightWrEn;", 1 )
+   write_line( f, "wire windowStart;", 1 )
+   write_line( f, "wire [BATCH_SIZE*OUTPUT_FEATURES*RESULT_WIDTH-1:0] outputData;", 1 )
+   write_line( f, "wire outputWrEn;", 1 )
+   write_line( f, "" )
+   write_line( f, "// read the rows of the matrices and the expected results", 1 )
+   write_line( f, "reg [INPUT_FEATURES*PRECISION-1:0] test_input [MATRICES*BATCH_SIZE-1:0];", 1 )
+   write_line( f, "reg [INPUT_FEATURES*PRECISION-1:0] test_weight [MATRICES*OUTPUT_FEATURES-1:0];", 1 )
+   write_line( f, "reg [BATCH_SIZE*OUTPUT_FEATURES*RESULT_WIDTH-1:0] expected_results [MATRICES-1:0];", 1 )
+   mif.write_mem_load_decls( f, datafmt )
+   write_line( f, "initial begin", 1 )
+   mif.write_mem_load( f, datafmt, "INPUT_ROWS", "test_input", "MATRICES*BATCH_SIZE" )
+   mif.write_mem_load( f, datafmt, "WEIGHT_ROWS", "test_weight", "MATRICES*OUTPUT_FEATURES" )
+   mif.write_mem_load( f, datafmt, "IP_RESULT", "expected_results", "MATRICES" )
+   write_line( f, "end", 1 )
+   write_line( f, "" )
+   write_line( f, "// Write the rows of matrix pair m during window m, one row per cycle", 1 )
+   write_line( f, "reg [" + str(count_width - 1) + ":0] cycle;", 1 )
+   write_line( f, "reg [" + str(matrix_width - 1) + ":0] matrix;", 1 )
+   write_line( f, "initial cycle = 0;", 1 )
+   write_line( f, "initial matrix = 0;", 1 )
+   write_line( f, "always @(posedge clk) begin", 1 )
+   write_line( f, "if( rst == 1'b1 ) begin", 2 )
+   write_line( f, "cycle <= 0;", 3 )
+   write_line( f, "matrix <= 0;", 3 )
+   write_line( f, "end else if( cycle == WINDOW-1 ) begin", 2 )
+   write_line( f, "cycle <= 0;", 3 )
+   write_line( f, "matrix <= matrix + 1;", 3 )
+   write_line( f, "end else begin", 2 )
+   write_line( f, "cycle <= cycle + 1;", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "assign inputWrEn = matrix < MATRICES && cycle < BATCH_SIZE;", 1 )
+   write_line( f, "assign inputAddr = cycle;", 1 )
+   write_line( f, "assign inputRow = test_input[matrix*BATCH_SIZE + cycle];", 1 )
+   write_line( f, "assign weightWrEn = matrix < MATRICES && cycle < OUTPUT_FEATURES;", 1 )
+   write_line( f, "assign weightAddr = cycle;", 1 )
+   write_line( f, "assign weightRow = test_weight[matrix*OUTPUT_FEATURES + cycle];", 1 )
+   write_line( f, "" )
+   write_line( f, "// output checking and error handling", 1 )
+   write_line( f, "integer result_index;", 1 )
+   write_line( f, "integer errors;", 1 )
+   write_line( f, "initial result_index = 0;", 1 )
+   write_line( f, "initial errors = 0;", 1 )
+   write_line( f, "always @(posedge clk) begin", 1 )
+   write_line( f, "if( rst ) begin", 2 )
+   write_line( f, "result_index <= 0;", 3 )
+   write_line( f, "end else begin", 2 )
+   write_line( f, "if( windowStart != (cycle == 0) ) begin", 3 )
+   write_line( f, "$display(\"Error. windowStart is %d on cycle %d of a window.\", windowStart, cycle);", 4 )
+   write_line( f, "errors = errors + 1;", 4 )
+   write_line( f, "end", 3 )
+   write_line( f, "if( outputWrEn == 1'b1 && result_index < MATRICES ) begin", 3 )
+   write_line( f, "if( outputData != expected_results[result_index] ) begin", 4 )
+   write_line( f, "$display(\"Error. Expected result %H does not match actual %H. On result index: %d\",", 5 )
+   write_line( f, "expected_results[result_index], outputData, result_index);", 6 )
+   write_line( f, "errors = errors + 1;", 5 )
+   write_line( f, "end", 4 )
+   write_line( f, "" )
+   write_line( f, "result_index = result_index + 1;", 4 )
+   write_line( f, "end", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "" )
+   write_line( f, "// Clock Generation", 1 )
+   write_line( f, "parameter CLOCK_PERIOD=10;", 1 )
+   write_line( f, "initial clk=1;", 1 )
+   write_line( f, "always begin", 1 )
+   write_line( f, "#(CLOCK_PERIOD/2);", 2 )
+   write_line( f, "clk = ~clk;", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "" )
+   write_line( f, "// instantiate module", 1 )
+   write_line( f, MATRIX_IP + " dut(", 1 )
+   write_line( f, "clk,", 2 )
+   write_line( f, "rst,", 2 )
+   write_line( f, "inputRow,", 2 )
+   write_line( f, "inputAddr,", 2 )
+   write_line( f, "inputWrEn,", 2 )
+   write_line( f, "weightRow,", 2 )
+   write_line( f, "weightAddr,", 2 )
+   write_line( f, "weightWrEn,", 2 )
+   write_line( f, "windowStart,", 2 )
+   write_line( f, "outputData,", 2 )
+   write_line( f, "outputWrEn", 2 )
+   write_line( f, ");", 1 )
+   write_line( f, "" )
+   write_line( f, "initial begin", 1 )
+   write_line( f, "rst = 1;", 2 )
+   write_line( f, "#(" + str(TB_RESET_CYCLES) + "*CLOCK_PERIOD);", 2 )
+   write_line( f, "" )
+   write_line( f, "// start sim", 2 )
+   write_line( f, "rst = 0;", 2 )
+   write_line( f, "#(((MATRICES + 1)*WINDOW + LATENCY + 1)*CLOCK_PERIOD); // until the last results are out", 2 )
+   write_line( f, "" )
+   write_line( f, "// error summary", 2 )
+   write_line( f, "$display(\"Simulation complete.\");", 2 )
+   write_line( f, "if( result_index < MATRICES ) begin", 2 )
+   write_line( f, "$display(\"Error. Only %d of %d results were checked.\", result_index, MATRICES);", 3 )
+   write_line( f, "errors = errors + 1;", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "if( errors > 0 ) begin", 2 )
+   write_line( f, "$display(\"Validataion failure: %d error(s).\", errors);", 3 )
+   write_line( f, "end else begin", 2 )
+   write_line( f, "$display(\"Validation successful.\");", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "" )
+   write_line( f, "$stop;", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "endmodule // " + module_name )
+
+# Write the header comment for the IP testbench to file, f.
+def write_ip_tb_header( f ):
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "// Create Date: " + get_time() )
+   write_line( f, "//" )
+   write_line( f, "// Description: The module serves as a testbench for the matrix multiply IP." )
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+
+# Generates the files used by the IP testbench, the rows of the input and
+# weight matrices and the expected results.
+# Parameters:
+#  data_dir, directory to write the data files into
+#  batch, inpt, outpt, precision, window, alaghi, matrices, chunk, see generate
+#  datafmt, a string, the format of the data files (bin, hex or raw)
+def gen_ip_data( data_dir, batch, inpt, outpt, precision, window, alaghi = False,
+                 matrices = IP_TEST_MATRICES, datafmt = "bin", chunk = STREAM_CHUNK ):
+   (inputs, weights, results) = ip_test_data( batch, inpt, outpt, precision, window, alaghi,
+                                              matrices, chunk )
+   for (fn, values, width) in ((_IP_INPUT_FN, inputs, precision),
+                               (_IP_WEIGHT_FN, weights, precision),
+                               (_IP_RES_FN, results.reshape( (matrices, -1) ),
+                                result_width( window ))):
+      mif.write_text( os.path.join( data_dir, mif.file_name( fn, datafmt ) ),
+                      mif.encode_bits( _row_bits( values, width ), datafmt ) )
+
+# Generates the IP test data, random input and weight matrices and the
+# results the IP computes from them, see gen_ip_data for the parameters.
+# Matrix pair m streams during window m+1, after window 0 streamed the banks
+# as reset, a chunk of cycles at a time.
+# Returns (inputs, weights, results), int arrays of shape (matrices, M, N),
+# (matrices, O, N) and (matrices, M, O).
+def ip_test_data( batch, inpt, outpt, precision, window, alaghi = False,
+                  matrices = IP_TEST_MATRICES, chunk = STREAM_CHUNK ):
+   top = 1 << precision
+   inputs = np.random.randint( top, size = (matrices, batch, inpt) )
+   weights = np.random.randint( top, size = (matrices, outpt, inpt) )
+
+   rng = lfsr_model.LfsrModel( precision )
+   (seed0, seed1) = ip_seeds( precision )
+   model = golden_model.MatrixMultModel( alaghi=alaghi )
+   results = np.zeros( (matrices, batch, outpt), dtype=np.int64 )
+   for w in range(matrices + 1):
+      data = np.zeros( (batch, inpt), dtype=np.int64 ) if w == 0 else inputs[w-1]
+      weight = np.zeros( (outpt, inpt), dtype=np.int64 ) if w == 0 else weights[w-1]
+      counts = np.zeros( (batch, outpt), dtype=np.int64 )
+      for (start, stop) in chunk_ranges( window, chunk ):
+         (start, stop) = (w*window + start, w*window + stop)
+         datas = bitstream.from_thresholds( rng.sequence( seed0, stop - start, start ), data )
+         streams = bitstream.from_thresholds( rng.sequence( seed1, stop - start, start ), weight )
+         # the counter is a cycle ahead of the streams, which wait in the sngs
+         sel = (np.arange( start, stop ) + 1) % inpt
+         counts += model.run( datas, streams, sel ).count()
+      if w > 0:
+         results[w-1] = counts
+   return (inputs, weights, results)
+
+# Runs the IP testbench on the python simulator instead of a verilog
+# simulator, like write_ip_tb, with test data from ip_test_data.
+# Parameters:
+#  batch, inpt, outpt, precision, window, alaghi, matrices, chunk, see generate
+# Returns (errors, checked), the number of output matrices which did not
+# match the golden model and the number of output matrices checked.
+def simulate_test( batch, inpt, outpt, precision = IP_PRECISION, window = None, alaghi = False,
+                   matrices = IP_TEST_MATRICES, chunk = STREAM_CHUNK ):
+   window = ip_window( batch, inpt, outpt, precision, window, alaghi )
+   sim = simulator.Simulator( build_design( batch, inpt, outpt, precision, window, alaghi ) )
+   (inputs, weights, results) = ip_test_data( batch, inpt, outpt, precision, window, alaghi,
+                                              matrices, chunk )
+   input_rows = _row_bits( inputs, precision ).reshape( (matrices, batch, -1) )
+   weight_rows = _row_bits( weights, precision ).reshape( (matrices, outpt, -1) )
+   expected = _row_bits( results.reshape( (matrices, -1) ), result_width( window ) )
+   idle = np.zeros( inpt * precision, dtype=bool )
+
+   errors = 0
+   checked = 0
+   for c in range((matrices + 1) * window + ip_delay( inpt, alaghi ) + 1):
+      (w, cycle) = (c // window, c % window)
+      inputs = { "rst" : 0,
+                 "inputRow" : input_rows[w, cycle] if w < matrices and cycle < batch else idle,
+                 "inputAddr" : cycle % (1 << address_width( batch )),
+                 "inputWrEn" : int(w < matrices and cycle < batch),
+                 "weightRow" : weight_rows[w, cycle] if w < matrices and cycle < outpt else idle,
+                 "weightAddr" : cycle % (1 << address_width( outpt )),
+                 "weightWrEn" : int(w < matrices and cycle < outpt) }
+      if c == 0:
+         # the testbench holds reset for 8 cycles with the first inputs
+         for i in range(TB_RESET_CYCLES):
+            sim.step( dict( inputs, rst=1 ) )
+      outputs = sim.step( inputs )
+      if outputs["windowStart"][0, 0] != (cycle == 0):
+         errors += 1
+      if outputs["outputWrEn"][0, 0] and checked < matrices:
+         if not np.array_equal( outputs["outputData"][:, 0], expected[checked] ):
+            errors += 1
+         checked += 1
+   return (errors + matrices - checked, checked)
+
+# Helper function
+# Returns the bits of the rows of an int array of shape (..., K), every row
+# a line of K elements of the given width, element k in bits
+# [k*width, (k+1)*width). Returns a bool array of shape (rows, K*width).
+def _row_bits( values, width ):
+   values = np.asarray( values, dtype=np.int64 )
+   values = values.reshape( (-1, values.shape[-1]) )
+   shifts = np.arange( width, dtype=np.int64 )
+   bits = (values[:, :, np.newaxis] >> shifts) & 1
+   return bits.reshape( (values.shape[0], -1) ).astype( bool )
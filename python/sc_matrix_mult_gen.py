@@ -3,12 +3,16 @@
 # stochastic matrix multiply. 
 
 from common import *
+import bitstream
+import gen_cache
+import golden_model
+import lfsr_model
+import mif
+import netlist
 import numpy as np
 import os
-from pysc.core.arithmetic import *
-from pysc.linear_algebra.sc_dot_product import *
-from pysc.rngs.lfsr import *
 import sc_dot_product_gen
+import simulator
 
 # matrix multiply testbench constants
 _MM_INPUT_FN = "input_matrices.mif"
@@ -25,29 +29,72 @@ _MM_TEST_SIZE = 100
 #  output_features, an int, O
 #  alaghi, boolean, specifies use of alaghi adders instead of conventional 
 #     stochastic adders
-def generate( dest, batch, input_features, output_features, alaghi = False, test = True ):
+#  datafmt, a string, the format of the testbench data files (bin, hex or raw)
+#  length, an int, the number of cycles of testbench data
+#  chunk, an int, the number of cycles of testbench data generated at once
+#  engines, an int, P, the number of dot products of a folded matrix multiply
+#     which computes the M*O outputs P at a time, one tile per window of
+#     length cycles, None (or M*O) for one dot product per output
+@gen_cache.cached
+def generate( dest, batch, input_features, output_features, alaghi = False, test = True,
+              datafmt = "bin", length = _MM_TEST_SIZE, chunk = STREAM_CHUNK, engines = None ):
+   # Generate the core of matrix multiply, the dot_prodcut module
+   sc_dot_product_gen.generate( dest, input_features, rep="uni", alaghi=alaghi, test=test,
+                                datafmt=datafmt, length=length, chunk=chunk )
+
+   generate_module( dest, batch, input_features, output_features, alaghi, engines, length )
+   if test:
+      generate_test( dest, batch, input_features, output_features, alaghi, datafmt, length,
+                     chunk, engines )
+
+# Adds the tasks of generate to a scheduler.Scheduler and returns the name of
+# the task writing the module. See generate for the parameters.
+def plan( sched, batch, input_features, output_features, alaghi = False, test = True,
+          datafmt = "bin", length = _MM_TEST_SIZE, chunk = STREAM_CHUNK, engines = None ):
+   key = gen_cache.call_key( generate, batch=batch, input_features=input_features,
+                             output_features=output_features, alaghi=alaghi, test=test,
+                             datafmt=datafmt, length=length, chunk=chunk, engines=engines )
+   dot_prod = sc_dot_product_gen.plan( sched, input_features, rep="uni", alaghi=alaghi,
+                                       test=test, datafmt=datafmt, length=length, chunk=chunk )
+   args = (batch, input_features, output_features, alaghi)
+   if is_folded( batch, output_features, engines ):
+      # only a folded module depends on the window, so designs of other
+      # lengths still share the module
+      args += (engines, length)
+   module = sched.add( MATRIX, generate_module, args, deps=[dot_prod] )
+   if test:
+      sched.add( MATRIX + "_tb", generate_test, (batch, input_features, output_features, alaghi,
+                 datafmt, length, chunk, engines), deps=[module], seed_key=key )
+   return module
+
+# Writes the matrix multiply module into dest, see generate for engines and
+# window, the length of its windows.
+def generate_module( dest, batch, input_features, output_features, alaghi = False,
+                     engines = None, window = _MM_TEST_SIZE ):
+   with open_verilog( os.path.join( dest, MATRIX + ".v" ) ) as f:
+      write_header_mat_mult( f, is_folded( batch, output_features, engines ) )
+      write_matrix_module( f, MATRIX, batch, input_features, output_features, alaghi=alaghi,
+                           engines=engines, window=window )
+
+# Writes the matrix multiply testbench and its data into dest.
+def generate_test( dest, batch, input_features, output_features, alaghi = False, datafmt = "bin",
+                   length = _MM_TEST_SIZE, chunk = STREAM_CHUNK, engines = None ):
    M = batch
    N = input_features
    O = output_features
 
-   # Generate the core of matrix multiply, the dot_prodcut module   
-   sc_dot_product_gen.generate( dest, input_features, rep="uni", alaghi=alaghi )
+   # make the testbench directory
+   (tb, data) = makeTestDir( dest )
+   tb_name = MATRIX + "_tb"
 
-   with open( os.path.join( dest, MATRIX + ".v" ), 'w' ) as f: 
-      write_header_mat_mult( f )
-      write_matrix_module( f, MATRIX, M, N, O, alaghi=alaghi )
-
-   if test:
-      # make the testbench directory 
-      (tb, data) = makeTestDir( dest )	
-      tb_name = MATRIX + "_tb"
-
-      # write the matrix multiply testbench
-      gen_mm_data( data, M, N, O, _MM_TEST_SIZE, rep="uni", alaghi=alaghi )
-      with open( os.path.join( tb, tb_name + ".v" ), 'w' ) as f:
-         # write header comment
-         write_mm_tb_header( f ) 
-         write_mm_tb( f, tb_name, M, N, O, alaghi=alaghi )
+   # write the matrix multiply testbench
+   gen_mm_data( data, M, N, O, length, rep="uni", alaghi=alaghi, datafmt=datafmt,
+                chunk=chunk, engines=engines )
+   with open_verilog( os.path.join( tb, tb_name + ".v" ) ) as f:
+      # write header comment
+      write_mm_tb_header( f )
+      write_mm_tb( f, tb_name, M, N, O, alaghi=alaghi, datafmt=datafmt, length=length,
+                   engines=engines )
 
 # Writes a stochatsic matrix multiply module to an output file, f.
 # Parameters:
@@ -55,63 +102,222 @@ def generate( dest, batch, input_features, output_features, alaghi = False, test
 #  batch, an int specifying the batch size (in a matrix mult MxN * NxO, M is batch size)
 #  inpt, an int specifying the input feature size (N)
 #  outpt, an int specifying the output feature size (O)
-def write_matrix_module( f, module_name, batch, inpt, outpt, alaghi = False ):
-   # compute the log base 2 of the input, 
+#  engines, an int, P, the dot products of a folded module, see build_folded_module
+#  window, an int, the cycles of every tile of a folded module
+def write_matrix_module( f, module_name, batch, inpt, outpt, alaghi = False, engines = None,
+                         window = _MM_TEST_SIZE ):
+   netlist.write_module( f, build_matrix_module( module_name, batch, inpt, outpt, alaghi,
+                                                 engines, window ) )
+
+# Builds the netlist of a stochastic matrix multiply module, see write_matrix_module.
+# One sc_dot_product is instantiated for every element of the output matrix,
+# unless the module is folded onto fewer engines.
+def build_matrix_module( module_name, batch, inpt, outpt, alaghi = False, engines = None,
+                         window = _MM_TEST_SIZE ):
+   if is_folded( batch, outpt, engines ):
+      return build_folded_module( module_name, batch, inpt, outpt, engines, window, alaghi )
+
+   # compute the log base 2 of the input,
    # this is how many select streams are required
    select_width = clogb2( inpt )
 
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "clk,", 1 )
-   write_line( f, "rst,", 1 )
-   write_line( f, "inputStreams,", 1 )
-   write_line( f, "weightStreams,", 1 )
+   m = netlist.Module( module_name )
+   batch = m.add_param( "BATCH_SIZE", batch, "M" )
+   inpt = m.add_param( "INPUT_FEATURES", inpt, "N" )
+   outpt = m.add_param( "OUTPUT_FEATURES", outpt, "O" )
    if not alaghi:
-      write_line( f, "sel,", 1 )
-   write_line( f, "outputStreams,", 1 )
-   write_line( f, "outputWriteEn", 1 )
-   write_line( f, ");" )
-   write_line( f, "" )
-   write_line( f, "parameter BATCH_SIZE = " + str(batch) + "; // M", 1 )
-   write_line( f, "parameter INPUT_FEATURES = " + str(inpt) + "; // N", 1 )
-   write_line( f, "parameter OUTPUT_FEATURES = " + str(outpt) + "; // O", 1 )
+      select_width = m.add_param( "SELECT_WIDTH", select_width )
+
+   # inputs and outputs
+   clk = m.add_input( "clk" )
+   rst = m.add_input( "rst" )
+   m.add_input( "inputStreams", batch * inpt )
+   m.add_input( "weightStreams", outpt * inpt )
    if not alaghi:
-      write_line( f, "parameter SELECT_WIDTH = " + str(select_width) + ";", 1 )
-   write_line( f, "" )
-   write_line( f, "// inputs and outputs", 1 )
-   write_line( f, "input                                      clk;", 1 )
-   write_line( f, "input                                      rst;", 1 )
-   write_line( f, "input [BATCH_SIZE*INPUT_FEATURES-1:0]      inputStreams;", 1 )
-   write_line( f, "input [OUTPUT_FEATURES*INPUT_FEATURES-1:0] weightStreams;", 1 )
+      sel = m.add_input( "sel", select_width )
+   m.add_output( "outputStreams", batch * outpt )
+   write_en = m.add_output( "outputWriteEn" )
+
+   (i, j) = (netlist.Index( "i" ), netlist.Index( "j" ))
+   m.add_wire( "valids", batch * outpt )
+   conns = [("clk", clk), ("rst", rst),
+            ("data", netlist.Part( "inputStreams", i * inpt, inpt )),
+            ("weights", netlist.Part( "weightStreams", j * inpt, inpt ))]
    if not alaghi:
-      write_line( f, "input [SELECT_WIDTH-1:0]                 sel;", 1 )
-   write_line( f, "output [BATCH_SIZE*OUTPUT_FEATURES-1:0]    outputStreams;", 1 )
-   write_line( f, "output                                     outputWriteEn;", 1 )
-   write_line( f, "" )
-   write_line( f, "genvar i;", 1 )
-   write_line( f, "genvar j;", 1 )
-   write_line( f, "wire [BATCH_SIZE*OUTPUT_FEATURES-1:0] valids;", 1 )
-   write_line( f, "generate", 1 )
-   write_line( f, "for( i = 0; i < BATCH_SIZE; i = i + 1) begin : dot_prod_loop", 2 )
-   write_line( f, "for( j = 0; j < OUTPUT_FEATURES; j = j + 1) begin", 3 )
-   write_line( f, "sc_dot_product DOT_PRODUCT(.clk(clk),", 4 )
-   write_line( f, "                .rst(rst),", 4 )
-   write_line( f, "                .data(inputStreams[i*INPUT_FEATURES +: INPUT_FEATURES]),", 4 )
-   write_line( f, "                .weights(weightStreams[j*INPUT_FEATURES +: INPUT_FEATURES]),", 4 )
+      conns.append( ("sel", sel) )
+   conns.append( ("result", netlist.Ref( "outputStreams", i * outpt + j )) )
+   conns.append( ("valid", netlist.Ref( "valids", i * outpt + j )) )
+   m.add_instance_array( DOT_PROD, "DOT_PRODUCT", "dot_prod_loop", [("i", batch), ("j", outpt)],
+                         conns, comment="dot product (i, j) multiplies row i of the inputs "
+                                        "by row j of the transposed weights" )
+
+   m.assign( write_en, netlist.Op( "eq", netlist.Ref( "valids", 0 ), netlist.Const( 1, 1 ) ),
+             comment="later we will incorporate this signal" )
+   return m
+
+# Builds the netlist of a folded stochastic matrix multiply module, which
+# trades throughput for area. Only P = engines sc_dot_products are
+# instantiated and the M*O outputs, in row-major order, are computed P at a
+# time: during tile t engine p computes output t*P + p, see fold_schedule.
+# Every tile takes a window of 'window' stream cycles, so the whole matrix
+# takes TILES = ceil(M*O / P) windows, after which the tiles start over. The
+# inputs must keep streaming the same matrices for all of them.
+#
+# A tile counter, advanced at the end of every window, selects the rows of
+# the input and weight matrices fed to every engine. Engines without an
+# output in the last tile are fed 0 streams. A second pair of counters
+# follows the results out of the pipeline:
+#  outputStreams, the result streams of the engines, bit p is output
+#     outputTile*P + p
+#  outputTile, the tile of the results
+#  outputTileLast, 1 on the last cycle of the window of a tile
+#  outputWriteEn, 1 when the results are valid
+# See build_matrix_module for the other parameters.
+def build_folded_module( module_name, batch, inpt, outpt, engines, window, alaghi = False ):
+   select_width = clogb2( inpt )
+   tiles = fold_tiles( batch, outpt, engines )
+   tile_width = max( clogb2( tiles ), 1 )
+   count_width = max( clogb2( window ), 1 )
+
+   m = netlist.Module( module_name )
+   batch = m.add_param( "BATCH_SIZE", batch, "M" )
+   inpt = m.add_param( "INPUT_FEATURES", inpt, "N" )
+   outpt = m.add_param( "OUTPUT_FEATURES", outpt, "O" )
+   engines = m.add_param( "ENGINES", engines, "P" )
+   m.add_param( "TILES", tiles, "ceil(M*O/P)" )
+   m.add_param( "WINDOW", window, "cycles per tile" )
    if not alaghi:
-      write_line( f, "                .sel(sel),", 4 )
-   write_line( f, "                .result(outputStreams[(i*OUTPUT_FEATURES)+j]),", 4 )
-   write_line( f, "                .valid(valids[(i*OUTPUT_FEATURES)+j]));", 4 )
-   write_line( f, "end", 3 )
-   write_line( f, "end", 2 )
-   write_line( f, "endgenerate", 1 )
-   write_line( f, "" )
-   write_line( f, "// later we will incorporate this signal", 1 )
-   write_line( f, "assign outputWriteEn = (valids[0] == 1'b1);", 1 )
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+      select_width = m.add_param( "SELECT_WIDTH", select_width )
+
+   # inputs and outputs
+   clk = m.add_input( "clk" )
+   rst = m.add_input( "rst" )
+   m.add_input( "inputStreams", batch * inpt )
+   m.add_input( "weightStreams", outpt * inpt )
+   if not alaghi:
+      sel = m.add_input( "sel", select_width )
+   m.add_output( "outputStreams", engines )
+   m.add_output( "outputTile", tile_width )
+   tile_last = m.add_output( "outputTileLast" )
+   write_en = m.add_output( "outputWriteEn" )
+
+   # the tile the engines compute and the cycle of its window
+   window_end = m.add_wire( "window_end" )
+   count = _counter( m, "window_count", count_width, window - 1, None,
+                     "cycle of the window of the input tile" )
+   tile = _counter( m, "tile", tile_width, tiles - 1, window_end )
+   m.assign( window_end, netlist.Op( "eq", count, netlist.Const( window - 1, count_width ) ) )
+
+   # route the rows of the current tile to every engine
+   (rows, cols) = fold_schedule( batch, outpt, engines )
+   zeros = netlist.Const( 0, inpt )
+   m.add_wire( "valids", engines )
+   for p in range(engines):
+      data = m.add_wire( "data_" + str(p), inpt )
+      weights = m.add_wire( "weights_" + str(p), inpt )
+      m.assign( data, _tile_select( tile, tile_width,
+                [_row( "inputStreams", rows[t][p], inpt, batch, zeros ) for t in range(tiles)] ) )
+      m.assign( weights, _tile_select( tile, tile_width,
+                [_row( "weightStreams", cols[t][p], inpt, outpt, zeros ) for t in range(tiles)] ) )
+
+      conns = [("clk", clk), ("rst", rst), ("data", data), ("weights", weights)]
+      if not alaghi:
+         conns.append( ("sel", sel) )
+      conns.append( ("result", netlist.Ref( "outputStreams", p )) )
+      conns.append( ("valid", netlist.Ref( "valids", p )) )
+      m.add_instance( DOT_PROD, "ENGINE_" + str(p), conns )
+
+   # follow the tiles out of the pipeline, every engine has the same latency
+   out_end = m.add_wire( "out_window_end" )
+   out_count = _counter( m, "out_count", count_width, window - 1, write_en,
+                         "cycle of the window of the output tile" )
+   out_tile = _counter( m, "out_tile", tile_width, tiles - 1, out_end )
+   m.assign( out_end, netlist.Op( "and", write_en,
+                                  netlist.Op( "eq", out_count,
+                                              netlist.Const( window - 1, count_width ) ) ) )
+
+   m.assign( write_en, netlist.Op( "eq", netlist.Ref( "valids", 0 ), netlist.Const( 1, 1 ) ) )
+   m.assign( netlist.Ref( "outputTile" ), out_tile )
+   m.assign( tile_last, out_end )
+   return m
+
+# Returns True when a matrix multiply with the given number of engines is
+# folded, see build_folded_module.
+def is_folded( batch, outpt, engines ):
+   if engines is None:
+      return False
+   if engines < 1 or engines > batch * outpt:
+      raise ValueError( "Engines must be between 1 and M*O = " + str(batch * outpt) + ": " \
+                        + str(engines) )
+   return engines < batch * outpt
+
+# Returns the number of tiles, the windows a folded matrix multiply takes to
+# compute every output.
+def fold_tiles( batch, outpt, engines ):
+   return (batch * outpt + engines - 1) // engines
+
+# Returns the schedule of a folded matrix multiply, (rows, cols), where
+# rows[t][p] and cols[t][p] are the row of the input matrix and of the
+# (transposed) weight matrix engine p is fed during tile t. An engine without
+# an output in the last tile gets row M and O, past the last rows.
+def fold_schedule( batch, outpt, engines ):
+   rows = []
+   cols = []
+   for t in range(fold_tiles( batch, outpt, engines )):
+      outputs = [t * engines + p for p in range(engines)]
+      rows.append( [i // outpt if i < batch * outpt else batch for i in outputs] )
+      cols.append( [i % outpt if i < batch * outpt else outpt for i in outputs] )
+   return (rows, cols)
+
+# Returns the netlist.Design of a matrix multiply module and every module
+# below it, for simulation.
+def build_design( batch, inpt, outpt, alaghi = False, engines = None, window = _MM_TEST_SIZE ):
+   dot_prod = sc_dot_product_gen.build_design( inpt, alaghi=alaghi )
+   return netlist.Design( build_matrix_module( MATRIX, batch, inpt, outpt, alaghi, engines,
+                                               window ),
+                          dot_prod.modules.values() )
+
+# Helper function
+# Adds a counter register from 0 to last to a module, which advances on every
+# cycle enable is 1, or every cycle when enable is None. Returns its reference.
+def _counter( m, name, width, last, enable, comment=None ):
+   ref = netlist.Ref( name )
+   wrap = netlist.Op( "eq", ref, netlist.Const( last, width ) )
+   if enable is not None:
+      wrap = netlist.Op( "and", enable, wrap )
+   return m.add_register( name, width, [(netlist.is_high( "rst" ), netlist.Const( 0 )),
+                                        (wrap, netlist.Const( 0 )),
+                                        (enable, netlist.Op( "add", ref, netlist.Const( 1, width ) ))],
+                          comment=comment )
+
+# Helper function
+# Returns the reference to row i of a flattened matrix of the given number of
+# rows, or zeros past the last row.
+def _row( name, i, width, count, zeros ):
+   if i >= count:
+      return zeros
+   return netlist.Ref( name, (i+1)*width - 1, i*width )
+
+# Helper function
+# Returns the expression selecting choices[tile]. The choices of consecutive
+# tiles are often the same row, so every run of equal choices is a single
+# comparison of a chain of muxes.
+def _tile_select( tile, width, choices ):
+   runs = []
+   for t in range(len( choices )):
+      if runs and str(runs[-1][1]) == str(choices[t]):
+         runs[-1] = (t, choices[t])
+      else:
+         runs.append( (t, choices[t]) )
+   expr = runs[-1][1]
+   for (last, choice) in reversed( runs[:-1] ):
+      expr = netlist.Op( "mux", netlist.Op( "lt", tile, netlist.Const( last + 1, width ) ),
+                         choice, expr )
+   return expr
 
 # Writes the header comment for the sc_matrix_mult module.
-def write_header_mat_mult( f ):
+# folded, a boolean, describes the folded module instead
+def write_header_mat_mult( f, folded = False ):
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
    write_line( f, "// Create Date: " + get_time() )
    write_line( f, "//" )
@@ -120,6 +326,10 @@ def write_header_mat_mult( f ):
    write_line( f, "// where A has dimensions MxN and B has dimensions NxO." )
    write_line( f, "// The input matrix B is actually the transpose of B (still flattened)" )
    write_line( f, "// This results in a matrix C with dimensions MxO." )
+   if folded:
+      write_line( f, "// The module is folded onto ENGINES dot products, which compute the outputs" )
+      write_line( f, "// of C, in row-major order, ENGINES at a time, one tile per WINDOW cycles." )
+      write_line( f, "// Output bit p belongs to element outputTile*ENGINES + p of C." )
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
    write_line( f, "" )
 
@@ -130,23 +340,44 @@ def write_header_mat_mult( f ):
 # batch, an int, specifies batch size (in a matrix mult MxN * NxO, M is batch size)
 # inpt, an int, specifies input feature size (N)
 # outpt, an int, specifies output feature size (O)
-def write_mm_tb( f, module_name, batch, inpt, outpt, alaghi=False ):
+# datafmt, a string, the format of the data files to load (bin, hex or raw)
+# length, an int, the number of cycles of test data
+# engines, an int, the engines of a folded module, which is tested for every
+#  tile, length cycles each, see build_folded_module
+def write_mm_tb( f, module_name, batch, inpt, outpt, alaghi=False, datafmt="bin",
+                 length=_MM_TEST_SIZE, engines=None ):
   
    # compute number of select streams needed 
    select_width = clogb2( inpt )
 
+   # a folded module is checked for every tile, the data covers them all
+   folded = is_folded( batch, outpt, engines )
+   cycles = length
+   depth = "LENGTH"
+   results = "BATCH_SIZE*OUTPUT_FEATURES"
+   if folded:
+      tiles = fold_tiles( batch, outpt, engines )
+      cycles = tiles * length
+      depth = "CYCLES"
+      results = "ENGINES"
+
    write_line( f, "module " + module_name + "();" )
    write_line( f, "parameter BATCH_SIZE =      " + str(batch) + "; // M", 1 ) 
    write_line( f, "parameter INPUT_FEATURES =  " + str(inpt) + "; // N", 1 ) 
    write_line( f, "parameter OUTPUT_FEATURES = " + str(outpt) + "; // O", 1 ) 
    if not alaghi:
       write_line( f, "parameter SELECT_WIDTH =    " + str(select_width) + ";", 1 ) 
-   write_line( f, "parameter INPUT_MATRICES =  \"" + _MM_INPUT_FN + "\";", 1 ) 
-   write_line( f, "parameter WEIGHT_MATRICES = \"" + _MM_WEIGHT_FN + "\";", 1 ) 
+   write_line( f, "parameter INPUT_MATRICES =  \"" + mif.file_name( _MM_INPUT_FN, datafmt ) + "\";", 1 ) 
+   write_line( f, "parameter WEIGHT_MATRICES = \"" + mif.file_name( _MM_WEIGHT_FN, datafmt ) + "\";", 1 ) 
    if not alaghi:
-      write_line( f, "parameter SELECT_STREAM =   \"" + _MM_SEL_FN + "\";", 1 ) 
-   write_line( f, "parameter MM_RESULT =       \"" + _MM_RES_FN + "\";", 1 ) 
-   write_line( f, "parameter LENGTH =       " + str(_MM_TEST_SIZE) + ";", 1 ) 
+      write_line( f, "parameter SELECT_STREAM =   \"" + mif.file_name( _MM_SEL_FN, datafmt ) + "\";", 1 ) 
+   write_line( f, "parameter MM_RESULT =       \"" + mif.file_name( _MM_RES_FN, datafmt ) + "\";", 1 ) 
+   write_line( f, "parameter LENGTH =       " + str(length) + ";", 1 ) 
+   write_line( f, "parameter LATENCY =      " + str(sc_dot_product_gen.dp_delay( inpt, alaghi )) + ";", 1 )
+   if folded:
+      write_line( f, "parameter ENGINES =      " + str(engines) + "; // P", 1 )
+      write_line( f, "parameter TILES =        " + str(tiles) + ";", 1 )
+      write_line( f, "parameter CYCLES =       TILES*LENGTH;", 1 )
    write_line( f, "" )
    write_line( f, "// module inputs and outputs", 1 ) 
    write_line( f, "reg clk;", 1 ) 
@@ -155,26 +386,30 @@ def write_mm_tb( f, module_name, batch, inpt, outpt, alaghi=False ):
    write_line( f, "wire [OUTPUT_FEATURES*INPUT_FEATURES-1:0] weightStreams;", 1 ) 
    if not alaghi:
       write_line( f, "wire [SELECT_WIDTH-1:0]                 sel;", 1 ) 
-   write_line( f, "wire [BATCH_SIZE*OUTPUT_FEATURES-1:0]    outputStreams;", 1 ) 
+   write_line( f, "wire [" + results + "-1:0]    outputStreams;", 1 ) 
+   if folded:
+      write_line( f, "wire [" + str(max( clogb2( tiles ), 1 ) - 1) + ":0] outputTile;", 1 )
+      write_line( f, "wire                                     outputTileLast;", 1 )
    write_line( f, "wire                                     outputWriteEn;", 1 ) 
    write_line( f, "" )
    write_line( f, "// read input data and expected output data", 1 ) 
-   write_line( f, "reg [BATCH_SIZE*INPUT_FEATURES-1:0] test_input [LENGTH-1:0];", 1 ) 
-   write_line( f, "reg [OUTPUT_FEATURES*INPUT_FEATURES-1:0] test_weight [LENGTH-1:0];", 1 ) 
+   write_line( f, "reg [BATCH_SIZE*INPUT_FEATURES-1:0] test_input [" + depth + "-1:0];", 1 ) 
+   write_line( f, "reg [OUTPUT_FEATURES*INPUT_FEATURES-1:0] test_weight [" + depth + "-1:0];", 1 ) 
    if not alaghi:
-      write_line( f, "reg [SELECT_WIDTH-1:0]                 test_sel [LENGTH-1:0];", 1 ) 
-   write_line( f, "reg [BATCH_SIZE*OUTPUT_FEATURES-1:0] expected_results [LENGTH-1:0];", 1 ) 
+      write_line( f, "reg [SELECT_WIDTH-1:0]                 test_sel [" + depth + "-1:0];", 1 ) 
+   write_line( f, "reg [" + results + "-1:0] expected_results [" + depth + "-1:0];", 1 ) 
+   mif.write_mem_load_decls( f, datafmt )
    write_line( f, "initial begin", 1 ) 
-   write_line( f, "$readmemb(INPUT_MATRICES, test_input, 0, LENGTH-1);", 2 ) 
-   write_line( f, "$readmemb(WEIGHT_MATRICES, test_weight, 0, LENGTH-1);", 2 ) 
+   mif.write_mem_load( f, datafmt, "INPUT_MATRICES", "test_input", depth )
+   mif.write_mem_load( f, datafmt, "WEIGHT_MATRICES", "test_weight", depth )
    if not alaghi:
-      write_line( f, "$readmemb(SELECT_STREAM, test_sel, 0, LENGTH-1);", 2 ) 
-   write_line( f, "$readmemb(MM_RESULT, expected_results, 0, LENGTH-1);", 2 ) 
+      mif.write_mem_load( f, datafmt, "SELECT_STREAM", "test_sel", depth )
+   mif.write_mem_load( f, datafmt, "MM_RESULT", "expected_results", depth )
    write_line( f, "end", 1 ) 
    write_line( f, "" )
    write_line( f, "// Test input assignment logic", 1 ) 
 
-   test_width = clogb2( _MM_TEST_SIZE )
+   test_width = max( clogb2( cycles ), 1 )
 
    write_line( f, "reg [" + str(test_width-1) + ":0] test_index;", 1 ) 
    write_line( f, "initial test_index = 0;", 1 ) 
@@ -198,12 +433,19 @@ def write_mm_tb( f, module_name, batch, inpt, outpt, alaghi=False ):
    write_line( f, "always @(posedge clk) begin", 1 )
    write_line( f, "if( rst ) begin", 2 )
    write_line( f, "result_index <= 0;", 3 )
-   write_line( f, "end else if( outputWriteEn == 1'b1 ) begin", 2 )
+   write_line( f, "end else if( outputWriteEn == 1'b1 && result_index < " + depth + " ) begin", 2 )
    write_line( f, "if( outputStreams != expected_results[result_index] ) begin", 3 )
    write_line( f, "$display(\"Error. Expected result %B does not match actual %B. On result index: %d\",", 4 )
    write_line( f, "expected_results[result_index], outputStreams, result_index);", 5 )
    write_line( f, "errors = errors + 1;", 4 )
    write_line( f, "end", 3 )
+   if folded:
+      write_line( f, "if( outputTile != result_index / LENGTH ||", 3 )
+      write_line( f, "outputTileLast != (result_index % LENGTH == LENGTH - 1) ) begin", 4 )
+      write_line( f, "$display(\"Error. Output tile %d (last %B) is wrong. On result index: %d\",", 4 )
+      write_line( f, "outputTile, outputTileLast, result_index);", 5 )
+      write_line( f, "errors = errors + 1;", 4 )
+      write_line( f, "end", 3 )
    write_line( f, "" )
    write_line( f, "result_index = result_index + 1;", 3 )
    write_line( f, "end", 2 )
@@ -226,19 +468,26 @@ def write_mm_tb( f, module_name, batch, inpt, outpt, alaghi=False ):
    if not alaghi:
       write_line( f, "sel,", 2 )
    write_line( f, "outputStreams,", 2 )
+   if folded:
+      write_line( f, "outputTile,", 2 )
+      write_line( f, "outputTileLast,", 2 )
    write_line( f, "outputWriteEn", 2 )
    write_line( f, ");", 1 )
    write_line( f, "" )
    write_line( f, "initial begin", 1 )
    write_line( f, "rst = 1;", 2 )
-   write_line( f, "#(8*CLOCK_PERIOD);", 2 )
+   write_line( f, "#(" + str(TB_RESET_CYCLES) + "*CLOCK_PERIOD);", 2 )
    write_line( f, "" )
    write_line( f, "// start sim", 2 )
    write_line( f, "rst = 0;", 2 )
-   write_line( f, "#(LENGTH*CLOCK_PERIOD + 100)  // give 100 clock cycles for initial output delay", 2 )
+   write_line( f, "#((" + depth + " + LATENCY + 1)*CLOCK_PERIOD); // until the last result is out of the pipeline", 2 )
    write_line( f, "" )
    write_line( f, "// error summary", 2 )
    write_line( f, "$display(\"Simulation complete.\");", 2 )
+   write_line( f, "if( result_index < " + depth + " ) begin", 2 )
+   write_line( f, "$display(\"Error. Only %d of %d results were checked.\", result_index, " + depth + ");", 3 )
+   write_line( f, "errors = errors + 1;", 3 )
+   write_line( f, "end", 2 )
    write_line( f, "if( errors > 0 ) begin", 2 )
    write_line( f, "$display(\"Validataion failure: %d error(s).\", errors);", 3 )
    write_line( f, "end else begin", 2 )
@@ -260,7 +509,9 @@ def write_mm_tb_header( f ):
 
 # This function generates a few files used by the matrix multiply testbench.
 # Files for input matrics, weight matrices, select streams and expected output
-# are generated.
+# are generated. The streams are generated, checked against the golden model
+# and appended to the files one chunk of cycles at a time, so memory use is
+# bounded by the chunk size rather than the length of the test.
 # Parameters:
 #  data_dir, directory to write the data files into
 #  batch, an int, batch size M  (in matrix multiply MxN *NxO)
@@ -269,87 +520,142 @@ def write_mm_tb_header( f ):
 #  length, an int, the length of the stochastic bit streams
 #  rep, a string, 'uni' or 'bi', represents the type fo stochastic representation
 #  alaghi, a boolean, 'True' specifies that alaghi adders are used
-def gen_mm_data( data_dir, batch, inpt, outpt, length, rep="uni", alaghi=False ):
-   # generate data/input features matrix
-   datas = np.empty( (batch, inpt, length), dtype = bool )
-   for b in range(batch):
-      data = np.random.randint( length, size = inpt )
-      rng = lfsr_sequence( length, normalize = False )
-
-      for i in range(inpt):
-         datas[b, i, :] = rng < data[i]
-
-   # generate weights matrix
-   weights = np.empty( (outpt, inpt, length), dtype = bool )
-   for o in range(outpt):
-      weight = np.random.randint( length, size = inpt )
-      rng = lfsr_sequence( length, normalize = False )
-
-      for i in range(inpt):
-         weights[o, i, :] = rng < weight[i]
-
-   # write inputs and weights to data files
-   with open( os.path.join( data_dir, _MM_INPUT_FN ), 'w' ) as f:
-         write_matrix_stream( f, datas, length )
-   with open( os.path.join( data_dir, _MM_WEIGHT_FN ), 'w' ) as f:
-      write_matrix_stream( f, weights, length )
-
-   results = np.empty( (batch, outpt, length), dtype = bool )
+#  datafmt, a string, the format of the data files (bin, hex or raw)
+#  chunk, an int, the number of cycles generated at once
+#  engines, an int, the engines of a folded module, see mm_test_data
+def gen_mm_data( data_dir, batch, inpt, outpt, length, rep="uni", alaghi=False, datafmt="bin",
+                 chunk=STREAM_CHUNK, engines=None ):
+   input_path = os.path.join( data_dir, mif.file_name( _MM_INPUT_FN, datafmt ) )
+   weight_path = os.path.join( data_dir, mif.file_name( _MM_WEIGHT_FN, datafmt ) )
+   sel_path = os.path.join( data_dir, mif.file_name( _MM_SEL_FN, datafmt ) )
+   res_path = os.path.join( data_dir, mif.file_name( _MM_RES_FN, datafmt ) )
+
+   select_width = clogb2( inpt )
+   for (start, datas, weights, sel, results) in mm_test_data( batch, inpt, outpt, length, rep,
+                                                              alaghi, chunk, engines ):
+      append = start > 0
+      mif.write_streams( input_path, datas, datafmt, append )
+      mif.write_streams( weight_path, weights, datafmt, append )
+      if not alaghi:
+         mif.write_ints( sel_path, sel, select_width, datafmt, append )
+      mif.write_streams( res_path, results, datafmt, append )
+
+# Generates the matrix multiply test data a chunk of cycles at a time, see
+# gen_mm_data for the parameters.
+# Yields (start, datas, weights, sel, results) for every chunk, the first
+# cycle of the chunk, the input and weight matrices and expected results as
+# PackedStreams of shape (M, N), (O, N) and (M, O), and the select stream,
+# None with alaghi adders.
+# A folded module (see build_folded_module) is tested for every tile, length
+# cycles each, and its results are the streams of its engines, of shape (P).
+# Chunks then never cross the end of a window.
+def mm_test_data( batch, inpt, outpt, length, rep="uni", alaghi=False, chunk=STREAM_CHUNK,
+                  engines=None ):
+   # Every row of the input features and weights matrices has its own noise
+   # source, an LFSR with a random seed. The LFSR sequences are produced a
+   # chunk at a time.
+   rng = lfsr_model.LfsrModel( lfsr_model.rng_width( length ) )
+   top = 1 << rng.width
+
+   # pick the binary values of the input features and weights matrices
+   data = np.random.randint( top, size = (batch, inpt) )
+   data_seeds = np.random.randint( top, size = batch )
+   weight = np.random.randint( top, size = (outpt, inpt) )
+   weight_seeds = np.random.randint( top, size = outpt )
+
    if not alaghi:
-      # generate a select stream
-      sel_sequence = lfsr_sequence( length, normalize = False )
-
-      # Write the select sequence out to a data file 
-      with open( os.path.join( data_dir, _MM_SEL_FN ), 'w' ) as f:
-         select_width = clogb2( inpt )
-         for num in sel_sequence:
-            sel = int(num % inpt)
-            s_str = int_to_n_length_binary( sel, select_width )
-            f.write( s_str + "\n" )
-
-      # compute matrix multiply and write the results file
-      for b in range(batch):
-         data_vec = datas[b, :, :]
-         for o in range(outpt):
-            weight_vec = weights[o, :, :]
-            res = sc_dot_product( data_vec, weight_vec, mode="LFSR", rep=rep, sel_sequence=sel_sequence )
-            results[b, o, :] = res
-   else:
-      for b in range(batch):
-         data_vec = datas[b, :, :]
-         for o in range(outpt):
-            weight_vec = weights[o, :, :]
-            res = sc_dot_product( data_vec, weight_vec, mode="ALAGHI", rep=rep )
-            results[b, o, :] = res
-
-   with open( os.path.join( data_dir, _MM_RES_FN ), 'w' ) as f:
-      write_matrix_stream( f, results, length )
+      # the select stream has its own noise source
+      sel_seed = np.random.randint( top )
 
-# Helper function
-# Writes a flattened form of the matrix (elements are streams of 1s and 0s)
-# to the file f. The length of the streams should be equal to 'length'.
-def write_matrix_stream( f, mtrx, length ):
-   # Note: we write the string in an order interpretable by
-   # verilog's readmemb() function. 
-   for stream_idx in range(length):
-      m_str = ""
-      for m in reversed(range(len(mtrx))):
-         vector = mtrx[m]
-         for n in reversed(range(len(vector))):
-            el = vector[n]
-            if el[stream_idx]:
-               m_str += "1" 
-            else:
-               m_str += "0" 
-
-      f.write( m_str + "\n" )
+   model = golden_model.MatrixMultModel( rep=rep, alaghi=alaghi )
+   ranges = chunk_ranges( length, chunk )
+   if is_folded( batch, outpt, engines ):
+      model = golden_model.DotProductsModel( rep=rep, alaghi=alaghi )
+      (rows, cols) = fold_schedule( batch, outpt, engines )
+      ranges = [(w + start, w + stop) for w in range(0, len( rows ) * length, length)
+                for (start, stop) in chunk_ranges( length, chunk )]
 
-# Helper function
-# Converts a number, num, to a binary string of precision n.
-def int_to_n_length_binary( num, n ):
-   b_str = bin(num)[2:]
-   for i in range(0, n - len(b_str)):
-      b_str = "0" + b_str
+   for (start, stop) in ranges:
+      # convert this chunk of the matrices to streams
+      data_rngs = rng.sequence( data_seeds, stop - start, start )
+      weight_rngs = rng.sequence( weight_seeds, stop - start, start )
+      datas = bitstream.from_thresholds( data_rngs[:, np.newaxis, :], data )
+      weights = bitstream.from_thresholds( weight_rngs[:, np.newaxis, :], weight )
 
-   return b_str
+      sel = None
+      if not alaghi:
+         sel = rng.sequence( sel_seed, stop - start, start ) % inpt
 
+      # compute the matrix multiply for this chunk, or feed every engine the
+      # rows of its tile
+      if isinstance( model, golden_model.DotProductsModel ):
+         tile = start // length
+         results = model.run( _zero_row( datas )[rows[tile]], _zero_row( weights )[cols[tile]],
+                              sel )
+      else:
+         results = model.run( datas, weights, sel )
+      yield (start, datas, weights, sel, results)
+
+# Runs the matrix multiply testbench on the python simulator instead of a
+# verilog simulator. The design is driven and checked like write_mm_tb does,
+# with test data from mm_test_data.
+# Parameters:
+#  batch, inpt, outpt, alaghi, length, chunk, engines, see generate
+# Returns (errors, checked), the number of results which did not match the
+# golden model and the number of results checked.
+def simulate_test( batch, inpt, outpt, alaghi = False, length = _MM_TEST_SIZE,
+                   chunk = STREAM_CHUNK, engines = None ):
+   sim = simulator.Simulator( build_design( batch, inpt, outpt, alaghi, engines, length ) )
+   # the results of a folded module come with their tile
+   window = length if is_folded( batch, outpt, engines ) else None
+   expected = []
+   errors = 0
+   checked = 0
+   inputs = None
+   for (start, datas, weights, sel, results) in mm_test_data( batch, inpt, outpt, length,
+                                                              alaghi=alaghi, chunk=chunk,
+                                                              engines=engines ):
+      data_bits = datas.to_bools().reshape( (batch * inpt, -1) )
+      weight_bits = weights.to_bools().reshape( (outpt * inpt, -1) )
+      result_bits = results.to_bools().reshape( (-1, datas.length) )
+      expected.extend( result_bits[:, t] for t in range(result_bits.shape[1]) )
+      for t in range(data_bits.shape[1]):
+         inputs = { "rst" : 0, "inputStreams" : data_bits[:, t],
+                    "weightStreams" : weight_bits[:, t] }
+         if not alaghi:
+            inputs["sel"] = sel[t]
+         if start == 0 and t == 0:
+            # the testbench holds reset for 8 cycles with the first inputs
+            for i in range(TB_RESET_CYCLES):
+               sim.step( dict( inputs, rst=1 ) )
+         (e, c) = _check( sim.step( inputs ), expected, checked, window )
+         errors += e
+         checked += c
+
+   # run until the last result is out of the pipeline
+   for t in range(sc_dot_product_gen.dp_delay( inpt, alaghi ) + 1):
+      (e, c) = _check( sim.step( inputs ), expected, checked, window )
+      errors += e
+      checked += c
+   return (errors + len( expected ) - checked, checked)
+
+# Helper function
+# Compares the outputs of a cycle of simulate_test with the next expected
+# result when they are valid, and for a folded module with windows of the
+# given length, its tile and the end of its window. Returns (errors, checked).
+def _check( outputs, expected, checked, window=None ):
+   if not outputs["outputWriteEn"][0, 0] or checked >= len( expected ):
+      return (0, 0)
+   if not np.array_equal( outputs["outputStreams"][:, 0], expected[checked] ):
+      return (1, 1)
+   if window is not None \
+      and (simulator.from_bits( outputs["outputTile"] )[0] != checked // window
+           or outputs["outputTileLast"][0, 0] != (checked % window == window - 1)):
+      return (1, 1)
+   return (0, 1)
+
+# Helper function
+# Returns streams of shape (R, N) with a row of 0 streams added, row R.
+def _zero_row( streams ):
+   zeros = np.zeros( (1,) + streams.words.shape[1:], dtype=streams.words.dtype )
+   return bitstream.PackedStreams( np.concatenate( [streams.words, zeros] ), streams.length )
@@ -2,60 +2,100 @@
 # This file contains a function to generate a stochastic nadder module.
 
 from common import *
+import gen_cache
+import netlist
 import os
 
 # Opens and writes a stochastic n-adder module to a file.
 #  dest, a string, the directory to write the file to
 #  n, an int, the number of inputs to the adder 
-def generate( dest, n, test = True ):
-   with open( os.path.join( dest, NADDER + ".v" ), 'w' ) as f:
-      write_header_nadder( f )
-      write_nadder_module( f, NADDER, n )
+#  lanes, an int, the stream bits added per cycle, see build_nadder_module
+@gen_cache.cached
+def generate( dest, n, test = True, lanes = 1 ):
+   generate_module( dest, n, lanes )
+   if test:
+      generate_test( dest, n, lanes )
 
+# Adds the tasks of generate to a scheduler.Scheduler and returns the name of
+# the task writing the module. See generate for the parameters.
+def plan( sched, n, test = True, lanes = 1 ):
+   module = sched.add( NADDER, generate_module, (n, lanes) )
    if test:
-      (tb, _) = makeTestDir( dest )
-      tb_name = NADDER + "_tb"
+      sched.add( NADDER + "_tb", generate_test, (n, lanes), deps=[module] )
+   return module
+
+# Writes the nadder module into dest.
+def generate_module( dest, n, lanes = 1 ):
+   with open_verilog( os.path.join( dest, NADDER + ".v" ) ) as f:
+      write_header_nadder( f )
+      write_nadder_module( f, NADDER, n, lanes )
 
-      # write the nadder testbench module
-      with open( os.path.join( tb, tb_name + ".v" ), 'w' ) as f:
-         write_nadder_tb( f, tb_name, n )
+# Writes the nadder testbench into dest.
+def generate_test( dest, n, lanes = 1 ):
+   (tb, _) = makeTestDir( dest )
+   tb_name = NADDER + "_tb"
+
+   # write the nadder testbench module
+   with open_verilog( os.path.join( tb, tb_name + ".v" ) ) as f:
+      write_nadder_tb( f, tb_name, n, lanes )
 
 # Writes a sc_nadder module.
 # Parameters:
 #  f, the file to write to
 #  module_name, a string for the module name
 #  n, an integer which specifies the number of inputs to the adder module
-def write_nadder_module( f, module_name, n ):
+#  lanes, an int, k, the stream bits added per cycle
+def write_nadder_module( f, module_name, n, lanes = 1 ):
+   # write the header comment
+   write_header_nadder( f )
+
+   netlist.write_module( f, build_nadder_module( module_name, n, lanes ) )
+
+# Builds the netlist of a sc_nadder module.
+# With k lanes every input carries k consecutive bits of its stream, lane j of
+# input i in x[j*n + i], and lane j has its own select number,
+# sel[j*SELECT_WIDTH +: SELECT_WIDTH], so out[j] is a mux of lane j.
+# Parameters:
+#  module_name, a string for the module name
+#  n, an integer which specifies the number of inputs to the adder module
+#  lanes, an int, k, the stream bits added per cycle
+def build_nadder_module( module_name, n, lanes = 1 ):
    # compute number of select streams needed
    select_width = clogb2( n )
 
-   # write the header comment
-   write_header_nadder( f )
+   m = netlist.Module( module_name )
+   n = m.add_param( "INPUT_STREAMS", n )
+   select_width = m.add_param( "SELECT_WIDTH", select_width )
+   if lanes > 1:
+      lanes = m.add_param( "LANES", lanes )
+   x = m.add_input( "x", lanes * n )
+   sel = m.add_input( "sel", lanes * select_width )
+   out = m.add_output( "out", lanes_width( lanes ) )
+   if lanes == 1:
+      m.assign( out, netlist.Op( "index", x, sel ) )
+      return m
 
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "x,", 1 )
-   write_line( f, "sel,", 1 )
-   write_line( f, "out", 1 )
-   write_line( f, ");" )
-   write_line( f, "" )
-   write_line( f, "parameter INPUT_STREAMS = " + str(n) + ";", 1 )
-   write_line( f, "parameter SELECT_WIDTH = " + str(select_width) + ";", 1 )
-   write_line( f, "" )
-   write_line( f, "input [INPUT_STREAMS-1:0] x;", 1 )
-   write_line( f, "input [SELECT_WIDTH-1:0]  sel;", 1 )
-   write_line( f, "output                    out;", 1 )
-   write_line( f, "" )
-   write_line( f, "assign out = x[sel];", 1 )
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+   for j in range(lanes):
+      lane = m.add_wire( "lane" + str(j), n )
+      m.assign( lane, netlist.Ref( "x", (j+1)*n - 1, j*n ) )
+      lane_sel = netlist.Ref( "sel", (j+1)*select_width - 1, j*select_width )
+      m.assign( netlist.Ref( "out", j ), netlist.Op( "index", lane, lane_sel ) )
+   return m
+
+# Returns the netlist.Design of a sc_nadder module, for simulation.
+def build_design( n, lanes = 1 ):
+   return netlist.Design( build_nadder_module( NADDER, n, lanes ) )
 
 # Writes a testbench module for the generated sc_nadder.
+# With k lanes, lane l gets input permutation i + l and select s + l, so
+# every lane is checked against a different mux.
 # Parameter:
 #  f, the file to write to
 #  module_name, the name of the testbench module
 #  dut_name, a string, the module to test
 #  n, an int, the number of inputs to the nadder
-def write_nadder_tb( f, module_name, n ):
+#  lanes, an int, the lanes of the nadder
+def write_nadder_tb( f, module_name, n, lanes = 1 ):
    # write the header comment
    write_nadder_tb_header( f ) 
 
@@ -72,10 +112,17 @@ def write_nadder_tb( f, module_name, n ):
    write_line( f, "module " + module_name + "();" )
    write_line( f, "parameter INPUT_STREAMS = " + str(n) + ";", 1 ) 
    write_line( f, "parameter SELECT_WIDTH = " + str(select_width) + ";", 1 ) 
-   write_line( f, "" )
-   write_line( f, "reg [INPUT_STREAMS-1:0] x;", 1 ) 
-   write_line( f, "reg [SELECT_WIDTH-1:0]  sel;", 1 ) 
-   write_line( f, "wire                    out;", 1 ) 
+   if lanes > 1:
+      write_line( f, "parameter LANES = " + str(lanes) + ";", 1 )
+      write_line( f, "" )
+      write_line( f, "reg [LANES*INPUT_STREAMS-1:0] x;", 1 )
+      write_line( f, "reg [LANES*SELECT_WIDTH-1:0]  sel;", 1 )
+      write_line( f, "wire [LANES-1:0]              out;", 1 )
+   else:
+      write_line( f, "" )
+      write_line( f, "reg [INPUT_STREAMS-1:0] x;", 1 ) 
+      write_line( f, "reg [SELECT_WIDTH-1:0]  sel;", 1 ) 
+      write_line( f, "wire                    out;", 1 ) 
    write_line( f, "" )
    write_line( f, NADDER + " dut(.x(x), .sel(sel), .out(out));", 1 ) 
    write_line( f, "" )
@@ -84,6 +131,9 @@ def write_nadder_tb( f, module_name, n ):
    write_line( f, "" )
    write_line( f, "integer i;", 1 ) 
    write_line( f, "integer s;", 1 ) 
+   if lanes > 1:
+      write_line( f, "integer l;", 1 )
+      write_line( f, "integer lane_sel;", 1 )
    write_line( f, "initial begin", 1 ) 
    write_line( f, "// initialize inputs", 2 ) 
    write_line( f, "x = 0;", 2 ) 
@@ -92,14 +142,17 @@ def write_nadder_tb( f, module_name, n ):
    write_line( f, "" )
    write_line( f, "// for all input stream permutations, test each possible select permutation", 2 ) 
    write_line( f, "for(i = 0; i < " + str(input_count) + "; i = i + 1) begin", 2 )
-   write_line( f, "x = i;", 3 )
-   write_line( f, "for(s = 0; s < " + str(select_count) + "; s = s + 1) begin", 3 )
-   write_line( f, "sel = s;", 4 )
-   write_line( f, "#5;", 4 )
-   write_line( f, "if( x[s] != out ) begin", 4 )
-   write_line( f, "$display( \"Error incorrect output. Input streams: %B, Select streams: %B, out: %d\", x, sel, out );", 5 )
-   write_line( f, "errors = errors + 1;", 5 )
-   write_line( f, "end", 4 )
+   if lanes > 1:
+      write_nadder_tb_lanes( f, input_count, select_count )
+   else:
+      write_line( f, "x = i;", 3 )
+      write_line( f, "for(s = 0; s < " + str(select_count) + "; s = s + 1) begin", 3 )
+      write_line( f, "sel = s;", 4 )
+      write_line( f, "#5;", 4 )
+      write_line( f, "if( x[s] != out ) begin", 4 )
+      write_line( f, "$display( \"Error incorrect output. Input streams: %B, Select streams: %B, out: %d\", x, sel, out );", 5 )
+      write_line( f, "errors = errors + 1;", 5 )
+      write_line( f, "end", 4 )
    write_line( f, "#5;", 4 ) 
    write_line( f, "end", 3 ) 
    write_line( f, "end", 2 ) 
@@ -115,6 +168,28 @@ def write_nadder_tb( f, module_name, n ):
    write_line( f, "end", 1 )
    write_line( f, "endmodule // sc_nadder_tb" )
 
+# Writes the body of the loop over the input permutations of the nadder
+# testbench, for a nadder of several lanes. Selects past the last input are
+# not checked, like the out of range x[s] of the serial testbench.
+#  f, the file to write to
+#  input_count, select_count, ints, the input and select permutations
+def write_nadder_tb_lanes( f, input_count, select_count ):
+   write_line( f, "for(l = 0; l < LANES; l = l + 1) begin", 3 )
+   write_line( f, "x[l*INPUT_STREAMS +: INPUT_STREAMS] = (i + l) % " + str(input_count) + ";", 4 )
+   write_line( f, "end", 3 )
+   write_line( f, "for(s = 0; s < " + str(select_count) + "; s = s + 1) begin", 3 )
+   write_line( f, "for(l = 0; l < LANES; l = l + 1) begin", 4 )
+   write_line( f, "sel[l*SELECT_WIDTH +: SELECT_WIDTH] = (s + l) % " + str(select_count) + ";", 5 )
+   write_line( f, "end", 4 )
+   write_line( f, "#5;", 4 )
+   write_line( f, "for(l = 0; l < LANES; l = l + 1) begin", 4 )
+   write_line( f, "lane_sel = (s + l) % " + str(select_count) + ";", 5 )
+   write_line( f, "if( lane_sel < INPUT_STREAMS && x[l*INPUT_STREAMS + lane_sel] != out[l] ) begin", 5 )
+   write_line( f, "$display( \"Error incorrect output. Lane: %d, Input streams: %B, Select streams: %B, out: %B\", l, x, sel, out );", 6 )
+   write_line( f, "errors = errors + 1;", 6 )
+   write_line( f, "end", 5 )
+   write_line( f, "end", 4 )
+
 # Writes the header comment for the sc_nadder module.
 # The file written to is the parameter, f.
 def write_header_nadder( f ):
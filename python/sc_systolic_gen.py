@@ -0,0 +1,527 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains functions to generate a weight-stationary systolic array
+# for stochastic matrix multiply, an alternative to sc_matrix_mult in which
+# every stream is only wired to its neighbours.
+#
+# The array is a grid of N x O processing elements (sc_systolic_pe), one for
+# every weight: the PE in row k and column j multiplies input feature k by
+# weight stream j*N + k, the only PE that stream is wired to. The input
+# features flow right along the rows and the partial results down the
+# columns, one PE per cycle, so every PE drives a single neighbour instead of
+# an input being broadcast to O dot products and a weight to M.
+#
+# The adder is the mux adder of sc_nadder taken apart along the columns: the
+# select stream flows down every column with the partial result, counting
+# down by one per PE, and the PE where it reaches 0 replaces the partial
+# result with its own product. So every column computes exactly
+# x[sel], x the products of its PEs. The alaghi adder tree does not break up
+# into a chain and is not supported.
+#
+# Input k enters its row k cycles late and result j leaves its column O-1-j
+# cycles late, so all the bits of a wavefront, the inputs and select of one
+# cycle, meet in every PE and the results of a wavefront leave the array
+# together, LATENCY = N + O - 1 cycles after it entered. A weight stream is
+# used where it enters its PE, so the weight bit of the PE in row k and
+# column j meeting wavefront t is bit t + k + j.
+#
+# The weights stay in the array while rows of the input matrix stream
+# through it one after the other, a row of results for every row of inputs.
+
+from common import *
+import bitstream
+import gen_cache
+import golden_model
+import lfsr_model
+import mif
+import netlist
+import numpy as np
+import os
+import shiftreg_gen
+import simulator
+
+# systolic array testbench constants
+_SA_INPUT_FN = "systolic_inputs.mif"
+_SA_WEIGHT_FN = "systolic_weights.mif"
+_SA_SEL_FN = "systolic_select_streams.mif"
+_SA_RES_FN = "systolic_results.mif"
+_SA_TEST_SIZE = 100
+
+
+# Generates a stochastic systolic array and writes it to a file.
+#  dest, a string, the directory to write the files to
+#  input_features, an int, N, the rows of the array
+#  output_features, an int, O, the columns of the array
+#  test, a boolean, selects testbench generation
+#  batch, an int, M, the rows of the input matrix streamed through the array
+#     by the testbench, one after the other
+#  datafmt, a string, the format of the testbench data files (bin, hex or raw)
+#  length, an int, the number of cycles of testbench data of every row
+#  chunk, an int, the number of cycles of testbench data generated at once
+@gen_cache.cached
+def generate( dest, input_features, output_features, test = True, batch = 4, datafmt = "bin",
+              length = _SA_TEST_SIZE, chunk = STREAM_CHUNK ):
+   shiftreg_gen.generate( dest, systolic_delay( input_features, output_features ) )
+   generate_module( dest, input_features, output_features )
+   if test:
+      generate_test( dest, input_features, output_features, batch, datafmt, length, chunk )
+
+# Adds the tasks of generate to a scheduler.Scheduler and returns the name of
+# the task writing the module. See generate for the parameters.
+def plan( sched, input_features, output_features, test = True, batch = 4, datafmt = "bin",
+          length = _SA_TEST_SIZE, chunk = STREAM_CHUNK ):
+   key = gen_cache.call_key( generate, input_features=input_features,
+                             output_features=output_features, test=test, batch=batch,
+                             datafmt=datafmt, length=length, chunk=chunk )
+   delay = systolic_delay( input_features, output_features )
+   shift = sched.add( shiftreg_name( delay ), shiftreg_gen.generate, (delay,) )
+   module = sched.add( SYSTOLIC, generate_module, (input_features, output_features),
+                       deps=[shift] )
+   if test:
+      sched.add( SYSTOLIC + "_tb", generate_test, (input_features, output_features, batch,
+                 datafmt, length, chunk), deps=[module], seed_key=key )
+   return module
+
+# Returns the number of cycles from the inputs of the systolic array to its
+# results, the skew of the rows, one cycle per PE down a column, and the
+# deskew of the columns.
+def systolic_delay( inpt, outpt ):
+   return inpt + outpt - 1
+
+# Returns the width of the select stream of an array with inpt rows.
+def select_width( inpt ):
+   return max( clogb2( inpt ), 1 )
+
+# Writes the systolic array and its processing element into dest.
+def generate_module( dest, input_features, output_features ):
+   with open_verilog( os.path.join( dest, SYSTOLIC + ".v" ) ) as f:
+      write_header_systolic( f )
+      write_systolic_module( f, SYSTOLIC, input_features, output_features )
+   with open_verilog( os.path.join( dest, SYSTOLIC_PE + ".v" ) ) as f:
+      write_header_pe( f )
+      netlist.write_module( f, build_pe_module( SYSTOLIC_PE, input_features ) )
+
+# Writes the systolic array testbench and its data into dest.
+def generate_test( dest, input_features, output_features, batch = 4, datafmt = "bin",
+                   length = _SA_TEST_SIZE, chunk = STREAM_CHUNK ):
+   (tb, data) = makeTestDir( dest )
+   tb_name = SYSTOLIC + "_tb"
+
+   gen_systolic_data( data, batch, input_features, output_features, length, datafmt=datafmt,
+                      chunk=chunk )
+   with open_verilog( os.path.join( tb, tb_name + ".v" ) ) as f:
+      write_systolic_tb_header( f )
+      write_systolic_tb( f, tb_name, batch, input_features, output_features, datafmt=datafmt,
+                         length=length )
+
+# Writes a stochastic systolic array module to an output file, f.
+# Parameters:
+#  module_name, a string for the module
+#  inpt, an int specifying the input feature size (N), the rows of the array
+#  outpt, an int specifying the output feature size (O), the columns
+def write_systolic_module( f, module_name, inpt, outpt ):
+   netlist.write_module( f, build_systolic_module( module_name, inpt, outpt ) )
+
+# Builds the netlist of a processing element of the systolic array for an
+# array of inpt rows.
+#  a_in, a_out, the input feature from the left, passed on to the right
+#  w, the weight stream of the PE
+#  sel_in, sel_out, the select stream from above, passed on down less one
+#  psum_in, psum_out, the partial result from above, passed on down, the
+#     product of the PE when sel_in is 0
+def build_pe_module( module_name, inpt ):
+   width = select_width( inpt )
+   reset = netlist.is_high( "rst" )
+   zero = netlist.Const( 0 )
+
+   m = netlist.Module( module_name )
+   width = m.add_param( "SELECT_WIDTH", width )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   a_in = m.add_input( "a_in" )
+   w = m.add_input( "w" )
+   sel_in = m.add_input( "sel_in", width )
+   psum_in = m.add_input( "psum_in" )
+   a_out = m.add_output( "a_out" )
+   sel_out = m.add_output( "sel_out", width )
+   psum_out = m.add_output( "psum_out" )
+
+   product = m.add_wire( "product" )
+   m.add_instance( "sc_multiplier", "MULT", [("x", a_in), ("y", w), ("res", product)] )
+   take = netlist.Op( "eq", sel_in, netlist.Const( 0, width ) )
+
+   a_reg = m.add_register( "a_reg", None, [(reset, zero), (None, a_in)] )
+   # adding all ones subtracts one
+   sel_reg = m.add_register( "sel_reg", width, [(reset, zero),
+                             (None, netlist.Op( "add", sel_in,
+                                                netlist.Const( (1 << width) - 1, width ) ))] )
+   psum_reg = m.add_register( "psum_reg", None, [(reset, zero),
+                              (None, netlist.Op( "mux", take, product, psum_in ))] )
+   m.assign( a_out, a_reg )
+   m.assign( sel_out, sel_reg )
+   m.assign( psum_out, psum_reg )
+   return m
+
+# Builds the netlist of a stochastic systolic array module, see
+# write_systolic_module and the top of this file.
+def build_systolic_module( module_name, inpt, outpt ):
+   width = select_width( inpt )
+   delay = systolic_delay( inpt, outpt )
+   clk = netlist.Ref( "clk" )
+   rst = netlist.Ref( "rst" )
+
+   m = netlist.Module( module_name )
+   inpt = m.add_param( "INPUT_FEATURES", inpt, "N" )
+   outpt = m.add_param( "OUTPUT_FEATURES", outpt, "O" )
+   width = m.add_param( "SELECT_WIDTH", width )
+
+   # inputs and outputs
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   m.add_input( "inputStreams", inpt )
+   m.add_input( "weightStreams", outpt * inpt )
+   sel = m.add_input( "sel", width )
+   m.add_output( "outputStreams", outpt )
+   m.add_output( "outputWriteEn" )
+
+   # the outputs of the PE in row k and column j, a_k_j, sel_k_j and psum_k_j
+   for k in range(inpt):
+      for j in range(outpt):
+         pe = "_" + str(k) + "_" + str(j)
+         m.add_wire( "a" + pe )
+         m.add_wire( "sel" + pe, width )
+         m.add_wire( "psum" + pe )
+
+   # input k enters row k k cycles late, the select stream enters column j
+   # j cycles late
+   rows = [_delay_line( m, "skew_" + str(k), netlist.Ref( "inputStreams", k ), None, k,
+                        "row " + str(k) + " skew" )[k] for k in range(inpt)]
+   tops = _delay_line( m, "sel_skew", sel, width, outpt - 1, "column select skew" )
+
+   for k in range(inpt):
+      for j in range(outpt):
+         pe = "_" + str(k) + "_" + str(j)
+         left = "_" + str(k) + "_" + str(j-1)
+         above = "_" + str(k-1) + "_" + str(j)
+         a_in = rows[k] if j == 0 else netlist.Ref( "a" + left )
+         if k == 0:
+            sel_in = tops[j]
+            psum_in = netlist.Const( 0, 1 )
+         else:
+            sel_in = netlist.Ref( "sel" + above )
+            psum_in = netlist.Ref( "psum" + above )
+         m.add_instance( SYSTOLIC_PE, "PE" + pe,
+                         [("clk", clk), ("rst", rst), ("a_in", a_in),
+                          ("w", netlist.Ref( "weightStreams", j*inpt + k )), ("sel_in", sel_in),
+                          ("psum_in", psum_in), ("a_out", netlist.Ref( "a" + pe )),
+                          ("sel_out", netlist.Ref( "sel" + pe )),
+                          ("psum_out", netlist.Ref( "psum" + pe ))] )
+
+   # result j leaves its column O-1-j cycles late, with the other results of
+   # its wavefront
+   for j in range(outpt):
+      result = netlist.Ref( "psum_" + str(inpt-1) + "_" + str(j) )
+      depth = outpt - 1 - j
+      m.assign( netlist.Ref( "outputStreams", j ),
+                _delay_line( m, "deskew_" + str(j), result, None, depth,
+                             "column " + str(j) + " deskew" )[depth] )
+
+   # Use shift register to indicate when module output is valid
+   m.add_instance( shiftreg_name( delay ), "SHIFT" + str(delay),
+                   [("clk", clk), ("rst", rst), ("data_in", netlist.Const( 1, 1 )),
+                    ("data_out", netlist.Ref( "outputWriteEn" ))] )
+   return m
+
+# Returns the netlist.Design of a systolic array, its processing element and
+# shift register, for simulation.
+def build_design( inpt, outpt ):
+   delay = systolic_delay( inpt, outpt )
+   return netlist.Design( build_systolic_module( SYSTOLIC, inpt, outpt ),
+                          [build_pe_module( SYSTOLIC_PE, inpt ),
+                           shiftreg_gen.build_shiftreg_module( shiftreg_name( delay ), delay )] )
+
+# Helper function
+# Adds a register delaying a signal of the given width (None for a scalar)
+# by depth cycles to a module, a vector of every stage which shifts towards
+# its top. Returns the list of the signal delayed by 0 to depth cycles.
+def _delay_line( m, name, signal, width, depth, comment=None ):
+   taps = [signal]
+   if depth == 0:
+      return taps
+   w = 1 if width is None else width
+   shifted = signal
+   if depth > 1:
+      shifted = netlist.Op( "concat", netlist.Ref( name, (depth-1)*w - 1, 0 ), signal )
+   m.add_register( name, depth * w, [(netlist.is_high( "rst" ), netlist.Const( 0 )),
+                                     (None, shifted)], comment=comment )
+   for d in range(1, depth + 1):
+      if width is None:
+         taps.append( netlist.Ref( name, d - 1 ) )
+      else:
+         taps.append( netlist.Ref( name, d*w - 1, (d-1)*w ) )
+   return taps
+
+# Writes the header comment for the sc_systolic_array module.
+def write_header_systolic( f ):
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "// Create Date: " + get_time() )
+   write_line( f, "//" )
+   write_line( f, "// Description: This module is a weight-stationary systolic array for matrix" )
+   write_line( f, "// multiply in the stochastic domain. The weights, the flattened transpose of an" )
+   write_line( f, "// NxO matrix B, stay in the array while the rows of an MxN matrix A stream" )
+   write_line( f, "// through it, one row of C for every row of A. The rows of the array sum the" )
+   write_line( f, "// products like sc_nadder, and results come out LATENCY = N + O - 1 cycles after" )
+   write_line( f, "// their inputs." )
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "" )
+
+# Writes the header comment for the sc_systolic_pe module.
+def write_header_pe( f ):
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "// Create Date: " + get_time() )
+   write_line( f, "//" )
+   write_line( f, "// Description: A processing element of the stochastic systolic array. It passes" )
+   write_line( f, "// its input on to the right and the partial result on down, replaced by the" )
+   write_line( f, "// product of its input and weight when the select stream from above is 0." )
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "" )
+
+# Writes the testbench module for the generated sc_systolic_array module.
+# The rows of the input matrix are streamed through the array one after the
+# other, length cycles each, and the results of every row checked.
+# Parameters:
+# f, file to write to
+# module_name, a string, name of the testbench
+# batch, an int, the rows of the input matrix (M)
+# inpt, an int, specifies input feature size (N)
+# outpt, an int, specifies output feature size (O)
+# datafmt, a string, the format of the data files to load (bin, hex or raw)
+# length, an int, the number of cycles of test data of every row
+def write_systolic_tb( f, module_name, batch, inpt, outpt, datafmt="bin", length=_SA_TEST_SIZE ):
+   delay = systolic_delay( inpt, outpt )
+
+   write_line( f, "module " + module_name + "();" )
+   write_line( f, "parameter BATCH_SIZE =      " + str(batch) + "; // M", 1 )
+   write_line( f, "parameter INPUT_FEATURES =  " + str(inpt) + "; // N", 1 )
+   write_line( f, "parameter OUTPUT_FEATURES = " + str(outpt) + "; // O", 1 )
+   write_line( f, "parameter SELECT_WIDTH =    " + str(select_width( inpt )) + ";", 1 )
+   write_line( f, "parameter INPUTS =          \"" + mif.file_name( _SA_INPUT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter WEIGHTS =         \"" + mif.file_name( _SA_WEIGHT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter SELECT_STREAM =   \"" + mif.file_name( _SA_SEL_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter SA_RESULT =       \"" + mif.file_name( _SA_RES_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter LENGTH =       " + str(length) + "; // per row", 1 )
+   write_line( f, "parameter LATENCY =      " + str(delay) + ";", 1 )
+   write_line( f, "parameter RESULTS =      BATCH_SIZE*LENGTH;", 1 )
+   write_line( f, "parameter CYCLES =       RESULTS + LATENCY; // the weights of the last results", 1 )
+   write_line( f, "" )
+   write_line( f, "// module inputs and outputs", 1 )
+   write_line( f, "reg clk;", 1 )
+   write_line( f, "reg rst;", 1 )
+   write_line( f, "wire [INPUT_FEATURES-1:0]                inputStreams;", 1 )
+   write_line( f, "wire [OUTPUT_FEATURES*INPUT_FEATURES-1:0] weightStreams;", 1 )
+   write_line( f, "wire [SELECT_WIDTH-1:0]                 sel;", 1 )
+   write_line( f, "wire [OUTPUT_FEATURES-1:0]               outputStreams;", 1 )
+   write_line( f, "wire                                     outputWriteEn;", 1 )
+   write_line( f, "" )
+   write_line( f, "// read input data and expected output data", 1 )
+   write_line( f, "reg [INPUT_FEATURES-1:0] test_input [CYCLES-1:0];", 1 )
+   write_line( f, "reg [OUTPUT_FEATURES*INPUT_FEATURES-1:0] test_weight [CYCLES-1:0];", 1 )
+   write_line( f, "reg [SELECT_WIDTH-1:0]   test_sel [CYCLES-1:0];", 1 )
+   write_line( f, "reg [OUTPUT_FEATURES-1:0] expected_results [RESULTS-1:0];", 1 )
+   mif.write_mem_load_decls( f, datafmt )
+   write_line( f, "initial begin", 1 )
+   mif.write_mem_load( f, datafmt, "INPUTS", "test_input", "CYCLES" )
+   mif.write_mem_load( f, datafmt, "WEIGHTS", "test_weight", "CYCLES" )
+   mif.write_mem_load( f, datafmt, "SELECT_STREAM", "test_sel", "CYCLES" )
+   mif.write_mem_load( f, datafmt, "SA_RESULT", "expected_results", "RESULTS" )
+   write_line( f, "end", 1 )
+   write_line( f, "" )
+   write_line( f, "// Test input assignment logic", 1 )
+
+   test_width = max( clogb2( batch * length + delay + 1 ), 1 )
+
+   write_line( f, "reg [" + str(test_width-1) + ":0] test_index;", 1 )
+   write_line( f, "initial test_index = 0;", 1 )
+   write_line( f, "always @(posedge clk) begin", 1 )
+   write_line( f, "if( rst == 1'b1 ) begin", 2 )
+   write_line( f, "test_index <= 0;", 3 )
+   write_line( f, "end else begin", 2 )
+   write_line( f, "test_index <= test_index + 1;", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "assign inputStreams = test_input[test_index];", 1 )
+   write_line( f, "assign weightStreams = test_weight[test_index];", 1 )
+   write_line( f, "assign sel = test_sel[test_index];", 1 )
+   write_line( f, "" )
+   write_line( f, "// output checking and error handling", 1 )
+   write_line( f, "integer result_index;", 1 )
+   write_line( f, "integer errors;", 1 )
+   write_line( f, "initial result_index = 0;", 1 )
+   write_line( f, "initial errors = 0;", 1 )
+   write_line( f, "always @(posedge clk) begin", 1 )
+   write_line( f, "if( rst ) begin", 2 )
+   write_line( f, "result_index <= 0;", 3 )
+   write_line( f, "end else if( outputWriteEn == 1'b1 && result_index < RESULTS ) begin", 2 )
+   write_line( f, "if( outputStreams != expected_results[result_index] ) begin", 3 )
+   write_line( f, "$display(\"Error. Expected result %B does not match actual %B. On result index: %d\",", 4 )
+   write_line( f, "expected_results[result_index], outputStreams, result_index);", 5 )
+   write_line( f, "errors = errors + 1;", 4 )
+   write_line( f, "end", 3 )
+   write_line( f, "" )
+   write_line( f, "result_index = result_index + 1;", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "" )
+   write_line( f, "// Clock Generation", 1 )
+   write_line( f, "parameter CLOCK_PERIOD=10;", 1 )
+   write_line( f, "initial clk=1;", 1 )
+   write_line( f, "always begin", 1 )
+   write_line( f, "#(CLOCK_PERIOD/2);", 2 )
+   write_line( f, "clk = ~clk;", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "" )
+   write_line( f, "// instantiate module", 1 )
+   write_line( f, SYSTOLIC + " dut(", 1 )
+   write_line( f, "clk,", 2 )
+   write_line( f, "rst,", 2 )
+   write_line( f, "inputStreams,", 2 )
+   write_line( f, "weightStreams,", 2 )
+   write_line( f, "sel,", 2 )
+   write_line( f, "outputStreams,", 2 )
+   write_line( f, "outputWriteEn", 2 )
+   write_line( f, ");", 1 )
+   write_line( f, "" )
+   write_line( f, "initial begin", 1 )
+   write_line( f, "rst = 1;", 2 )
+   write_line( f, "#(" + str(TB_RESET_CYCLES) + "*CLOCK_PERIOD);", 2 )
+   write_line( f, "" )
+   write_line( f, "// start sim", 2 )
+   write_line( f, "rst = 0;", 2 )
+   write_line( f, "#((RESULTS + LATENCY + 1)*CLOCK_PERIOD); // until the last result is out of the pipeline", 2 )
+   write_line( f, "" )
+   write_line( f, "// error summary", 2 )
+   write_line( f, "$display(\"Simulation complete.\");", 2 )
+   write_line( f, "if( result_index < RESULTS ) begin", 2 )
+   write_line( f, "$display(\"Error. Only %d of %d results were checked.\", result_index, RESULTS);", 3 )
+   write_line( f, "errors = errors + 1;", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "if( errors > 0 ) begin", 2 )
+   write_line( f, "$display(\"Validataion failure: %d error(s).\", errors);", 3 )
+   write_line( f, "end else begin", 2 )
+   write_line( f, "$display(\"Validation successful.\");", 3 )
+   write_line( f, "end", 2 )
+   write_line( f, "" )
+   write_line( f, "$stop;", 2 )
+   write_line( f, "end", 1 )
+   write_line( f, "endmodule // " + module_name )
+
+# Write the header comment for the systolic array testbench to file, f.
+def write_systolic_tb_header( f ):
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+   write_line( f, "// Create Date: " + get_time() )
+   write_line( f, "//" )
+   write_line( f, "// Description: The module serves as a testbench for the stochastic systolic" )
+   write_line( f, "// array." )
+   write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
+
+# Generates the files used by the systolic array testbench, the input rows,
+# weights, select stream and expected results, a chunk of cycles at a time.
+# Parameters:
+#  data_dir, directory to write the data files into
+#  batch, inpt, outpt, length, chunk, see generate
+#  rep, a string, 'uni' or 'bi', the stochastic representation
+#  datafmt, a string, the format of the data files (bin, hex or raw)
+def gen_systolic_data( data_dir, batch, inpt, outpt, length, rep="uni", datafmt="bin",
+                       chunk=STREAM_CHUNK ):
+   input_path = os.path.join( data_dir, mif.file_name( _SA_INPUT_FN, datafmt ) )
+   weight_path = os.path.join( data_dir, mif.file_name( _SA_WEIGHT_FN, datafmt ) )
+   sel_path = os.path.join( data_dir, mif.file_name( _SA_SEL_FN, datafmt ) )
+   res_path = os.path.join( data_dir, mif.file_name( _SA_RES_FN, datafmt ) )
+
+   for (start, datas, weights, sel, results) in systolic_test_data( batch, inpt, outpt, length,
+                                                                    rep, chunk ):
+      append = start > 0
+      mif.write_streams( input_path, datas, datafmt, append )
+      mif.write_streams( weight_path, weights, datafmt, append )
+      mif.write_ints( sel_path, sel, select_width( inpt ), datafmt, append )
+      if results is not None:
+         mif.write_streams( res_path, results, datafmt, append )
+
+# Generates the systolic array test data a chunk of cycles at a time, see
+# gen_systolic_data for the parameters. Row m of the input matrix streams
+# through the array during cycles [m*length, (m+1)*length), and the last row
+# on until the weights of the last results, batch*length + LATENCY cycles in
+# all. Chunks never cross the end of a row.
+# Yields (start, datas, weights, sel, results) for every chunk, the first
+# cycle of the chunk, the streams of the input row and of the weights, of
+# shape (N) and (O, N), the select stream, and the expected results of the
+# wavefronts of the chunk, of shape (O), or None past the last row.
+def systolic_test_data( batch, inpt, outpt, length, rep="uni", chunk=STREAM_CHUNK ):
+   # Like the matrix multiply test data, every row of the input and weight
+   # matrices has its own noise source, an LFSR with a random seed.
+   rng = lfsr_model.LfsrModel( lfsr_model.rng_width( length ) )
+   top = 1 << rng.width
+
+   data = np.random.randint( top, size = (batch, inpt) )
+   data_seeds = np.random.randint( top, size = batch )
+   weight = np.random.randint( top, size = (outpt, inpt) )
+   weight_seeds = np.random.randint( top, size = outpt )
+   sel_seed = np.random.randint( top )
+
+   # the weight bit meeting a wavefront is late by the skew of its PE
+   skew = np.arange( outpt )[:, np.newaxis] + np.arange( inpt )[np.newaxis, :]
+   late = systolic_delay( inpt, outpt ) - 1
+
+   cycles = batch * length + systolic_delay( inpt, outpt )
+   model = golden_model.MatrixMultModel( rep=rep )
+   for row_start in range(0, cycles, length):
+      row = min( row_start // length, batch - 1 )
+      for (start, stop) in chunk_ranges( min( length, cycles - row_start ), chunk ):
+         (start, stop) = (row_start + start, row_start + stop)
+         rngs = rng.sequence( data_seeds[row], stop - start, start )
+         datas = bitstream.from_thresholds( rngs[np.newaxis, :], data[row] )
+         rngs = rng.sequence( weight_seeds, stop - start + late, start )
+         ahead = bitstream.from_thresholds( rngs[:, np.newaxis, :], weight )
+         weights = ahead.time_slice( 0, stop - start )
+         sel = rng.sequence( sel_seed, stop - start, start ) % inpt
+
+         results = None
+         if start < batch * length:
+            skewed = np.zeros_like( weights.words )
+            for d in range(late + 1):
+               skewed[skew == d] = ahead.time_slice( d, d + stop - start ).words[skew == d]
+            skewed = bitstream.PackedStreams( skewed, stop - start )
+            results = model.run( datas[np.newaxis], skewed, sel )[0]
+         yield (start, datas, weights, sel, results)
+
+# Runs the systolic array testbench on the python simulator instead of a
+# verilog simulator, like write_systolic_tb, with test data from
+# systolic_test_data.
+# Parameters:
+#  batch, inpt, outpt, length, chunk, see generate
+# Returns (errors, checked), the number of results which did not match the
+# golden model and the number of results checked.
+def simulate_test( batch, inpt, outpt, length = _SA_TEST_SIZE, chunk = STREAM_CHUNK ):
+   sim = simulator.Simulator( build_design( inpt, outpt ) )
+   expected = []
+   errors = 0
+   checked = 0
+   for (start, datas, weights, sel, results) in systolic_test_data( batch, inpt, outpt, length,
+                                                                    chunk=chunk ):
+      data_bits = datas.to_bools()
+      weight_bits = weights.to_bools().reshape( (outpt * inpt, -1) )
+      if results is not None:
+         result_bits = results.to_bools()
+         expected.extend( result_bits[:, t] for t in range(result_bits.shape[1]) )
+      for t in range(data_bits.shape[1]):
+         inputs = { "rst" : 0, "inputStreams" : data_bits[:, t],
+                    "weightStreams" : weight_bits[:, t], "sel" : sel[t] }
+         if start == 0 and t == 0:
+            # the testbench holds reset for 8 cycles with the first inputs
+            for i in range(TB_RESET_CYCLES):
+               sim.step( dict( inputs, rst=1 ) )
+         outputs = sim.step( inputs )
+         if outputs["outputWriteEn"][0, 0] and checked < len( expected ):
+            if not np.array_equal( outputs["outputStreams"][:, 0], expected[checked] ):
+               errors += 1
+            checked += 1
+   return (errors + batch * length - checked, checked)
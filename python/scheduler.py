@@ -0,0 +1,220 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains a scheduler which runs generation tasks on a pool of
+# processes.
+#
+# A task is a function writing files into the directory it is given, and the
+# tasks it depends on. The generators add their tasks with plan functions,
+# which mirror their generate functions, and the scheduler starts every task
+# once its dependencies are done, as many at a time as it has processes.
+#
+# Every task writes into its own temporary directory. When all tasks are done
+# their files are copied into the destination in the order the tasks were
+# added, so the result never depends on which task finished first, and it is
+# the same as running the generate functions one after another.
+#
+# One scheduler can write several destinations, see Scheduler.target. A task
+# is identified by its name and arguments, so a task added for several
+# destinations, such as a dot product shared by several matrix multiplies,
+# only runs once and its files are copied into each of them.
+
+import gen_cache
+import multiprocessing
+import numpy as np
+import os
+import profiling
+import shutil
+import tempfile
+
+# A generation task.
+class Task( object ):
+
+   # name, a string, the id of the task, see task_name
+   # func, a module level function called as func( dest, *args )
+   # args, a tuple of the arguments after dest
+   # deps, a list of the names of the tasks which must finish first
+   # seed_key, a string, the key the random state is seeded from in
+   #     deterministic mode, see gen_cache.call_key
+   def __init__( self, name, func, args=(), deps=None, seed_key=None ):
+      self.name = name
+      self.func = func
+      self.args = tuple( args )
+      self.deps = list( deps or [] )
+      self.seed_key = seed_key
+
+# Runs tasks on a pool of processes.
+class Scheduler( object ):
+
+   # jobs, an int, the number of processes, 1 runs the tasks in this process
+   def __init__( self, jobs=1 ):
+      self.jobs = jobs
+      self.tasks = []
+      self.ids = {}
+      self.targets = []
+      self.hits = 0
+      self.misses = 0
+
+   # Adds a task and returns its id, the name and arguments of the task.
+   # Adding a task already added returns its id without adding it again, so
+   # plans which share a sub-module share its task.
+   # See Task for the parameters, deps are ids returned by add.
+   def add( self, name, func, args=(), deps=None, seed_key=None ):
+      task_id = task_name( name, args )
+      if task_id not in self.ids:
+         for dep in deps or []:
+            if dep not in self.ids:
+               raise ValueError( "Task " + task_id + " depends on unknown task " + dep )
+         task = Task( task_id, func, args, deps, seed_key )
+         self.tasks.append( task )
+         self.ids[task_id] = task
+      elif self.ids[task_id].func is not func:
+         raise ValueError( "Task " + task_id + " was added twice with different functions" )
+
+      if self.targets and task_id not in self.targets[-1][1]:
+         self.targets[-1][1].append( task_id )
+      return task_id
+
+   # Starts a new destination directory, the files of the tasks added after
+   # this are written into dest by run.
+   def target( self, dest ):
+      self.targets.append( (dest, []) )
+
+   # Returns a list of (dest, task ids) of the destinations.
+   def outputs( self ):
+      return [(dest, list( ids )) for (dest, ids) in self.targets]
+
+   # Runs all tasks and writes their files into their destinations. dest is
+   # the destination of all tasks when no target was started.
+   def run( self, dest=None ):
+      targets = self.targets or [(dest, [t.name for t in self.tasks])]
+      for (target, _) in targets:
+         if not os.path.isdir( target ):
+            os.makedirs( target )
+      work = tempfile.mkdtemp( prefix=".tasks.", dir=targets[0][0] )
+      try:
+         dirs = {}
+         for i in range(len( self.tasks )):
+            dirs[self.tasks[i].name] = os.path.join( work, str(i) )
+            os.makedirs( dirs[self.tasks[i].name] )
+
+         if self.jobs > 1:
+            self._run_pool( dirs )
+         else:
+            for task in self.tasks:
+               self._count( run_task( task, dirs[task.name], _state() ) )
+
+         with profiling.span( "copy" ):
+            for (target, ids) in targets:
+               for task_id in ids:
+                  _copy_tree( dirs[task_id], target )
+      finally:
+         shutil.rmtree( work, ignore_errors=True )
+
+   # Helper function
+   # Runs the tasks on a pool, starting each as soon as its dependencies are done.
+   def _run_pool( self, dirs ):
+      pool = multiprocessing.Pool( self.jobs )
+      try:
+         done = set()
+         waiting = list( self.tasks )
+         running = {}
+         while waiting or running:
+            for task in [t for t in waiting if all( d in done for d in t.deps )]:
+               waiting.remove( task )
+               running[task.name] = pool.apply_async( run_task,
+                                                      (task, dirs[task.name], _state()) )
+            if not running:
+               raise ValueError( "Task dependencies form a cycle: " \
+                                 + ", ".join( t.name for t in waiting ) )
+
+            finished = [name for name in running if running[name].ready()]
+            if not finished:
+               next( iter( running.values() ) ).wait( 0.05 )
+               continue
+            for name in finished:
+               # get raises the exception of a failed task
+               self._count( running.pop( name ).get() )
+               done.add( name )
+         pool.close()
+      except:
+         pool.terminate()
+         raise
+      finally:
+         pool.join()
+
+   # Helper function
+   # Adds up the results of a task, see run_task.
+   def _count( self, counts ):
+      self.hits += counts[0]
+      self.misses += counts[1]
+      if counts[2]:
+         profiling.get_profiler().merge( counts[2] )
+
+# Runs a task into the directory dest, through the cache when it is on.
+# Parameters:
+#  task, the Task
+#  dest, a string, the directory to write into
+#  state, the deterministic mode, cache and profiling of the parent process,
+#     see _state
+# Returns the (hits, misses) of the cache and, in a process of a pool with
+# profiling on, the spans of the task, see profiling.Profiler.merge.
+def run_task( task, dest, state ):
+   (seed, cache, profile) = state
+   gen_cache.set_seed( seed )
+   gen_cache.set_cache( cache )
+   if seed is None:
+      # the processes of a pool start from the same random state
+      np.random.seed( np.frombuffer( os.urandom( 16 ), dtype=np.uint32 ) )
+
+   # a process of a pool records its own spans, and sends them back
+   pooled = profile is not None and profile != os.getpid()
+   if pooled and profiling.get_profiler().pid != os.getpid():
+      profiling.set_profiler( profiling.Profiler() )
+   with profiling.span( "task", task.name ):
+      counts = _run_task( task, dest, seed, cache )
+   return counts + (profiling.get_profiler().take() if pooled else [],)
+
+# Helper function
+# Runs a task, see run_task, and returns the (hits, misses) of the cache.
+def _run_task( task, dest, seed, cache ):
+   build = lambda d: _seeded_call( task, d )
+   if cache is None:
+      build( dest )
+      return (0, 0)
+   (hits, misses) = (cache.hits, cache.misses)
+   key = gen_cache.make_key( "task:" + task.name, [task.func.__module__, task.func.__name__,
+                                                   task.args], seed )
+   cache.build( key, task.name, { "args" : task.args }, dest, build )
+   return (cache.hits - hits, cache.misses - misses)
+
+# Helper function
+def _seeded_call( task, dest ):
+   state = np.random.get_state()
+   if task.seed_key is not None:
+      gen_cache.seed_random( task.seed_key )
+   try:
+      task.func( dest, *task.args )
+   finally:
+      np.random.set_state( state )
+
+# Helper function
+# Returns the deterministic mode, cache and profiling passed on to the tasks,
+# the last the id of the process profiling or None.
+def _state():
+   profiler = profiling.get_profiler()
+   return (gen_cache.get_seed(), gen_cache.get_cache(), None if profiler is None else profiler.pid)
+
+# Returns the id of a task, its name followed by its arguments.
+def task_name( name, args ):
+   if not args:
+      return name
+   return name + "(" + ", ".join( str(a) for a in args ) + ")"
+
+# Helper function
+# Copies every file below src into dst, replacing files already there.
+def _copy_tree( src, dst ):
+   for (path, dirs, names) in os.walk( src ):
+      folder = os.path.join( dst, os.path.relpath( path, src ) )
+      if not os.path.isdir( folder ):
+         os.makedirs( folder )
+      for fn in names:
+         shutil.copyfile( os.path.join( path, fn ), os.path.join( folder, fn ) )
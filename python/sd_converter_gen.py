@@ -5,51 +5,65 @@
 # The precision of the binary output must be specified.
 
 from common import *
+import gen_cache
+import netlist
 import os
 
 # Function to open and write a sd_converter module to a file.
 #  dest, the directory to write the file into
 #  precision, the bitwidth of the binary output
-def generate( dest, precision ):
-   with open( os.path.join( dest, SD_CONVERTER + ".v" ), 'w' ) as f:
+#  lanes, an int, the stream bits counted per cycle, see build_sd_converter_module
+@gen_cache.cached
+def generate( dest, precision, lanes = 1 ):
+   with open_verilog( os.path.join( dest, SD_CONVERTER + ".v" ) ) as f:
       write_header_sd_converter( f ) 
-      write_sd_converter_module( f, SD_CONVERTER, precision )
+      write_sd_converter_module( f, SD_CONVERTER, precision, lanes )
 
 # Writes a digital to stochastic converter module.
 # Parameters:
 #  f, the file to write to
 #  module_name, a string, the name of the module
 #  precision, an integer, the precision of the output binary number
-def write_sd_converter_module( f, module_name, precision ):
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "clk,", 1 )
-   write_line( f, "rst,", 1 )
-   write_line( f, "in,", 1 )
-   write_line( f, "last,", 1 )
-   write_line( f, "out", 1 )
-   write_line( f, ");" )
-   write_line( f, "parameter PRECISION = " + str(precision) + ";", 1 ) 
-   write_line( f, "" )
-   write_line( f, "input clk;", 1 ) 
-   write_line( f, "input rst;", 1 ) 
-   write_line( f, "input in;", 1 ) 
-   write_line( f, "input last;", 1 ) 
-   write_line( f, "output [PRECISION-1:0] out;", 1 ) 
-   write_line( f, "" )
-   write_line( f, "reg [PRECISION-1:0] count;", 1 ) 
-   write_line( f, "" )
-   write_line( f, "always @ (posedge clk) begin", 1 ) 
-   write_line( f, "if (rst == 1 || last == 1) begin", 2 ) 
-   write_line( f, "count <= 0;", 3 ) 
-   write_line( f, "end", 2 ) 
-   write_line( f, "else begin", 2 ) 
-   write_line( f, "count <= count + in;", 3 ) 
-   write_line( f, "end", 2 ) 
-   write_line( f, "end", 1 ) 
-   write_line( f, "" )
-   write_line( f, "assign out = count;", 1 ) 
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+#  lanes, an int, k, the stream bits counted per cycle
+def write_sd_converter_module( f, module_name, precision, lanes = 1 ):
+   netlist.write_module( f, build_sd_converter_module( module_name, precision, lanes ) )
+
+# Builds the netlist of a sd_converter module, see write_sd_converter_module.
+# With k lanes the input is k consecutive bits of the stream every cycle and
+# the count advances by their popcount, an adder tree of the k bits.
+def build_sd_converter_module( module_name, precision, lanes = 1 ):
+   m = netlist.Module( module_name )
+   precision = m.add_param( "PRECISION", precision )
+   if lanes > 1:
+      lanes = m.add_param( "LANES", lanes )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   inpt = m.add_input( "in", lanes_width( lanes ) )
+   m.add_input( "last" )
+   out = m.add_output( "out", precision )
+
+   if lanes > 1:
+      ones = m.add_wire( "ones", clogb2( lanes + 1 ), comment="ones among the lanes" )
+      m.assign( ones, popcount( [netlist.Ref( "in", j ) for j in range(lanes)] ) )
+      inpt = ones
+   restart = netlist.Op( "or", netlist.is_high( "rst" ), netlist.is_high( "last" ) )
+   count = m.add_register( "count", precision,
+                           [(restart, netlist.Const( 0 )),
+                            (None, netlist.Op( "add", netlist.Ref( "count" ), inpt ))] )
+   m.assign( out, count )
+   return m
+
+# Returns the netlist.Design of a sd_converter module, for simulation.
+def build_design( precision, lanes = 1 ):
+   return netlist.Design( build_sd_converter_module( SD_CONVERTER, precision, lanes ) )
+
+# Returns the expression of the number of ones among a list of one bit
+# expressions, a balanced tree of adders.
+def popcount( bits ):
+   while len( bits ) > 1:
+      pairs = [netlist.Op( "add", bits[i], bits[i+1] ) for i in range(0, len( bits ) - 1, 2)]
+      bits = pairs + bits[len( bits ) - len( bits ) % 2:]
+   return bits[0]
 
 def write_header_sd_converter( f ):
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
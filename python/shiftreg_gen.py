@@ -3,55 +3,48 @@
 # Shifts by n cycles (n registers).
 
 from common import *
+import gen_cache
+import netlist
 import os
 
 # Function to open and write a shift register verilog module to a file.
 #  dest, the directory to write the file into
 #  n, the number of registers in this shift register (i.e. the number of cycles to shift)
+@gen_cache.cached
 def generate( dest, n ):
-   with open( os.path.join( dest, shiftreg_name( n ) + ".v" ), 'w' ) as f:
+   with open_verilog( os.path.join( dest, shiftreg_name( n ) + ".v" ) ) as f:
       write_header_shiftreg( f ) 
       write_shiftreg_module( f, shiftreg_name( n ), n )
 
 # Writes a shift_n_register module. This module shifts a 1 bit value for n clock cycles.
 # Parameters:
-#  f, the file to write to
+#  f, the Emitter to write to
 #  module_name, string for module name
 #  shift, an int specifying how many clock cycles to shift for
 def write_shiftreg_module( f, module_name, shift ):
-   write_line( f, " module " + module_name + "(" )
-   write_line( f, "input clk,", 1 ) 
-   write_line( f, "input rst,", 1 ) 
-   write_line( f, "input data_in,", 1 ) 
-   write_line( f, "output data_out", 1 ) 
-   write_line( f, ");" )
-   write_line( f, "" )
-   write_line( f, "parameter DEPTH = " + str(shift) + ";", 1 ) 
-   write_line( f, "" )
-   write_line( f, "reg internal_registers [DEPTH-1:0];", 1 ) 
-   write_line( f, "" )
-   write_line( f, "// assign first register", 1 ) 
-   write_line( f, "always @ (posedge clk) begin", 1 ) 
-   write_line( f, "if (rst == 1)", 2 ) 
-   write_line( f, "internal_registers[0] <= 0;", 3 ) 
-   write_line( f, "else", 2 ) 
-   write_line( f, "internal_registers[0] <= data_in;", 3 ) 
-   write_line( f, "end", 1 ) 
-   write_line( f, "" )
-   write_line( f, "genvar i;", 1 ) 
-   write_line( f, "generate", 1 ) 
-   write_line( f, "for (i = 1; i < DEPTH; i = i + 1) begin: sr_loop", 2 ) 
-   write_line( f, "always @ (posedge clk) begin", 3 ) 
-   write_line( f, "if (rst == 1)", 4 ) 
-   write_line( f, "internal_registers[i] <= 0;", 5 ) 
-   write_line( f, "else", 4 ) 
-   write_line( f, "internal_registers[i] <= internal_registers[i-1];", 5 ) 
-   write_line( f, "end", 3 ) 
-   write_line( f, "end", 2 ) 
-   write_line( f, "endgenerate", 1 ) 
-   write_line( f, "" )
-   write_line( f, "assign data_out = internal_registers[DEPTH-1];", 1 ) 
-   write_line( f, "endmodule // shift_register" )
+   netlist.write_module( f, build_shiftreg_module( module_name, shift ) )
+
+# Builds the netlist of a shift_n_register module. The registers are held in
+# one vector which shifts towards its top bit, data_out.
+# Parameters:
+#  module_name, string for module name
+#  shift, an int specifying how many clock cycles to shift for
+def build_shiftreg_module( module_name, shift ):
+   m = netlist.Module( module_name )
+   shift = m.add_param( "DEPTH", shift )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   data_in = m.add_input( "data_in" )
+   data_out = m.add_output( "data_out" )
+
+   if shift > 1:
+      shifted = netlist.Op( "concat", netlist.Ref( "internal_registers", shift-2, 0 ), data_in )
+   else:
+      shifted = data_in
+   m.add_register( "internal_registers", shift,
+                   [(netlist.is_high( "rst" ), netlist.Const( 0 )), (None, shifted)] )
+   m.assign( data_out, netlist.Ref( "internal_registers", shift-1 ) )
+   return m
 
 # Writes header for shift register module.
 def write_header_shiftreg( f ):
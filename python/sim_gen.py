@@ -3,6 +3,7 @@
 # stochastic matrix multiply. 
 
 from common import *
+import gen_cache
 import os
 import counter_gen
 import lfsr_gen
@@ -13,6 +14,7 @@ import sc_dot_product_gen
 # Generates simulation modules for the following stochastic
 # circuits: dot_product, matrix_multiply
 # args, the parser arguments from generate.py
+@gen_cache.cached
 def generate( dest ):
    dims = 4
    width = 8
@@ -20,8 +22,8 @@ def generate( dest ):
    # generate width 8 lfsr
    lfsr_gen.generate( dest, width ) 
 
-   # generate modular counter which counts upto 4 for select streams
-   counter_gen.generate( dest, dims )
+   # generate modular counter which counts from 0 to 3 for select streams
+   counter_gen.generate( dest, dims - 1 )
 
    # generate an sd_convertor which converts to an 8 bit binary number
    sd_converter_gen.generate( dest, 8 )
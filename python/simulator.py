@@ -0,0 +1,642 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This file contains a cycle-accurate simulator of the netlists built by the
+# generators (see netlist.py), so designs can be checked without a verilog
+# simulator.
+#
+# Every module is compiled once into python functions: comb evaluates the
+# continuous assignments and instances from the inputs and register state,
+# update clocks the registers. A signal is a bool array of shape (W, B), bit
+# i of the signal in row i, and the B lanes are independent copies of the
+# module, so one numpy operation evaluates a signal of every copy at once.
+#
+# The instances of a module are levelized by their dependencies, and all
+# instances of the same module on the same level are evaluated together as
+# one call of the sub-module's functions, with a lane for every instance and
+# lane of the parent. The 1024 dot products of a 32x64x32 matrix multiply are
+# one call per cycle, and their 65536 multipliers another.
+#
+# Compiled modules are cached by a hash of their verilog and parameters, and
+# the modules they instantiate.
+
+from collections import OrderedDict
+import hashlib
+import netlist
+import numpy as np
+
+# The number of compiled modules kept before the least recently used is dropped.
+CACHE_SIZE = 64
+
+# Width of an unsized constant or a parameter, as in verilog.
+_INT_WIDTH = 32
+
+_SHIFTS = np.arange( 64, dtype=np.uint64 )
+_POWERS = np.uint64( 1 ) << _SHIFTS
+
+_cache = OrderedDict()
+
+# A module compiled into python functions.
+#  comb( inputs, state, B ), evaluates the module and returns a dictionary of
+#     every net and of the values of every group of instances
+#  update( values, state, B ), clocks the registers from the values of comb
+#  init_state( B ), returns the initial register state for B lanes
+class CompiledModule( object ):
+
+   def __init__( self, module, key, source, namespace ):
+      self.name = module.name
+      self.key = key
+      self.source = source
+      self.inputs = [(p.name, _width( p.width )) for p in module.ports if p.direction == "input"]
+      self.outputs = [(p.name, _width( p.width )) for p in module.ports
+                      if p.direction == "output"]
+      self.comb = namespace["comb"]
+      self.update = namespace["update"]
+      self.init_state = namespace["init_state"]
+
+# Simulates a netlist.Design, lanes independent copies of it at once.
+class Simulator( object ):
+
+   # design, a netlist.Design
+   # lanes, an int, the number of copies of the design simulated
+   def __init__( self, design, lanes=1 ):
+      self.design = design
+      self.lanes = lanes
+      self.model = compile_design( design )
+      self.reset()
+
+   # Returns every register to its initial value.
+   def reset( self ):
+      self.state = self.model.init_state( self.lanes )
+      self.cycle = 0
+
+   # Evaluates the design without clocking it.
+   # Parameters:
+   #  inputs, a dictionary of the input ports, see to_bits for the values
+   # Returns a dictionary of the outputs, bool arrays of shape (W, lanes).
+   def peek( self, inputs ):
+      values = self.model.comb( self._inputs( inputs ), self.state, self.lanes )
+      return dict( (name, values[name]) for (name, _) in self.model.outputs )
+
+   # Runs one clock cycle.
+   # Parameters:
+   #  inputs, a dictionary of the input ports, see to_bits for the values
+   # Returns a dictionary of the outputs before the rising edge of the clock,
+   # the values a testbench samples on that edge.
+   def step( self, inputs ):
+      values = self.model.comb( self._inputs( inputs ), self.state, self.lanes )
+      self.model.update( values, self.state, self.lanes )
+      self.cycle += 1
+      return dict( (name, values[name]) for (name, _) in self.model.outputs )
+
+   # Runs a clock cycle for every set of inputs.
+   # Parameters:
+   #  inputs, a list of dictionaries of the input ports
+   # Returns a list of dictionaries of the outputs, see step.
+   def run( self, inputs ):
+      return [self.step( i ) for i in inputs]
+
+   # Helper function
+   def _inputs( self, inputs ):
+      converted = {}
+      for (name, width) in self.model.inputs:
+         if name in inputs:
+            converted[name] = to_bits( inputs[name], width )
+      return converted
+
+# Converts a value of a port to the signal layout of the simulator.
+# Parameters:
+#  value, an int or array of ints per lane, or a bool array of shape (W,)
+#     or (W, lanes)
+#  width, an int, the width of the port
+# Returns a bool array of shape (width, 1) or (width, lanes).
+def to_bits( value, width ):
+   value = np.asarray( value )
+   if value.dtype == bool:
+      if value.ndim == 1:
+         value = value[:, np.newaxis]
+      return value
+   if width > 64:
+      raise ValueError( "Integer values are limited to 64 bits, port has " + str(width) )
+   lanes = value.astype( np.uint64 ).reshape( -1 )
+   return ((lanes[np.newaxis, :] >> _SHIFTS[:width, np.newaxis]) & np.uint64( 1 )).astype( bool )
+
+# Converts a signal to an unsigned int per lane, a uint64 array.
+def from_bits( bits ):
+   return _to_int( np.asarray( bits, dtype=bool ) )
+
+# Checks the simulator on a register which holds its value when none of its
+# rules apply, without reading itself in any of them, against a python model.
+# Parameters:
+#  cycles, an int, the number of cycles of random inputs
+# Returns (errors, checked), the number of cycles the register was wrong on
+# and the number of cycles checked.
+def self_test( cycles = 100 ):
+   m = netlist.Module( "hold_register" )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   m.add_input( "load" )
+   m.add_input( "d", 8 )
+   out = m.add_output( "q", 8 )
+   held = m.add_register( "held", 8, [(netlist.is_high( "rst" ), netlist.Const( 0 )),
+                                      (netlist.is_high( "load" ), netlist.Ref( "d" ))] )
+   m.assign( out, held )
+
+   sim = Simulator( netlist.Design( m ) )
+   rand = np.random.RandomState( 0 )
+   expected = 0
+   errors = 0
+   for t in range(cycles):
+      (rst, load, d) = (int(t == 0), rand.randint( 2 ), rand.randint( 256 ))
+      outputs = sim.step( { "rst" : rst, "load" : load, "d" : d } )
+      if from_bits( outputs["q"] )[0] != expected:
+         errors += 1
+      expected = 0 if rst else (d if load else expected)
+   return (errors, cycles)
+
+# Compiles the top module of a netlist.Design and every module below it.
+# Returns a CompiledModule.
+def compile_design( design ):
+   return compile_module( design, design.top )
+
+# Compiles a module of a design, with its parameters overridden by params, a
+# list of (parameter, value) pairs. Compiled modules are looked up in the cache
+# first.
+def compile_module( design, name, params=() ):
+   module = design.module( name )
+   values = dict( (p, v) for (p, v, _) in module.params )
+   values.update( dict( params ) )
+
+   # compile the instantiated modules first, their keys are part of this key
+   levels = _levels( design, module )
+   children = []
+   for group in _groups( levels ):
+      children.append( compile_module( design, group[0].module, group[0].params ) )
+   h = hashlib.sha1( module.digest().encode( "utf-8" ) )
+   h.update( repr( sorted( values.items() ) ).encode( "utf-8" ) )
+   for child in children:
+      h.update( child.key.encode( "utf-8" ) )
+   key = h.hexdigest()
+
+   compiled = _cache.pop( key, None )
+   if compiled is None:
+      compiler = _Compiler( module, values, levels, children )
+      source = compiler.source()
+      namespace = dict( _RUNTIME )
+      namespace.update( compiler.constants )
+      for i in range(len( children )):
+         namespace["m" + str(i)] = children[i]
+      exec( compile( source, "<" + module.name + ">", "exec" ), namespace )
+      compiled = CompiledModule( module, key, source, namespace )
+   _cache[key] = compiled
+   while len( _cache ) > CACHE_SIZE:
+      _cache.popitem( last=False )
+   return compiled
+
+# Helper function
+def _width( width ):
+   return 1 if width is None else width
+
+# Helper function
+# Returns the names of the nets referenced by an expression.
+def _refs( expr, names ):
+   if isinstance( expr, netlist.Ref ):
+      names.add( expr.name )
+   elif isinstance( expr, netlist.Op ):
+      for a in expr.args:
+         _refs( a, names )
+   return names
+
+# Helper function
+# Orders the assigns and instances of a module by level, the longest chain
+# of assigns and instances from an input or register to them.
+# Returns a list of levels, each a list of assigns and a list of groups of
+# instances of the same module and parameters.
+def _levels( design, module ):
+   nodes = module.assigns + module.instances
+   reads = []
+   drivers = {}
+   for node in nodes:
+      if isinstance( node, netlist.Assign ):
+         reads.append( _refs( node.rhs, set() ) )
+         drivers.setdefault( node.lhs.name, [] ).append( node )
+         continue
+      sub = set()
+      outputs = _outputs( design, node )
+      for (port, expr) in node.connections:
+         if port in outputs:
+            drivers.setdefault( expr.name, [] ).append( node )
+         else:
+            _refs( expr, sub )
+      reads.append( sub )
+
+   level = {}
+   pending = list( range(len( nodes )) )
+   index = dict( (id(nodes[i]), i) for i in range(len( nodes )) )
+   while pending:
+      waiting = []
+      for i in pending:
+         deps = [index[id(d)] for name in reads[i] for d in drivers.get( name, [] )]
+         if all( d in level for d in deps ):
+            level[i] = 1 + max( [level[d] for d in deps] + [0] )
+         else:
+            waiting.append( i )
+      if len( waiting ) == len( pending ):
+         raise ValueError( "Combinational loop in module " + module.name )
+      pending = waiting
+
+   levels = []
+   for l in range(1, max( list( level.values() ) + [0] ) + 1):
+      assigns = [nodes[i] for i in range(len( nodes )) if level[i] == l
+                 and isinstance( nodes[i], netlist.Assign )]
+      insts = [nodes[i] for i in range(len( nodes )) if level[i] == l
+               and isinstance( nodes[i], netlist.Instance )]
+      levels.append( (assigns, _group( insts )) )
+   return levels
+
+# Helper function
+# Returns the groups of instances of all levels, in order.
+def _groups( levels ):
+   groups = []
+   for (_, level) in levels:
+      groups.extend( level )
+   return groups
+
+# Helper function
+# Returns the names of the output ports of the module of an instance.
+def _outputs( design, inst ):
+   return set( p.name for p in design.module( inst.module ).ports if p.direction == "output" )
+
+# Helper function
+# Groups instances by module and parameters, in order of first appearance.
+def _group( insts ):
+   groups = OrderedDict()
+   for inst in insts:
+      groups.setdefault( (inst.module, repr( inst.params )), [] ).append( inst )
+   return list( groups.values() )
+
+# Helper class
+# Writes the python source of the functions of a compiled module.
+class _Compiler( object ):
+
+   def __init__( self, module, params, levels, children ):
+      self.module = module
+      self.params = params
+      self.levels = levels
+      self.groups = _groups( levels )
+      self.children = children
+      # constant arrays used by the code, by name
+      self.constants = {}
+      self.widths = {}
+      for item in module.ports + module.nets:
+         self.widths[item.name] = _width( item.width )
+      self.regs = dict( (r.name, r) for r in module.registers )
+      self.inputs = [p.name for p in module.ports if p.direction == "input"]
+
+   def source( self ):
+      lines = []
+      lines.extend( self._comb() )
+      lines.extend( self._update() )
+      lines.extend( self._init_state() )
+      return "\n".join( lines ) + "\n"
+
+   # Helper function
+   # Writes comb.
+   def _comb( self ):
+      m = self.module
+      lines = ["def comb( inputs, s, B ):"]
+      for name in self.inputs:
+         lines.append( "   n_" + name + " = _port( inputs, '" + name + "', " \
+                       + str(self.widths[name]) + ", B )" )
+      for reg in m.registers:
+         lines.append( "   n_" + reg.name + " = s['" + reg.name + "']" )
+      for reg in m.registers:
+         if reg.async_reset:
+            # the register takes its reset value as soon as the reset rises
+            (cond, value) = reg.rules[0]
+            lines.append( "   n_" + reg.name + " = s['" + reg.name + "'] = np.where( _any( " \
+                          + self._expr( cond )[0] + " ), " + self._fit( value, reg.name ) \
+                          + ", n_" + reg.name + " )" )
+
+      # nets written a part at a time are allocated first, undriven nets are 0
+      levels = self.levels
+      partial = set()
+      driven = set( self.inputs ) | set( self.regs )
+      for (assigns, groups) in levels:
+         for a in assigns:
+            if a.lhs.msb is not None:
+               partial.add( a.lhs.name )
+            driven.add( a.lhs.name )
+         for (group, child) in zip( groups, self.children ):
+            for inst in group:
+               for (port, expr) in inst.connections:
+                  if port in dict( child.outputs ):
+                     partial.add( expr.name )
+      for name in sorted( self.widths ):
+         if name in partial or name not in driven:
+            lines.append( "   n_" + name + " = np.zeros( (" + str(self.widths[name]) + ", B), bool )" )
+
+      g = 0
+      for (assigns, groups) in levels:
+         for a in assigns:
+            if a.lhs.msb is None and a.lhs.name not in partial:
+               lines.append( "   n_" + a.lhs.name + " = " + self._fit( a.rhs, a.lhs.name ) )
+            else:
+               (lo, hi) = self._rows( a.lhs )
+               lines.append( "   n_" + a.lhs.name + "[" + str(lo) + ":" + str(hi) + "] = _fit( " \
+                             + self._expr( a.rhs )[0] + ", " + str(hi - lo) + ", B )" )
+         for group in groups:
+            lines.extend( self._group( group, g ) )
+            g += 1
+
+
+      values = ["'" + name + "' : n_" + name for name in sorted( self.widths )]
+      values += ["'g" + str(i) + "' : c" + str(i) for i in range(g)]
+      lines.append( "   return { " + ", ".join( values ) + " }" )
+      lines.append( "" )
+      return lines
+
+   # Helper function
+   # Writes the call of the sub-module for a group of instances.
+   def _group( self, group, g ):
+      child = self.children[g]
+      k = len( group )
+      lanes = "B" if k == 1 else "B*" + str(k)
+      conns = [dict( inst.connections ) for inst in group]
+      args = []
+      for (port, width) in child.inputs:
+         exprs = [c.get( port, netlist.Const( 0 ) ) for c in conns]
+         args.append( "'" + port + "' : " + self._gather( exprs, width ) )
+      lines = ["   c" + str(g) + " = m" + str(g) + ".comb( { " + ", ".join( args ) + " }, s['g" \
+               + str(g) + "'], " + lanes + " )"]
+      for (port, width) in child.outputs:
+         targets = [c.get( port ) for c in conns]
+         lines.extend( self._scatter( targets, width, "c" + str(g) + "['" + port + "']", k ) )
+      return lines
+
+   # Helper function
+   # Returns the code of the input of a group of instances, the expression
+   # connected to every instance side by side, instance j in lanes [jB, (j+1)B).
+   def _gather( self, exprs, width ):
+      k = len( exprs )
+      if k == 1:
+         return "_fit( " + self._expr( exprs[0] )[0] + ", " + str(width) + ", B )"
+      if len( set( str(e) for e in exprs ) ) == 1:
+         return "_tile( " + self._expr( exprs[0] )[0] + ", " + str(width) + ", B, " + str(k) + " )"
+      rows = self._select_rows( exprs, width )
+      if rows is not None:
+         return "_gather( n_" + exprs[0].name + ", " + self._constant( rows ) + ", B )"
+      return "_stack( [" + ", ".join( self._expr( e )[0] for e in exprs ) + "], " + str(width) \
+             + ", B )"
+
+   # Helper function
+   # Returns the code writing the output of a group of instances into the nets
+   # connected to it.
+   def _scatter( self, targets, width, value, k ):
+      if all( t is None for t in targets ):
+         return []
+      rows = self._select_rows( targets, width )
+      if rows is not None:
+         return ["   _scatter( n_" + targets[0].name + ", " + self._constant( rows ) + ", " \
+                 + value + ", B )"]
+      lines = []
+      for j in range(k):
+         if targets[j] is None:
+            continue
+         (lo, hi) = self._rows( targets[j] )
+         lines.append( "   n_" + targets[j].name + "[" + str(lo) + ":" + str(hi) + "] = _fit( " \
+                       + value + "[:, " + str(j) + "*B:" + str(j+1) + "*B], " + str(hi - lo) \
+                       + ", B )" )
+      return lines
+
+   # Helper function
+   # Returns the rows of one net selected by every expression, an int array
+   # of shape (width, k), or None when they are not all selects of one net of
+   # the given width.
+   def _select_rows( self, exprs, width ):
+      if not all( isinstance( e, netlist.Ref ) for e in exprs ) \
+         or len( set( e.name for e in exprs ) ) != 1 or exprs[0].name in self.params:
+         return None
+      rows = []
+      for e in exprs:
+         (lo, hi) = self._rows( e )
+         if hi - lo != width:
+            return None
+         rows.append( list( range(lo, hi) ) )
+      return np.array( rows, dtype=np.intp ).T
+
+   # Helper function
+   # Returns the rows [lo, hi) of a net referenced by a Ref.
+   def _rows( self, ref ):
+      if ref.msb is None:
+         return (0, self.widths[ref.name])
+      if ref.lsb is None:
+         return (ref.msb, ref.msb + 1)
+      return (ref.lsb, ref.msb + 1)
+
+   # Helper function
+   # Returns the code of an expression fitted to the width of a net.
+   def _fit( self, expr, name ):
+      return "_fit( " + self._expr( expr )[0] + ", " + str(self.widths[name]) + ", B )"
+
+   # Helper function
+   # Returns the code and width of an expression.
+   def _expr( self, e ):
+      if isinstance( e, netlist.Ref ):
+         if e.name in self.params:
+            return self._const( self.params[e.name], _INT_WIDTH )
+         if e.name not in self.widths:
+            raise KeyError( "Unknown net " + e.name + " in module " + self.module.name )
+         (lo, hi) = self._rows( e )
+         if e.msb is None:
+            return ("n_" + e.name, hi - lo)
+         return ("n_" + e.name + "[" + str(lo) + ":" + str(hi) + "]", hi - lo)
+      if isinstance( e, netlist.Const ):
+         return self._const( e.value, _INT_WIDTH if e.width is None else e.width )
+
+      args = [self._expr( a ) for a in e.args]
+      if e.op in ("and", "or", "xor"):
+         w = max( a[1] for a in args )
+         op = { "and" : " & ", "or" : " | ", "xor" : " ^ " }[e.op]
+         return ("(" + op.join( _ext_code( a, w ) for a in args ) + ")", w)
+      if e.op == "not":
+         return ("~" + args[0][0], args[0][1])
+      if e.op == "reduce_or":
+         return ("_any( " + args[0][0] + " )", 1)
+      if e.op in ("eq", "lt"):
+         w = max( a[1] for a in args )
+         return ("_" + e.op + "( " + _ext_code( args[0], w ) + ", " + _ext_code( args[1], w ) + " )", 1)
+      if e.op == "add":
+         w = min( max( a[1] for a in args ) + 1, 64 )
+         return ("_add( " + args[0][0] + ", " + args[1][0] + ", " + str(w) + " )", w)
+      if e.op == "mux":
+         w = max( args[1][1], args[2][1] )
+         return ("np.where( _any( " + args[0][0] + " ), " + _ext_code( args[1], w ) + ", " \
+                 + _ext_code( args[2], w ) + " )", w)
+      if e.op == "concat":
+         # the first operand is the most significant
+         return ("_cat( [" + ", ".join( a[0] for a in reversed( args ) ) + "] )",
+                 sum( a[1] for a in args ))
+      # index
+      return ("_index( " + args[0][0] + ", " + args[1][0] + " )", 1)
+
+   # Helper function
+   # Returns the code and width of a constant.
+   def _const( self, value, width ):
+      width = min( width, 64 )
+      bits = to_bits( int(value) & ((1 << width) - 1), width )
+      return (self._constant( bits ), width)
+
+   # Helper function
+   # Returns the name of a shared constant array.
+   def _constant( self, array ):
+      name = "K" + hashlib.sha1( array.tobytes() + str(array.shape).encode( "utf-8" ) \
+                                 + str(array.dtype).encode( "utf-8" ) ).hexdigest()[:16]
+      self.constants[name] = array
+      return name
+
+   # Helper function
+   # Writes update.
+   def _update( self ):
+      lines = ["def update( v, s, B ):"]
+      names = set()
+      for reg in self.module.registers:
+         for (cond, value) in reg.rules:
+            _refs( value, names )
+            if cond is not None:
+               _refs( cond, names )
+         if all( cond is not None for (cond, value) in reg.rules ):
+            # it holds its value when no rule applies
+            names.add( reg.name )
+      for name in sorted( names ):
+         if name not in self.params:
+            lines.append( "   n_" + name + " = v['" + name + "']" )
+
+      for reg in self.module.registers:
+         # the first rule whose condition holds wins, and without one the
+         # register holds its value
+         nxt = "n_" + reg.name
+         for (cond, value) in reversed( reg.rules ):
+            if cond is None:
+               nxt = self._fit( value, reg.name )
+            else:
+               nxt = "np.where( _any( " + self._expr( cond )[0] + " ), " \
+                     + self._fit( value, reg.name ) + ", " + nxt + " )"
+         lines.append( "   x_" + reg.name + " = " + nxt )
+
+      for g in range(len( self.children )):
+         lines.append( "   m" + str(g) + ".update( v['g" + str(g) + "'], s['g" + str(g) + "'], B*" \
+                       + str(len( self.groups[g] )) + " )" )
+      for reg in self.module.registers:
+         lines.append( "   s['" + reg.name + "'] = x_" + reg.name )
+      if len( lines ) == 1:
+         lines.append( "   pass" )
+      lines.append( "" )
+      return lines
+
+   # Helper function
+   # Writes init_state, registers start at the value of their initial
+   # statement, or 0.
+   def _init_state( self ):
+      lines = ["def init_state( B ):", "   s = {}"]
+      nets = dict( (n.name, n) for n in self.module.nets )
+      for reg in self.module.registers:
+         init = nets[reg.name].init if reg.name in nets else None
+         if init is None:
+            init = netlist.Const( 0 )
+         elif not isinstance( init, netlist.Expr ):
+            init = netlist.Const( init )
+         lines.append( "   s['" + reg.name + "'] = np.array( " + self._fit( init, reg.name ) + " )" )
+      groups = self.groups
+      for g in range(len( groups )):
+         lines.append( "   s['g" + str(g) + "'] = m" + str(g) + ".init_state( B*" \
+                       + str(len( groups[g] )) + " )" )
+      lines.append( "   return s" )
+      lines.append( "" )
+      return lines
+
+# Helper function
+# Returns the code of an expression of width w, zero extended to w bits.
+def _ext_code( arg, w ):
+   (code, width) = arg
+   if width == w:
+      return code
+   return "_ext( " + code + ", " + str(w) + " )"
+
+# The functions used by the compiled code.
+
+# Returns input port name of width w, 0 when it is not driven.
+def _port( inputs, name, w, B ):
+   if name not in inputs:
+      return np.zeros( (w, B), bool )
+   return _fit( inputs[name], w, B )
+
+# Returns x zero extended or truncated to w rows.
+def _ext( x, w ):
+   if x.shape[0] > w:
+      return x[:w]
+   if x.shape[0] < w:
+      return np.concatenate( [x, np.zeros( (w - x.shape[0], x.shape[1]), bool )] )
+   return x
+
+# Returns x fitted to w rows and B lanes.
+def _fit( x, w, B ):
+   x = _ext( x, w )
+   if x.shape[1] != B:
+      x = np.broadcast_to( x, (w, B) )
+   return x
+
+# Returns x of every lane repeated for k instances.
+def _tile( x, w, B, k ):
+   return np.tile( _fit( x, w, B ), (1, k) )
+
+# Returns rows[:, j] of x for every instance j, side by side.
+def _gather( x, rows, B ):
+   (w, k) = rows.shape
+   return _fit( x, x.shape[0], B )[rows].reshape( (w, k * B) )
+
+# Writes the rows of x for every instance j into rows[:, j] of net.
+def _scatter( net, rows, x, B ):
+   (w, k) = rows.shape
+   net[rows] = x.reshape( (w, k, B) )
+
+# Returns the expressions of every instance side by side.
+def _stack( xs, w, B ):
+   return np.concatenate( [_fit( x, w, B ) for x in xs], axis=1 )
+
+# Returns the OR of the bits of x.
+def _any( x ):
+   if x.shape[0] == 1:
+      return x
+   return np.any( x, axis=0, keepdims=True )
+
+def _eq( x, y ):
+   return np.all( x == y, axis=0, keepdims=True )
+
+def _lt( x, y ):
+   return (_to_int( x ) < _to_int( y ))[np.newaxis, :]
+
+def _add( x, y, w ):
+   return to_bits( _to_int( x ) + _to_int( y ), w )
+
+# Returns the unsigned int of every lane of x.
+def _to_int( x ):
+   if x.shape[0] > 64:
+      raise ValueError( "Arithmetic is limited to 64 bits, signal has " + str(x.shape[0]) )
+   return _POWERS[:x.shape[0]].dot( x.astype( np.uint64 ) )
+
+# Concatenates signals, the first is the least significant.
+def _cat( xs ):
+   lanes = max( x.shape[1] for x in xs )
+   return np.concatenate( [np.broadcast_to( x, (x.shape[0], lanes) ) for x in xs] )
+
+# Returns bit sel of x in every lane, 0 when sel is past the top of x.
+def _index( x, sel ):
+   s = _to_int( sel ).astype( np.intp )
+   lanes = max( x.shape[1], s.shape[0] )
+   s = np.broadcast_to( s, (lanes,) )
+   x = np.broadcast_to( x, (x.shape[0], lanes) )
+   bits = x[np.minimum( s, x.shape[0] - 1 ), np.arange( lanes )] & (s < x.shape[0])
+   return bits[np.newaxis, :]
+
+_RUNTIME = { "np" : np, "_port" : _port, "_ext" : _ext, "_fit" : _fit, "_tile" : _tile,
+             "_gather" : _gather, "_scatter" : _scatter, "_stack" : _stack, "_any" : _any,
+             "_eq" : _eq, "_lt" : _lt, "_add" : _add, "_cat" : _cat, "_index" : _index }
@@ -6,18 +6,22 @@
 
 from common import *
 import ds_converter_gen as ds_gen
+import gen_cache
+import netlist
 import os
 
 # Function to open and write a SNG module to a file.
 # The SNG depends on a ds_converter, so a ds_converter is written as well.
 #  dest, the directory to write the file into
 #  precision, the bitwidth of the binary input
-def generate( dest, precision ):
+#  lanes, an int, the stream bits generated per cycle, see build_sng_module
+@gen_cache.cached
+def generate( dest, precision, lanes = 1 ):
    ds_gen.generate( dest, precision )
    
-   with open( os.path.join( dest, SNG + ".v" ), 'w' ) as f:
+   with open_verilog( os.path.join( dest, SNG + ".v" ) ) as f:
       write_header_sng( f ) 
-      write_sng_module( f, SNG, precision )
+      write_sng_module( f, SNG, precision, lanes )
      
 # Writes a stochastic number generator module.
 # Parameters:
@@ -27,38 +31,45 @@ def generate( dest, precision ):
 #     input random number
 #  rng, a string, specifies the kind of noise source for the stochastic
 #     number generator. Options are: LFSR, COUNTER, REVERSECOUNTER (VANDERCORPIT?)
-def write_sng_module( f, module_name, precision ):
-   write_line( f, "module " + module_name + "(" )
-   write_line( f, "clk,", 1 )
-   write_line( f, "rst,", 1 )
-   write_line( f, "in,", 1 )
-   write_line( f, "rng,", 1 )
-   write_line( f, "out", 1 )
-   write_line( f, ");" )
-   write_line( f, "parameter PRECISION = " + str(precision) + ";", 1 ) 
-   write_line( f, "" )
-   write_line( f, "input clk;", 1 ) 
-   write_line( f, "input rst;", 1 ) 
-   write_line( f, "input [PRECISION-1:0] in;", 1 ) 
-   write_line( f, "input [PRECISION-1:0] rng;", 1 ) 
-   write_line( f, "output out;", 1 ) 
-   write_line( f, "" )
-   write_line( f, "// pass the noise and input to the converter and clock the output", 1 ) 
-   write_line( f, "wire ds_out;", 1 )
-   write_line( f, "reg ds_out_reg;", 1 ) 
-   write_line( f, "ds_converter DS_CONVERT(.in(in), .rng(rng), .out(ds_out));", 1 ) 
-   write_line( f, "" )
-   write_line( f, "always @(posedge clk) begin", 1 ) 
-   write_line( f, "if (rst == 1) begin", 2 ) 
-   write_line( f, "ds_out_reg <= 0;", 3 ) 
-   write_line( f, "end else begin", 2 ) 
-   write_line( f, "ds_out_reg <= ds_out;", 3 ) 
-   write_line( f, "end", 2 ) 
-   write_line( f, "end", 1 ) 
-   write_line( f, ""  )
-   write_line( f, "assign out = ds_out_reg;", 1 ) 
-   write_line( f, "" )
-   write_line( f, "endmodule // " + module_name )
+#  lanes, an int, k, the stream bits generated per cycle
+def write_sng_module( f, module_name, precision, lanes = 1 ):
+   netlist.write_module( f, build_sng_module( module_name, precision, lanes ) )
+
+# Builds the netlist of a stochastic number generator module, see write_sng_module.
+# With k lanes the module takes k random numbers every cycle, rng[j*PRECISION +:
+# PRECISION] the noise of the j-th of k consecutive cycles of the serial
+# module, and compares each with the input, so out[j] is the j-th bit.
+def build_sng_module( module_name, precision, lanes = 1 ):
+   m = netlist.Module( module_name )
+   precision = m.add_param( "PRECISION", precision )
+   if lanes > 1:
+      lanes = m.add_param( "LANES", lanes )
+   m.add_input( "clk" )
+   m.add_input( "rst" )
+   inpt = m.add_input( "in", precision )
+   rng = m.add_input( "rng", lanes * precision )
+   out = m.add_output( "out", lanes_width( lanes ) )
+
+   ds_out = m.add_wire( "ds_out", lanes_width( lanes ) )
+   comment = "pass the noise and input to the converters and clock the output"
+   if lanes == 1:
+      m.add_instance( DS_CONVERTER, "DS_CONVERT", [("in", inpt), ("rng", rng), ("out", ds_out)],
+                      [("PRECISION", precision)], comment )
+   else:
+      j = netlist.Index( "j" )
+      m.add_instance_array( DS_CONVERTER, "DS_CONVERT", "lane", [("j", lanes)],
+                            [("in", inpt), ("rng", netlist.Part( "rng", j * precision, precision )),
+                             ("out", netlist.Ref( "ds_out", j ))],
+                            [("PRECISION", precision)], comment )
+   ds_out_reg = m.add_register( "ds_out_reg", lanes_width( lanes ),
+                                [(netlist.is_high( "rst" ), netlist.Const( 0 )), (None, ds_out)] )
+   m.assign( out, ds_out_reg )
+   return m
+
+# Returns the netlist.Design of a sng module and its converter, for simulation.
+def build_design( precision, lanes = 1 ):
+   return netlist.Design( build_sng_module( SNG, precision, lanes ),
+                          [ds_gen.build_ds_converter_module( DS_CONVERTER, precision )] )
 
 def write_header_sng( f ):
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
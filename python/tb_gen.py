@@ -2,14 +2,16 @@
 # This file contains functions to generate testbenches for the modules
 # produced by the top-level script, generate.py.
 
-import numpy as np
 from common import *
-from pysc.linear_algebra.sc_dot_product import *
-from pysc.rngs.lfsr import *
-from pysc.core.arithmetic import *
+import mif
 import os
 import random
 
+# The testbench data generators are shared with the module generators.
+from alaghi_nadder_gen import gen_alaghi_data
+from sc_dot_product_gen import dp_delay, gen_dp_data
+from sc_matrix_mult_gen import gen_mm_data
+
 # dot product testbench constants
 _DP_DATA_FN = "data_vectors.mif"
 _DP_WEIGHT_FN = "weight_vectors.mif"
@@ -36,6 +38,7 @@ def generate( args ):
    M = args.batch_size
    N = args.input_size
    O = args.output_size 
+   L = args.test_length
 
    # if a module name is supplied, concatenate module names
    mm_tb_name = MATRIX + "_tb"
@@ -53,28 +56,33 @@ def generate( args ):
       os.makedirs( data )
  
    # write the matrix multiply testbench
-   gen_mm_data( data, M, N, O, _MM_TEST_SIZE, rep=args.rep, alaghi=args.alaghi )
-   with open( os.path.join( tb, mm_tb_name + ".v" ), 'w' ) as f:
-      write_mm_tb( f, mm_tb_name, mm_dut_name, M, N, O, alaghi=args.alaghi )
+   gen_mm_data( data, M, N, O, L, rep=args.rep, alaghi=args.alaghi, datafmt=args.datafmt,
+                chunk=args.chunk_size )
+   with open_verilog( os.path.join( tb, mm_tb_name + ".v" ) ) as f:
+      write_mm_tb( f, mm_tb_name, mm_dut_name, M, N, O, alaghi=args.alaghi, datafmt=args.datafmt,
+                   length=L )
 
    # write the dot product testbench
-   gen_dp_data( data, N, _DP_TEST_SIZE, rep=args.rep, alaghi=args.alaghi )
-   with open( os.path.join( tb, dp_tb_name + ".v" ), 'w' ) as f:
-      write_dp_tb( f, dp_tb_name, dp_dut_name, N, rep=args.rep, alaghi=args.alaghi )
+   gen_dp_data( data, N, L, rep=args.rep, alaghi=args.alaghi, datafmt=args.datafmt,
+                chunk=args.chunk_size )
+   with open_verilog( os.path.join( tb, dp_tb_name + ".v" ) ) as f:
+      write_dp_tb( f, dp_tb_name, dp_dut_name, N, rep=args.rep, alaghi=args.alaghi, datafmt=args.datafmt,
+                   length=L )
 
    if args.alaghi:
       alaghi_tb_name = ALAGHI_NADDER + "_tb"
 
       # write the alaghi adder testbench module
-      gen_alaghi_data( data, N, _ALAGHI_TEST_SIZE )
-      with open( os.path.join( tb, alaghi_tb_name + ".v" ), 'w' ) as f:
-         write_alaghi_nadder_tb( f, alaghi_tb_name, args.input_size )
+      gen_alaghi_data( data, N, L, datafmt=args.datafmt, chunk=args.chunk_size )
+      with open_verilog( os.path.join( tb, alaghi_tb_name + ".v" ) ) as f:
+         write_alaghi_nadder_tb( f, alaghi_tb_name, args.input_size, datafmt=args.datafmt,
+                                 length=L )
    else:
       nadder_tb_name = NADDER + "_tb"
       nadder_dut_name = NADDER
 
       # write the nadder testbench module
-      with open( os.path.join( tb, nadder_tb_name + ".v" ), 'w' ) as f:
+      with open_verilog( os.path.join( tb, nadder_tb_name + ".v" ) ) as f:
          write_nadder_tb( f, nadder_tb_name, nadder_dut_name, N )
 
 # Writes the testbench module for the generated sc_matrix_multiply module.
@@ -85,7 +93,10 @@ def generate( args ):
 # batch, an int, specifies batch size (in a matrix mult MxN * NxO, M is batch size)
 # inpt, an int, specifies input feature size (N)
 # outpt, an int, specifies output feature size (O)
-def write_mm_tb( f, module_name, dut_name, batch, inpt, outpt, alaghi=False ):
+# datafmt, a string, the format of the data files to load (bin, hex or raw)
+# length, an int, the number of cycles of test data
+def write_mm_tb( f, module_name, dut_name, batch, inpt, outpt, alaghi=False, datafmt="bin",
+                 length=_MM_TEST_SIZE ):
    # write header comment
    write_mm_tb_header( f )
    
@@ -98,12 +109,13 @@ def write_mm_tb( f, module_name, dut_name, batch, inpt, outpt, alaghi=False ):
    write_line( f, "parameter OUTPUT_FEATURES = " + str(outpt) + "; // O", 1 )
    if not alaghi:
       write_line( f, "parameter SELECT_WIDTH =    " + str(select_width) + ";", 1 )
-   write_line( f, "parameter INPUT_MATRICES =  \"" + _MM_INPUT_FN + "\";", 1 )
-   write_line( f, "parameter WEIGHT_MATRICES = \"" + _MM_WEIGHT_FN + "\";", 1 )
+   write_line( f, "parameter INPUT_MATRICES =  \"" + mif.file_name( _MM_INPUT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter WEIGHT_MATRICES = \"" + mif.file_name( _MM_WEIGHT_FN, datafmt ) + "\";", 1 )
    if not alaghi:
-      write_line( f, "parameter SELECT_STREAM =   \"" + _MM_SEL_FN + "\";", 1 )
-   write_line( f, "parameter MM_RESULT =       \"" + _MM_RES_FN + "\";", 1 )
-   write_line( f, "parameter LENGTH =       " + str(_MM_TEST_SIZE) + ";", 1 )
+      write_line( f, "parameter SELECT_STREAM =   \"" + mif.file_name( _MM_SEL_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter MM_RESULT =       \"" + mif.file_name( _MM_RES_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter LENGTH =       " + str(length) + ";", 1 )
+   write_line( f, "parameter LATENCY =      " + str(dp_delay( inpt, alaghi )) + ";", 1 )
    write_line( f, "" )
    write_line( f, "// module inputs and outputs", 1 )
    write_line( f, "reg clk;", 1 )
@@ -121,17 +133,18 @@ def write_mm_tb( f, module_name, dut_name, batch, inpt, outpt, alaghi=False ):
    if not alaghi:
       write_line( f, "reg [SELECT_WIDTH-1:0]                 test_sel [LENGTH-1:0];", 1 )
    write_line( f, "reg [BATCH_SIZE*OUTPUT_FEATURES-1:0] expected_results [LENGTH-1:0];", 1 )
+   mif.write_mem_load_decls( f, datafmt )
    write_line( f, "initial begin", 1 )
-   write_line( f, "$readmemb(INPUT_MATRICES, test_input, 0, LENGTH-1);", 2 )
-   write_line( f, "$readmemb(WEIGHT_MATRICES, test_weight, 0, LENGTH-1);", 2 )
+   mif.write_mem_load( f, datafmt, "INPUT_MATRICES", "test_input", "LENGTH" )
+   mif.write_mem_load( f, datafmt, "WEIGHT_MATRICES", "test_weight", "LENGTH" )
    if not alaghi:
-      write_line( f, "$readmemb(SELECT_STREAM, test_sel, 0, LENGTH-1);", 2 )
-   write_line( f, "$readmemb(MM_RESULT, expected_results, 0, LENGTH-1);", 2 )
+      mif.write_mem_load( f, datafmt, "SELECT_STREAM", "test_sel", "LENGTH" )
+   mif.write_mem_load( f, datafmt, "MM_RESULT", "expected_results", "LENGTH" )
    write_line( f, "end", 1 )
    write_line( f, "" )
    write_line( f, "// Test input assignment logic", 1 )
 
-   test_width = clogb2( _MM_TEST_SIZE )
+   test_width = max( clogb2( length ), 1 )
 
    write_line( f, "reg [" + str(test_width-1) + ":0] test_index;", 1 )
    write_line( f, "initial test_index = 0;", 1 )
@@ -155,7 +168,7 @@ def write_mm_tb( f, module_name, dut_name, batch, inpt, outpt, alaghi=False ):
    write_line( f, "always @(posedge clk) begin", 1 )
    write_line( f, "if( rst ) begin", 2 )
    write_line( f, "result_index <= 0;", 3 )
-   write_line( f, "end else if( outputWriteEn == 1'b1 ) begin", 2 )
+   write_line( f, "end else if( outputWriteEn == 1'b1 && result_index < LENGTH ) begin", 2 )
    write_line( f, "if( outputStreams != expected_results[result_index] ) begin", 3 )
    write_line( f, "$display(\"Error. Expected result %B does not match actual %B. On result index: %d\",", 4 )
    write_line( f, "expected_results[result_index], outputStreams, result_index);", 5 )
@@ -188,14 +201,18 @@ def write_mm_tb( f, module_name, dut_name, batch, inpt, outpt, alaghi=False ):
    write_line( f, "" )
    write_line( f, "initial begin", 1 )
    write_line( f, "rst = 1;", 2 )
-   write_line( f, "#(8*CLOCK_PERIOD);", 2 )
+   write_line( f, "#(" + str(TB_RESET_CYCLES) + "*CLOCK_PERIOD);", 2 )
    write_line( f, "" )
    write_line( f, "// start sim", 2 )
    write_line( f, "rst = 0;", 2 )
-   write_line( f, "#(LENGTH*CLOCK_PERIOD + 100)  // give 100 clock cycles for initial output delay", 2 )
+   write_line( f, "#((LENGTH + LATENCY + 1)*CLOCK_PERIOD); // until the last result is out of the pipeline", 2 )
    write_line( f, "" )
    write_line( f, "// error summary", 2 )
    write_line( f, "$display(\"Simulation complete.\");", 2 )
+   write_line( f, "if( result_index < LENGTH ) begin", 2 )
+   write_line( f, "$display(\"Error. Only %d of %d results were checked.\", result_index, LENGTH);", 3 )
+   write_line( f, "errors = errors + 1;", 3 )
+   write_line( f, "end", 2 )
    write_line( f, "if( errors > 0 ) begin", 2 )
    write_line( f, "$display(\"Validataion failure: %d error(s).\", errors);", 3 )
    write_line( f, "end else begin", 2 )
@@ -212,8 +229,11 @@ def write_mm_tb( f, module_name, dut_name, batch, inpt, outpt, alaghi=False ):
 #  module_name, a string, the name of the module
 #  dut_name, a string, the name of the module to test (device under test)
 #  rep, a string specifying the stochastic representation (either uni or bi)
-#  length, an integer, the length of the input vectors
-def write_dp_tb( f, module_name, dut_name, dimension, rep = "uni", alaghi = False ):
+#  dimension, an integer, the length of the input vectors
+#  datafmt, a string, the format of the data files to load (bin, hex or raw)
+#  length, an int, the number of cycles of test data
+def write_dp_tb( f, module_name, dut_name, dimension, rep = "uni", alaghi = False, datafmt = "bin",
+                 length = _DP_TEST_SIZE ):
    # write the header comment
    write_dp_tb_header( f )
 
@@ -226,11 +246,12 @@ def write_dp_tb( f, module_name, dut_name, dimension, rep = "uni", alaghi = Fals
    write_line( f, "parameter DIMENSION =     " + str(dimension) + ";", 1 )
    if not alaghi:
       write_line( f, "parameter SELECT_WIDTH =  " + str(select_width) + ";", 1 )
-   write_line( f, "parameter DATA_VECTOR =   \"" + _DP_DATA_FN + "\";", 1 )
-   write_line( f, "parameter WEIGHT_VECTOR = \"" + _DP_WEIGHT_FN + "\";", 1 )
-   write_line( f, "parameter SELECT_STREAM = \"" + _DP_SELECT_FN + "\";", 1 )
-   write_line( f, "parameter DP_RESULT =     \"" + _DP_RES_FN + "\";", 1 )
-   write_line( f, "parameter LENGTH =        " + str(_DP_TEST_SIZE) + ";", 1 )
+   write_line( f, "parameter DATA_VECTOR =   \"" + mif.file_name( _DP_DATA_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter WEIGHT_VECTOR = \"" + mif.file_name( _DP_WEIGHT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter SELECT_STREAM = \"" + mif.file_name( _DP_SELECT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter DP_RESULT =     \"" + mif.file_name( _DP_RES_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter LENGTH =        " + str(length) + ";", 1 )
+   write_line( f, "parameter LATENCY =       " + str(dp_delay( dimension, alaghi )) + ";", 1 )
    write_line( f, "" )
    write_line( f, "// module inputs and outputs", 1 )
    write_line( f, "reg                     clk;", 1 )
@@ -248,17 +269,18 @@ def write_dp_tb( f, module_name, dut_name, dimension, rep = "uni", alaghi = Fals
    if not alaghi:
       write_line( f, "reg [SELECT_WIDTH-1:0] test_sel [LENGTH-1:0];", 1 )
    write_line( f, "reg expected_result [LENGTH-1:0];", 1 )
+   mif.write_mem_load_decls( f, datafmt )
    write_line( f, "initial begin", 1 )
-   write_line( f, "$readmemb(DATA_VECTOR, test_data, 0, LENGTH-1);", 2 )
-   write_line( f, "$readmemb(WEIGHT_VECTOR, test_weights, 0, LENGTH-1);", 2 )
+   mif.write_mem_load( f, datafmt, "DATA_VECTOR", "test_data", "LENGTH" )
+   mif.write_mem_load( f, datafmt, "WEIGHT_VECTOR", "test_weights", "LENGTH" )
    if not alaghi:
-      write_line( f, "$readmemb(SELECT_STREAM, test_sel, 0, LENGTH-1);", 2 )
-   write_line( f, "$readmemb(DP_RESULT, expected_result, 0, LENGTH-1);", 2 )
+      mif.write_mem_load( f, datafmt, "SELECT_STREAM", "test_sel", "LENGTH" )
+   mif.write_mem_load( f, datafmt, "DP_RESULT", "expected_result", "LENGTH" )
    write_line( f, "end", 1 )
    write_line( f, "" )
    write_line( f, "// Test input assignment logic", 1 )
 
-   test_width = clogb2( _DP_TEST_SIZE )
+   test_width = max( clogb2( length ), 1 )
 
    write_line( f, "reg [" + str(test_width-1) + ":0] test_index;", 1 )
    write_line( f, "initial test_index = 0;", 1 )
@@ -282,7 +304,7 @@ def write_dp_tb( f, module_name, dut_name, dimension, rep = "uni", alaghi = Fals
    write_line( f, "always @(posedge clk) begin", 1 )
    write_line( f, "if( rst ) begin", 2 )
    write_line( f, "result_index <= 0;", 3 )
-   write_line( f, "end else if( valid == 1'b1 ) begin", 2 )
+   write_line( f, "end else if( valid == 1'b1 && result_index < LENGTH ) begin", 2 )
    write_line( f, "if( result != expected_result[result_index] ) begin", 3 )
    write_line( f, "$display(\"Error. Expected result %d does not match actual %d. On result index: %d\", ", 4 )
    write_line( f, "expected_result[result_index], result, result_index);", 5 )
@@ -316,14 +338,18 @@ def write_dp_tb( f, module_name, dut_name, dimension, rep = "uni", alaghi = Fals
    write_line( f, "initial begin", 1 )
    write_line( f, "// initialize inputs", 2 )
    write_line( f, "rst = 1;", 2 )
-   write_line( f, "#(8*CLOCK_PERIOD);", 2 )
+   write_line( f, "#(" + str(TB_RESET_CYCLES) + "*CLOCK_PERIOD);", 2 )
    write_line( f, "" )
    write_line( f, "// start sim", 2 )
    write_line( f, "rst = 0;", 2 )
-   write_line( f, "#(LENGTH*CLOCK_PERIOD + 100) // add 100 extra cycles for initial ouput delay", 2 )
+   write_line( f, "#((LENGTH + LATENCY + 1)*CLOCK_PERIOD); // until the last result is out of the pipeline", 2 )
    write_line( f, "" )
    write_line( f, "// error summary", 2 )
    write_line( f, "$display(\"Simulation complete.\");", 2 )
+   write_line( f, "if( result_index < LENGTH ) begin", 2 )
+   write_line( f, "$display(\"Error. Only %d of %d results were checked.\", result_index, LENGTH);", 3 )
+   write_line( f, "errors = errors + 1;", 3 )
+   write_line( f, "end", 2 )
    write_line( f, "if( errors > 0 ) begin", 2 )
    write_line( f, "$display(\"Validataion failure: %d error(s).\", errors);", 3 )
    write_line( f, "end else begin", 2 )
@@ -400,20 +426,28 @@ def write_nadder_tb( f, module_name, dut_name, n ):
    write_line( f, "end", 1 )
    write_line( f, "endmodule // sc_nadder_tb" )
 
-def write_alaghi_nadder_tb( f, module_name, n ):
+# Writes the test bench for the alaghi n-adder module.
+#  f, the file to write to
+#  module_name, the name of the testbench
+#  n, the number of inputs to the nadder dut
+#  datafmt, a string, the format of the data files to load (bin, hex or raw)
+#  length, an int, the number of cycles of test data
+def write_alaghi_nadder_tb( f, module_name, n, datafmt="bin", length=_ALAGHI_TEST_SIZE ):
    # write the header comment
    write_alaghi_nadder_tb_header( f )
 
    delay = int(clogb2( n )) - 1
+   test_width = max( clogb2( length ), 1 )
+   delay_width = max( clogb2( n ), 1 )
 
    write_line( f, "`timescale 1ns / 10ps" )
    write_line( f, "" )
    write_line( f, "module " + module_name + "();" )
    write_line( f, "parameter INPUT_STREAMS = " + str(n) + ";", 1 )
    write_line( f, "parameter DELAY =         " + str(delay) + ";", 1 )
-   write_line( f, "parameter INPUTS =        \"" + _ALAGHI_INPUT_FN + "\";", 1 )
-   write_line( f, "parameter ADDER_RESULT =  \"" + _ALAGHI_RES_FN + "\";", 1 )
-   write_line( f, "parameter TEST_LENGTH =   " + str(_ALAGHI_TEST_SIZE) + ";", 1 )
+   write_line( f, "parameter INPUTS =        \"" + mif.file_name( _ALAGHI_INPUT_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter ADDER_RESULT =  \"" + mif.file_name( _ALAGHI_RES_FN, datafmt ) + "\";", 1 )
+   write_line( f, "parameter TEST_LENGTH =   " + str(length) + ";", 1 )
    write_line( f, "" )
    write_line( f, "// modules inputs and outputs", 1 )
    write_line( f, "reg                      clk;", 1 )
@@ -424,13 +458,14 @@ def write_alaghi_nadder_tb( f, module_name, n ):
    write_line( f, "// read input data and expected results data", 1 )
    write_line( f, "reg [INPUT_STREAMS-1:0] test_inputs [TEST_LENGTH-1:0];", 1 )
    write_line( f, "reg expected_results [TEST_LENGTH-1:0];", 1 )
+   mif.write_mem_load_decls( f, datafmt )
    write_line( f, "initial begin", 1 )
-   write_line( f, "$readmemb(INPUTS, test_inputs, 0, TEST_LENGTH-1);", 2 )
-   write_line( f, "$readmemb(ADDER_RESULT, expected_results, 0, TEST_LENGTH-1);", 2 )
+   mif.write_mem_load( f, datafmt, "INPUTS", "test_inputs", "TEST_LENGTH" )
+   mif.write_mem_load( f, datafmt, "ADDER_RESULT", "expected_results", "TEST_LENGTH" )
    write_line( f, "end", 1 )
    write_line( f, "" )
    write_line( f, "// Test input data assignment logic", 1 )
-   write_line( f, "reg [TEST_LENGTH-1:0] test_index;", 1 )
+   write_line( f, "reg [" + str(test_width-1) + ":0] test_index;", 1 )
    write_line( f, "initial test_index = 0;", 1 )
    write_line( f, "always @(posedge clk) begin", 1 )
    write_line( f, "if( rst == 1'b1 ) begin", 2 )
@@ -439,11 +474,13 @@ def write_alaghi_nadder_tb( f, module_name, n ):
    write_line( f, "test_index <= test_index + 1;", 3 )
    write_line( f, "end", 2 )
    write_line( f, "end", 1 )
-   write_line( f, "assign inpts = test_inputs[test_index];", 1 )
+   # hold the inputs at 0 during reset, the tree's pipeline registers have no
+   # reset and are flushed with 0s instead, which never toggle an adder
+   write_line( f, "assign inpts = (rst == 1'b1) ? 0 : test_inputs[test_index];", 1 )
    write_line( f, "" )
    write_line( f, "// Output checking and error handling", 1 )
    write_line( f, "reg valid;", 1 )
-   write_line( f, "reg [TEST_LENGTH-1:0] valid_delay;", 1 )
+   write_line( f, "reg [" + str(delay_width-1) + ":0] valid_delay;", 1 )
    write_line( f, "initial valid_delay = 0;", 1 )
    write_line( f, "always @(posedge clk) begin", 1 )
    write_line( f, "if( rst ) begin", 2 )
@@ -489,7 +526,7 @@ def write_alaghi_nadder_tb( f, module_name, n ):
    write_line( f, "initial begin", 1 )
    write_line( f, "// initialize inputs", 2 )
    write_line( f, "rst = 1;", 2 )
-   write_line( f, "#(1*CLOCK_PERIOD);", 2 )
+   write_line( f, "#((DELAY+2)*CLOCK_PERIOD);", 2 )
    write_line( f, "" )
    write_line( f, "// start sim", 2 )
    write_line( f, "rst = 0;", 2 )
@@ -539,229 +576,3 @@ def write_alaghi_nadder_tb_header( f ):
    write_line( f, "//" )
    write_line( f, "// Description: This module serves as a testbench for the alaghi_nadder module." )
    write_line( f, "//////////////////////////////////////////////////////////////////////////////////" )
-
-# This function generates a few files used by the matrix multiply testbench.
-# Files for input matrics, weight matrices, select streams and expected output
-# are generated.
-# Parameters:
-#  data_dir, directory to write the data files into
-#  batch, an int, batch size M  (in matrix multiply MxN *NxO)
-#  inpt, an int, input feature size N
-#  output, an int, output feature size O
-#  length, an int, the length of the stochastic bit streams
-#  rep, a string, 'uni' or 'bi', represents the type fo stochastic representation
-#  alaghi, a boolean, 'True' specifies that alaghi adders are used
-def gen_mm_data( data_dir, batch, inpt, outpt, length, rep="uni", alaghi=False ):
-   # generate data/input features matrix
-   datas = np.empty( (batch, inpt, length), dtype = bool )
-   for b in range(batch):
-      data = np.random.randint( length, size = inpt )
-      rng = lfsr_sequence( length, normalize = False )   
-
-      for i in range(inpt):
-         datas[b, i, :] = rng < data[i]
-
-   # generate weights matrix
-   weights = np.empty( (outpt, inpt, length), dtype = bool )
-   for o in range(outpt):
-      weight = np.random.randint( length, size = inpt )
-      rng = lfsr_sequence( length, normalize = False )
-
-      for i in range(inpt):
-         weights[o, i, :] = rng < weight[i]
-   
-   # write inputs and weights to data files
-   with open( os.path.join( data_dir, _MM_INPUT_FN ), 'w' ) as f:
-         write_matrix_stream( f, datas, length )
-   with open( os.path.join( data_dir, _MM_WEIGHT_FN ), 'w' ) as f:
-      write_matrix_stream( f, weights, length )
-
-   results = np.empty( (batch, outpt, length), dtype = bool )
-   if not alaghi:
-      # generate a select stream
-      sel_sequence = lfsr_sequence( length, normalize = False )
-      
-      # Write the select sequence out to a data file 
-      with open( os.path.join( data_dir, _MM_SEL_FN ), 'w' ) as f:
-         select_width = clogb2( inpt )
-         for num in sel_sequence:
-            sel = int(num % inpt)
-            s_str = int_to_n_length_binary( sel, select_width ) 
-            f.write( s_str + "\n" )
-
-      # compute matrix multiply and write the results file
-      for b in range(batch):
-         data_vec = datas[b, :, :]
-         for o in range(outpt):
-            weight_vec = weights[o, :, :]
-            res = sc_dot_product( data_vec, weight_vec, mode="LFSR", rep=rep, sel_sequence=sel_sequence )
-            results[b, o, :] = res
-   else:
-      for b in range(batch):
-         data_vec = datas[b, :, :]
-         for o in range(outpt):
-            weight_vec = weights[o, :, :]
-            res = sc_dot_product( data_vec, weight_vec, mode="ALAGHI", rep=rep )
-            results[b, o, :] = res
-
-   with open( os.path.join( data_dir, _MM_RES_FN ), 'w' ) as f:
-      write_matrix_stream( f, results, length )
-
-# This function generates a few files used by the dot product testbench.
-# Files for input data vector, weight vector, select streams and final
-# dot_product results are generated. 
-#
-# Parameters:
-#  data_dir, the directory to write the 'mif' data files
-#  dimension, an int, the dimension of the vectors
-#  length, the length of the input streams (essentially the length of the test)
-#  rep, a string, 'uni' or 'bi' specifying the stochastic representation
-#  alaghi, a boolean, specifies whether alaghi adders are used in the dot_product
-def gen_dp_data( data_dir, dimension, length, rep='uni', alaghi=False ):
-   # randomly generate some data and weight vectors
-   data = np.random.randint( length, size = dimension ) 
-   weight = np.random.randint( length, size = dimension )
-
-   rng0 = lfsr_sequence( length, normalize = False )
-   rng1 = lfsr_sequence( length, normalize = False ) 
-
-   datas = np.empty( (dimension, length), dtype = bool )
-   weights = np.empty( (dimension, length), dtype = bool )
-
-   for d in range(dimension):
-      datas[d, :] = rng0 < data[d]
-      weights[d, : ] = rng1 < weight[d]
-
-   # Write the data and weight vectors out to 'mif' files
-   # Open and write data to files 
-   with open( os.path.join( data_dir, _DP_DATA_FN ), 'w' ) as f:
-      for stream in range(length):
-         s_str = stream_to_str( datas[:,stream] )
-         f.write( s_str + "\n" )
-   with open( os.path.join( data_dir, _DP_WEIGHT_FN ), 'w' ) as f:
-      for stream in range(length):
-         s_str = stream_to_str( weights[:,stream] )
-         f.write( s_str + "\n" )
-
-   if not alaghi:
-      # generate a select stream
-      sel_sequence = lfsr_sequence( length, normalize = False )
-      
-      # Write the select sequence out to a data file 
-      with open( os.path.join( data_dir, _DP_SELECT_FN ), 'w' ) as f:
-         select_width = clogb2( dimension )
-         for num in sel_sequence:
-            sel = int(num % dimension)
-            s_str = int_to_n_length_binary( sel, select_width ) 
-            f.write( s_str + "\n" )
-      
-      # compute the standard dot product
-      result = sc_dot_product( datas, weights, mode="LFSR", rep=rep, sel_sequence=sel_sequence )
-   else:
-      result = sc_dot_product( datas, weights, mode="ALAGHI", rep=rep )
-
-   # write out the dot_product result to a 'mif' file
-   with open( os.path.join( data_dir, _DP_RES_FN ), 'w' ) as f:
-      for res in result:
-         if res:
-            res_str = "1"
-         else:
-            res_str = "0"
-         f.write( res_str + "\n" )
-
-# Function to generate random input data for the alaghi adder.
-# Parameters:
-#  data_dir, the directory to write the files into
-#  n, an int, the number of inputs to the adder
-#  length, an int, the length of the stochastic streams
-def gen_alaghi_data( data_dir, n, length ):
-   # generate a random vector of size n
-   inpt = np.random.randint( length, size = n )
-   rng = lfsr_sequence( length, normalize = False )
-   inputs = np.empty( (n, length), dtype = bool )
-   for d in range(n):
-      inputs[d, :] = rng < inpt[d]
-
-   # Write the input data to a file
-   with open( os.path.join( data_dir, _ALAGHI_INPUT_FN ), 'w' ) as f:
-      for stream in range(length):
-         s_str = stream_to_str( inputs[:,stream] )
-         f.write( s_str + "\n" )
-
-   # compute the result and write them to a file
-   result = alaghi_adder( inputs )
-
-   #result = sc_nadder(inputs, select_mode = "ALAGHI", seed = 0)
-
-   with open( os.path.join( data_dir, _ALAGHI_RES_FN ), 'w' ) as f:
-      for res in result:
-         if res:
-            res_str = "1"
-         else:
-            res_str = "0"
-         f.write( res_str + "\n" )
-
-# Takes in an array of 1's and 0's and outputs a string of
-# those 1's and 0's concatenated.
-# Characters of the stream are concatenated to the front,
-# this is because we write the stream to the data file
-# in a way that makes it easy for verilog's readmemb()
-# to read the data.
-def stream_to_str( stream, reverse = False ):
-   s_str = ""
-   for bit in stream:
-      #s_str = "1" + s_str if bit else "0" + s_str
-      if bit:
-         s_str = "1" + s_str
-      else:
-         s_str = "0" + s_str
-
-   return s_str
-
-# Converts a number, num, to a binary string of precision n.
-def int_to_n_length_binary( num, n ):
-   b_str = bin(num)[2:]
-   for i in range(0, n - len(b_str)):
-      b_str = "0" + b_str
-
-   return b_str
-
-# Writes a flattened form of the matrix (elements are streams of 1s and 0s)
-# to the file f. The length of the streams should be equal to 'length'.
-def write_matrix_stream( f, mtrx, length ):
-   # Note: we write the string in an order interpretable by
-   # verilog's readmemb() function. 
-   for stream_idx in range(length):
-      m_str = ""
-      for m in reversed(range(len(mtrx))):
-         vector = mtrx[m]
-         for n in reversed(range(len(vector))):
-            el = vector[n]
-            if el[stream_idx]:
-               m_str += "1"
-            else:
-               m_str += "0"
-
-      f.write( m_str + "\n" )
-
-# This function could be facoted out to the arithmetic directory in pysc.
-# Also pysc's sc_dot_product could call this function?
-def alaghi_adder( inputs ):
-   (dimensions, length) = inputs.shape
-   dims = int(2 ** clogb2(dimensions))
-   zero = np.zeros( length, dtype=bool )
-   while dims > 1:
-      x = 0
-      while x in range(dims):
-         op_a = zero if x >= dimensions else inputs[x, :]
-         op_b = zero if x+1 >= dimensions else inputs[x+1, :]
-         add_res = sc_add( op_a, op_b, select_mode = "ALAGHI" )
-         if x == 0:
-            inputs[0, :] = add_res
-         else:
-            inputs[x/2, :] = add_res
-         x = x + 2
-
-      dims = dims / 2
-
-   return inputs[0, :]
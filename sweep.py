@@ -0,0 +1,133 @@
+# Copyright (c) Gyorgy Wyatt Muntean 2017
+# This script generates a sweep of matrix multiply designs, one directory per
+# configuration, on a shared pool of processes. Configurations come from a
+# grid given on the command line or from a JSON spec file, see
+# python/design_sweep.py for the spec format. A manifest indexing every
+# generated design is written to the destination directory.
+# See the README for a detailed description of runtime arguments and flags.
+
+import argparse
+import design_sweep
+import gen_cache
+import json
+import numpy as np
+import os
+import performance
+
+# Command line interface specification
+# See README for spec description
+def cli():
+   parser = argparse.ArgumentParser(
+      description='Generates a sweep of Stochastic Matrix Multiply Verilog Modules'
+   )
+   parser.add_argument(
+      '-dst', dest='dest_dir', action='store', type=str, required=False,
+      default="sweep", help='Destination directory'
+   )
+   parser.add_argument(
+      '-spec', dest='spec', action='store', type=str, required=False,
+      default=None, help='JSON spec file of the configurations, replaces the grid arguments'
+   )
+   parser.add_argument(
+      '-bs', dest='batch', action='store', type=int_list, required=False,
+      default=[4], help='Batch sizes, comma separated'
+   )
+   parser.add_argument(
+      '-is', dest='input', action='store', type=int_list, required=False,
+      default=[4], help='Input feature sizes, comma separated'
+   )
+   parser.add_argument(
+      '-os', dest='output', action='store', type=int_list, required=False,
+      default=[4], help='Output feature sizes, comma separated'
+   )
+   parser.add_argument(
+      '-alaghi', dest='alaghi', action='store', type=bool_list, required=False,
+      default=[False], help='Adder types, comma separated booleans, e.g. 0,1 for both'
+   )
+   parser.add_argument(
+      '-engines', dest='engines', action='store', type=int_list, required=False,
+      default=[None], help='Dot product engines of folded designs, comma separated, default unfolded'
+   )
+   parser.add_argument(
+      '-datafmt', dest='datafmt', action='store', type=str, required=False,
+      default='bin', help='Format of the testbench data files, options are bin, hex or raw'
+   )
+   parser.add_argument(
+      '-testlen', dest='length', action='store', type=int, required=False,
+      default=100, help='Number of cycles of testbench data'
+   )
+   parser.add_argument(
+      '-clock', dest='clock', action='store', type=float, required=False,
+      default=performance.DEFAULT_CLOCK, help='Clock frequency in MHz of the performance manifests'
+   )
+   parser.add_argument(
+      '-j', dest='jobs', action='store', type=int, required=False,
+      default=1, help='Number of processes shared by the whole sweep'
+   )
+   parser.add_argument(
+      '-seed', dest='seed', action='store', type=int, required=False,
+      default=None, help='Seed for deterministic output'
+   )
+   parser.add_argument(
+      '-cache', dest='cache_dir', action='store', type=str, required=False,
+      default=None, help='Directory of the generation cache, requires -seed'
+   )
+   args = parser.parse_args()
+
+   # Argument validation
+   if ( args.jobs < 1 ):
+      print( "Usage: -j N, N > 0" )
+      exit()
+   if ( args.clock <= 0 ):
+      print( "Usage: -clock MHz, MHz > 0" )
+      exit()
+   if ( args.cache_dir is not None and args.seed is None ):
+      print( "Usage: -cache DIR requires -seed N" )
+      exit()
+   if ( args.spec is not None and not os.path.isfile( args.spec ) ):
+      print( "ERROR: spec={} is not a file".format( args.spec ) )
+      exit()
+
+   return args
+
+# Helper function to parse a comma separated list of ints
+def int_list( v ):
+   try:
+      return [int( x ) for x in v.split( ',' )]
+   except ValueError:
+      raise argparse.ArgumentTypeError( 'Comma separated integers expected.' )
+
+# Helper function to parse a comma separated list of booleans
+def bool_list( v ):
+   values = []
+   for x in v.split( ',' ):
+      if x.lower() in ('yes', 'true', 't', 'y', '1'):
+         values.append( True )
+      elif x.lower() in ('no', 'false', 'f', 'n', '0'):
+         values.append( False )
+      else:
+         raise argparse.ArgumentTypeError( 'Comma separated booleans expected.' )
+   return values
+
+# Script entry point function
+if __name__ == '__main__':
+   args = cli()
+   if args.seed is not None:
+      np.random.seed( args.seed )
+      gen_cache.set_seed( args.seed )
+   if args.cache_dir is not None:
+      gen_cache.set_cache( gen_cache.GenCache( args.cache_dir ) )
+
+   if args.spec is not None:
+      with open( args.spec, 'r' ) as f:
+         spec = json.load( f )
+   else:
+      spec = { "batch" : args.batch, "input" : args.input, "output" : args.output,
+               "alaghi" : args.alaghi, "datafmt" : args.datafmt, "length" : args.length,
+               "engines" : args.engines }
+   configs = design_sweep.expand( spec )
+
+   print( "Generating {} designs on {} processes...".format( len( configs ), args.jobs ) )
+   manifest = design_sweep.run( args.dest_dir, configs, jobs=args.jobs, clock=args.clock )
+   print( "done! {} tasks, {} shared between designs".format( manifest["tasks"],
+                                                              len( manifest["shared"] ) ) )